@@ -0,0 +1,1428 @@
+"""
+Offline benchmarks for ServerQuotes
+
+Generate a synthetic quotes database, then time the cog's DB interface
+against a scratch copy of it:
+
+    python -m benchmarks.serverquotes_bench generate bench.sqlite --servers 200 --authors 20000 --quotes 1000000
+    python -m benchmarks.serverquotes_bench run bench.sqlite --repeat 50 -o report.json
+
+Run from the repository root, with the bot's root directory on PYTHONPATH,
+so the cog and its imports resolve as they do when Red loads it. Nothing
+touches Discord or the network beyond a local HTTP stub; the report is
+printed (or written) as JSON. Correctness checks live in tests/serverquotes.
+"""
+import argparse
+import asyncio
+from bisect import bisect
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import io
+from itertools import accumulate, islice
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+from time import perf_counter
+from types import SimpleNamespace
+from typing import Callable, Dict, List
+
+from serverquotes.dupes import MINHASH_SQL, DuplicateQuote, register as register_minhash
+from serverquotes.serverquotes import ServerQuotes, FTS_SQL, INIT_SQL
+
+ONSETS = ('', 'b', 'br', 'ch', 'd', 'f', 'g', 'gr', 'h', 'j', 'k', 'l', 'm', 'n', 'p', 'pl', 'r', 's', 'sh', 'st',
+          't', 'th', 'tr', 'v', 'w', 'y', 'z')
+VOWELS = ('a', 'e', 'i', 'o', 'u', 'ai', 'ea', 'ee', 'oo', 'ou')
+CODAS = ('', '', '', 'n', 'r', 's', 't', 'ng', 'ck', 'll', 'st')
+
+SERVER_ID_BASE = 180000000000000000
+USER_ID_BASE = 280000000000000000
+INSERT_CHUNK = 50000
+
+SUITES = OrderedDict()  # type: Dict[str, Callable[[Bench], None]]
+
+
+def suite(name: str, needs_db: bool = True):
+    """Registers a benchmark suite; suites that need_db get a cog opened on the corpus"""
+    def decorator(func):
+        func.needs_db = needs_db
+        SUITES[name] = func
+        return func
+
+    return decorator
+
+
+def summarize(samples: List[float]) -> dict:
+    ordered = sorted(samples)
+    ms = 1000
+    return {
+        'n'       : len(ordered),
+        'mean_ms' : statistics.mean(ordered) * ms,
+        'p50_ms'  : ordered[len(ordered) // 2] * ms,
+        'p95_ms'  : ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * ms,
+        'max_ms'  : ordered[-1] * ms
+    }
+
+
+def zipf_cum_weights(n: int, s: float = 1.07) -> List[float]:
+    return list(accumulate(1 / (i + 1) ** s for i in range(n)))
+
+
+# Corpus generation
+
+def make_vocabulary(rng: random.Random, size: int) -> List[str]:
+    words = OrderedDict()
+
+    while len(words) < size:
+        word = ''.join(rng.choice(ONSETS) + rng.choice(VOWELS) for _ in range(rng.choice((1, 1, 2, 2, 2, 3))))
+        words[word + rng.choice(CODAS)] = None
+
+    return list(words)
+
+
+class CorpusGenerator:
+    """
+    Synthetic quote corpus with skewed, chat-like distributions
+
+    Word frequencies, server sizes and author activity all follow Zipf
+    curves; most authors quote (and are quoted) on a home server.
+    """
+
+    def __init__(self, *, servers: int = 50, authors: int = 2000, quotes: int = 100000, vocab: int = 20000,
+                 links: int = 10, seed: int = 0):
+        self.servers = servers
+        self.authors = authors
+        self.quotes = quotes
+        self.links = links
+        self.rng = rng = random.Random(seed)
+
+        self.words = make_vocabulary(rng, vocab)
+        self.word_weights = zipf_cum_weights(vocab)
+        self.server_ids = [SERVER_ID_BASE + i for i in range(servers)]
+        self.server_weights = zipf_cum_weights(servers, 0.9)
+        self.user_ids = [USER_ID_BASE + i for i in range(authors)]
+        self.user_weights = zipf_cum_weights(authors, 0.8)
+        rng.shuffle(self.user_ids)
+        self.homes = {uid: self._pick_server() for uid in self.user_ids}
+        self.end = datetime(2020, 1, 1)
+
+    def _pick_server(self) -> int:
+        i = bisect(self.server_weights, self.rng.random() * self.server_weights[-1])
+        return self.server_ids[i]
+
+    def _pick_user(self) -> int:
+        i = bisect(self.user_weights, self.rng.random() * self.user_weights[-1])
+        return self.user_ids[i]
+
+    def text(self) -> str:
+        length = min(80, max(1, int(self.rng.lognormvariate(2.2, 0.7))))
+        return ' '.join(self.rng.choices(self.words, cum_weights=self.word_weights, k=length))
+
+    def _timestamp(self) -> str:
+        date = self.end - timedelta(seconds=self.rng.randrange(5 * 365 * 86400))
+        return date.strftime('%Y-%m-%d %H:%M:%S')
+
+    def _rows(self):
+        rng = self.rng
+        counters = {}
+
+        for _ in range(self.quotes):
+            author_id = self._pick_user()
+            server_id = self.homes[author_id] if rng.random() < 0.85 else self._pick_server()
+            counters[server_id] = sqid = counters.get(server_id, 0) + 1
+            author_name = None
+            image_url = None
+            said = self._timestamp()
+
+            if rng.random() < 0.03:
+                author_name, author_id = self.text()[:32], None
+
+            if rng.random() < 0.05:
+                image_url = 'https://cdn.example.invalid/%i/%i.png' % (server_id, sqid)
+
+            yield (server_id, sqid, said, said, self._pick_user(), author_id, author_name, self.text(), image_url,
+                   rng.randrange(1 << 40), rng.randrange(1 << 40), int(rng.random() < 0.01))
+
+    def populate(self, db: sqlite3.Connection):
+        """Bulk-loads the corpus, with FTS and index maintenance deferred to the end"""
+        rng = self.rng
+
+        db.execute("PRAGMA synchronous = OFF;")
+        db.executescript("DROP TRIGGER IF EXISTS quotes_fts_INSERT; DROP TRIGGER IF EXISTS quotes_set_sqid_noinc; "
+                         "DROP TRIGGER IF EXISTS quotes_minhash_INSERT; "
+                         "DROP TRIGGER IF EXISTS temp.quotes_tfidf_INSERT;")
+
+        with db as con:
+            indexes = [r[0] for r in con.execute("SELECT sql FROM sqlite_master WHERE type = 'index' "
+                                                 "AND tbl_name = 'quotes' AND sql IS NOT NULL;")]
+
+            for (name,) in con.execute("SELECT name FROM sqlite_master WHERE type = 'index' "
+                                       "AND tbl_name = 'quotes' AND sql IS NOT NULL;").fetchall():
+                con.execute("DROP INDEX %s;" % name)
+
+        rows = self._rows()
+
+        while True:
+            chunk = list(islice(rows, INSERT_CHUNK))
+
+            if not chunk:
+                break
+
+            with db as con:
+                con.executemany("INSERT INTO quotes (server_id, server_quote_id, date_said, date_added, added_by, "
+                                "author_id, author_name, quote, image_url, channel_id, message_id, is_global) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);", chunk)
+
+        with db as con:
+            for sql in indexes:
+                con.execute(sql)
+
+            con.execute("INSERT INTO server_counters (server_id, last_qid) "
+                        "SELECT server_id, MAX(server_quote_id) FROM quotes GROUP BY server_id;")
+
+            con.executemany("INSERT INTO users (user_id, username, discriminator, avatar_url) VALUES (?, ?, ?, ?);",
+                            [(uid, self.words[i % len(self.words)] + str(i), rng.randrange(1, 10000),
+                              'https://cdn.example.invalid/avatars/%i.png' % uid)
+                             for i, uid in enumerate(self.user_ids)])
+
+            nicknames = {(self.homes[uid], uid): self.text()[:32] for uid in self.user_ids if rng.random() < 0.3}
+            con.executemany("INSERT INTO nicknames (server_id, user_id, nickname) VALUES (?, ?, ?);",
+                            [(*k, v) for k, v in nicknames.items()])
+
+            links = {tuple(rng.sample(self.server_ids, 2)) for _ in range(self.links if self.servers > 1 else 0)}
+            con.executemany("INSERT OR IGNORE INTO server_links (from_id, to_id) VALUES (?, ?);", links)
+
+            has_fts = con.execute("SELECT 1 FROM sqlite_master WHERE name = 'quotes_fts';").fetchone()
+
+            if has_fts:
+                con.execute("INSERT INTO quotes_fts (rowid, content) SELECT quote_id, quote FROM quotes;")
+                con.execute("INSERT INTO quotes_fts (quotes_fts) VALUES ('optimize');")
+
+        # put the dropped triggers back
+        db.executescript(INIT_SQL)
+        db.executescript(MINHASH_SQL)
+
+        if has_fts:
+            db.executescript(FTS_SQL)
+
+        with db as con:
+            con.execute("ANALYZE;")
+
+
+def open_cog(path: str) -> ServerQuotes:
+    # the DB interface only needs a connection, not a bot
+    cog = ServerQuotes.__new__(ServerQuotes)
+    cog.bot = None
+    cog._open_db(path)
+    return cog
+
+
+def generate(args):
+    if os.path.exists(args.db):
+        sys.exit('%s already exists' % args.db)
+
+    gen = CorpusGenerator(servers=args.servers, authors=args.authors, quotes=args.quotes, vocab=args.vocab,
+                          links=args.links, seed=args.seed)
+    cog = open_cog(args.db)
+    start = perf_counter()
+    gen.populate(cog.db)
+
+    while cog.dupes.backfill(INSERT_CHUNK):
+        pass
+
+    cog.db.execute("VACUUM;")
+    cog.db.close()
+
+    print(json.dumps({
+        'db'        : args.db,
+        'quotes'    : args.quotes,
+        'servers'   : args.servers,
+        'authors'   : args.authors,
+        'seconds'   : perf_counter() - start,
+        'bytes'     : os.path.getsize(args.db)
+    }, indent=2))
+
+
+# Benchmark runner
+
+class Bench:
+    def __init__(self, cog, repeat: int, seed: int):
+        self.cog = cog
+        self.repeat = repeat
+        self.rng = random.Random(seed)
+        self.results = OrderedDict()
+        self._sample = None
+
+    def measure(self, name: str, func: Callable, *, setup: Callable = None, repeat: int = None, **extra):
+        """
+        Times func over `repeat` calls and records the summary under name
+
+        setup, if given, runs untimed before each call and returns func's arguments.
+        """
+        samples = []
+
+        for _ in range(repeat or self.repeat):
+            args = setup() if setup else ()
+            start = perf_counter()
+            func(*args)
+            samples.append(perf_counter() - start)
+
+        return self.record(name, samples, **extra)
+
+    def record(self, name: str, samples: List[float], **extra) -> dict:
+        self.results[name] = dict(summarize(samples), **extra)
+        return self.results[name]
+
+    @property
+    def sample(self) -> List[sqlite3.Row]:
+        """A fixed random sample of existing quotes, for picking realistic query arguments"""
+        if self._sample is None:
+            con = self.cog.db
+            top = con.execute("SELECT MAX(quote_id) FROM quotes;").fetchone()[0] or 0
+            ids = [self.rng.randint(1, top) for _ in range(min(top, 1000))]
+            self._sample = con.execute("SELECT quote_id, server_id, server_quote_id, author_id, quote FROM quotes "
+                                       "WHERE quote_id IN (%s);" % ', '.join('?' * len(ids)), ids).fetchall()
+
+        return self._sample
+
+    def pick(self) -> sqlite3.Row:
+        return self.rng.choice(self.sample)
+
+    def terms(self, words: int = 1) -> str:
+        text = self.pick()['quote'].split() or ['quote']
+        return ' '.join(self.rng.sample(text, min(words, len(text))))
+
+    def fake_ctx(self, server_id: int, author_id: int, content: str = '') -> SimpleNamespace:
+        message = SimpleNamespace(id=str(self.rng.randrange(1 << 40)), content=content, timestamp=datetime.utcnow(),
+                                  author=SimpleNamespace(id=str(author_id)), server=SimpleNamespace(id=str(server_id)),
+                                  channel=SimpleNamespace(id=str(self.rng.randrange(1 << 40))), embeds=[],
+                                  attachments=[])
+        return SimpleNamespace(message=message)
+
+
+@suite('queries')
+def bench_queries(bench: Bench):
+    cog = bench.cog
+
+    def server():
+        return bench.pick()['server_id'],
+
+    def author():
+        row = bench.pick()
+        return row['server_id'], row['author_id']
+
+    def sqid():
+        row = bench.pick()
+        return row['server_id'], row['server_quote_id']
+
+    def cold(args):
+        def setup():
+            cog.result_cache.bump()
+            return args()
+
+        return setup
+
+    bench.measure('get_quotes.server', lambda sid: cog._get_quotes(server_id=sid), setup=server)
+    bench.measure('get_quotes.server_linked', lambda sid: cog._get_quotes(server_id=sid, link=True), setup=server)
+    bench.measure('get_quotes.author', lambda sid, aid: cog._get_quotes(server_id=sid, author_id=aid), setup=author)
+    bench.measure('get_quotes.server_quote_id', lambda sid, n: cog._get_quotes(server_id=sid, server_quote_id=n),
+                  setup=sqid)
+
+    def browse(sid):
+        browser = cog._browse_quotes(server_id=sid, link=True)
+
+        for _ in range(10):
+            if browser:
+                browser[bench.rng.randrange(len(browser))]
+
+    bench.measure('browse.open_and_10_jumps', browse, setup=server)
+
+    def random_quote(sid):
+        cog._get_random_quote(server_id=sid, link=True)
+
+    bench.measure('random.cold', random_quote, setup=cold(server))
+    bench.measure('random.warm', random_quote, setup=lambda: (bench.sample[0]['server_id'],))
+
+    if not cog.has_fts:
+        return
+
+    def search(term, sid):
+        cog._do_search(term, server_id=sid, link=True)
+
+    bench.measure('search.one_word.cold', search, setup=cold(lambda: (bench.terms(1), bench.pick()['server_id'])))
+    bench.measure('search.two_words.cold', search, setup=cold(lambda: (bench.terms(2), bench.pick()['server_id'])))
+    warm = bench.terms(1), bench.sample[0]['server_id']
+    bench.measure('search.warm', search, setup=lambda: warm)
+    bench.measure('search.global.cold', lambda term: cog._do_search(term, is_global=True),
+                  setup=cold(lambda: (bench.terms(1),)))
+
+
+@suite('writes')
+def bench_writes(bench: Bench):
+    cog = bench.cog
+    added = []
+
+    def add():
+        row = bench.pick()
+        return bench.fake_ctx(row['server_id'], row['author_id'] or 1), row['author_id'], bench.terms(12)
+
+    def do_add(ctx, author_id, quote):
+        # includes the near-duplicate check, as the add commands do
+        try:
+            added.append(cog._add_quote(ctx, author_id=author_id, quote=quote)['quote_id'])
+        except DuplicateQuote:
+            pass
+
+    bench.measure('add_quote', do_add, setup=add)
+    bench.measure('update_quote.text', lambda qid, text: cog._update_quotes(quote_id=qid, quote=text),
+                  setup=lambda: (bench.rng.choice(added), bench.terms(5)))
+    bench.measure('update_quote.flags', lambda qid: cog._update_quotes(quote_id=qid, is_global=True),
+                  setup=lambda: (bench.rng.choice(added),))
+    bench.measure('delete_quote', lambda qid: cog._delete_quotes(quote_id=qid), setup=lambda: (added.pop(),),
+                  repeat=len(added))
+
+
+@suite('dupes')
+def bench_dupes(bench: Bench):
+    cog = bench.cog
+
+    def existing():
+        row = bench.pick()
+        return row['server_id'], row['quote']
+
+    def fresh():
+        return bench.pick()['server_id'], bench.terms(8) + ' ' + bench.terms(8)
+
+    bench.measure('dupes.find.existing', cog.dupes.find, setup=existing)
+    bench.measure('dupes.find.fresh', cog.dupes.find, setup=fresh)
+
+    sid = cog.db.execute("SELECT server_id FROM quotes GROUP BY server_id ORDER BY COUNT(*) DESC LIMIT 1;").fetchone()
+    found = []
+    bench.measure('dupes.clusters.largest_server', lambda: found.append(cog.dupes.clusters(sid[0])),
+                  repeat=max(1, min(bench.repeat, 3)))
+    bench.results['dupes.clusters.largest_server']['clusters'] = len(found[-1])
+
+
+@suite('authors')
+def bench_authors(bench: Bench):
+    cog = bench.cog
+    names = [r[0] for r in cog.db.execute("SELECT username FROM users ORDER BY user_id LIMIT 1000;")]
+
+    def typo():
+        name = list(bench.rng.choice(names))
+        name[bench.rng.randrange(len(name))] = bench.rng.choice('aeiou')
+        return ''.join(name), bench.pick()['server_id']
+
+    bench.measure('authors.load', lambda: cog.author_index.load(cog.db), repeat=1)
+    bench.results['authors.load']['entries'] = len(cog.author_index)
+    bench.measure('authors.fuzzy.server', lambda name, sid: cog._find_authors(name, sid), setup=typo)
+    bench.measure('authors.fuzzy.global', lambda name, sid: cog._find_authors(name), setup=typo)
+    bench.measure('authors.random_quote', lambda name, sid: cog._get_random_quote(server_id=sid, author_fuzzy=name,
+                                                                                  link=True), setup=typo)
+
+
+@suite('similar')
+def bench_similar(bench: Bench):
+    cog = bench.cog
+    index = cog.similar
+    bench.measure('similar.build', lambda: [None for _ in index.sync(cog.db)], repeat=1)
+    bench.results['similar.build'].update(docs=len(index), terms=len(index.terms))
+
+    def pick():
+        row = bench.pick()
+        return row['quote'], cog.links.expand([row['server_id']]), row['quote_id']
+
+    bench.measure('similar.query.server', lambda text, scope, qid: index.similar(text, scope, exclude=qid),
+                  setup=pick)
+    bench.measure('similar.query.global', lambda text, scope, qid: index.similar(text, exclude=qid), setup=pick)
+    bench.measure('similar.save', index.save, repeat=1)
+    bench.results['similar.save']['bytes'] = os.path.getsize(index.path)
+    bench.measure('similar.load', index.load, repeat=1)
+
+
+@suite('dump')
+def bench_dump(bench: Bench):
+    cog = bench.cog
+    sid = cog.db.execute("SELECT server_id FROM quotes GROUP BY server_id ORDER BY COUNT(*) DESC LIMIT 1;").fetchone()
+    rows = cog.db.execute("SELECT COUNT(*) FROM quotes WHERE server_id = ?;", sid).fetchone()[0]
+    size = []
+    bench.measure('dump.largest_server', lambda: size.append(len(cog._dump_csv(sid[0]).getvalue())),
+                  repeat=max(1, min(bench.repeat, 5)), rows=rows)
+    bench.results['dump.largest_server']['bytes'] = size[-1]
+
+
+async def _loop_lag(workload, interval: float = 0.001) -> List[float]:
+    """Runs workload() while sampling how late the event loop wakes a short sleep"""
+    lateness = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = perf_counter()
+            await asyncio.sleep(interval)
+            lateness.append(perf_counter() - start - interval)
+
+    task = asyncio.ensure_future(ticker())
+
+    try:
+        await workload()
+    finally:
+        done.set()
+        await task
+
+    return lateness
+
+
+@suite('apsw', needs_db=False)
+def bench_apsw(bench: Bench):
+    """Event loop stalls while querying through APSWConnectionWrapper vs ThreadedAPSWConnection"""
+    from serverquotes.utils.dbtools import APSWConnectionWrapper, ThreadedAPSWConnection
+
+    tmpdir = tempfile.mkdtemp(prefix='sqbench')
+    path = os.path.join(tmpdir, 'apsw.sqlite')
+    words = make_vocabulary(bench.rng, 2000)
+    queries = [("SELECT COUNT(*), SUM(LENGTH(body)) FROM t WHERE body LIKE ?;", ('%' + bench.rng.choice(words) + '%',))
+               for _ in range(bench.repeat)]
+
+    try:
+        setup = APSWConnectionWrapper(path)
+
+        with setup.transaction() as c:
+            c.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, body TEXT);")
+            c.executemany("INSERT INTO t (body) VALUES (?);",
+                          ((' '.join(bench.rng.choices(words, k=12)),) for _ in range(100000)))
+
+        setup.close()
+
+        async def wrapper():
+            conn = APSWConnectionWrapper(path)
+
+            for sql, bindings in queries:
+                with conn.with_cursor() as c:
+                    c.execute(sql, bindings).fetchall()
+
+                await asyncio.sleep(0)
+
+            conn.close()
+
+        async def threaded():
+            async with ThreadedAPSWConnection(path) as conn:
+                for sql, bindings in queries:
+                    await conn.fetch(sql, bindings)
+
+        loop = asyncio.new_event_loop()
+
+        try:
+            for name, workload in (('wrapper', wrapper), ('threaded', threaded)):
+                start = perf_counter()
+                lateness = loop.run_until_complete(_loop_lag(workload))
+                bench.record('apsw.%s.loop_lag' % name, lateness, queries=len(queries),
+                             wall_ms=(perf_counter() - start) * 1000)
+        finally:
+            loop.close()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+@suite('media', needs_db=False)
+def bench_media(bench: Bench):
+    """Media cache downloads, deduplicated downloads and eviction, against a local HTTP stub"""
+    from tests.serverquotes.httpstub import LocalHTTPStub
+    from serverquotes.media import MediaCache
+
+    tmpdir = tempfile.mkdtemp(prefix='sqbench')
+    db = sqlite3.connect(os.path.join(tmpdir, 'media.sqlite'))
+    cache = MediaCache(db, os.path.join(tmpdir, 'media'), max_file_bytes=1024 * 1024)
+    sizes = [bench.rng.randint(1, 256) * 1024 for _ in range(max(bench.repeat, 10))]
+    blobs = [bench.rng.getrandbits(n * 8).to_bytes(n, 'little') for n in sizes]
+
+    async def scenario():
+        async with LocalHTTPStub() as stub:
+            for i, blob in enumerate(blobs):
+                # every file is served under two links
+                stub.add_file('a%i.bin' % i, blob)
+                stub.add_file('b%i.bin' % i, blob)
+
+            cache.configure(enabled=True, max_bytes=sum(sizes) * 2, max_age=0)
+            samples = []
+
+            for i in range(len(blobs)):
+                start = perf_counter()
+                await cache.store(stub.url('/file/a%i.bin' % i))
+                samples.append(perf_counter() - start)
+
+            bench.record('media.store', samples, bytes=sum(sizes))
+
+            start = perf_counter()
+            await asyncio.gather(*(cache.store(stub.url('/file/b%i.bin' % i)) for i in range(len(blobs))))
+            bench.record('media.store.duplicates', [perf_counter() - start], files=len(blobs))
+
+            cache.configure(max_bytes=cache.report()['bytes'] // 2)
+            bench.measure('media.evict.size', cache.evict, repeat=1)
+
+        await cache.close()
+
+    loop = asyncio.new_event_loop()
+
+    try:
+        loop.run_until_complete(scenario())
+        bench.results['media.report'] = cache.report()
+    finally:
+        loop.close()
+        db.close()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+@suite('startup')
+def bench_startup(bench: Bench):
+    """Cog load time: module import, the constructor, and the background jobs it starts"""
+    import importlib.util
+    from serverquotes import serverquotes as module
+    from serverquotes.shards import db_path
+
+    def import_module():
+        # a fresh copy of the module body, with its dependencies already imported
+        spec = importlib.util.spec_from_file_location(module.__package__ + '._import_probe', module.__file__)
+        spec.loader.exec_module(importlib.util.module_from_spec(spec))
+
+    repeat = max(1, min(bench.repeat, 5))
+    bench.measure('startup.import', import_module, repeat=repeat)
+    path = db_path(bench.cog.db)
+
+    def eager():
+        # what loading used to block on: the schema plus the whole member index
+        cog = open_cog(path)
+        list(cog.name_sync.load_index(*cog.store.connections()))
+        cog.store.close()
+        cog.db.close()
+
+    bench.measure('startup.eager', eager, repeat=repeat)
+    loop = asyncio.new_event_loop()
+
+    async def ready():
+        pass
+
+    bot = SimpleNamespace(loop=loop, servers=[], get_server=lambda server_id: None, wait_until_ready=ready,
+                          get_cog=lambda name: None)
+    samples = []
+
+    try:
+        for _ in range(repeat):
+            start = perf_counter()
+            cog = ServerQuotes(bot, path)
+            samples.append(perf_counter() - start)
+            names = [n for n in cog.jobs.jobs if n != 'similar_autosave']
+            start = perf_counter()
+            lateness = loop.run_until_complete(_loop_lag(lambda: cog.jobs.wait(*names)))
+            jobs_wall = perf_counter() - start
+            cog.jobs.cancel_all()
+            cog.name_sync.stop()
+            loop.run_until_complete(asyncio.sleep(0.05))  # lets the cancelled tasks unwind
+            cog.store.close()
+            cog.db.close()
+
+        bench.record('startup.init', samples)
+        bench.record('startup.jobs.loop_lag', lateness, wall_ms=jobs_wall * 1000)
+        bench.results['startup.jobs'] = OrderedDict((j['name'], {'state': j['state'], 'seconds': j['seconds']})
+                                                    for j in cog.jobs.report())
+    finally:
+        loop.close()
+
+
+def _contention(path: str, server_ids: List[int], per_thread: int, *, wal: bool = False,
+                shard_of: Callable[[int], str] = None) -> dict:
+    """Inserts per_thread quotes into each server at once, one thread and connection per server"""
+    latencies = []  # type: List[float]
+    errors = []
+    barrier = threading.Barrier(len(server_ids))
+
+    def writer(server_id):
+        con = sqlite3.connect(shard_of(server_id) if shard_of else path, timeout=60)
+        # the signing triggers are TEMP, so each writer sets them up as the cog does
+        register_minhash(con)
+        con.executescript(MINHASH_SQL)
+
+        if wal:
+            con.execute("PRAGMA journal_mode = WAL;")
+
+        rng = random.Random(server_id)
+        barrier.wait()
+
+        for i in range(per_thread):
+            start = perf_counter()
+
+            try:
+                with con:
+                    con.execute("INSERT INTO quotes (server_id, added_by, author_id, quote) VALUES (?, ?, ?, ?);",
+                                (server_id, USER_ID_BASE, USER_ID_BASE, 'contention %i %i' % (i, rng.random())))
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+
+            latencies.append(perf_counter() - start)
+
+        con.close()
+
+    threads = [threading.Thread(target=writer, args=(sid,)) for sid in server_ids]
+    start = perf_counter()
+
+    for t in threads:
+        t.start()
+
+    for t in threads:
+        t.join()
+
+    wall = perf_counter() - start
+    return dict(summarize(latencies), inserts_per_s=len(latencies) / wall, errors=len(errors),
+                threads=len(server_ids), journal_mode='wal' if wal or shard_of else 'delete')
+
+
+@suite('shards')
+def bench_shards(bench: Bench):
+    """Single-file vs sharded storage: split and merge times, linked reads, and concurrent writes"""
+    from serverquotes import shards
+
+    cog = bench.cog
+    tmpdir = tempfile.mkdtemp(prefix='sqbench')
+    sharded_path = os.path.join(tmpdir, 'quotes.sqlite')
+    buckets = 16
+
+    try:
+        with sqlite3.connect(sharded_path) as copy:
+            cog.db.backup(copy)
+
+        copy = open_cog(sharded_path)
+        start = perf_counter()
+        bench.results['shards.split'] = dict(shards.split(copy, buckets), wall_ms=(perf_counter() - start) * 1000)
+        copy.db.close()
+        sharded = open_cog(sharded_path)
+
+        for name, c in (('single', cog), ('sharded', sharded)):
+            bench.measure('shards.%s.get_quotes.linked' % name, lambda sid: c._get_quotes(server_id=sid, link=True),
+                          setup=lambda: (bench.pick()['server_id'],))
+            bench.measure('shards.%s.get_quotes.global' % name, lambda: c._get_quotes(is_global=True, limit=50))
+
+            def random_quote(sid):
+                c.result_cache.bump()
+                c._get_random_quote(server_id=sid, link=True)
+
+            bench.measure('shards.%s.random.cold' % name, random_quote, setup=lambda: (bench.pick()['server_id'],))
+
+            if c.has_fts:
+                def search(term, sid):
+                    c.result_cache.bump()
+                    c._do_search(term, server_id=sid, link=True)
+
+                bench.measure('shards.%s.search.linked' % name, search,
+                              setup=lambda: (bench.terms(1), bench.pick()['server_id']))
+
+            def add():
+                row = bench.pick()
+                return bench.fake_ctx(row['server_id'], row['author_id'] or 1), row['author_id'], bench.terms(12)
+
+            bench.measure('shards.%s.add_quote' % name,
+                          lambda ctx, aid, text: c._add_quote(ctx, force=True, author_id=aid, quote=text), setup=add)
+
+        # write contention: the busiest servers adding quotes at the same time
+        server_ids = [r[0] for r in cog.db.execute("SELECT server_id FROM quotes GROUP BY server_id "
+                                                   "ORDER BY COUNT(*) DESC LIMIT 8;")]
+        per_thread = min(max(20, bench.repeat * 5), shards.ID_BLOCK // len(server_ids))
+
+        for name, wal in (('single', False), ('single_wal', True)):
+            path = os.path.join(tmpdir, name + '.sqlite')
+
+            with sqlite3.connect(path) as copy:
+                cog.db.backup(copy)
+
+            bench.results['shards.contention.' + name] = _contention(path, server_ids, per_thread, wal=wal)
+
+        for sid in server_ids:
+            # creates any missing shards, with IDs to spare for every thread that might share one
+            sharded.store.connection(sid, room=per_thread * len(server_ids))
+
+        bench.results['shards.contention.sharded'] = _contention(
+            None, server_ids, per_thread, shard_of=lambda sid: sharded.store.path(sharded.store.shard_of(sid)))
+        bench.results['shards.contention.sharded']['shards'] = len({sharded.store.shard_of(s) for s in server_ids})
+
+        start = perf_counter()
+        bench.results['shards.merge'] = dict(shards.merge(sharded), wall_ms=(perf_counter() - start) * 1000)
+        sharded.db.close()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+@suite('pagify', needs_db=False)
+def bench_pagify(bench: Bench):
+    """pagify vs the single-pass apagify on 1 MB of text, whole and streamed as lines"""
+    from serverquotes.utils.chat_formatting import apagify, pagify
+
+    words = make_vocabulary(bench.rng, 5000)
+    size = 1024 * 1024
+
+    def lines(make_line):
+        out, total = [], 0
+
+        while total < size:
+            out.append(make_line())
+            total += len(out[-1])
+
+        return out
+
+    inputs = OrderedDict([
+        ('quotes', lines(lambda: '#%i %s - <@%i>\n' % (bench.rng.randrange(100000),
+                                                       ' '.join(bench.rng.choices(words, k=bench.rng.randint(3, 40))),
+                                                       bench.rng.randrange(1 << 60)))),
+        ('code', ['```py\n'] + lines(lambda: 'log(%r)\n' % ' '.join(bench.rng.choices(words, k=8))) + ['```\n']),
+        ('mentions', lines(lambda: bench.rng.choice(('@everyone ', '@here ', 'hi ', 'there\n')))),
+        ('unbroken', [''.join(bench.rng.choices(words, k=size // 5))[:size]])
+    ])
+    loop = asyncio.new_event_loop()
+
+    async def stream(chunks):
+        for chunk in chunks:
+            yield chunk
+
+    def collect(source, **kwargs):
+        async def pages():
+            return [page async for page in apagify(source, **kwargs)]
+
+        return loop.run_until_complete(pages())
+
+    try:
+        for name, chunks in inputs.items():
+            text = ''.join(chunks)
+            repeat = min(bench.repeat, 10)
+            extra = {'chars': len(text)}
+            bench.measure('pagify.%s.pagify' % name, lambda: list(pagify(text)), repeat=repeat, **extra)
+            bench.measure('pagify.%s.apagify' % name, lambda: collect(text, code_blocks=False), repeat=repeat, **extra)
+            bench.measure('pagify.%s.apagify.code_blocks' % name, lambda: collect(text), repeat=repeat, **extra)
+            bench.measure('pagify.%s.apagify.lines' % name, lambda: collect(stream(chunks)), repeat=repeat,
+                          chunks=len(chunks), **extra)
+
+            # linear work should take about 4x as long on 4x the text
+            quarter = text[:len(text) // 4]
+            times = []
+
+            for sample in (quarter, text):
+                start = perf_counter()
+                list(pagify(sample))
+                times.append(perf_counter() - start)
+
+            bench.results['pagify.%s.pagify' % name]['growth_4x'] = times[1] / times[0]
+    finally:
+        loop.close()
+
+
+@suite('filters', needs_db=False)
+def bench_filters(bench: Bench):
+    """FilterPipeline against chaining the filter functions, on chat-like messages"""
+    from serverquotes.utils import common_filters as cf
+
+    order = (cf.filter_urls, cf.filter_invites, cf.filter_mass_mentions, cf.filter_various_mentions,
+             cf.normalize_smartquotes, cf.escape_spoilers)
+
+    words = make_vocabulary(bench.rng, 5000)
+    extras = ('https://example.com/%i' % bench.rng.randrange(1000), 'discord.gg/abc%i' % bench.rng.randrange(1000),
+              '@everyone', '@here', '<@!%i>' % USER_ID_BASE, '<#%i>' % SERVER_ID_BASE, '\u201cquoted\u201d',
+              '||spoiler||', 'don\u2019t')
+
+    def message():
+        text = bench.rng.choices(words, k=bench.rng.randint(3, 40))
+
+        for _ in range(bench.rng.randrange(3)):
+            text.insert(bench.rng.randrange(len(text) + 1), bench.rng.choice(extras))
+
+        return ' '.join(text)
+
+    messages = [message() for _ in range(20000)]
+    chars = sum(map(len, messages))
+
+    for name, funcs in (('all', order), ('spoilers_mass_mentions', (cf.filter_mass_mentions, cf.escape_spoilers)),
+                        ('urls_invites_mass_mentions', order[:3])):
+        pipeline = cf.FilterPipeline(*funcs)
+
+        def chained():
+            for text in messages:
+                for func in funcs:
+                    text = func(text)
+
+        def piped():
+            for text in messages:
+                pipeline(text)
+
+        for variant, func in (('chained', chained), ('pipeline', piped)):
+            result = bench.measure('filters.%s.%s' % (name, variant), func, repeat=min(bench.repeat, 10),
+                                   messages=len(messages))
+            result['mb_per_s'] = chars / (result['mean_ms'] / 1000) / 1e6
+
+
+async def _fixed_purge(messages, channel):
+    """mass_purge before it paced itself: chunks of 100 with a fixed sleep between"""
+    import discord
+
+    while messages:
+        try:
+            await channel.delete_messages(messages[:100])
+        except discord.HTTPException:
+            pass
+        messages = messages[100:]
+        await asyncio.sleep(1.5)
+
+
+@suite('purge', needs_db=False)
+def bench_purge(bench: Bench):
+    """adaptive_purge vs fixed-sleep bulk deletion, across channels with simulated rate limits"""
+    import discord
+    from serverquotes.utils.mod import adaptive_purge
+    from tests.serverquotes.utils.sims import PurgeSim
+
+    loop = asyncio.new_event_loop()
+    channels, per_channel, old_ratio = 3, 200, 0.025
+    seed = bench.rng.randrange(1 << 32)
+
+    async def fixed(sim):
+        # one channel after another; old messages can't be bulk deleted, so a cog would delete them one by one
+        limit = discord.utils.utcnow() - timedelta(days=14)
+        by_channel = OrderedDict()
+
+        for message in sim.messages:
+            by_channel.setdefault(message.channel, []).append(message)
+
+        for channel, messages in by_channel.items():
+            await _fixed_purge([m for m in messages if m.created_at > limit], channel)
+
+            for message in messages:
+                if message.created_at <= limit:
+                    await message.delete()
+
+    progress = []
+
+    async def adaptive(sim):
+        report = await adaptive_purge(sim.messages, on_progress=lambda r: progress.append(r.deleted),
+                                      progress_interval=1)
+        bench.results['purge.adaptive.report'] = {'deleted': report.deleted, 'failed': report.failed,
+                                                  'requests': report.requests, 'backoffs': report.backoffs}
+
+    try:
+        for name, purge in (('fixed', fixed), ('adaptive', adaptive)):
+            sim = PurgeSim(random.Random(seed), channels, per_channel, old_ratio)
+            start = perf_counter()
+            loop.run_until_complete(purge(sim))
+            elapsed = perf_counter() - start
+            bench.results['purge.' + name] = {
+                'messages': len(sim.messages),
+                'deleted': sum(1 for n in sim.deleted.values() if n),
+                'requests': sim.requests,
+                'wall_ms': elapsed * 1000,
+                'messages_per_s': len(sim.deleted) / elapsed,
+                'held_back_ms': sum(b.waited for c in {m.channel for m in sim.messages}
+                                    for b in (c.bulk, c.single, c.old)) * 1000
+            }
+    finally:
+        loop.close()
+
+    bench.results['purge.adaptive']['progress_reports'] = progress
+
+
+@suite('tunnel', needs_db=False)
+def bench_tunnel(bench: Bench):
+    """Tunnel attachment downloads: one after another in memory vs Tunnel.streamed_files, from a slow local server"""
+    import tracemalloc
+    import aiohttp
+    from tests.serverquotes.httpstub import LocalHTTPStub
+    from serverquotes.utils import tunnel
+    from serverquotes.utils.tunnel import Tunnel
+
+    sizes = [bench.rng.randint(256, 6 * 1024) * 1024 for _ in range(8)]
+    limit = sum(sizes) + 1024
+    destination = SimpleNamespace(guild=SimpleNamespace(filesize_limit=limit))
+    loop = asyncio.new_event_loop()
+
+    def attachments(stub, names):
+        return [SimpleNamespace(filename=name, url=stub.url('/slowfile/' + name), proxy_url=stub.url('/file/' + name),
+                                size=len(stub.files[name][0]), height=None, description=None, is_spoiler=lambda: False)
+                for name in names]
+
+    async def in_memory(atts):
+        # what Attachment.to_file does, one attachment after another
+        async with aiohttp.ClientSession() as session:
+            files = []
+
+            for a in atts:
+                async with session.get(a.url) as resp:
+                    files.append(io.BytesIO(await resp.read()))
+
+            return sum(len(f.getvalue()) for f in files)
+
+    async def streamed(atts):
+        async with Tunnel.streamed_files(SimpleNamespace(attachments=atts), destination) as files:
+            return sum(f.fp.seek(0, io.SEEK_END) for f in files)
+
+    async def scenario():
+        async with LocalHTTPStub(slow_delay=0.2) as stub:
+            names = []
+
+            for i, size in enumerate(sizes):
+                names.append('a%i.bin' % i)
+                stub.add_file(names[-1], bench.rng.getrandbits(size * 8).to_bytes(size, 'little'))
+
+            atts = attachments(stub, names)
+
+            for name, fetch in (('in_memory', in_memory), ('streamed', streamed)):
+                tracemalloc.start()
+                start = perf_counter()
+                total = await fetch(atts)
+                elapsed = perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                bench.results['tunnel.' + name] = {'files': len(atts), 'bytes': total, 'wall_ms': elapsed * 1000,
+                                                   'peak_mb': peak / 1048576}
+
+    try:
+        loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+
+    bench.results['tunnel.settings'] = {'spool_threshold': tunnel.SPOOL_THRESHOLD,
+                                        'max_downloads': tunnel.MAX_DOWNLOADS,
+                                        'download_budget': tunnel.DOWNLOAD_BUDGET}
+
+
+@suite('menus', needs_db=False)
+def bench_menus(bench: Bench):
+    """menu() over 500 pages, paged through 20 times: a prebuilt list vs LazyPages"""
+    import tracemalloc
+    from serverquotes.utils.menus import DEFAULT_CONTROLS, LazyPages, menu, next_page
+
+    n_pages, n_views = 500, 20
+    forward = next(k for k, v in DEFAULT_CONTROLS.items() if v is next_page)
+    rows = [(bench.rng.randrange(1 << 40), bench.rng.randint(0, 100000)) for _ in range(n_pages * 10)]
+    loop = asyncio.new_event_loop()
+
+    def render(num):
+        lines = ('#%i <@%i>: %i points' % (i + 1, user, points)
+                 for i, (user, points) in enumerate(rows[num * 10:num * 10 + 10], num * 10))
+        return 'Leaderboard, page %i of %i\n' % (num + 1, n_pages) + '\n'.join(lines) + '\n' + '-' * 1200
+
+    class Message:
+        id = 0
+        channel = None
+        _state = SimpleNamespace(self_id=None)
+
+        def __init__(self, shown, content):
+            self.shown = shown
+            shown.append(content)
+
+        async def edit(self, *, content=None, embed=None):
+            self.shown.append(content)
+
+        async def add_reaction(self, emoji):
+            pass
+
+    class Bot:
+        user = None
+
+        def __init__(self):
+            self.reactions = n_views
+
+        async def use_buttons(self):
+            return False
+
+        async def wait_for(self, event, *, check=None):
+            if event == 'reaction_add' and self.reactions:
+                self.reactions -= 1
+                return SimpleNamespace(emoji=forward), None
+
+            await asyncio.sleep(3600)
+
+    async def run_menu(make_pages):
+        shown = []
+        ctx = SimpleNamespace(bot=Bot(), author=None, me=None)
+
+        async def send(content=None, *, embed=None):
+            return Message(shown, content)
+
+        ctx.send = send
+        tracemalloc.start()
+        start = perf_counter()
+        pages = make_pages()
+        await menu(ctx, pages, timeout=0.001)
+        elapsed = perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return shown, pages, elapsed, peak
+
+    def eager():
+        return [render(i) for i in range(n_pages)]
+
+    def lazy():
+        return LazyPages(render, length=n_pages)
+
+    try:
+        for name, make_pages in (('list', eager), ('lazy', lazy)):
+            walls, peaks = [], []
+
+            for _ in range(bench.repeat):
+                shown, pages, elapsed, peak = loop.run_until_complete(run_menu(make_pages))
+                walls.append(elapsed)
+                peaks.append(peak)
+
+            built = pages.built if isinstance(pages, LazyPages) else len(pages)
+            bench.results['menus.' + name] = {'pages': n_pages, 'viewed': len(shown), 'built': built,
+                                              'wall_ms': statistics.median(walls) * 1000,
+                                              'peak_kb': max(peaks) / 1024}
+    finally:
+        loop.close()
+
+
+@suite('fuzzy', needs_db=False)
+def bench_fuzzy(bench: Bench):
+    """fuzzy_command_search over 4000 commands: a full scan of every name vs the trigram index"""
+    import rapidfuzz
+    from serverquotes.utils._internal_utils import _get_command_index
+    from tests.serverquotes.utils.sims import SimBot, SimCommand
+
+    vocab = make_vocabulary(bench.rng, 3000)
+    commands = []
+
+    for _ in range(1000):
+        group = SimCommand(bench.rng.choice(vocab), aliases=bench.rng.sample(vocab, bench.rng.choice((0, 0, 1))))
+        commands.append(group)
+        commands.extend(SimCommand(bench.rng.choice(vocab), group, bench.rng.sample(vocab, bench.rng.choice((0, 1))))
+                        for _ in range(bench.rng.choice((0, 1, 3, 5))))
+
+    bot = SimBot(commands)
+    names = [(c, ('%s %s' % (c.full_parent_name, n)).lstrip()) for c in commands for n in [c.name] + c.aliases]
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+
+    def typo(name):
+        chars = list(name)
+
+        for _ in range(bench.rng.choice((0, 1, 1, 2))):
+            i = bench.rng.randrange(len(chars))
+            op = bench.rng.randrange(3)
+
+            if op == 0:
+                chars[i] = bench.rng.choice(letters)
+            elif op == 1 and len(chars) > 1:
+                del chars[i]
+            else:
+                chars.insert(i, bench.rng.choice(letters))
+
+        return ''.join(chars)
+
+    terms = [typo(bench.rng.choice(names)[1]) for _ in range(max(bench.repeat, 200))]
+
+    def full_scan(term, choices):
+        return [(cmd, score) for __, score, cmd in rapidfuzz.process.extract(
+            term, choices, limit=5, scorer=rapidfuzz.fuzz.QRatio, processor=rapidfuzz.utils.default_process)]
+
+    def scan_names(term):
+        # what fuzzy_command_search did: walk every command, then score every name
+        return full_scan(term, {c: c.qualified_name for c in bot.walk_commands()})
+
+    start = perf_counter()
+    index = _get_command_index(bot)
+    bench.results['fuzzy.build'] = {'commands': len(commands), 'names': len(names),
+                                    'wall_ms': (perf_counter() - start) * 1000}
+
+    it = iter(terms * 2)
+    bench.measure('fuzzy.full_scan', lambda: scan_names(next(it)), repeat=len(terms))
+    it = iter(terms * 2)
+    bench.measure('fuzzy.index', lambda: index.search(next(it), min_score=80), repeat=len(terms))
+
+
+@suite('backup', needs_db=False)
+def bench_backup(bench: Bench):
+    """create_backup's archive: a full tar.gz vs incremental backups after small changes, over a live SQLite db"""
+    import tarfile
+    from pathlib import Path
+    from serverquotes.utils._internal_utils import _write_backup
+
+    vocab = make_vocabulary(bench.rng, 5000)
+    tmp = tempfile.mkdtemp(prefix='sq-bench-backup-')
+
+    try:
+        data, dest = Path(tmp, 'data'), Path(tmp, 'backups')
+        (data / 'cogs' / 'ServerQuotes').mkdir(parents=True)
+        dest.mkdir()
+        db_path = data / 'cogs' / 'ServerQuotes' / 'quotes.sqlite'
+        # kept open in WAL mode, as the cog keeps it
+        con = sqlite3.connect(str(db_path))
+        con.execute('PRAGMA journal_mode=WAL;')
+        con.execute('CREATE TABLE quotes (quote_id INTEGER PRIMARY KEY, quote TEXT);')
+
+        def add_quotes(n):
+            con.executemany('INSERT INTO quotes (quote) VALUES (?);',
+                            ((' '.join(bench.rng.choices(vocab, k=40)),) for _ in range(n)))
+            con.commit()
+
+        add_quotes(100000)
+        configs = []
+
+        for i in range(300):
+            path = data / 'cogs' / ('Cog%i' % (i // 10)) / ('settings%i.json' % i)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps({str(bench.rng.randrange(1 << 60)): bench.rng.choices(vocab, k=50)
+                                        for _ in range(20)}))
+            configs.append(path)
+
+        def files():
+            return [f for f in data.glob('**/*') if f.is_file()]
+
+        def old_backup():
+            # what create_backup did: tar.gz every file as-is
+            archive = dest / 'full.tar.gz'
+
+            with tarfile.open(str(archive), 'w:gz') as tar:
+                for f in files():
+                    tar.add(str(f), arcname=str(f.relative_to(data)), recursive=False)
+
+            return archive.stat().st_size
+
+        def record(name, report):
+            bench.results['backup.' + name] = {'files': report.files, 'unchanged': report.unchanged,
+                                               'deleted': report.deleted, 'bytes_read': report.bytes_read,
+                                               'bytes_written': report.bytes_written,
+                                               'wall_ms': report.elapsed * 1000}
+
+        manifest = dest / 'manifest.json'
+        start = perf_counter()
+        size = old_backup()
+        bench.results['backup.tar_gz'] = {'files': len(files()), 'bytes_written': size,
+                                          'wall_ms': (perf_counter() - start) * 1000}
+
+        record('full', _write_backup(data, files(), dest / 'base.tar.gz', manifest, False))
+        record('incremental_unchanged', _write_backup(data, files(), dest / 'i1.tar.gz', manifest, True))
+
+        # a few new quotes, three edited configs, one deleted and one rewritten as it was
+        add_quotes(100)
+
+        for path in configs[:3]:
+            path.write_text(path.read_text() + ' ')
+
+        configs[3].unlink()
+        configs[4].write_text(configs[4].read_text())
+        record('incremental_changed', _write_backup(data, files(), dest / 'i2.tar.gz', manifest, True))
+
+        con.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+@suite('asynciter', needs_db=False)
+def bench_asynciter(bench: Bench):
+    """AsyncIter and bounded_gather over 1M items: one at a time and all at once vs chunks and map_concurrent"""
+    from serverquotes.utils import AsyncIter, bounded_gather, bounded_gather_iter
+
+    n, limit = 1000000, 64
+    loop = asyncio.new_event_loop()
+    tasks = [0]
+
+    async def work(x):
+        if x == n // 2:
+            # how many tasks exist halfway through, as a measure of memory held
+            tasks[0] = len(asyncio.all_tasks())
+
+        await asyncio.sleep(0)
+        return x * 2
+
+    async def one_by_one():
+        total = 0
+
+        async for x in AsyncIter(range(n)):
+            total += x * 2
+
+        return total
+
+    async def chunked():
+        total = 0
+
+        async for chunk in AsyncIter(range(n)).chunks(1000):
+            total += sum(chunk) * 2
+
+        return total
+
+    async def gather():
+        return sum(await bounded_gather(*(work(x) for x in range(n)), limit=limit))
+
+    async def ordered():
+        return sum([y async for y in AsyncIter(range(n)).map_concurrent(work, limit)])
+
+    async def unordered():
+        return sum([y async for y in AsyncIter(range(n)).map_concurrent(work, limit, ordered=False)])
+
+    async def gather_iter():
+        async def coros():
+            for x in range(n):
+                yield work(x)
+
+        return sum([y async for y in bounded_gather_iter(coros(), limit=limit)])
+
+    try:
+        for name, func in (('iterate', one_by_one), ('chunks', chunked), ('bounded_gather', gather),
+                           ('map_concurrent', ordered), ('map_concurrent_unordered', unordered),
+                           ('bounded_gather_iter_async', gather_iter)):
+            tasks[0] = 0
+            start = perf_counter()
+            loop.run_until_complete(func())
+            bench.results['asynciter.' + name] = {'items': n, 'wall_ms': (perf_counter() - start) * 1000,
+                                                  'tasks_halfway': tasks[0]}
+    finally:
+        loop.close()
+
+
+@suite('antispam', needs_db=False)
+def bench_antispam(bench: Bench):
+    """AntiSpamRegistry throughput at 100k checks/s, against the old list-based algorithm"""
+    from serverquotes.utils.antispam import AntiSpam, AntiSpamRegistry
+    from tests.serverquotes.utils.sims import ListAntiSpam
+
+    intervals = AntiSpam.default_intervals
+    now = [0.0]
+
+    def clock():
+        return now[0]
+
+    # one event every 10us of simulated time, from users and channels with skewed activity
+    events = max(100000, bench.repeat * 2000)
+    weights = zipf_cum_weights(5000)
+    keys = [bisect(weights, bench.rng.random() * weights[-1]) for _ in range(events)]
+    target = 100000
+
+    def workload(name, get_spammy, stamp, limit=events, stamp_all=False):
+        """Checks each event; stamps the allowed ones, or all of them to count floods rather than rate limit"""
+        now[0] = 0.0
+        blocked = 0
+        start = perf_counter()
+
+        for key in keys[:limit]:
+            now[0] += 1 / target
+
+            if get_spammy(key):
+                blocked += 1
+
+                if stamp_all:
+                    stamp(key)
+            else:
+                stamp(key)
+
+        wall = perf_counter() - start
+        result = bench.results['antispam.' + name] = {'checks': limit, 'blocked': blocked, 'wall_ms': wall * 1000,
+                                                      'checks_per_s': limit / wall}
+        return result
+
+    lists = {}  # type: Dict[int, ListAntiSpam]
+
+    def list_limiter(key):
+        if key not in lists:
+            lists[key] = ListAntiSpam(intervals, clock)
+
+        return lists[key]
+
+    for mode, stamp_all in (('limit', False), ('flood', True)):
+        registry = AntiSpamRegistry(intervals, max_keys=10000, clock=clock)
+        result = workload('registry.' + mode, registry.spammy, registry.stamp, stamp_all=stamp_all)
+        result['meets_target'] = result['checks_per_s'] >= target
+
+        # the old algorithm rescans every kept stamp, so flooding gets slow fast; compare on a prefix
+        lists.clear()
+        limit = events if not stamp_all else events // 10
+        workload('list.' + mode, lambda key: list_limiter(key).spammy, lambda key: list_limiter(key).stamp(), limit,
+                 stamp_all)
+
+
+def run(args):
+    names = args.suite or list(SUITES)
+    unknown = set(names) - set(SUITES)
+
+    if unknown:
+        sys.exit('unknown suite(s): %s' % ', '.join(sorted(unknown)))
+
+    random.seed(args.seed)  # the cog's own random picks
+    meta = OrderedDict([
+        ('started', datetime.utcnow().isoformat()),
+        ('python', platform.python_version()),
+        ('sqlite', sqlite3.sqlite_version),
+        ('platform', platform.platform()),
+        ('repeat', args.repeat),
+        ('seed', args.seed),
+        ('suites', names)
+    ])
+    bench = Bench(None, args.repeat, args.seed)
+    tmpdir = None
+
+    try:
+        if any(SUITES[n].needs_db for n in names):
+            if not args.db:
+                sys.exit('a database is required for: %s' % ', '.join(n for n in names if SUITES[n].needs_db))
+
+            # writes are benchmarked too, so work on a scratch copy
+            tmpdir = tempfile.mkdtemp(prefix='sqbench')
+            path = os.path.join(tmpdir, 'quotes.sqlite')
+            shutil.copyfile(args.db, path)
+            bench.cog = open_cog(path)
+            meta['db'] = args.db
+            meta['db_bytes'] = os.path.getsize(args.db)
+            meta['quotes'] = bench.cog.db.execute("SELECT COUNT(*) FROM quotes;").fetchone()[0]
+            meta['servers'] = bench.cog.db.execute("SELECT COUNT(DISTINCT server_id) FROM quotes;").fetchone()[0]
+            meta['has_fts'] = bench.cog.has_fts
+
+        for name in names:
+            start = perf_counter()
+            SUITES[name](bench)
+            print('%s done in %.1fs' % (name, perf_counter() - start), file=sys.stderr)
+    finally:
+        if bench.cog:
+            bench.cog.db.close()
+
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    if bench.cog:
+        meta['cache'] = bench.cog.result_cache.stats()
+
+    report = json.dumps(OrderedDict([('meta', meta), ('results', bench.results)]), indent=2)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.serverquotes_bench',
+                                     description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+
+    p = sub.add_parser('generate', help='build a synthetic quotes database')
+    p.add_argument('db')
+    p.add_argument('--servers', type=int, default=50)
+    p.add_argument('--authors', type=int, default=2000)
+    p.add_argument('--quotes', type=int, default=100000)
+    p.add_argument('--vocab', type=int, default=20000, help='distinct words, Zipf-distributed')
+    p.add_argument('--links', type=int, default=10, help='random server links')
+    p.add_argument('--seed', type=int, default=0)
+    p.set_defaults(func=generate)
+
+    p = sub.add_parser('run', help='run benchmark suites and report JSON')
+    p.add_argument('db', nargs='?', help='database from generate; never modified')
+    p.add_argument('--suite', action='append', help='suite to run, repeatable (default: all of %s)' % ', '.join(SUITES))
+    p.add_argument('--repeat', type=int, default=20)
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('-o', '--output')
+    p.set_defaults(func=run)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
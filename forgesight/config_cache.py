@@ -0,0 +1,95 @@
+import re
+import time
+
+# How long a guild with no config row is remembered as having none, before
+# the database is asked again
+MISSING_CONFIG_TTL = 60
+
+
+def parse_ids(value):
+    # allowed_channels is stored as text, e.g. '1171917207375183872, 1172234313400582315'
+    return frozenset(int(i) for i in re.findall(r'\d+', str(value or '')))
+
+
+class RewardParams:
+    """
+    A guild's config, worked out once into what on_message checks
+
+    min_length is 0 when the length requirement is off, and allowed_channels
+    is None when channels aren't restricted, so each check is one comparison.
+    """
+
+    __slots__ = ('guild_id', 'config', 'rewards_enabled', 'allowed_channels', 'min_length', 'reward_timeout',
+                 'base_gold', 'subscriber_role_id', 'subscriber_bonus', 'media_bonus', 'streak_bonus')
+
+    def __init__(self, config):
+        self.guild_id = str(config['guild_id'])
+        self.config = config
+        self.rewards_enabled = config.get('rewards_enabled', 1) != 0
+        self.allowed_channels = parse_ids(config.get('allowed_channels')) if config.get('channel_id_restriction') == 1 else None
+        self.min_length = int(config.get('min_message_length') or 0) if config.get('min_message_requirement') == 1 else 0
+        self.reward_timeout = float(config.get('reward_timeout') or 0)
+        self.base_gold = int(config.get('base_gold') or 0)
+        role_id = config.get('subscriber_role_id')
+        self.subscriber_role_id = int(role_id) if role_id else None
+        self.subscriber_bonus = int(config.get('subscriber_bonus') or 0)
+        self.media_bonus = int(config.get('media_bonus') or 0)
+        self.streak_bonus = int(config.get('streak_bonus') or 0)
+
+
+class GuildConfigCache:
+    """
+    Keeps every guild's reward config in memory, so messages don't query it
+
+    load() reads the whole config table, on startup. A guild that isn't
+    cached is loaded on its first message, and one with no config is
+    remembered as such for MISSING_CONFIG_TTL seconds. The config commands
+    call invalidate() after they commit, and the next message reloads it.
+    """
+
+    def __init__(self, db_manager, logger=None):
+        self.db_manager = db_manager
+        self.logger = logger
+        self.guilds = {}
+        self._missing = {}
+        # bumped by invalidate(), so a load that was running at the time isn't kept
+        self._generation = 0
+
+    async def load(self):
+        generation = self._generation
+        configs = await self.db_manager.load_all_configs()
+        if generation != self._generation:
+            # a config changed while it was read; guilds load on their next message instead
+            return
+        self.guilds = {str(config['guild_id']): RewardParams(config) for config in configs}
+        self._missing.clear()
+        if self.logger:
+            self.logger.info(f'Loaded reward config for {len(self.guilds)} guilds.')
+
+    async def get(self, guild_id):
+        guild_id = str(guild_id)
+        params = self.guilds.get(guild_id)
+        if params is not None:
+            return params
+
+        if time.monotonic() < self._missing.get(guild_id, 0):
+            return None
+
+        generation = self._generation
+        config = await self.db_manager.load_config(guild_id)
+        params = RewardParams(config) if config else None
+        if generation == self._generation:
+            if params is None:
+                self._missing[guild_id] = time.monotonic() + MISSING_CONFIG_TTL
+            else:
+                self.guilds[guild_id] = params
+        return params
+
+    def invalidate(self, guild_id=None):
+        self._generation += 1
+        if guild_id is None:
+            self.guilds.clear()
+            self._missing.clear()
+        else:
+            self.guilds.pop(str(guild_id), None)
+            self._missing.pop(str(guild_id), None)
@@ -1,18 +1,140 @@
+import asyncio
+import contextlib
+
 import aiosqlite
 
+# Set on every connection when it's opened. WAL lets the readers run while the
+# writer commits, and with WAL, synchronous=NORMAL is still safe but skips an
+# fsync on every commit.
+WRITER_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-16000',
+)
+READER_PRAGMAS = (
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-16000',
+    'PRAGMA mmap_size=67108864',
+    'PRAGMA query_only=ON',
+)
+
+# The queries run on every message. The connections stay open, so sqlite's
+# statement cache keeps these prepared and they're only compiled once each.
+LOAD_CONFIG_SQL = 'SELECT * FROM config WHERE guild_id = ?'
+LOAD_USER_SQL = 'SELECT * FROM user_data WHERE user_id = ?'
+SAVE_USER_SQL = '''
+                    REPLACE INTO user_data (user_id, user_name, gold, last_earned, consecutive_days, last_post_date, media_bonuses, streak_bonuses, msg_avg_length, total_msg_count, total_msg_length)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                '''
+LOG_TRANSACTION_SQL = '''
+                INSERT INTO transaction_log (timestamp, user_id, total_gold_earned, channel_id, base_gold, streak_bonus, media_bonus, subscriber_bonus, message_length)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            '''
+
+
 class Forgesight_DB_Manager:
-    def __init__(self, db_path, logger=None):
-        self.db = db_path
+    """
+    Keeps the bot's connections to the database open for as long as it runs
+
+    There's one writer connection, used by `async with db_manager as db:`
+    blocks and the methods that save, and a few read-only connections the
+    loading methods share. Each write block holds the writer to itself until
+    it ends, and rolls back if it raises. Connections are opened on first use,
+    or by connect(), and must be closed with close() on shutdown.
+    """
+
+    def __init__(self, db_path='forgesight.db', logger=None, readers=2):
+        self.db_path = db_path
         self.logger = logger
+        self.reader_count = readers
+        self.db = None
+        self._readers = []
+        self._idle_readers = None
+        # made on first use, so they belong to the loop the bot runs on
+        self._write_lock = None
+        self._connect_lock = None
+
+    async def connect(self):
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+            self._write_lock = asyncio.Lock()
+
+        async with self._connect_lock:
+            if self.db is not None:
+                return
+
+            db = await aiosqlite.connect(self.db_path, cached_statements=256)
+            for pragma in WRITER_PRAGMAS:
+                await db.execute(pragma)
+
+            idle = asyncio.Queue()
+            try:
+                for _ in range(self.reader_count):
+                    reader = await aiosqlite.connect(self.db_path, cached_statements=256)
+                    self._readers.append(reader)
+                    for pragma in READER_PRAGMAS:
+                        await reader.execute(pragma)
+                    idle.put_nowait(reader)
+            except BaseException:
+                await db.close()
+                await self._close_readers()
+                raise
+
+            self.db, self._idle_readers = db, idle
+            if self.logger:
+                self.logger.info(f'Connected to {self.db_path} with {self.reader_count} readers.')
+
+    async def close(self):
+        if self._connect_lock is None:
+            return
+
+        async with self._connect_lock:
+            # let a write in progress finish first
+            async with self._write_lock:
+                if self.db is not None:
+                    await self.db.close()
+                    self.db = None
+                await self._close_readers()
+                self._idle_readers = None
+
+    async def _close_readers(self):
+        readers, self._readers = self._readers, []
+        for reader in readers:
+            await reader.close()
+
     async def __aenter__(self):
-        self.db = await aiosqlite.connect('forgesight.db')
+        await self.connect()
+        await self._write_lock.acquire()
         return self.db
 
     async def __aexit__(self, exc_type, exc, tb):
-        await self.db.close()
+        try:
+            if exc_type is not None and self.db.in_transaction:
+                await self.db.rollback()
+        finally:
+            self._write_lock.release()
+
+    @contextlib.asynccontextmanager
+    async def reader(self):
+        if self._idle_readers is None:
+            await self.connect()
+        if not self.reader_count:
+            # no readers, so reads go through the writer
+            async with self as db:
+                yield db
+            return
+        idle = self._idle_readers
+        db = await idle.get()
+        try:
+            yield db
+        finally:
+            idle.put_nowait(db)
 
     async def initialize_db(self,):
-        async with aiosqlite.connect('forgesight.db') as db:
+        async with self as db:
             if self.logger:
                 self.logger.info('Initialize: Connected to database.')
             
@@ -84,7 +206,7 @@ class Forgesight_DB_Manager:
             await db.commit()
 
     async def update_config_value(self, key, value):
-        async with aiosqlite.connect('forgesight.db') as db:
+        async with self as db:
             try:
                 await db.execute('UPDATE config SET value = ? WHERE key = ?', (value, key))
             except Exception as e:
@@ -92,8 +214,8 @@ class Forgesight_DB_Manager:
             await db.commit()
 
     async def load_config(self, guild_id):
-        async with self as db:
-            async with db.execute('SELECT * FROM config WHERE guild_id = ?', (guild_id,)) as cursor:
+        async with self.reader() as db:
+            async with db.execute(LOAD_CONFIG_SQL, (guild_id,)) as cursor:
                 row = await cursor.fetchone()
                 if row is None:
                     print(f"No config found for guild_id: {guild_id}")
@@ -106,8 +228,15 @@ class Forgesight_DB_Manager:
                 ]
                 return dict(zip(config_keys, row))
 
+    async def load_all_configs(self):
+        async with self.reader() as db:
+            async with db.execute('SELECT * FROM config') as cursor:
+                rows = await cursor.fetchall()
+                config_keys = [column[0] for column in cursor.description]
+                return [dict(zip(config_keys, row)) for row in rows]
+
     async def save_config(self, key, value):
-        async with aiosqlite.connect('forgesight.db') as db:
+        async with self as db:
             await db.execute('REPLACE INTO config (key, value) VALUES (?, ?)', (key, value))
             self.logger.info(f'Ran SQL Query REPLACE INTO config (key, value) VALUES (?, ?), (key, value). Updated config value: {key} = {value}')
             await db.commit()
@@ -115,33 +244,39 @@ class Forgesight_DB_Manager:
     async def load_vault_data(self, user_id, user_name):
         print(f"Loading vault data for user_id: {user_id}")
         
-        async with self as db:
-            async with db.execute('SELECT * FROM user_data WHERE user_id = ?', (user_id,)) as cursor:
+        async with self.reader() as db:
+            async with db.execute(LOAD_USER_SQL, (user_id,)) as cursor:
                 row = await cursor.fetchone()
-                if row is None: 
-                    print(f"No vault data found for user_id: {user_id}")
-                    await self.create_new_user(user_id, user_name, gold=0, last_earned=0, last_post_date=None, consecutive_days=0, media_bonuses=0, streak_bonuses=0, msg_avg_length=0, total_msg_count=0, total_msg_length=0)  
-                    print(f'Created new user {user_name}, {user_id} with 0 gold.')
-                    return {}
+                # keyed by the table's own column names, so the row comes back
+                # in the shape save_vault_data expects
+                columns = [column[0] for column in cursor.description]
+
+        # created once the reader is given back, as with readers=0 it's the
+        # writer, and create_new_user needs the writer too
+        if row is None:
+            print(f"No vault data found for user_id: {user_id}")
+            await self.create_new_user(user_id, user_name, gold=0, last_earned=0, last_post_date=None, consecutive_days=0, media_bonuses=0, streak_bonuses=0, msg_avg_length=0, total_msg_count=0, total_msg_length=0)  
+            print(f'Created new user {user_name}, {user_id} with 0 gold.')
+            return {}
 
-                user_data_keys = ['user_id','user_name', 'gold', 'last_earned', 'last_post_date', 'consecutive_days', 'media_bonuses', 'streak_bonuses', 'msg_avg_length', 'total_msg_count','total_msg_length']
-                return dict(zip(user_data_keys, row))
+        return dict(zip(columns, row))
             
     async def load_vault_data_from_id(self, user_id):
         print(f"Loading vault data for user_id: {user_id}")
         
-        async with self as db:
-            async with db.execute('SELECT * FROM user_data WHERE user_id = ?', (user_id,)) as cursor:
+        async with self.reader() as db:
+            async with db.execute(LOAD_USER_SQL, (user_id,)) as cursor:
                 row = await cursor.fetchone()
                 if row is None: 
                     print(f"No vault data found for user_id: {user_id}")
                     return {}
-                user_data_keys = ['user_id','user_name', 'gold', 'last_earned', 'last_post_date', 'consecutive_days', 'media_bonuses', 'streak_bonuses', 'msg_avg_length', 'total_msg_count','total_msg_length']
-                return dict(zip(user_data_keys, row))
+                # keyed by the table's own column names, so the row comes back
+                # in the shape save_vault_data expects
+                return dict(zip((column[0] for column in cursor.description), row))
 
     async def load_all_vault_data(self):
         try:
-            async with self as db: 
+            async with self.reader() as db: 
                 async with db.execute('SELECT * FROM user_data') as cursor:
                     rows = await cursor.fetchall()
 
@@ -157,12 +292,9 @@ class Forgesight_DB_Manager:
     async def save_vault_data(self, user_id, user_name, gold, last_earned, consecutive_days, last_post_date, media_bonuses, streak_bonuses, msg_avg_length, total_msg_count, total_msg_length):
         try:
             print('Connecting to database to save vault data')  # Debug Print
-            async with aiosqlite.connect('forgesight.db') as db:
+            async with self as db:
                 print('Connected to database, executing REPLACE INTO')  # Debug Print
-                await db.execute('''
-                    REPLACE INTO user_data (user_id, user_name, gold, last_earned, consecutive_days, last_post_date, media_bonuses, streak_bonuses, msg_avg_length, total_msg_count, total_msg_length)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (user_id, user_name, gold, last_earned, consecutive_days, last_post_date, media_bonuses, streak_bonuses, msg_avg_length, total_msg_count, total_msg_length))
+                await db.execute(SAVE_USER_SQL, (user_id, user_name, gold, last_earned, consecutive_days, last_post_date, media_bonuses, streak_bonuses, msg_avg_length, total_msg_count, total_msg_length))
                 await db.commit()
                 print('Vault data saved successfully')  # Debug Print
         except Exception as e:
@@ -171,18 +303,15 @@ class Forgesight_DB_Manager:
         
 
     async def log_transaction(self, timestamp, user_id, total_gold_earned, channel_id, base_gold, streak_bonus, media_bonus, subscriber_bonus, message_length):
-        async with aiosqlite.connect('forgesight.db') as db:
-            await db.execute('''
-                INSERT INTO transaction_log (timestamp, user_id, total_gold_earned, channel_id, base_gold, streak_bonus, media_bonus, subscriber_bonus, message_length)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (timestamp, user_id, total_gold_earned, channel_id, base_gold, streak_bonus, media_bonus, subscriber_bonus, message_length))
+        async with self as db:
+            await db.execute(LOG_TRANSACTION_SQL, (timestamp, user_id, total_gold_earned, channel_id, base_gold, streak_bonus, media_bonus, subscriber_bonus, message_length))
             await db.commit()
             
     async def create_new_user(self, user_id, user_name, gold=0, last_earned=0, consecutive_days=0, last_post_date=None, media_bonuses=0, streak_bonuses=0, msg_avg_length=0, total_msg_count=0, total_msg_length=0):
-        async with aiosqlite.connect('forgesight.db') as db:
+        async with self as db:
             await db.execute('''
                 INSERT INTO user_data (user_id, user_name, gold, last_earned, consecutive_days, last_post_date, media_bonuses, streak_bonuses, msg_avg_length, total_msg_count, total_msg_length)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (user_id, user_name, gold, last_earned, consecutive_days, last_post_date, media_bonuses, streak_bonuses, msg_avg_length, total_msg_count, total_msg_length))
             await db.commit()
             if self.logger:
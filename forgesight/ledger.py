@@ -0,0 +1,233 @@
+import asyncio
+import json
+import os
+
+from database import SAVE_USER_SQL, LOG_TRANSACTION_SQL
+
+# The order SAVE_USER_SQL and LOG_TRANSACTION_SQL take their values in
+USER_COLUMNS = ('user_id', 'user_name', 'gold', 'last_earned', 'consecutive_days', 'last_post_date', 'media_bonuses', 'streak_bonuses', 'msg_avg_length', 'total_msg_count', 'total_msg_length')
+TRANSACTION_COLUMNS = ('timestamp', 'user_id', 'total_gold_earned', 'channel_id', 'base_gold', 'streak_bonus', 'media_bonus', 'subscriber_bonus', 'message_length')
+
+# The last journal entry that made it into the database. It's written in the
+# same transaction as the entries, which is what makes replay exact.
+CREATE_LEDGER_STATE_SQL = '''
+                CREATE TABLE IF NOT EXISTS ledger_state (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    last_seq INTEGER NOT NULL
+                )
+            '''
+LOAD_LEDGER_SEQ_SQL = 'SELECT last_seq FROM ledger_state WHERE id = 0'
+SAVE_LEDGER_SEQ_SQL = 'REPLACE INTO ledger_state (id, last_seq) VALUES (0, ?)'
+
+
+class GoldLedger:
+    """
+    Keeps users' gold in memory and writes it to the database behind the bot
+
+    record() updates the cached user, appends the change to a journal file and
+    queues it. The queue is written in one transaction every flush_ms, or as
+    soon as max_events changes are waiting, so a busy chat costs one commit
+    per flush rather than one per message. Each journal line carries a
+    sequence number; the database remembers the last one it has, and on
+    start() anything after it is replayed, so a crash loses nothing and
+    applies nothing twice. Call close() on shutdown to write what's left.
+
+    record() only swaps the user into the cache once the change is journaled,
+    so callers should pass an updated copy rather than change the cached dict.
+    """
+
+    def __init__(self, db_manager, journal_path='forgesight.journal', flush_ms=250, max_events=500, logger=None):
+        self.db_manager = db_manager
+        self.journal_path = journal_path
+        self.flushing_path = journal_path + '.flushing'
+        self.flush_interval = flush_ms / 1000
+        self.max_events = max_events
+        self.logger = logger
+        self.users = {}
+        self.flushes = 0
+        self._seq = 0
+        self._pending_users = {}
+        self._pending_transactions = []
+        self._journal = None
+        self._task = None
+        self._closing = False
+        # made in start(), so they belong to the loop the bot runs on
+        self._wake = None
+        self._flush_lock = None
+
+    async def start(self):
+        if self._task is not None:
+            return
+
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._closing = False
+        await self.db_manager.connect()
+        await self.replay()
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is None:
+            return
+
+        # not cancelled, as a flush cut off mid-commit can't tell whether
+        # its batch made it; the loop finishes the one it's in and stops
+        self._closing = True
+        self._wake.set()
+        await self._task
+        self._task = None
+
+        try:
+            await self.flush()
+        finally:
+            self._journal.close()
+            self._journal = None
+
+    async def get(self, user_id, user_name):
+        user_id = str(user_id)
+        user_data = self.users.get(user_id)
+        if user_data is None:
+            user_data = await self.db_manager.load_vault_data(user_id, user_name)
+            # someone else may have loaded and changed them while we waited
+            if user_data and user_id not in self.users:
+                user_data['user_id'] = user_id
+                self.users[user_id] = user_data
+            user_data = self.users.get(user_id, user_data)
+        return user_data
+
+    def record(self, user_data, transaction=None):
+        if self._journal is None:
+            raise RuntimeError('GoldLedger.start() has not been called')
+
+        user_id = str(user_data['user_id'])
+        row = {column: user_data.get(column) for column in USER_COLUMNS}
+        row['user_id'] = user_id
+
+        # nothing changes in memory until the entry is in the journal
+        seq = self._seq + 1
+        entry = {'seq': seq, 'user': row}
+        if transaction is not None:
+            entry['transaction'] = transaction
+        self._journal.write(json.dumps(entry) + '\n')
+        self._journal.flush()
+        self._seq = seq
+
+        self.users[user_id] = user_data
+        self._pending_users[user_id] = row
+        if transaction is not None:
+            self._pending_transactions.append(transaction)
+        if len(self._pending_users) + len(self._pending_transactions) >= self.max_events:
+            self._wake.set()
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending_users and not self._pending_transactions:
+                return
+
+            users, transactions, seq = self._pending_users, self._pending_transactions, self._seq
+            self._pending_users, self._pending_transactions = {}, []
+            self._rotate_journal()
+
+            # shielded, so a flush that's cancelled still waits to learn
+            # whether the batch was committed before putting it back
+            write = asyncio.ensure_future(self._write(users.values(), transactions, seq))
+            try:
+                await asyncio.shield(write)
+            except BaseException:
+                if not write.done():
+                    await asyncio.wait({write})
+                if write.cancelled() or write.exception() is not None:
+                    self._requeue(users, transactions)
+                else:
+                    self._flushed()
+                raise
+
+            self._flushed()
+
+    def _requeue(self, users, transactions):
+        # put the batch back behind anything recorded since; its entries are
+        # still in the .flushing file
+        users.update(self._pending_users)
+        self._pending_users = users
+        self._pending_transactions = transactions + self._pending_transactions
+
+    def _flushed(self):
+        os.remove(self.flushing_path)
+        self.flushes += 1
+
+    async def replay(self):
+        async with self.db_manager as db:
+            await db.execute(CREATE_LEDGER_STATE_SQL)
+            async with db.execute(LOAD_LEDGER_SEQ_SQL) as cursor:
+                row = await cursor.fetchone()
+            await db.commit()
+        last_seq = row[0] if row else 0
+
+        users, transactions, seq = {}, [], last_seq
+        for entry in self._read_journal():
+            if entry['seq'] <= last_seq:
+                continue
+            users[entry['user']['user_id']] = entry['user']
+            if 'transaction' in entry:
+                transactions.append(entry['transaction'])
+            seq = max(seq, entry['seq'])
+
+        if seq > last_seq:
+            await self._write(users.values(), transactions, seq)
+            if self.logger:
+                self.logger.info(f'Ledger replayed {seq - last_seq} journal entries.')
+
+        for path in (self.flushing_path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._seq = seq
+
+    async def _write(self, users, transactions, seq):
+        async with self.db_manager as db:
+            await db.executemany(SAVE_USER_SQL, [tuple(user[column] for column in USER_COLUMNS) for user in users])
+            if transactions:
+                await db.executemany(LOG_TRANSACTION_SQL, [tuple(transaction.get(column) for column in TRANSACTION_COLUMNS) for transaction in transactions])
+            await db.execute(SAVE_LEDGER_SEQ_SQL, (seq,))
+            await db.commit()
+
+    def _rotate_journal(self):
+        # Start a new journal for what's recorded during the flush. If the
+        # last flush failed, its file is still there, and this batch joins it.
+        self._journal.close()
+        if os.path.exists(self.flushing_path):
+            with open(self.journal_path, 'rb') as src, open(self.flushing_path, 'ab') as dst:
+                dst.write(src.read())
+            os.remove(self.journal_path)
+        else:
+            os.replace(self.journal_path, self.flushing_path)
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+    def _read_journal(self):
+        for path in (self.flushing_path, self.journal_path):
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # a line cut short by the crash, which was never flushed
+                        continue
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self._closing:
+                # close() writes what's left itself, and reports if that fails
+                return
+
+            try:
+                await self.flush()
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f'Error flushing the gold ledger: {e}')
@@ -16,6 +16,8 @@ from PIL import Image, ImageDraw, ImageFont
 from io import BytesIO
 from datetime import datetime
 from database import Forgesight_DB_Manager
+from ledger import GoldLedger
+from config_cache import GuildConfigCache
 import sqlite3
 import json
 import datetime
@@ -61,6 +63,12 @@ load_dotenv()
 # Define the database manager object
 db_manager = Forgesight_DB_Manager('forgesight.db', logger)
 
+# Users' gold lives here while the bot runs, and is written to the database in batches
+ledger = GoldLedger(db_manager, 'forgesight.journal', logger=logger)
+
+# Each guild's reward settings, kept in memory; the config commands invalidate their guild
+guild_configs = GuildConfigCache(db_manager, logger)
+
 # Create a variable for bot commands which can be used in the help command
 bot_commands = [command.name for command in bot.commands]
 
@@ -203,7 +211,7 @@ async def sync(Interaction: discord.Interaction):
 async def balance(Interaction: discord.Interaction):
     member = Interaction.user
     user_name = member.display_name# Set the member to the user who triggered the command
-    user_data = await db_manager.load_vault_data(member.id, user_name)  # Fetch user data from the database
+    user_data = await ledger.get(member.id, user_name)  # Fetch user data from the ledger
    
     if user_data:
         gold_balance = user_data['gold']  # Adjust the index based on your table structure
@@ -327,6 +335,7 @@ async def set_min_message_length(Interaction: discord.Interaction, new_length: i
         async with db_manager as db:
             await db.execute("UPDATE config SET min_message_length = ? WHERE guild_id = ?", (new_length, str(guild_id)))
             await db.commit()
+            guild_configs.invalidate(guild_id)
 
         await Interaction.response.send_message(
             f"Minimum message length set to {new_length}.",
@@ -360,6 +369,7 @@ async def set_subscriberbonus(Interaction: discord.Interaction, subscriber_bonus
         async with db_manager as db:
             await db.execute("UPDATE config SET subscriber_bonus = ? WHERE guild_id = ?", (subscriber_bonus, str(guild_id)))
             await db.commit()
+            guild_configs.invalidate(guild_id)
 
         await Interaction.response.send_message(
             f"Subscriber bonus set to {subscriber_bonus}.",
@@ -392,6 +402,7 @@ async def set_mediabonus(Interaction: discord.Interaction, media_bonus: int):
         async with db_manager as db:
             await db.execute("UPDATE config SET media_bonus = ? WHERE guild_id = ?", (media_bonus, str(guild_id)))
             await db.commit()
+            guild_configs.invalidate(guild_id)
 
         await Interaction.response.send_message(
             f"Media bonus set to {media_bonus}.",
@@ -431,6 +442,7 @@ async def toggle_rewards(Interaction: discord.Interaction, toggle: str):
         async with db_manager as db:
             await db.execute("UPDATE config SET rewards_enabled = ? WHERE guild_id = ?", (1 if toggle == "on" else 0, str(guild_id)))
             await db.commit()
+            guild_configs.invalidate(guild_id)
         await Interaction.response.send_message(
             "Gold rewards have been turned on." if toggle == "on" else "Gold rewards have been turned off.", ephemeral=False
         )
@@ -466,6 +478,7 @@ async def set_reward_timeout(Interaction: discord.Interaction, timeout: int):
         async with db_manager as db: 
             await db.execute("UPDATE config SET reward_timeout = ? WHERE guild_id = ?", (timeout, str(guild_id)))
             await db.commit()
+            guild_configs.invalidate(guild_id)
         await Interaction.response.send_message(f"Reward timeout set to {timeout} seconds.", ephemeral=False)
         logger.info(f"Message reward timeout set to {timeout} seconds by {Interaction.user}")
     except Exception as e:
@@ -489,6 +502,7 @@ async def toggle_channel_id_restriction(Interaction: discord.Interaction, toggle
         async with db_manager as db:
             await db.execute("UPDATE config SET channel_id_restriction = ? WHERE guild_id = ?", (1 if toggle == "on" else 0, str(guild_id)))
             await db.commit()
+            guild_configs.invalidate(guild_id)
             await Interaction.response.send_message(
                     "Channel Restrictions have been enabled." if toggle == "on" else "Channel Restrictions have been disabled.", ephemeral=False
                 )
@@ -511,6 +525,7 @@ async def toggle_min_message_requirement(Interaction: discord.Interaction, toggl
         async with db_manager as db:
             await db.execute("UPDATE config SET  min_message_requirement = ? WHERE guild_id = ?", (1 if toggle == "on" else 0, str(guild_id)))
             await db.commit()
+            guild_configs.invalidate(guild_id)
             await Interaction.response.send_message(
                     "Message Length Requirements have been enabled." if toggle == "on" else "Message Length Requirements have been disabled.", ephemeral=False
                 )
@@ -532,6 +547,7 @@ async def set_streak_bonus (Interaction: discord.Interaction, streak_bonus: int)
         async with db_manager as db: 
             await db.execute('UPDATE config SET streak_bonus = ? WHERE guild_id = ?', (streak_bonus, str(guild_id)))
             await db.commit()
+            guild_configs.invalidate(guild_id)
             await Interaction.response.send_message(f"Streak bonus set to {streak_bonus}.", ephemeral=False)
             logger.info(f"Streak bonus was set to {streak_bonus} for guild {guild_id}")
     except Exception as e:
@@ -581,6 +597,8 @@ async def commands_list(Interaction: discord.Interaction):
 )
 async def get_leaderboard(interaction: discord.Interaction):
     try:
+        # Write out any gold still waiting in the ledger, so the ranking is current
+        await ledger.flush()
         # Connect to the database
         with sqlite3.connect("forgesight.db") as conn:
             cursor = conn.cursor()
@@ -641,50 +659,73 @@ async def on_message(event):
     user_name = str(event.author.display_name)
 
     try:
-        config_vals = await db_manager.load_config(guild_id)
-        if not config_vals:
+        # Comes from memory; the database is only asked for guilds it hasn't seen
+        reward_params = await guild_configs.get(guild_id)
+        if reward_params is None:
             logger.warning(f"No configuration found for guild {guild_id}")
             return
 
-        user_data = await db_manager.load_vault_data(user_id, user_name)
-        if not user_data:
-            logger.warning(f"No user data found for user {user_id}")
+        if not reward_params.rewards_enabled:
             return
 
         # Check channel restrictions
-        if config_vals['channel_id_restriction'] == 1 and event.channel.id not in config_vals['allowed_channels']:
+        if reward_params.allowed_channels is not None and event.channel.id not in reward_params.allowed_channels:
             logger.debug(f"Message in channel {event.channel.id} is not allowed for rewards.")
             return
 
         # Check message length requirement
-        if config_vals['min_message_requirement'] == 1 and len(event.content) < config_vals['min_message_length']:
+        if len(event.content) < reward_params.min_length:
             logger.debug("Message was not long enough for rewards")
             return
 
+        user_data = await ledger.get(user_id, user_name)
+        if not user_data:
+            logger.warning(f"No user data found for user {user_id}")
+            return
+
         # Check reward timeout
-        last_earned_timestamp = float(user_data.get('last_earned', 0))
-        if time.time() - last_earned_timestamp < config_vals['reward_timeout']:
+        last_earned_timestamp = float(user_data.get('last_earned') or 0)
+        if time.time() - last_earned_timestamp < reward_params.reward_timeout:
             logger.info(f"{event.author} has already earned gold recently.")
             return
 
         # Calculate gold award
-        current_gold_award = config_vals['base_gold']
-        if any(role.id == config_vals.get('subscriber_role_id') for role in event.author.roles):
-            current_gold_award += int(config_vals.get('subscriber_bonus', 0))
+        base_gold = reward_params.base_gold
+        subscriber_bonus = 0
+        media_bonus = 0
+        if reward_params.subscriber_role_id is not None and any(role.id == reward_params.subscriber_role_id for role in event.author.roles):
+            subscriber_bonus = reward_params.subscriber_bonus
 
+        media_bonuses = int(user_data.get('media_bonuses', 0))
         if event.attachments:
-            current_gold_award += int(config_vals.get('media_bonus', 0))
-            user_data['media_bonuses'] = int(user_data.get('media_bonuses', 0)) + 1
-
-        # Update user data
-        user_data['gold'] = int(user_data.get('gold', 0)) + current_gold_award
-        user_data['last_earned'] = time.time()
-        user_data['total_msg_count'] = int(user_data.get('total_msg_count', 0)) + 1
-        user_data['msg_avg_length'] = int(user_data.get('msg_avg_length', 0)) + len(event.content)
-        user_data['last_post_date'] = datetime.date.today().isoformat()
-
-        # Save the updated user data
-        await db_manager.save_vault_data(**user_data)
+            media_bonus = reward_params.media_bonus
+            media_bonuses += 1
+        current_gold_award = base_gold + subscriber_bonus + media_bonus
+
+        # Build the updated user as a copy; the ledger swaps it in once the
+        # change is journaled, so a failed record() leaves the cached user as it was
+        user_data = dict(
+            user_data,
+            gold=int(user_data.get('gold', 0)) + current_gold_award,
+            last_earned=time.time(),
+            media_bonuses=media_bonuses,
+            total_msg_count=int(user_data.get('total_msg_count', 0)) + 1,
+            msg_avg_length=int(user_data.get('msg_avg_length', 0)) + len(event.content),
+            last_post_date=datetime.date.today().isoformat(),
+        )
+
+        # Record the reward; the ledger writes it to the database with the next batch
+        ledger.record(user_data, {
+            'timestamp': datetime.datetime.now().isoformat(),
+            'user_id': user_id,
+            'total_gold_earned': current_gold_award,
+            'channel_id': str(event.channel.id),
+            'base_gold': base_gold,
+            'streak_bonus': 0,
+            'media_bonus': media_bonus,
+            'subscriber_bonus': subscriber_bonus,
+            'message_length': len(event.content),
+        })
         logger.info('Forgesight Reward Recorded: ' + str(user_data))
 
     except Exception as e:
@@ -697,15 +738,12 @@ async def grant_gold(Interaction: discord.Interaction, user: discord.Member, amo
     await Interaction.response.defer()
     user_id = str(user.id)
     user_name = user.display_name
-    user_data = await db_manager.load_vault_data(user_id, user_name)
+    user_data = await ledger.get(user_id, user_name)
     
     if user_data:
         new_gold = user_data['gold'] + amount 
+        ledger.record(dict(user_data, gold=new_gold))
         logger.info(f"Granted {amount} gold to {user}. New gold: {new_gold}")
-
-        user_data['gold'] = new_gold
-
-        await db_manager.save_vault_data(**user_data) 
         await Interaction.followup.send(f"{amount} gold granted to {user.mention}.", ephemeral=False)
     else:
         await db_manager.create_new_user(user_id, user_name, gold=amount)
@@ -717,13 +755,12 @@ async def deduct_gold(Interaction: discord.Interaction, user: discord.Member, am
     await Interaction.response.defer()
     user_id = str(user.id)
     user_name = user.display_name
-    user_data = await db_manager.load_vault_data(user_id, user_name)
+    user_data = await ledger.get(user_id, user_name)
 
     if user_data:
         new_gold = user_data['gold'] - amount
-        user_data['gold'] = new_gold
+        ledger.record(dict(user_data, gold=new_gold))
         logger.info(f"Deducted {amount} gold from {user}. New gold: {new_gold}")
-        await db_manager.save_vault_data(**user_data)  
         await Interaction.followup.send(f"{amount} gold deducted {user.mention}.", ephemeral=False)
     else:
         await Interaction.followup.send(f"No data found for {user.mention}.", ephemeral=True)
@@ -765,6 +802,7 @@ async def say(Interaction: discord.Interaction, thing_to_say: str):
 @is_mod_or_admin()
 async def gold_reward(Interaction: discord.Interaction, number_of_gold: int):
     await db_manager.update_config_value("base_gold", number_of_gold)
+    guild_configs.invalidate()
     await Interaction.response.send_message(
         f"Gold reward per message set to {number_of_gold}", ephemeral=False
     )
@@ -776,12 +814,21 @@ async def on_error(event_name, *args, **kwargs):
     with open('error_log.txt', 'a', encoding='utf-8') as f:
         f.write(f"Unhandled message: {args[0]}\n")
 
+# Open the database, replay the ledger and load the guild configs once, before
+# the bot connects; on_ready runs again on every reconnect, and events can
+# arrive before it
+async def setup_hook():
+    await db_manager.connect()
+    await db_manager.initialize_db()
+    await ledger.start()
+    await guild_configs.load()
+    print('Database initialized')
+
+bot.setup_hook = setup_hook
+
 # Do some stuff when the bot logs in
 @bot.event
 async def on_ready():
-    db_manager = Forgesight_DB_Manager('forgesight.db', logger)
-    await db_manager.initialize_db()
-    print('Database initialized')
     logger.info(f"{bot} has connected to Discord.")
     print(f"Logged in as {bot.user.name}")
     print(f"Discord.py API version: {discord.__version__}")
@@ -797,7 +844,18 @@ async def on_ready():
     except Exception as e:
         print(e)
 
-# Run the bot with the discord token
+# Run the bot with the discord token, writing out the ledger and closing the database connections when it stops
+async def main(token):
+    async with bot:
+        try:
+            await bot.start(token)
+        finally:
+            try:
+                await ledger.close()
+            finally:
+                await db_manager.close()
+
 if __name__ == "__main__":
     token = os.getenv("DISCORD_TOKEN")
-    bot.run(token)
+    discord.utils.setup_logging()
+    asyncio.run(main(token))
@@ -0,0 +1,227 @@
+"""
+Opt-in usage statistics for calebj cogs
+
+Nothing here runs unless the bot owner turns it on, with [p]quote analytics
+on or [p]gvanalytics on, and the cog only imports this module in the
+background after startup. When on, the cog reports loads and command
+names, with hashed user and bot IDs, to a Matomo (Piwik) server. The
+choice is stored in data/lib_calebj/analytics.json, which every calebj
+cog shares.
+"""
+import asyncio
+from base64 import b64encode
+from collections import deque
+from hashlib import sha1
+import os
+import platform
+import sys
+
+import aiohttp
+from discord.ext import commands
+
+from utils.checks import is_owner
+from utils.dataIO import dataIO
+
+
+PATH = 'data/lib_calebj/'
+JSON = PATH + 'analytics.json'
+
+PRIVACY = ("When enabled, your bot will send anonymous data about which cogs "
+           "you've loaded and how many of each command you run, along with "
+           "which OS and python version you're running.\n"
+           "Nobody but me has access to the data, and I won't share it.\n\n"
+           "You can read my full privacy policy here: "
+           "<https://github.com/calebj/calebj-cogs/blob/master/PRIVACY.md>.\n"
+           "Other questions? DM <@!152111727402680320> or email me@calebj.io .")
+
+
+def _load() -> dict:
+    return dataIO.load_json(JSON) if dataIO.is_valid_json(JSON) else {}
+
+
+def consented() -> bool:
+    """Whether the owner has turned analytics on; undecided counts as off"""
+    return _load().get('consent') is True
+
+
+def set_consent(bot, on: bool):
+    data = _load()
+    data['consent'] = on
+
+    if not os.path.exists(PATH):
+        os.makedirs(PATH)
+
+    dataIO.save_json(JSON, data)
+    core = bot.get_cog('GVAnalytics')
+
+    if core:
+        core.data['consent'] = on
+
+
+def anon(value: str, hexdigest: bool = False) -> str:
+    digest = sha1(value.encode())
+    return digest.hexdigest() if hexdigest else b64encode(digest.digest()).decode()
+
+
+class GVAnalytics:
+    """
+    The sender shared by every calebj cog on a bot
+
+    Registered as its own cog by whichever cog starts it first, and replaced
+    by newer versions. Events are queued and sent one at a time while
+    analytics are on; failed sends are retried.
+    """
+
+    __version__ = 1.35
+    STATS_URL = 'https://stats.calebj.io/piwik.php'
+    BASE_URL = 'https://red.calebj.io/'
+    PARAM_BASE = {'idsite': 3, 'rec': 1, 'apiv': 1}
+
+    def __init__(self, bot, events=()):
+        self.__module__ = 'cogs.lib_calebj.analytics'
+        self.bot = bot
+        self.terminate = False
+        self.params_base = {}
+        self.queue = deque(events, maxlen=512)
+        self.gvanalytics.help = 'Enable or disable analytics for calebj cogs\n\n' + PRIVACY
+        self.data = _load()
+        self.task = self.bot.loop.create_task(self._start())
+
+    @classmethod
+    def start(cls, bot) -> 'GVAnalytics':
+        cog = cls(bot)
+        bot.add_cog(cog)
+        return cog
+
+    @classmethod
+    def replace(cls, oldcog):
+        if cls.__version__ <= oldcog.__version__:
+            return None
+
+        # 1.32 and older named their attributes differently
+        if oldcog.__version__ > 1.32:
+            cog = cls(oldcog.bot, oldcog.queue)
+        else:
+            cog = cls(oldcog.b, oldcog.q)
+
+        cog.bot.remove_cog(oldcog.__class__.__name__)
+        cog.bot.add_cog(cog)
+        return cog
+
+    def upgrade(self, newcls):
+        return newcls.replace(self)
+
+    def __unload(self):
+        self.terminate = True
+        self.task.cancel()
+
+    def send(self, iface, cat, res=None, act=None, value=None, user=None, name_first=False) -> bool:
+        if self.terminate:
+            return False
+
+        self.queue.append((iface, cat, res, act, value, user, name_first))
+        return True
+
+    def _update_base_params(self, owner_id):
+        bot_id = self.bot.user.id
+        self.params_base = dict(self.PARAM_BASE, uid=anon(owner_id), _id=anon(bot_id, True)[:16],
+                                dimension2=anon(bot_id))
+        self.params_base['ua'] = ' '.join(('Python/%s' % platform.python_version(),
+                                           '(%s %s)' % (platform.system(), platform.release()),
+                                           '%s/%s' % (self.__class__.__name__, self.__version__)))
+
+    async def _start(self):
+        try:
+            await self.bot.wait_until_ready()
+
+            if self.bot.user.bot:
+                owner = await self.bot.get_user_info(self.bot.settings.owner)
+            else:
+                owner = self.bot.user
+
+            self._update_base_params(owner.id)
+            await self._run()
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self):
+        async with aiohttp.ClientSession() as session:
+            while not self.terminate:
+                await asyncio.sleep(0.1)
+
+                if self.data.get('consent') is not True or not self.queue:
+                    continue
+
+                event = self.queue.popleft()
+
+                if not await self._send(session, event):
+                    self.queue.append(event)
+
+    async def _send(self, session, event) -> bool:
+        try:
+            async with session.get(self.STATS_URL, params=self._get_params(event), timeout=10) as resp:
+                return resp.status in {200, 204}
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    def _get_params(self, event) -> dict:
+        iface, cat, res, act, value, user, name_first = event
+        params = self.params_base.copy()
+        path = [cat]
+
+        if act if name_first else res:
+            path.extend([act, res] if name_first else [res, act])
+
+        action = '/'.join(p for p in path if p)
+        params.update({'act_name': action, 'url': self.BASE_URL + action, 'dimension1': iface.version})
+
+        if user is not None:
+            params['uid'] = anon(user)
+
+        return params
+
+    @commands.command(name='gvanalytics')
+    @is_owner()
+    async def gvanalytics(self, on_off: bool = None):
+        if on_off is not None:
+            set_consent(self.bot, on_off)
+            verb = 'have been'
+        else:
+            on_off = self.data.get('consent')
+            verb = 'are currently'
+
+        await self.bot.say('Analytics %s %s.' % (verb, 'enabled' if on_off else 'disabled'))
+
+
+class AnalyticsInterface:
+    def __init__(self, bot):
+        self.bot = bot
+        self.version = None
+        self.project = None
+
+    def send_action(self, cat, res=None, act=None, value=None, uid=None, name_first=False) -> bool:
+        core = self._get_core()
+        return bool(core) and core.send(self, cat, res, act, value, uid, name_first)
+
+    def _get_core(self) -> GVAnalytics:
+        cog = self.bot.get_cog('GVAnalytics')
+
+        if not cog:
+            return GVAnalytics.start(self.bot)
+
+        return GVAnalytics.replace(cog) or cog
+
+
+class CogAnalytics(AnalyticsInterface):
+    """Reports a cog's load and its commands"""
+
+    def __init__(self, wrapped):
+        super().__init__(wrapped.bot)
+        module = sys.modules.get(wrapped.__module__)
+        module_version = getattr(module, '__version__', None)
+        self.version = getattr(wrapped, '__version__', module_version)
+        self.project = getattr(wrapped, '__name__', wrapped.__class__.__name__)
+        self.send_action('cog', self.project, 'load', name_first=True)
+
+    def command(self, ctx, value=None):
+        self.send_action('command', self.project, ctx.command.qualified_name, value, uid=ctx.message.author.id)
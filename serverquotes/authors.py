@@ -0,0 +1,219 @@
+from collections import Counter
+import re
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+
+AUTHOR_NAMES_SQL = """
+SELECT q.server_id, q.author_id, q.author_name, u.username, n.nickname
+FROM (SELECT server_id, author_id, author_name FROM quotes GROUP BY server_id, author_id, author_name) AS q
+LEFT JOIN users u ON u.user_id = q.author_id
+LEFT JOIN nicknames n ON n.server_id = q.server_id AND n.user_id = q.author_id;
+"""
+
+_SPACES = re.compile(r'\s+')
+
+
+# user_id is set for members, who are filtered by ID; author_name for
+# non-member authors, who are filtered by name. name is the name that matched.
+AuthorMatch = NamedTuple('AuthorMatch', [('score', float), ('user_id', Optional[int]),
+                                         ('author_name', Optional[str]), ('name', str)])
+
+
+def normalize(name: str) -> str:
+    return _SPACES.sub(' ', name.casefold()).strip()
+
+
+def trigrams(name: str) -> FrozenSet[str]:
+    padded = '  %s ' % name
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class AuthorIndex:
+    """
+    Trigram index over the names of quoted authors, for fuzzy lookups
+
+    Members are indexed under their username and, per server, their
+    nickname; non-member authors under the author_name they were quoted
+    with. Scores are the Jaccard similarity of the trigram sets, with a
+    bonus for names that start with the query.
+
+    The index is rebuilt lazily after invalidate(), which is for bulk
+    changes. New quote authors are added as they are quoted, and members'
+    names are swapped in place by update_names() as they change.
+    """
+
+    def __init__(self):
+        # entry id -> (server_id, user_id, author_name, display name, trigram count), or None once removed;
+        # removed ids are reused by later names, so renames don't grow the list
+        self._entries = []  # type: List[Optional[Tuple[int, Optional[int], Optional[str], str, int]]]
+        self._free = []  # type: List[int]
+        self._seen = {}  # type: Dict[tuple, int]
+        self._grams = {}  # type: Dict[str, Dict[int, Set[int]]]
+        # (server_id, user_id) -> [username, nickname], and user_id -> the servers they're quoted in
+        self._members = {}  # type: Dict[Tuple[int, int], List[Optional[str]]]
+        self._servers = {}  # type: Dict[int, Set[int]]
+        self.dirty = True
+        self.loads = 0
+        self.updates = 0
+
+    def __len__(self):
+        return len(self._seen)
+
+    def invalidate(self):
+        self.dirty = True
+
+    def load(self, *cons):
+        self._entries.clear()
+        self._free.clear()
+        self._seen.clear()
+        self._grams.clear()
+        self._members.clear()
+        self._servers.clear()
+
+        for con in cons:
+            for server_id, author_id, author_name, username, nickname in con.execute(AUTHOR_NAMES_SQL):
+                self.add(server_id, author_id, author_name, username, nickname)
+
+        self.dirty = False
+        self.loads += 1
+
+    def add(self, server_id: int, author_id: Optional[int], author_name: Optional[str],
+            username: Optional[str] = None, nickname: Optional[str] = None):
+        """Indexes an author in a server, under its author_name or, for members, their names"""
+        if author_id is None:
+            self._add_name(server_id, None, author_name, author_name)
+            return
+
+        key = (server_id, author_id)
+        names = self._members.get(key)
+
+        if names is None:
+            self._members[key] = [username, nickname]
+            self._servers.setdefault(author_id, set()).add(server_id)
+        else:
+            names[0] = username or names[0]
+            names[1] = nickname or names[1]
+
+        for name in (username, nickname):
+            self._add_name(server_id, author_id, None, name)
+
+    def update_names(self, users: Dict[int, tuple], nicknames: Dict[Tuple[int, int], Optional[str]]):
+        """
+        Reindexes the members whose names changed
+
+        Takes NameSync's flushed batches: user ID -> (username, discriminator,
+        avatar), and (server ID, user ID) -> nickname. Members who aren't
+        quoted anywhere are ignored.
+        """
+        changed = {}  # type: Dict[Tuple[int, int], List[Optional[str]]]
+
+        for user_id, user in users.items():
+            for server_id in self._servers.get(user_id, ()):
+                changed[server_id, user_id] = [user[0], self._members[server_id, user_id][1]]
+
+        for key, nickname in nicknames.items():
+            if key in self._members:
+                changed.setdefault(key, list(self._members[key]))[1] = nickname
+
+        for (server_id, user_id), names in changed.items():
+            if names == self._members[server_id, user_id]:
+                continue
+
+            for name in self._members[server_id, user_id]:
+                self._remove_name(server_id, user_id, name)
+
+            self._members[server_id, user_id] = names
+
+            for name in names:
+                self._add_name(server_id, user_id, None, name)
+
+            self.updates += 1
+
+    def _add_name(self, server_id: int, user_id: Optional[int], author_name: Optional[str], name: Optional[str]):
+        if not name:
+            return
+
+        norm = normalize(name)
+        key = (server_id, user_id, norm)
+
+        if not norm or key in self._seen:
+            return
+
+        grams = trigrams(norm)
+        value = (server_id, user_id, author_name, name, len(grams))
+
+        if self._free:
+            entry = self._free.pop()
+            self._entries[entry] = value
+        else:
+            entry = len(self._entries)
+            self._entries.append(value)
+
+        self._seen[key] = entry
+
+        for gram in grams:
+            self._grams.setdefault(gram, {}).setdefault(server_id, set()).add(entry)
+
+    def _remove_name(self, server_id: int, user_id: int, name: Optional[str]):
+        norm = name and normalize(name)
+        entry = self._seen.pop((server_id, user_id, norm), None)
+
+        if entry is None:
+            return
+
+        self._entries[entry] = None
+        self._free.append(entry)
+
+        for gram in trigrams(norm):
+            postings = self._grams[gram]
+            postings[server_id].discard(entry)
+
+            if not postings[server_id]:
+                del postings[server_id]
+
+                if not postings:
+                    del self._grams[gram]
+
+    def search(self, query: str, server_ids: Optional[Iterable[int]] = None, limit: int = 5,
+               min_score: float = 0.3) -> List[AuthorMatch]:
+        """Best matches for query among authors in server_ids (all servers if None), best first"""
+        norm = normalize(query)
+
+        if not norm:
+            return []
+
+        scope = None if server_ids is None else set(server_ids)
+        grams = trigrams(norm)
+        shared = Counter()
+
+        for gram in grams:
+            postings = self._grams.get(gram)
+
+            if not postings:
+                continue
+            elif scope is None:
+                for entries in postings.values():
+                    shared.update(entries)
+            else:
+                for sid in scope.intersection(postings):
+                    shared.update(postings[sid])
+
+        # the best score per author, across their names and servers
+        best = {}  # type: Dict[tuple, AuthorMatch]
+
+        for entry, count in shared.items():
+            server_id, user_id, author_name, name, size = self._entries[entry]
+            score = count / (len(grams) + size - count)
+
+            if normalize(name).startswith(norm):
+                score = min(1.0, score + 0.2)
+
+            if score < min_score:
+                continue
+
+            target = (user_id, author_name and author_name.casefold())
+
+            if target not in best or score > best[target].score:
+                best[target] = AuthorMatch(score, user_id, author_name, name)
+
+        return sorted(best.values(), key=lambda m: (-m.score, m.name))[:limit]
@@ -0,0 +1,149 @@
+from bisect import bisect_right
+from typing import Dict, List, Optional, Sequence
+
+
+class QuoteSegment:
+    """
+    A contiguous run of browsable quotes sharing one keyset column
+
+    Linked-server listings are made of one segment per server (keyed on
+    ``server_quote_id``), while global listings are a single segment keyed
+    on ``quote_id``.
+    """
+
+    __slots__ = ('kwargs', 'key', 'count', 'start')
+
+    def __init__(self, kwargs: dict, key: str, count: int, start: int):
+        self.kwargs = kwargs
+        self.key = key
+        self.count = count
+        self.start = start
+
+
+class QuoteBrowser:
+    """
+    Lazily pages through quote records using keyset pagination
+
+    Records are fetched on demand in small chunks with ``key > ?`` and
+    ``key < ?`` range scans on the segment's index, and only a window of
+    records around the current position is kept in memory. Supports len()
+    and indexing so it can be handed to embed_menu in place of a list.
+    """
+
+    def __init__(self, cog, segments: Sequence[QuoteSegment], chunk_size: int = 10, window: int = 25):
+        self.cog = cog
+        self.segments = list(segments)
+        self.chunk_size = chunk_size
+        self.window = window
+        self._starts = [s.start for s in self.segments]
+        self._cache = {}  # type: Dict[int, object]
+        self.queries = 0
+
+    def __len__(self):
+        if not self.segments:
+            return 0
+
+        last = self.segments[-1]
+        return last.start + last.count
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __getitem__(self, pos: int):
+        total = len(self)
+
+        if pos < 0:
+            pos += total
+
+        if not 0 <= pos < total:
+            raise IndexError('quote browser index out of range')
+
+        record = self._cache.get(pos)
+
+        if record is None:
+            self._fetch(pos)
+            record = self._cache.get(pos)
+
+        self._trim(pos)
+
+        if record is None:
+            raise IndexError('quote at position %i no longer exists' % pos)
+
+        return record
+
+    def _segment_for(self, pos: int) -> QuoteSegment:
+        return self.segments[bisect_right(self._starts, pos) - 1]
+
+    def _nearest_cached(self, pos: int, seg: QuoteSegment, direction: int) -> Optional[int]:
+        # closest cached position on the given side of pos, within this segment
+        lo, hi = seg.start, seg.start + seg.count - 1
+        reach = self.chunk_size * 2
+
+        for dist in range(1, reach + 1):
+            p = pos - dist * direction
+
+            if not lo <= p <= hi:
+                break
+            elif p in self._cache:
+                return p
+
+        return None
+
+    def _query(self, seg: QuoteSegment, wheres: List[str], params: list, order: str, limit: int,
+               offset: int = 0) -> list:
+        where, params = self.cog._build_where(seg.kwargs, params=params, wheres=wheres)
+        sql = "SELECT * FROM quotes_view_230 %s ORDER BY `%s` %s LIMIT ? OFFSET ?" % (where, seg.key, order)
+        route = self.cog._route(seg.kwargs)
+        self.queries += 1
+
+        if not self.cog.store.merges(**route):
+            params.extend((limit, offset))
+            return self.cog.store.read(sql, params, **route)
+
+        # merged from several groups of shards, each of which has to return everything up to the offset
+        params.extend((limit + offset, 0))
+        rows = self.cog.store.read(sql, params, key=lambda r: r[seg.key], reverse=order == 'DESC',
+                                   limit=limit + offset, **route)
+        return rows[offset:]
+
+    def _fetch(self, pos: int):
+        seg = self._segment_for(pos)
+        first, last = seg.start, seg.start + seg.count - 1
+        chunk = self.chunk_size
+
+        before = self._nearest_cached(pos, seg, 1)
+        after = self._nearest_cached(pos, seg, -1)
+
+        if before is not None:
+            # walk forward from the closest record we already have
+            bound = self._cache[before][seg.key]
+            limit = min(pos - before + chunk - 1, last - before)
+            rows = self._query(seg, ['`%s` > ?' % seg.key], [bound], 'ASC', limit)
+            self._store(before + 1, rows, 1)
+        elif after is not None:
+            bound = self._cache[after][seg.key]
+            limit = min(after - pos + chunk - 1, after - first)
+            rows = self._query(seg, ['`%s` < ?' % seg.key], [bound], 'DESC', limit)
+            self._store(after - 1, rows, -1)
+        elif pos - first < chunk:
+            rows = self._query(seg, [], [], 'ASC', min(pos - first + chunk, seg.count))
+            self._store(first, rows, 1)
+        elif last - pos < chunk:
+            rows = self._query(seg, [], [], 'DESC', min(last - pos + chunk, seg.count))
+            self._store(last, rows, -1)
+        else:
+            # random jump into the middle; the offset scan only touches the index
+            offset = pos - first - chunk // 2
+            rows = self._query(seg, [], [], 'ASC', chunk, offset)
+            self._store(first + offset, rows, 1)
+
+    def _store(self, start: int, rows: list, step: int):
+        for i, row in enumerate(rows):
+            self._cache[start + i * step] = row
+
+    def _trim(self, pos: int):
+        window = self.window
+
+        if len(self._cache) > window * 2:
+            for p in [p for p in self._cache if abs(p - pos) > window]:
+                del self._cache[p]
@@ -0,0 +1,121 @@
+from collections import OrderedDict
+import sys
+from typing import Dict, Hashable, Iterable, List, Optional
+
+
+def _approx_size(value) -> int:
+    # Rough in-memory footprint of a cached result: rows, tuples and the scalars they hold
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_approx_size(v) for v in value)
+    elif hasattr(value, 'keys'):
+        return sys.getsizeof(value) + sum(sys.getsizeof(value[k]) for k in value.keys())
+    else:
+        return sys.getsizeof(value)
+
+
+class ResultCache:
+    """
+    Per-server LRU cache for query results, invalidated by a write generation
+
+    Every write to the quotes table bumps the generation; entries stored under
+    an older generation are treated as misses and dropped. Changes that only
+    affect some servers' results, such as renamed members, invalidate just
+    those servers. Each server gets its own LRU of at most max_entries
+    results, and the total approximate size of all cached results is capped
+    at max_bytes.
+    """
+
+    def __init__(self, max_entries: int = 128, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+        self._servers = {}  # type: Dict[Optional[int], OrderedDict]
+        self._server_bytes = {}  # type: Dict[Optional[int], int]
+
+    def __len__(self):
+        return sum(len(s) for s in self._servers.values())
+
+    def bump(self):
+        """Invalidates every cached result"""
+        self.generation += 1
+        self._servers.clear()
+        self._server_bytes.clear()
+        self.size = 0
+
+    def servers(self) -> List[Optional[int]]:
+        """The servers with cached results; None holds global queries"""
+        return list(self._servers)
+
+    def invalidate(self, server_ids: Iterable[Optional[int]]):
+        """Drops every cached result of the given servers"""
+        for server_id in server_ids:
+            if server_id in self._servers:
+                del self._servers[server_id]
+                self.size -= self._server_bytes.pop(server_id)
+
+    def get(self, server_id: Optional[int], key: Hashable, default=None):
+        entries = self._servers.get(server_id)
+        entry = entries and entries.get(key)
+
+        if entry is None or entry[0] != self.generation:
+            self.misses += 1
+            return default
+
+        entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def put(self, server_id: Optional[int], key: Hashable, value):
+        size = _approx_size(value)
+
+        if size > self.max_bytes:
+            return value
+
+        entries = self._servers.setdefault(server_id, OrderedDict())
+
+        if key in entries:
+            self._drop(server_id, key)
+
+        entries[key] = (self.generation, size, value)
+        self._server_bytes[server_id] = self._server_bytes.get(server_id, 0) + size
+        self.size += size
+
+        while len(entries) > self.max_entries:
+            self._drop(server_id, next(iter(entries)))
+            self.evictions += 1
+
+        while self.size > self.max_bytes:
+            # evict from whichever server is holding the most memory
+            victim = max(self._server_bytes, key=self._server_bytes.get)
+            self._drop(victim, next(iter(self._servers[victim])))
+            self.evictions += 1
+
+        return value
+
+    def _drop(self, server_id, key):
+        entries = self._servers[server_id]
+        size = entries.pop(key)[1]
+        self.size -= size
+        self._server_bytes[server_id] -= size
+
+        if not entries:
+            del self._servers[server_id]
+            del self._server_bytes[server_id]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'generation' : self.generation,
+            'entries'    : len(self),
+            'servers'    : len(self._servers),
+            'bytes'      : self.size,
+            'max_bytes'  : self.max_bytes,
+            'hits'       : self.hits,
+            'misses'     : self.misses,
+            'evictions'  : self.evictions,
+            'hit_rate'   : self.hits / lookups if lookups else 0.0
+        }
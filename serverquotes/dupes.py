@@ -0,0 +1,269 @@
+from array import array
+from hashlib import blake2b
+import re
+import struct
+from typing import Dict, List, Optional, Tuple
+from zlib import crc32
+
+
+SHINGLE = 4     # bytes per shingle
+BINS = 32       # signature length; one-permutation hashing with BINS bins
+BANDS = 8       # LSH bands of BINS // BANDS values each
+ROWS = BINS // BANDS
+
+BIN_SHIFT = 27
+VALUE_MASK = (1 << BIN_SHIFT) - 1
+EMPTY = 1 << 32
+
+# duplicate_settings.mode values
+OFF = 0
+WARN = 1
+BLOCK = 2
+
+DEFAULT_THRESHOLD = 0.8
+
+MINHASH_SQL = """
+CREATE TABLE IF NOT EXISTS quotes_minhash (
+    quote_id INTEGER PRIMARY KEY,
+    server_id INTEGER NOT NULL,
+    signature BLOB
+);
+
+CREATE TABLE IF NOT EXISTS quotes_minhash_bands (
+    bucket INTEGER NOT NULL,
+    server_id INTEGER NOT NULL,
+    quote_id INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS quotes_minhash_bands_bucket ON quotes_minhash_bands(bucket);
+CREATE INDEX IF NOT EXISTS quotes_minhash_bands_server ON quotes_minhash_bands(server_id, bucket, quote_id);
+CREATE INDEX IF NOT EXISTS quotes_minhash_bands_quote_id ON quotes_minhash_bands(quote_id);
+
+CREATE TABLE IF NOT EXISTS minhash_bands (
+    band INTEGER PRIMARY KEY
+);
+
+INSERT OR IGNORE INTO minhash_bands (band) VALUES {bands};
+
+CREATE TRIGGER IF NOT EXISTS quotes_minhash_DELETE AFTER DELETE ON quotes
+  BEGIN
+    DELETE FROM quotes_minhash WHERE quote_id = OLD.quote_id;
+  END;
+
+CREATE TRIGGER IF NOT EXISTS quotes_minhash_bands_DELETE AFTER DELETE ON quotes_minhash
+  BEGIN
+    DELETE FROM quotes_minhash_bands WHERE quote_id = OLD.quote_id;
+  END;
+
+-- these call minhash(), so they're TEMP and only fire on connections that
+-- register() it; quotes added elsewhere are signed by backfill(). Older
+-- databases had them as permanent triggers, which broke other connections.
+DROP TRIGGER IF EXISTS main.quotes_minhash_INSERT;
+DROP TRIGGER IF EXISTS main.quotes_minhash_UPDATE;
+DROP TRIGGER IF EXISTS main.quotes_minhash_bands_INSERT;
+
+CREATE TEMP TRIGGER IF NOT EXISTS quotes_minhash_INSERT AFTER INSERT ON main.quotes
+  BEGIN
+    INSERT INTO quotes_minhash (quote_id, server_id, signature)
+        VALUES (NEW.quote_id, NEW.server_id, minhash(NEW.quote));
+  END;
+
+CREATE TEMP TRIGGER IF NOT EXISTS quotes_minhash_UPDATE AFTER UPDATE ON main.quotes
+  WHEN OLD.quote IS NOT NEW.quote OR OLD.server_id IS NOT NEW.server_id
+  BEGIN
+    DELETE FROM quotes_minhash WHERE quote_id = OLD.quote_id;
+    INSERT INTO quotes_minhash (quote_id, server_id, signature)
+        VALUES (NEW.quote_id, NEW.server_id, minhash(NEW.quote));
+  END;
+
+CREATE TEMP TRIGGER IF NOT EXISTS quotes_minhash_bands_INSERT AFTER INSERT ON main.quotes_minhash
+  WHEN NEW.signature IS NOT NULL
+  BEGIN
+    INSERT INTO quotes_minhash_bands (bucket, server_id, quote_id)
+        SELECT minhash_bucket(NEW.server_id, NEW.signature, band), NEW.server_id, NEW.quote_id FROM minhash_bands;
+  END;
+""".format(bands=', '.join('(%i)' % i for i in range(BANDS)))
+
+# Kept apart from MINHASH_SQL, as settings stay in the shared database when quotes are sharded
+SETTINGS_SQL = """
+CREATE TABLE IF NOT EXISTS duplicate_settings (
+    server_id INTEGER PRIMARY KEY,
+    mode INTEGER NOT NULL DEFAULT {off},
+    threshold REAL NOT NULL DEFAULT {threshold}
+);
+""".format(off=OFF, threshold=DEFAULT_THRESHOLD)
+
+BACKFILL_SQL = """
+INSERT INTO quotes_minhash (quote_id, server_id, signature)
+    SELECT quotes.quote_id, quotes.server_id, minhash(quotes.quote) FROM quotes
+    LEFT JOIN quotes_minhash ON quotes_minhash.quote_id = quotes.quote_id
+    WHERE quotes_minhash.quote_id IS NULL
+    ORDER BY quotes.quote_id LIMIT ?;
+"""
+
+_NORMALIZE = re.compile(r'[\W_]+')
+
+
+def normalize(text: Optional[str]) -> str:
+    # case, punctuation and spacing differences don't make a quote new
+    return _NORMALIZE.sub('', text or '').lower()
+
+
+def signature(text: Optional[str]) -> Optional[bytes]:
+    """
+    One-permutation MinHash of a text's byte shingles, or None if it has no words
+
+    Each shingle is hashed once; the top bits pick a bin and the rest are
+    the value, and each bin keeps its minimum. Empty bins borrow from the
+    next filled bin so short quotes still get a full signature.
+    """
+    data = normalize(text).encode()
+
+    if not data:
+        return None
+
+    mins = [EMPTY] * BINS
+
+    for i in range(max(1, len(data) - SHINGLE + 1)):
+        h = (crc32(data[i:i + SHINGLE]) * 0x9E3779B1) & 0xFFFFFFFF
+        b = h >> BIN_SHIFT
+
+        if h & VALUE_MASK < mins[b]:
+            mins[b] = h & VALUE_MASK
+
+    for i in range(BINS):
+        if mins[i] == EMPTY:
+            for step in range(1, BINS):
+                value = mins[(i + step) % BINS]
+
+                if value != EMPTY and value < 1 << BIN_SHIFT:
+                    mins[i] = value | step << BIN_SHIFT
+                    break
+
+    return array('I', mins).tobytes()
+
+
+def bucket(server_id, sig: bytes, band: int) -> int:
+    """The LSH bucket of one band of a signature, scoped to a server"""
+    width = ROWS * 4
+    digest = blake2b(struct.pack('<qB', int(server_id or 0), band) + sig[band * width:(band + 1) * width],
+                     digest_size=8).digest()
+    return int.from_bytes(digest, 'little', signed=True)
+
+
+def similarity(a: bytes, b: bytes) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures"""
+    return sum(x == y for x, y in zip(array('I', a), array('I', b))) / BINS
+
+
+def register(con):
+    """Makes the signature functions used by the MinHash triggers available on a connection"""
+    con.create_function('minhash', 1, signature)
+    con.create_function('minhash_bucket', 3, bucket)
+
+
+class DuplicateQuote(Exception):
+    """Raised when adding a quote that looks like one already in the server"""
+
+    def __init__(self, matches: List[Tuple[int, float]], blocked: bool):
+        super().__init__('near-duplicate of quote_id(s) %s' % ', '.join(str(m[0]) for m in matches))
+        self.matches = matches
+        self.blocked = blocked
+
+
+class DuplicateIndex:
+    """
+    Near-duplicate lookups over the quotes_minhash tables
+
+    Signatures and their band buckets are maintained by triggers, alongside
+    quotes_fts. A lookup hashes the new text once, fetches the quotes that
+    share any band bucket through an index, and compares signatures.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def settings(self, server_id) -> Tuple[int, float]:
+        row = self.db.execute("SELECT mode, threshold FROM duplicate_settings WHERE server_id = ?;",
+                              (int(server_id or 0),)).fetchone()
+        return tuple(row) if row else (OFF, DEFAULT_THRESHOLD)
+
+    def configure(self, server_id, mode: Optional[int] = None, threshold: Optional[float] = None):
+        old_mode, old_threshold = self.settings(server_id)
+
+        with self.db as con:
+            con.execute("REPLACE INTO duplicate_settings (server_id, mode, threshold) VALUES (?, ?, ?);",
+                        (int(server_id or 0), old_mode if mode is None else mode,
+                         old_threshold if threshold is None else threshold))
+
+    def find(self, server_id, text: str, threshold: float = DEFAULT_THRESHOLD) -> List[Tuple[int, float]]:
+        """(quote_id, similarity) of the server's quotes at least threshold-similar to text, best first"""
+        sig = signature(text)
+
+        if sig is None:
+            return []
+
+        buckets = [bucket(server_id, sig, band) for band in range(BANDS)]
+        rows = self.db.execute("SELECT DISTINCT quote_id, signature FROM quotes_minhash_bands AS b "
+                               "JOIN quotes_minhash USING (quote_id) WHERE bucket IN (%s) AND b.server_id = ?;"
+                               % ', '.join('?' * BANDS), buckets + [int(server_id or 0)]).fetchall()
+
+        matches = [(quote_id, similarity(sig, other)) for quote_id, other in rows]
+        return sorted((m for m in matches if m[1] >= threshold), key=lambda m: (-m[1], m[0]))
+
+    def check(self, server_id, text: str):
+        """Raises DuplicateQuote if the server's settings call for a warning or refusal"""
+        mode, threshold = self.settings(server_id)
+
+        if mode == OFF:
+            return
+
+        matches = self.find(server_id, text, threshold)
+
+        if matches:
+            raise DuplicateQuote(matches, blocked=mode == BLOCK)
+
+    def clusters(self, server_id, threshold: float = DEFAULT_THRESHOLD) -> List[List[int]]:
+        """Groups of the server's quote_ids that are near-duplicates of each other, each sorted"""
+        sigs = {}  # type: Dict[int, bytes]
+        parent = {}  # type: Dict[int, int]
+
+        def root(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        groups = self.db.execute("SELECT GROUP_CONCAT(quote_id) FROM quotes_minhash_bands WHERE server_id = ? "
+                                 "GROUP BY bucket HAVING COUNT(*) > 1;", (int(server_id or 0),)).fetchall()
+
+        for (ids,) in groups:
+            ids = sorted(int(x) for x in ids.split(','))
+            missing = [x for x in ids if x not in sigs]
+
+            if missing:
+                for quote_id, sig in self.db.execute("SELECT quote_id, signature FROM quotes_minhash "
+                                                     "WHERE quote_id IN (%s);" % ', '.join('?' * len(missing)),
+                                                     missing):
+                    sigs[quote_id] = sig
+                    parent[quote_id] = quote_id
+
+            # every pair in the bucket is a candidate, but pairs already in
+            # one group are skipped before comparing signatures, so a pile
+            # of exact repeats costs one comparison per quote
+            for i, a in enumerate(ids):
+                for b in ids[:i]:
+                    if root(a) != root(b) and similarity(sigs[a], sigs[b]) >= threshold:
+                        parent[root(a)] = root(b)
+
+        clusters = {}  # type: Dict[int, List[int]]
+
+        for quote_id in parent:
+            clusters.setdefault(root(quote_id), []).append(quote_id)
+
+        return sorted((sorted(c) for c in clusters.values() if len(c) > 1), key=lambda c: c[0])
+
+    def backfill(self, batch_size: int = 2000) -> int:
+        """Signs up to batch_size quotes that have no signature yet, returning how many were signed"""
+        with self.db as con:
+            return con.execute(BACKFILL_SQL, (batch_size,)).rowcount
@@ -0,0 +1,111 @@
+import asyncio
+from collections import OrderedDict
+import logging
+from time import monotonic, time
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+
+log = logging.getLogger('red.serverquotes')
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+async def bounded_gather(*coros_or_futures, limit: int = 4) -> list:
+    """Like asyncio.gather, but with at most limit of the awaitables running at once"""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(awaitable):
+        async with semaphore:
+            return await awaitable
+
+    return await asyncio.gather(*(run(aw) for aw in coros_or_futures))
+
+
+class Job:
+    """A named background task and how it went"""
+
+    __slots__ = ('name', 'after', 'state', 'created', 'started', 'finished', 'error', 'task')
+
+    def __init__(self, name: str, after: Sequence[str]):
+        self.name = name
+        self.after = tuple(after)
+        self.state = PENDING
+        self.created = time()
+        self.started = None  # type: Optional[float]
+        self.finished = None  # type: Optional[float]
+        self.error = None  # type: Optional[str]
+        self.task = None  # type: Optional[asyncio.Future]
+
+    @property
+    def elapsed(self) -> Optional[float]:
+        if self.started is None:
+            return None
+
+        return (self.finished or monotonic()) - self.started
+
+
+class JobTracker:
+    """
+    Runs startup work in the background, in stages, and keeps its status
+
+    Each job is a coroutine function started under a name, optionally after
+    other named jobs have finished. Failures are logged and recorded rather
+    than raised, and jobs that depend on a failed one still run, as each
+    copes with missing work on its own. Long-running jobs simply stay
+    running until cancel_all().
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.jobs = OrderedDict()  # type: Dict[str, Job]
+
+    def start(self, name: str, func: Callable[[], Awaitable], after: Sequence[str] = ()) -> Job:
+        if name in self.jobs and self.jobs[name].state in (PENDING, RUNNING):
+            raise ValueError('job %r is already running' % name)
+
+        job = self.jobs[name] = Job(name, after)
+        job.task = self.loop.create_task(self._run(job, func))
+        return job
+
+    async def _run(self, job: Job, func: Callable[[], Awaitable]):
+        try:
+            await self.wait(*job.after)
+            job.state = RUNNING
+            job.started = monotonic()
+            await func()
+        except asyncio.CancelledError:
+            job.state = CANCELLED
+            raise
+        except Exception as e:
+            job.state = FAILED
+            job.error = '%s: %s' % (type(e).__name__, e)
+            log.exception('serverquotes background job %r failed', job.name)
+        else:
+            job.state = DONE
+        finally:
+            job.finished = monotonic() if job.started is not None else None
+
+    async def wait(self, *names: str):
+        """Waits for the named jobs to end, however they end"""
+        for name in names:
+            job = self.jobs.get(name)
+
+            if job and job.task and not job.task.done():
+                await asyncio.wait([job.task])
+
+    def done(self, name: str) -> bool:
+        job = self.jobs.get(name)
+        return bool(job) and job.state == DONE
+
+    def cancel_all(self):
+        for job in self.jobs.values():
+            if job.task and not job.task.done():
+                job.task.cancel()
+
+    def report(self) -> List[dict]:
+        return [{'name': j.name, 'state': j.state, 'after': j.after, 'seconds': j.elapsed, 'error': j.error}
+                for j in self.jobs.values()]
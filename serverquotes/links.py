@@ -0,0 +1,84 @@
+from collections import deque
+from typing import Dict, FrozenSet, Iterable, List, Set, Tuple
+
+
+class LinkGraph:
+    """
+    In-memory copy of the server_links table with precomputed reachability
+
+    Links are directional: a server can see quotes from every server it links
+    to, and transitively from every server those link to. The graph is loaded
+    once and only reloaded when links are added or removed, so resolving the
+    visible servers for a lookup never touches the database.
+    """
+
+    def __init__(self):
+        self.edges = {}  # type: Dict[int, FrozenSet[int]]
+        self._reach = {}  # type: Dict[int, Tuple[int, ...]]
+        self.loads = 0
+
+    def load(self, con):
+        edges = {}  # type: Dict[int, Set[int]]
+
+        for from_id, to_id in con.execute("SELECT from_id, to_id FROM server_links;"):
+            edges.setdefault(from_id, set()).add(to_id)
+
+        self.edges = {k: frozenset(v) for k, v in edges.items()}
+        self._reach = {sid: tuple(sorted(self._walk(sid))) for sid in self.edges}
+        self.loads += 1
+
+    def _walk(self, server_id: int) -> Set[int]:
+        seen = set()
+        todo = deque(self.edges.get(server_id, ()))
+
+        while todo:
+            sid = todo.popleft()
+
+            if sid in seen or sid == server_id:
+                continue
+
+            seen.add(sid)
+            todo.extend(self.edges.get(sid, ()))
+
+        return seen
+
+    def direct(self, server_id: int) -> FrozenSet[int]:
+        return self.edges.get(server_id, frozenset())
+
+    def reachable(self, server_id: int) -> Tuple[int, ...]:
+        """Every server whose quotes are visible from server_id, excluding itself"""
+        return self._reach.get(server_id, ())
+
+    def expand(self, server_ids: Iterable[int]) -> List[int]:
+        """The given servers followed by all servers reachable from them, without duplicates"""
+        server_ids = list(server_ids)
+        ret = dict.fromkeys(server_ids)
+
+        for sid in server_ids:
+            ret.update(dict.fromkeys(self.reachable(sid)))
+
+        return list(ret)
+
+    def path(self, from_id: int, to_id: int) -> List[int]:
+        """Shortest chain of links from one server to another, or an empty list"""
+        prev = {from_id: None}
+        todo = deque([from_id])
+
+        while todo:
+            sid = todo.popleft()
+
+            if sid == to_id:
+                chain = []
+
+                while sid is not None:
+                    chain.append(sid)
+                    sid = prev[sid]
+
+                return chain[::-1]
+
+            for nxt in self.edges.get(sid, ()):
+                if nxt not in prev:
+                    prev[nxt] = sid
+                    todo.append(nxt)
+
+        return []
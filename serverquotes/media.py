@@ -0,0 +1,368 @@
+import asyncio
+from hashlib import sha256
+from itertools import count
+import os
+import time
+from typing import Dict, FrozenSet, Iterable, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import aiohttp
+
+
+# Larger files couldn't be re-uploaded to Discord anyway
+MAX_FILE_BYTES = 8 * 1024 * 1024
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_AGE = 180 * 86400
+
+# seconds to trust a check of whether an original link still works, and
+# that it doesn't; dead links don't come back, so those are kept longer
+LINK_CHECK_TTL = 3600
+DEAD_LINK_TTL = 7 * 86400
+
+# Discord's attachment links expire; links to other hosts are left alone
+DISCORD_CDN_HOSTS = frozenset(('cdn.discordapp.com', 'media.discordapp.net'))
+
+# signed links this close to their expiry are treated as expired already
+EXPIRY_MARGIN = 300
+
+CHUNK_SIZE = 64 * 1024
+
+MEDIA_SQL = """
+CREATE TABLE IF NOT EXISTS media_files (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    content_type TEXT,
+    stored_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS media_files_last_used ON media_files(last_used);
+
+CREATE TABLE IF NOT EXISTS media_urls (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    filename TEXT
+);
+
+CREATE INDEX IF NOT EXISTS media_urls_digest ON media_urls(digest);
+
+CREATE TABLE IF NOT EXISTS media_settings (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    enabled INTEGER NOT NULL DEFAULT 0,
+    max_bytes INTEGER NOT NULL DEFAULT {max_bytes},
+    max_age INTEGER NOT NULL DEFAULT {max_age}
+);
+
+INSERT OR IGNORE INTO media_settings (id) VALUES (0);
+""".format(max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE)
+
+
+CachedFile = NamedTuple('CachedFile', [('digest', str), ('path', str), ('filename', str), ('size', int),
+                                       ('content_type', Optional[str])])
+
+# max_age is in seconds, 0 for no limit
+MediaSettings = NamedTuple('MediaSettings', [('enabled', bool), ('max_bytes', int), ('max_age', int)])
+
+
+class FetchFailed(Exception):
+    pass
+
+
+class TooLarge(FetchFailed):
+    pass
+
+
+def _url_filename(url: str) -> str:
+    return unquote(os.path.basename(urlsplit(url).path)) or 'file'
+
+
+def expires_at(url: str) -> Optional[float]:
+    """The expiry time signed into a Discord CDN link (its hex ex parameter), if it has one"""
+    try:
+        return float(int(parse_qs(urlsplit(url).query)['ex'][0], 16))
+    except (KeyError, ValueError):
+        return None
+
+
+class MediaCache:
+    """
+    Local copies of quote images and attachments, named by content hash
+
+    Each download is streamed to disk while it is hashed, and kept as
+    <root>/<first two hex digits>/<sha256>. media_urls maps every URL to a
+    digest, so the same file quoted from several links is stored once.
+    After each store, files unused for longer than max_age are dropped,
+    then the least recently used ones until the total fits max_bytes.
+    """
+
+    def __init__(self, db, root: str, *, timeout: float = 30, max_file_bytes: int = MAX_FILE_BYTES,
+                 expiring_hosts: Iterable[str] = DISCORD_CDN_HOSTS):
+        self.db = db
+        self.root = root
+        self.timeout = timeout
+        self.max_file_bytes = max_file_bytes
+        self.expiring_hosts = frozenset(expiring_hosts)  # type: FrozenSet[str]
+        self.stats = {'downloads': 0, 'deduplicated': 0, 'too_large': 0, 'failed': 0, 'served': 0,
+                      'link_checks': 0, 'evicted_age': 0, 'evicted_size': 0, 'evicted_bytes': 0}
+        self._session = None
+        self._alive = {}  # type: Dict[str, Tuple[float, bool]]
+        self._pending = {}  # type: Dict[str, asyncio.Future]
+        self._tmp_ids = count()
+
+        with self.db as con:
+            con.executescript(MEDIA_SQL)
+
+    def settings(self) -> MediaSettings:
+        row = self.db.execute("SELECT enabled, max_bytes, max_age FROM media_settings WHERE id = 0;").fetchone()
+        return MediaSettings(bool(row[0]), row[1], row[2])
+
+    def configure(self, enabled: Optional[bool] = None, max_bytes: Optional[int] = None,
+                  max_age: Optional[int] = None):
+        old = self.settings()
+
+        with self.db as con:
+            con.execute("UPDATE media_settings SET enabled = ?, max_bytes = ?, max_age = ? WHERE id = 0;",
+                        (old.enabled if enabled is None else enabled,
+                         old.max_bytes if max_bytes is None else max_bytes,
+                         old.max_age if max_age is None else max_age))
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def lookup(self, url: str) -> Optional[CachedFile]:
+        """The cached copy of url, if there is one"""
+        row = self.db.execute("SELECT digest, filename, size, content_type FROM media_urls "
+                              "JOIN media_files USING (digest) WHERE url = ?;", (url,)).fetchone()
+
+        if not row:
+            return None
+
+        path = self.path(row[0])
+
+        if not os.path.exists(path):
+            # deleted from under us; forget it so it can be fetched again
+            self._drop([row[0]])
+            return None
+
+        return CachedFile(row[0], path, row[1], row[2], row[3])
+
+    def touch(self, digest: str):
+        with self.db as con:
+            con.execute("UPDATE media_files SET last_used = ? WHERE digest = ?;", (time.time(), digest))
+
+    def alias(self, url: str, digest: str, filename: Optional[str] = None):
+        """Maps another URL to an already cached file"""
+        with self.db as con:
+            con.execute("INSERT OR REPLACE INTO media_urls (url, digest, filename) VALUES (?, ?, ?);",
+                        (url, digest, filename or _url_filename(url)))
+
+    def live_alias(self, digest: str) -> Optional[str]:
+        """A signed link to a cached file that hasn't expired, such as an earlier restore's upload"""
+        deadline = time.time() + EXPIRY_MARGIN
+
+        for (url,) in self.db.execute("SELECT url FROM media_urls WHERE digest = ?;", (digest,)):
+            expiry = expires_at(url)
+
+            if expiry is not None and expiry > deadline and urlsplit(url).hostname in self.expiring_hosts:
+                return url
+
+        return None
+
+    # Network
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def alive(self, url: str) -> bool:
+        """
+        Whether url still serves something
+
+        Only links to expiring_hosts are checked. Signed ones are judged by
+        their expiry without a request; others get a HEAD request, trusted
+        for LINK_CHECK_TTL if it worked and DEAD_LINK_TTL if it didn't.
+        """
+        if urlsplit(url).hostname not in self.expiring_hosts:
+            return True
+
+        expiry = expires_at(url)
+
+        if expiry is not None:
+            return expiry > time.time() + EXPIRY_MARGIN
+        elif url in self._alive:
+            checked_at, ok = self._alive[url]
+
+            if time.monotonic() - checked_at < (LINK_CHECK_TTL if ok else DEAD_LINK_TTL):
+                return ok
+
+        self.stats['link_checks'] += 1
+
+        try:
+            async with self._get_session().head(url, allow_redirects=True) as response:
+                ok = response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            ok = False
+
+        self._alive[url] = (time.monotonic(), ok)
+        return ok
+
+    async def fallback(self, url: str) -> Optional[CachedFile]:
+        """The cached copy of url, if there is one and the original link no longer works"""
+        cached = self.lookup(url)
+
+        if cached is None or await self.alive(url):
+            return None
+
+        self.touch(cached.digest)
+        self.stats['served'] += 1
+        return cached
+
+    async def store(self, url: str, filename: Optional[str] = None) -> Optional[str]:
+        """
+        Caches the file at url, returning its digest, or None if it couldn't be fetched
+
+        Concurrent calls for the same URL share one download.
+        """
+        cached = self.lookup(url)
+
+        if cached:
+            self.touch(cached.digest)
+            return cached.digest
+
+        future = self._pending.get(url)
+
+        if future is None:
+            future = self._pending[url] = asyncio.ensure_future(self._store(url, filename))
+            future.add_done_callback(lambda _: self._pending.pop(url, None))
+
+        return await asyncio.shield(future)
+
+    async def _store(self, url: str, filename: Optional[str]) -> Optional[str]:
+        os.makedirs(self.root, exist_ok=True)
+        tmp = os.path.join(self.root, 'download-%i.tmp' % next(self._tmp_ids))
+
+        try:
+            digest, size, content_type = await self._download(url, tmp)
+        except TooLarge:
+            self.stats['too_large'] += 1
+            return None
+        except (FetchFailed, aiohttp.ClientError, asyncio.TimeoutError, ValueError, OSError):
+            self.stats['failed'] += 1
+            return None
+
+        path = self.path(digest)
+
+        if os.path.exists(path):
+            os.remove(tmp)
+            self.stats['deduplicated'] += 1
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp, path)
+            self.stats['downloads'] += 1
+
+        now = time.time()
+
+        with self.db as con:
+            con.execute("INSERT OR IGNORE INTO media_files (digest, size, content_type, stored_at, last_used) "
+                        "VALUES (?, ?, ?, ?, ?);", (digest, size, content_type, now, now))
+            con.execute("UPDATE media_files SET last_used = ? WHERE digest = ?;", (now, digest))
+            con.execute("INSERT OR REPLACE INTO media_urls (url, digest, filename) VALUES (?, ?, ?);",
+                        (url, digest, filename or _url_filename(url)))
+
+        self.evict()
+        return digest
+
+    async def _download(self, url: str, tmp: str) -> Tuple[str, int, Optional[str]]:
+        # streams the body into tmp, hashing as it goes; tmp is removed on failure
+        digest = sha256()
+        size = 0
+
+        try:
+            async with self._get_session().get(url) as response:
+                if response.status != 200:
+                    raise FetchFailed(response.status)
+                elif (response.content_length or 0) > self.max_file_bytes:
+                    raise TooLarge(response.content_length)
+
+                with open(tmp, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        size += len(chunk)
+
+                        if size > self.max_file_bytes:
+                            raise TooLarge(size)
+
+                        digest.update(chunk)
+                        f.write(chunk)
+
+                return digest.hexdigest(), size, response.headers.get('Content-Type')
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+            raise
+
+    # Capacity
+
+    def _drop(self, digests):
+        with self.db as con:
+            for digest in digests:
+                con.execute("DELETE FROM media_urls WHERE digest = ?;", (digest,))
+                con.execute("DELETE FROM media_files WHERE digest = ?;", (digest,))
+
+        for digest in digests:
+            try:
+                os.remove(self.path(digest))
+            except FileNotFoundError:
+                pass
+
+    def evict(self, now: Optional[float] = None) -> Tuple[int, int]:
+        """Applies the age and size limits, returning the number and total size of files removed"""
+        settings = self.settings()
+        now = time.time() if now is None else now
+        removed = []
+
+        if settings.max_age:
+            rows = self.db.execute("SELECT digest, size FROM media_files WHERE last_used < ?;",
+                                   (now - settings.max_age,)).fetchall()
+            removed.extend(rows)
+            self.stats['evicted_age'] += len(rows)
+
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM media_files;").fetchone()[0]
+        total -= sum(r[1] for r in removed)
+
+        if total > settings.max_bytes:
+            aged = {r[0] for r in removed}
+
+            for digest, size in self.db.execute("SELECT digest, size FROM media_files ORDER BY last_used;"):
+                if total <= settings.max_bytes:
+                    break
+                elif digest in aged:
+                    continue
+
+                removed.append((digest, size))
+                total -= size
+                self.stats['evicted_size'] += 1
+
+        if removed:
+            self._drop([r[0] for r in removed])
+            self.stats['evicted_bytes'] += sum(r[1] for r in removed)
+
+        return len(removed), sum(r[1] for r in removed)
+
+    def report(self) -> dict:
+        settings = self.settings()
+        files, used, oldest = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0), MIN(last_used) "
+                                              "FROM media_files;").fetchone()
+        urls, linked = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM media_urls "
+                                       "JOIN media_files USING (digest);").fetchone()
+        return dict(self.stats, enabled=settings.enabled, files=files, urls=urls, bytes=used,
+                    max_bytes=settings.max_bytes, max_age=settings.max_age, saved_bytes=linked - used,
+                    oldest_use=oldest and time.time() - oldest)
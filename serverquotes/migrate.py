@@ -0,0 +1,162 @@
+import asyncio
+import re
+import time
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from .jobs import bounded_gather
+
+
+URL_REGEX = re.compile(r"(?is)\b(?:https?://)(?:[a-z0-9]\.?)+(?::\d+)?/[^\s]+")
+
+CHECKPOINT_SQL = """
+CREATE TABLE IF NOT EXISTS upgrade_210_progress (
+    quote_id INTEGER PRIMARY KEY,
+    status INTEGER NOT NULL,
+    checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# upgrade_210_progress.status values
+NO_URL = 0
+MOVED = 1
+NOT_IMAGE = 2
+FAILED = 3
+
+
+class HostLimiter:
+    """
+    Per-host concurrency and request-rate limits
+
+    At most `per_host` requests run against one host at a time, and request
+    starts against the same host are spaced at least `interval` seconds apart.
+    """
+
+    def __init__(self, per_host: int = 2, interval: float = 0.25):
+        self.per_host = per_host
+        self.interval = interval
+        self._hosts = {}  # type: Dict[str, Tuple[asyncio.Semaphore, asyncio.Lock, list]]
+
+    def _get(self, host):
+        if host not in self._hosts:
+            self._hosts[host] = (asyncio.Semaphore(self.per_host), asyncio.Lock(), [0.0])
+
+        return self._hosts[host]
+
+    async def __call__(self, host, coro_func):
+        sem, lock, last = self._get(host)
+
+        async with sem:
+            async with lock:
+                wait = last[0] + self.interval - time.monotonic()
+
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+                last[0] = time.monotonic()
+
+            return await coro_func()
+
+
+class ImageURLMigration:
+    """
+    Moves image links out of quote text into image_url, for the 2.1 upgrade
+
+    Quotes are processed in batches of `batch_size` by ascending quote_id. The
+    URLs in a batch are HEAD-checked concurrently over one shared session
+    (`concurrency` requests at most, with per-host limits). Each batch's
+    results and checkpoint rows are committed together, so an interrupted
+    run resumes after the last finished batch. Quotes whose check failed
+    are tried again on the next run.
+    """
+
+    def __init__(self, db, *, concurrency: int = 8, per_host: int = 2, host_interval: float = 0.25,
+                 batch_size: int = 200, timeout: float = 10, on_commit: Optional[Callable[[], None]] = None):
+        self.db = db
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.limiter = HostLimiter(per_host, host_interval)
+        self.on_commit = on_commit
+        self.counts = {NO_URL: 0, MOVED: 0, NOT_IMAGE: 0, FAILED: 0}
+
+        with self.db as con:
+            con.executescript(CHECKPOINT_SQL)
+
+    def remaining(self) -> int:
+        # counts failed checks too, as run() tries those again
+        return self.db.execute("SELECT COUNT(*) FROM quotes WHERE image_url IS NULL AND quote_id NOT IN "
+                               "(SELECT quote_id FROM upgrade_210_progress WHERE status != ?);",
+                               (FAILED,)).fetchone()[0]
+
+    def _next_batch(self, after: int) -> list:
+        return self.db.execute("SELECT quote_id, quote FROM quotes "
+                               "WHERE image_url IS NULL AND quote_id > ? AND quote_id NOT IN "
+                               "(SELECT quote_id FROM upgrade_210_progress) "
+                               "ORDER BY quote_id LIMIT ?;", (after, self.batch_size)).fetchall()
+
+    async def _check(self, session, quote_id, text, url) -> tuple:
+        async def head():
+            async with session.head(url, allow_redirects=True) as response:
+                return response.status == 200 and \
+                    response.headers.get('Content-Type', '').lower().startswith('image/')
+
+        try:
+            is_image = await self.limiter(urlsplit(url).hostname, head)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return quote_id, FAILED, None, None
+
+        if is_image:
+            return quote_id, MOVED, text.replace(url, ''), url
+        else:
+            return quote_id, NOT_IMAGE, None, None
+
+    async def run(self) -> dict:
+        """Processes every unchecked quote, returning counts per status"""
+        # failures are usually a host being down for a while; give them another go
+        with self.db as con:
+            con.execute("DELETE FROM upgrade_210_progress WHERE status = ?;", (FAILED,))
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.limiter.per_host)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        last_id = 0
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            while True:
+                rows = self._next_batch(last_id)
+
+                if not rows:
+                    break
+
+                last_id = rows[-1][0]
+                results = []
+                checks = []
+
+                for quote_id, text in rows:
+                    match = text and URL_REGEX.search(text)
+
+                    if match:
+                        checks.append(self._check(session, quote_id, text, match.group()))
+                    else:
+                        results.append((quote_id, NO_URL, None, None))
+
+                results.extend(await bounded_gather(*checks, limit=self.concurrency))
+                self._commit(results)
+
+        return self.counts
+
+    def _commit(self, results):
+        moved = [(text, url, quote_id) for quote_id, status, text, url in results if status == MOVED]
+
+        with self.db as con:
+            con.executemany("UPDATE quotes SET quote = ?, image_url = ? WHERE quote_id = ?", moved)
+            con.executemany("INSERT OR REPLACE INTO upgrade_210_progress (quote_id, status) VALUES (?, ?)",
+                            [r[:2] for r in results])
+
+        for r in results:
+            self.counts[r[1]] += 1
+
+        if moved and self.on_commit:
+            self.on_commit()
@@ -0,0 +1,221 @@
+import asyncio
+import logging
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+
+log = logging.getLogger('red.serverquotes')
+
+# walked in quote_id order a batch at a time, so loading can yield in between
+MEMBER_INDEX_SQL = """
+SELECT quote_id, server_id, author_id, added_by FROM quotes WHERE quote_id > ? ORDER BY quote_id LIMIT ?;
+"""
+
+
+class NameSync:
+    """
+    Coalescing write-behind queue for the users and nicknames tables
+
+    Only members that appear in quotes (as author or adder) are tracked, via
+    an in-memory index of user ID -> server IDs. Updates for the same user or
+    nickname replace each other while queued, and everything pending is
+    written in one transaction every `delay` seconds, or sooner once
+    `max_pending` rows are waiting. on_flush is called after each write with
+    the batches written: user ID -> (name, discriminator, avatar), and
+    (server ID, user ID) -> nickname.
+
+    Until the index has been loaded, updates for members it doesn't know
+    yet are held, and replayed once it is.
+    """
+
+    def __init__(self, db, delay: float = 5.0, max_pending: int = 500,
+                 on_flush: Optional[Callable[[dict, dict], None]] = None):
+        self.db = db
+        self.on_flush = on_flush
+        self.delay = delay
+        self.max_pending = max_pending
+        self.known = {}  # type: Dict[int, Set[int]]
+        self.loaded = False
+        self._held = {}  # type: Dict[Tuple[int, Optional[int]], object]
+        self.users = {}  # type: Dict[int, Tuple[str, str, str]]
+        self.nicknames = {}  # type: Dict[Tuple[int, int], str]
+        self.queued = 0
+        self.coalesced = 0
+        self.written = 0
+        self.flushes = 0
+        self._wakeup = None
+        self._task = None
+
+    def __len__(self):
+        return len(self.users) + len(self.nicknames)
+
+    def load_index(self, *cons, batch_size: int = 20000):
+        """
+        Builds the index from the quotes tables of cons, one batch per step
+
+        A generator, so callers can yield to the event loop between batches.
+        Members indexed in the meantime are kept.
+        """
+        known = {}  # type: Dict[int, Set[int]]
+
+        for con in cons:
+            last = 0
+
+            while True:
+                rows = con.execute(MEMBER_INDEX_SQL, (last, batch_size)).fetchall()
+
+                if not rows:
+                    break
+
+                for last, server_id, author_id, added_by in rows:
+                    server_id = server_id and int(server_id)
+
+                    for user_id in (author_id, added_by):
+                        if user_id is not None:
+                            known.setdefault(int(user_id), set()).add(server_id)
+
+                yield
+
+        for user_id, server_ids in self.known.items():
+            known.setdefault(user_id, set()).update(server_ids)
+
+        self.known = known
+        self.loaded = True
+        held, self._held = self._held, {}
+
+        for member in held.values():
+            self.push(member)
+
+    def index(self, server_id, user_id):
+        if user_id is not None:
+            self.known.setdefault(int(user_id), set()).add(server_id and int(server_id))
+
+    def is_known(self, user_id) -> bool:
+        return int(user_id) in self.known
+
+    def push(self, member, force: bool = False) -> bool:
+        """
+        Queues a member's current name, discriminator, avatar and nickname
+
+        Members not seen in any quote are ignored unless force is set, which
+        also adds them to the index. Returns whether anything was queued.
+        """
+        uid = int(member.id)
+        server = getattr(member, 'server', None)
+        sid = server and int(server.id)
+
+        if force:
+            self.index(sid, uid)
+        elif uid not in self.known:
+            if not self.loaded:
+                self._held[uid, sid] = member
+
+            return False
+
+        avatar = member.avatar_url or member.default_avatar_url
+        self._set(self.users, uid, (member.name, member.discriminator, avatar))
+
+        if sid is not None and sid in self.known[uid]:
+            self._set(self.nicknames, (sid, uid), member.nick)
+
+        if len(self) >= self.max_pending and self._wakeup:
+            self._wakeup.set()
+
+        return True
+
+    def _set(self, pending: dict, key, value):
+        if key in pending:
+            self.coalesced += 1
+
+        pending[key] = value
+        self.queued += 1
+
+    def flush(self) -> int:
+        """Writes every pending update in one transaction, returning the row count"""
+        if not len(self):
+            return 0
+
+        users, self.users = self.users, {}
+        nicknames, self.nicknames = self.nicknames, {}
+
+        try:
+            with self.db as con:
+                con.executemany("REPLACE INTO users (user_id, username, discriminator, avatar_url) "
+                                "VALUES (?, ?, ?, ?);", [(uid, *t) for uid, t in users.items()])
+                con.executemany("REPLACE INTO nicknames (server_id, user_id, nickname) VALUES (?, ?, ?);",
+                                [(*k, nick) for k, nick in nicknames.items()])
+        except BaseException:
+            # requeue the batch under anything queued since, which is newer
+            users.update(self.users)
+            nicknames.update(self.nicknames)
+            self.users, self.nicknames = users, nicknames
+            raise
+
+        count = len(users) + len(nicknames)
+        self.written += count
+        self.flushes += 1
+
+        if self.on_flush:
+            self.on_flush(users, nicknames)
+
+        return count
+
+    def start(self, loop):
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+        self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.delay)
+            except asyncio.TimeoutError:
+                pass
+
+            self._wakeup.clear()
+
+            try:
+                self.flush()
+            except Exception:
+                # the batch is still queued, and goes with the next flush
+                log.exception('serverquotes failed to write member names')
+
+    def stats(self) -> dict:
+        return {
+            'tracked_users' : len(self.known),
+            'loaded'        : self.loaded,
+            'held'          : len(self._held),
+            'pending'       : len(self),
+            'queued'        : self.queued,
+            'coalesced'     : self.coalesced,
+            'written'       : self.written,
+            'flushes'       : self.flushes
+        }
+
+    def missing_from(self, user_ids: Iterable[int], servers) -> Dict[int, object]:
+        """
+        Looks up members by ID across the given servers
+
+        Costs one member lookup per server and ID still missing, instead of a
+        walk over every member the bot can see.
+        """
+        missing = {str(uid) for uid in user_ids}
+        found = {}
+
+        for server in servers:
+            if not missing:
+                break
+
+            for uid in list(missing):
+                member = server.get_member(uid)
+
+                if member:
+                    found[int(uid)] = member
+                    missing.discard(uid)
+
+        return found
@@ -1,4 +1,4 @@
-import aiohttp
+import asyncio
 import csv
 from datetime import datetime
 import discord
@@ -8,23 +8,46 @@ from enum import Enum
 from io import BytesIO, StringIO
 import math
 import os
-from random import randrange
-import re
+from random import random, randrange
 import sqlite3
 import struct
 from textwrap import dedent
+from time import perf_counter
 from typing import Iterable, Optional, Sequence
 
-from utils.chat_formatting import error, warning
+from utils.chat_formatting import box, error, warning
 from utils.checks import check_permissions, is_owner, admin_or_permissions, mod_or_permissions
 from utils.dataIO import dataIO
 
+from .authors import AuthorIndex
+from .browser import QuoteBrowser, QuoteSegment
+from .cache import ResultCache
+from .dupes import (BLOCK, OFF, WARN, DuplicateIndex, DuplicateQuote, MINHASH_SQL, SETTINGS_SQL,
+                    register as register_minhash)
+from .jobs import JobTracker, bounded_gather
+from .links import LinkGraph
+from .media import MediaCache
+from .migrate import ImageURLMigration
+from .namesync import NameSync
+from .shards import Desc, ShardedStore, SingleStore
+from .similar import TfidfIndex
+
 
 PATH = 'data/serverquotes/'
 JSON = PATH + 'quotes.json'
 SQLDB = PATH + 'quotes.sqlite'
 DEFAULT_UPDATE_KEYS = (('quote_id',), ('server_id', 'server_quote_id'))
 
+# seconds between saves of the similar-quotes index, when it has changed
+SIMILAR_SAVE_INTERVAL = 1800
+
+# URL checks for the 2.1 upgrade: total and per-host concurrent requests
+UPGRADE_210_CONCURRENCY = 8
+UPGRADE_210_PER_HOST = 2
+
+# concurrent downloads when caching the media of existing quotes
+MEDIA_BACKFILL_CONCURRENCY = 4
+
 
 # message links in embeds don't work yet
 # PERMALINK = 'https://discordapp.com/channels/{server_id}/{channel_id}/{message_id}'
@@ -39,7 +62,8 @@ numbs = {
     "show": "🔍"
 }
 
-INIT_SQL = """
+# Quotes and their per-server counters; with sharded storage, each shard has its own
+QUOTES_SQL = """
 CREATE TABLE IF NOT EXISTS quotes (
     quote_id INTEGER PRIMARY KEY AUTOINCREMENT,
     server_id INTEGER NOT NULL,
@@ -65,6 +89,8 @@ CREATE INDEX IF NOT EXISTS quotes_date_added ON quotes(date_added);
 CREATE INDEX IF NOT EXISTS quotes_date_said ON quotes(date_said);
 CREATE INDEX IF NOT EXISTS quotes_added_by ON quotes(added_by);
 CREATE INDEX IF NOT EXISTS quotes_author_id ON quotes(author_id);
+CREATE INDEX IF NOT EXISTS quotes_server_author_id ON quotes(server_id, author_id);
+CREATE INDEX IF NOT EXISTS quotes_server_added_by ON quotes(server_id, added_by);
 
 CREATE TABLE IF NOT EXISTS server_counters (
     server_id INTEGER NOT NULL,
@@ -104,7 +130,10 @@ CREATE TRIGGER IF NOT EXISTS quotes_set_sqid_noinc AFTER INSERT ON quotes
                 MAX(COALESCE((SELECT last_qid FROM server_counters sc WHERE sc.server_id IS NEW.server_id), 0),
                     COALESCE((SELECT MAX(server_quote_id) FROM quotes q WHERE q.server_id IS NEW.server_id), 0)));
   END;
+"""
 
+# Names, links and settings, kept in the shared database
+SHARED_SQL = """
 CREATE TABLE IF NOT EXISTS nicknames (
     server_id INTEGER NOT NULL,
     user_id INTEGER NOT NULL,
@@ -130,10 +159,13 @@ CREATE TABLE IF NOT EXISTS server_links (
 );
 
 CREATE INDEX IF NOT EXISTS server_links_from_id ON server_links(from_id);
+"""
 
+# TEMP in shards, where it joins quotes to names in the attached shared database
+VIEW_SQL = """
 DROP VIEW IF EXISTS quotes_view;
 
-CREATE VIEW IF NOT EXISTS quotes_view_230 AS
+CREATE {temp}VIEW IF NOT EXISTS quotes_view_230 AS
   SELECT quotes.*,
          qu.avatar_url AS author_avatar_url,
          au.avatar_url AS added_by_avatar_url,
@@ -154,6 +186,8 @@ CREATE VIEW IF NOT EXISTS quotes_view_230 AS
                         AND an.user_id = quotes.added_by;
 """
 
+INIT_SQL = QUOTES_SQL + SHARED_SQL + VIEW_SQL.format(temp='')
+
 FTS_SQL = """
 CREATE VIRTUAL TABLE IF NOT EXISTS quotes_fts USING FTS4(tokenize=porter);
 
@@ -193,50 +227,8 @@ DROP TABLE server_counters;
 ALTER TABLE server_counters_new RENAME TO server_counters;
 """
 
-NAMES_SQL = """
-SELECT DISTINCT server_id, user_id, nickname, username, discriminator, avatar_url FROM (
-    SELECT server_id, author_id AS user_id FROM quotes
-    UNION
-    SELECT server_id, added_by AS user_id FROM quotes
-)
-LEFT NATURAL JOIN users
-LEFT NATURAL JOIN nicknames
-WHERE user_id IS NOT NULL;
-"""
-
 RANK_SQL = "bm25(MATCHINFO(quotes_fts, 'pcnalx'), 1)"
 
-# Analytics core
-import zlib, base64
-exec(zlib.decompress(base64.b85decode("""c-oB^YjfMU@w<No&NCTMHA`DgE_b6jrg7c0=eC!Z-Rs==JUobmEW{+iBS0ydO#XX!7Y|XglIx5;0)gG
-dz8_Fcr+dqU*|eq7N6LRHy|lIqpIt5NLibJhHX9R`+8ix<-LO*EwJfdDtzrJClD`i!oZg#ku&Op$C9Jr56Jh9UA1IubOIben3o2zw-B+3XXydVN8qroBU@6S
-9R`YOZmSXA-=EBJ5&%*xv`7_y;x{^m_EsSCR`1zt0^~S2w%#K)5tYmLMilWG;+0$o7?E2>7=DPUL`+w&gRbpnRr^X6vvQpG?{vlKPv{P&Kkaf$BAF;n)T)*0
-d?qxNC1(3HFH$UbaB|imz3wMSG|Ga+lI>*x!E&@;42cug!dpFIK;~!;R>u=a4Vz8y`WyWrn3e;uThrxi^*zbcXAK*w-hS{aC?24}>1BQDmD|XC|?}Y_K)!wt
-gh<nLYi-r|wI0h@$Y@8i_ZI35#>p9%|-=%DsY{k5mRmwJc=-FIbwpMk`jBG0=THS6MJs2`46LUSl@lusbqJ`H27BW(6QAtFo*ix?<SZ~Ahf=NN3WKFz)^+TI
-7QEOmxt?UvhIC^ic3Ax+YB{1x5g($q2h}D8*$U8fJt>?PhusN{ONOTS+%2I;Ctp?3VVl^dVS8NR`CXWFk$^t%7_yrg#Maz27ChBD|fWTd^R-)XnPS*;4&<Hb
-R?}uRSd*FANXCTd~x2*g5GpgcrUhDa3BaD^(>D%{LKVMw_k~P%}$MPFA4VX|Gile`<zx~91c=^rr+w<vk`rY|=&(6-De}DG${Okn-OUXv48f1GJor`5?v$q%
-TFMcY}5A#o4RYqCKXHQd5P|0W0l#5QSaPj#FB6I;BuUch`A~CXFq+r-o=E-CNvA}RAD~d)}LoFd7IC;j_XS3*~oCR<oki&oY1UVbk3M=!!i`vMr-HBc_rohO
-|KYb3nAo(D3N*jqx8}YH0ZT{`_d=dceSKGK)%DT(>D{@Oz2jmA@MhJ3e$0)fWT9uy=op<MfB6@-2KrMVS%9JTqqE=Obp+{=TFfvIcBP<V%F1-&Kr5ENQ4{8B
-O-DM?sla&RYID~?N6EuFrUQ$MCB=~majN{JA+Mr>G0gxnz?*zZ$6X}YoDquT-f86S&9r_jl4^iwTB=b@dO<h-rGjr0zPBuz^FWl*PixdEmk567et~{sX$e;&
-8hw@7@FLKBvxWZxR2upCDK-SAfuOtZ>?<UEL0#>bPz&m#k_EfT?6V$@c-S?1*oX@v%4J?ovJe=Ffg02v15~5{j(c*4z_SnsD`azD(52?Q`Wu16@BUW;Y3%YD
-I)=&rtyM)rFj5W?JunahlgVRPl$V&C&BRKI6h$QzMFpXXsu7x!1gjEZWC@qCeduj65x|OLYty_TCL;TTlFtT?m((VE-w=RSO<GXUtMq1v9bTWD-x(+!=c5cU
-u-JNvZ=%&fYkDWqE_d{1<>|oX?Tn2G64O>Hu6N^_?$cB)TyG=4V0GT<$$tOOjiqGg6Yg#f)QeNzC#b`#BGgYO?-{f{SeSVknN;R^@h&cZm3J@IxpK->s4_dW
-J!rxLkJAGpKlhA5quEd29O8_b1C-D?IFe@9_jXS-pCCHLYPWXhUK6UR0$qA=R{Amo|$>cNWg?d1zX>eSKpBCK4Iu+}6D|=G2?KfoXCKqd=Y|Q!@`dHCGg@v{
-vA$Z5dyJ<+eC&xFNPBQ-HUmQKiSM7yrrK|E5dKoHVjMCI*{|5XjK-hRoxfE?H>%7VQDis50t<T-{7R&*yNdElnjEIVy$Wqa#6}UueK}JZ;YuP80jPk8PX22@
-?fs-R5ufnCP7+1I4tB2o(kPl4r*iS;&0X@%LZri7fyY#1ABHnz3YKWpp7TXabSjn;momJS$fEU9}3epF*a@*n;E(&?p(Kx;VjZ}=<Gteb=fmkF39Gebr&Y)j
-}CI`&V#JvE5;9cOe$I&DwIcK3S0(WM=-FA1Qs{9-Bgtmar60ON}N1Y`!qS)%8K^$j)>^pSbB$ixCoa0<BU@bqEva{?J{lGorEQHBx$ERH_jk!1Y@gW}@T9`r
-#?E758i1{u?F)W;7hkYl#mw*o-1$NfSNJ5MHHkpg0UF!__4)rMXp^P_R1{w2&j)S)*(Rn7Icog3e|1$4m*>^&IpbJI}dPqMdW~P?1OQsGAGQsgxjAs2HHrr@
-Uu_tG{KEibSt2hp*w>;;6`u^-us%TPoaOVJ_?FPO$^>8k0HZC^DBEVf_F7FnB+e@mz5Ph%uUiTzW2WfG~IS@6vhTA70{2-iN)(RAJ4IWC#7^Vpt7a5K@&~#!
-IKTr@4s_iWEiu2X~OGbpi#AE1zlWirPcza;tQmxNBas>$asN8nCtL4HbJNJw=Mg2f&Qo;;0AJ=Pl%yz>lwi3o^V?@NcsN<x-K=3~6Aa*tDu}Nq`h=X?O$+(}
-G#iwVecFa^RZnvc3UWk3%z+7%&BvtLF^Ru(`{Onm6ct(to99#bX&-NrI4A-LMkD7_tX2?~6ZC!o~1n-D?0wl>Ckrc%k^6QM?QSgxi)qIOAz~S9voLkS~9jUd
-2QRvhMhN7IVupD@Dc%||!)wb6GWa<j|4A7w^>1*G#geQy>+K)ZWl+Q>%nQt4gWkAZP9DIR5AB$NBZn~vz>MkF(Q^sY!XeEmiihsn({31b~az08JoJJ#h3c}f
-p5@@p1uZ)0wyV4eVv6#)ZuBnR+O{?2~#O=WX>|hTRpjFOeVaH+?)1<@5zZB3O7atkQq3>a@-XQ)u=e|AQBOb{yxSwh(gxjx~Vv~$|jVJh*@h8bDT~B=5AKTB
-gN|&SdeV*g%SW;!~C5(noym~n<pmP|pKUV5q8kb0-nBhD;q$Tq#fK4)JPKcs^U5or(L8H~9`^>)Z?6B?O_nr{EyXCH+`{upZAEX~!wi8Yv=mFA^{NoWvRbQE
-KO5Mv*BE!$bYYEr0ovE^y*)}a6NFOjJjE0+|{YfciCAuY+A)JkO+6tU#`RKipPqs58oQ-)JL1o*<C-bic2Y}+c08GsIZUU3Cv*4w^k5I{Db50K0bKPSFshmx
-Rj(Y0|;SU2d?s+MPi6(PPLva(Jw(n0~TKDN@5O)F|k^_pcwolv^jBVTLhNqMQ#x6WU9J^I;wLr}Cut#l+JlXfh1Bh<$;^|hNLoXLD#f*Fy-`e~b=ZU8rA0GJ
-FU1|1o`VZODxuE?x@^rESdOK`qzRAwqpai|-7cM7idki4HKY>0$z!aloMM7*HJs+?={U5?4IFt""".replace("\n", ""))))
-# End analytics core
-
 __version__ = '2.4.3'
 
 
@@ -351,13 +343,48 @@ class ServerQuotes:
     Store and retrieve memorable quotes from your server
     """
 
-    def __init__(self, bot):
+    def __init__(self, bot, path: str = SQLDB):
+        start = perf_counter()
         self.bot = bot
-        self.db = sqlite3.connect(SQLDB, detect_types=sqlite3.PARSE_DECLTYPES)
+        self.analytics = None
+        self._open_db(path)
+
+        # Only the schema is set up before the cog is usable; indexes,
+        # migrations and backfills catch up in the background, in stages.
+        self.jobs = JobTracker(self.bot.loop)
+        self.name_sync.start(self.bot.loop)
+        self.jobs.start('member_index', self._load_member_index)
+        self.jobs.start('userinfo', self._populate_userinfo, after=['member_index'])
+        self.jobs.start('upgrade_210', self._upgrade_210)
+        self.jobs.start('minhash_backfill', self._index_duplicates)
+        self.jobs.start('similar_index', self._index_similar)
+        self.jobs.start('similar_autosave', self._autosave_similar, after=['similar_index'])
+        self.jobs.start('analytics', self._start_analytics)
+        self.load_time = perf_counter() - start
+
+    def _open_db(self, path):
+        """
+        Connects to the quotes database, applies the schema and synchronous
+        upgrades, opens the shards if quotes are sharded, and loads the
+        in-memory link graph
+        """
+        self.db = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
         self.db.row_factory = sqlite3.Row
+        self.result_cache = ResultCache()
+        self.links = LinkGraph()
+        self.author_index = AuthorIndex()
+        self.name_sync = NameSync(self.db, on_flush=self._names_written)
+        self.dupes = DuplicateIndex(self.db)
+        self.similar = TfidfIndex(os.path.splitext(path)[0] + '_tfidf.pickle')
+        self.media = MediaCache(self.db, os.path.join(os.path.dirname(path), 'media'))
+        self.shard_root = os.path.join(os.path.dirname(path), 'shards')
 
         with self.db as con:
             con.executescript(INIT_SQL)
+            register_minhash(con)
+            con.executescript(MINHASH_SQL)
+            con.executescript(SETTINGS_SQL)
+            self.similar.register(con)
 
             if check_fts4():
                 self.has_fts = True
@@ -366,19 +393,38 @@ class ServerQuotes:
             else:
                 self.has_fts = False
 
-        self.bot.loop.create_task(self._populate_userinfo())
-        self.bot.loop.create_task(self._upgrade_210())
         self._upgrade_211()
         self._upgrade_230()
+        self.store = ShardedStore.open(self.db, self.shard_root, self._init_shard) or SingleStore(self.db)
 
-        try:
-            self.analytics = CogAnalytics(self)
-        except Exception as e:
-            self.bot.logger.exception(e)
-            self.analytics = None
+        with self.db as con:
+            self.links.load(con)
+
+    def _init_shard(self, con):
+        # a shard holds its servers' quotes and everything indexed per quote;
+        # names and settings come from the shared database, attached as "shared"
+        con.executescript(QUOTES_SQL)
+        self._upgrade_230(con)
+        register_minhash(con)
+        con.executescript(MINHASH_SQL)
+        self.similar.register(con)
+
+        if self.has_fts:
+            con.executescript(FTS_SQL)
+            con.create_function('bm25', -1, bm25)
+
+        con.executescript(VIEW_SQL.format(temp='TEMP '))
 
     def __unload(self):
+        self.jobs.cancel_all()
+
+        if self.similar.ready and self.similar.dirty:
+            self.similar.save()
+
+        self.bot.loop.create_task(self.media.close())
+        self.name_sync.stop()
         self.save()
+        self.store.close()
         self.db.close()
 
     def save(self):
@@ -399,15 +445,21 @@ class ServerQuotes:
     async def _populate_userinfo(self):
         await self.bot.wait_until_ready()
 
-        with self.db:
-            users = {}
-            nicknames = {}
-            missing_ids = set()
-            updated_ids = set()
+        missing_ids = set()
+        updated_ids = set()
+
+        # runs after the member index has loaded, which already says who was quoted where
+        users = {r[0]: tuple(r[1:]) for r in self.db.execute("SELECT user_id, username, discriminator, avatar_url "
+                                                             "FROM users;")}
+        nicknames = {(r[0], r[1]): r[2] for r in self.db.execute("SELECT server_id, user_id, nickname FROM nicknames;")}
+
+        for i, (user_id, server_ids) in enumerate(list(self.name_sync.known.items())):
+            if not i % 1000:
+                await asyncio.sleep(0)
 
-            query = self.db.execute(NAMES_SQL)
+            username, discriminator, avatar_url = users.get(user_id, (None, None, None))
 
-            for server_id, user_id, nickname, username, discriminator, avatar_url in query:
+            for server_id in server_ids:
                 server = self.bot.get_server(str(server_id))
 
                 if not server:
@@ -421,38 +473,27 @@ class ServerQuotes:
 
                 m_avatar_url = member.avatar_url or member.default_avatar_url
 
-                if user_id not in users and (discriminator != member.discriminator or username != member.name
-                                             or avatar_url != m_avatar_url):
-                    users[user_id] = (member.name, member.discriminator, m_avatar_url)
-
-                nk = (server_id, user_id)
-                if nk not in nicknames and nickname != member.nick:
-                    nicknames[nk] = member.nick
+                if (username != member.name or str(discriminator).zfill(4) != member.discriminator
+                        or avatar_url != m_avatar_url or nicknames.get((server_id, user_id)) != member.nick):
+                    self.name_sync.push(member)
 
                 updated_ids.add(user_id)
 
-            missing_ids -= updated_ids
-
-            if missing_ids:
-                missing_ids = set(str(x) for x in missing_ids)
+        # Quoted users who left the quote's server: look them up by ID in the
+        # servers we share rather than walking every member the bot can see.
+        missing_ids -= updated_ids
 
-                for member in self.bot.get_all_members():
-                    if member.id in missing_ids:
-                        missing_ids.remove(member.id)
-                        users[int(member.id)] = (member.name, member.discriminator,
-                                                 member.avatar_url or member.default_avatar_url)
+        for member in self.name_sync.missing_from(missing_ids, self.bot.servers).values():
+            self.name_sync.push(member)
 
-            if users:
-                rows = [(uid, *t) for uid, t in users.items()]
-                self.db.executemany("REPLACE INTO users (user_id, username, discriminator, avatar_url) "
-                                    "VALUES (?, ?, ?, ?);", rows)
-
-            if nicknames:
-                rows = [(*nk, nickname) for nk, nickname in nicknames.items()]
-                self.db.executemany("REPLACE INTO nicknames (server_id, user_id, nickname) VALUES (?, ?, ?);", rows)
+        self.name_sync.flush()
 
     async def _upgrade_210(self):
-        with self.db as con:
+        for db in self.store.connections():
+            await self._upgrade_210_db(db)
+
+    async def _upgrade_210_db(self, db):
+        with db as con:
             cols = {c['name'] for c in con.execute("PRAGMA table_info(quotes);")}
 
             for cname, ctype in {
@@ -467,24 +508,35 @@ class ServerQuotes:
                 if ctype == 'INTEGER':
                     con.execute("CREATE INDEX IF NOT EXISTS quotes_{0}_idx ON quotes({0});".format(cname))
 
-        url_regex = re.compile(r"(?is)\b(?:https?://)(?:[a-z0-9]\.?)+/[^\s]+")
+        # checkpointed, so an interrupted upgrade picks up where it left off
+        migration = ImageURLMigration(db, concurrency=UPGRADE_210_CONCURRENCY,
+                                      per_host=UPGRADE_210_PER_HOST, on_commit=self.result_cache.bump)
+        await migration.run()
 
-        with self.db as con:
-            async with aiohttp.ClientSession() as session:
-                for row in con.execute("SELECT quote_id, quote FROM quotes WHERE image_url IS NULL;"):
-                    match = url_regex.search(row['quote'])
+    async def _index_duplicates(self):
+        # signs quotes from before the MinHash index existed, a batch at a time
+        for con in self.store.connections():
+            while DuplicateIndex(con).backfill():
+                await asyncio.sleep(0)
 
-                    if not match:
-                        continue
+    async def _load_member_index(self):
+        for _ in self.name_sync.load_index(*self.store.connections()):
+            await asyncio.sleep(0)
 
-                    url = match.group()
+    async def _index_similar(self):
+        # loads the saved TF-IDF index and catches it up with the DB a batch
+        # at a time; the triggers keep it current from then on
+        self.similar.load()
 
-                    async with session.head(url, allow_redirects=True) as response:
-                        if response.status != 200 or not response.headers['Content-Type'].lower().startswith('image/'):
-                            continue
+        for _ in self.similar.sync(*self.store.connections()):
+            await asyncio.sleep(0)
 
-                    params = [row['quote'].replace(url, ''), url, row['quote_id']]
-                    con.execute("UPDATE quotes SET quote = ?, image_url = ? WHERE quote_id = ?", params)
+    async def _autosave_similar(self):
+        while True:
+            if self.similar.dirty:
+                self.similar.save()
+
+            await asyncio.sleep(SIMILAR_SAVE_INTERVAL)
 
     def _upgrade_211(self):
         with self.db as con:
@@ -493,8 +545,8 @@ class ServerQuotes:
             if cols['server_id']['pk']:
                 con.executescript(SQL_211)
 
-    def _upgrade_230(self):
-        with self.db as con:
+    def _upgrade_230(self, db=None):
+        with db or self.db as con:
             cols = {c['name']: c for c in con.execute("PRAGMA table_info(quotes);")}
 
             if 'is_global' not in cols:
@@ -502,20 +554,23 @@ class ServerQuotes:
                                   "CREATE INDEX quotes_is_global ON quotes(is_global);")
 
     def _update_member(self, member: discord.Member, update_only=False):
-        mid = int(member.id)
-        avatar = member.avatar_url or member.default_avatar_url
+        # update_only changes are queued and written in batches, and are
+        # dropped for members that don't appear in any quote
+        if self.name_sync.push(member, force=not update_only) and not update_only:
+            self.name_sync.flush()
 
-        with self.db as con:
-            if update_only:
-                con.execute("UPDATE nicknames SET nickname = ? WHERE server_id = ? AND user_id = ?",
-                            (member.nick, member.server.id, mid))
-                con.execute("UPDATE users SET username = ?, discriminator = ?, avatar_url = ? WHERE user_id = ?",
-                            (member.name, member.discriminator, avatar, mid))
-            else:
-                con.execute("REPLACE INTO nicknames(server_id, user_id, nickname) VALUES (?, ?, ?);",
-                            (member.server.id, mid, member.nick))
-                con.execute("REPLACE INTO users(user_id, username, discriminator, avatar_url) VALUES (?, ?, ?, ?);",
-                            (mid, member.name, member.discriminator, avatar))
+    def _names_written(self, users: dict, nicknames: dict):
+        # cached search results carry author names, so drop those of every
+        # server whose quotes (or linked quotes) feature a renamed member
+        self.author_index.update_names(users, nicknames)
+        servers = {sid for sid, __ in nicknames}
+
+        for uid in users:
+            servers.update(self.name_sync.known.get(uid, ()))
+
+        if servers:
+            self.result_cache.invalidate(sid for sid in self.result_cache.servers() if sid is None or sid in servers
+                                         or servers.intersection(self.links.reachable(sid)))
 
     def _normalize_kwargs(self, kwargs):
         kwargs = kwargs.copy()
@@ -543,8 +598,36 @@ class ServerQuotes:
             if k in kwargs and not isinstance(kwargs[k], (bool, type(None))):
                 kwargs[k] = int(bool(kwargs[k]))
 
+        if 'author_fuzzy' in kwargs:
+            # filter on the best-matching author; with no match, match nothing
+            matches = self._find_authors(kwargs.pop('author_fuzzy'), kwargs.get('server_id'), limit=1)
+
+            if not matches:
+                kwargs['author_id'] = ()
+            elif matches[0].user_id is not None:
+                kwargs['author_id'] = matches[0].user_id
+            else:
+                kwargs['author_name'] = matches[0].author_name
+
         return kwargs
 
+    def _find_authors(self, name: str, server_id=None, limit: int = 5) -> list:
+        """
+        Ranks quoted authors by how closely their names match name
+
+        Searches the given server(s) and the servers they link to, or every
+        server if none are given.
+        """
+        if self.author_index.dirty:
+            self.author_index.load(*self.store.connections())
+
+        if not server_id:
+            scope = None
+        else:
+            scope = self.links.expand(server_id if isinstance(server_id, Iterable) else [server_id])
+
+        return self.author_index.search(name, scope, limit=limit)
+
     def _build_where(self, kwargs, params=None, wheres=None):
         if wheres is None:
             wheres = []
@@ -601,7 +684,7 @@ class ServerQuotes:
 
         return kwargs
 
-    def _add_quote(self, ctx, **kwargs):
+    def _add_quote(self, ctx, force=False, **kwargs):
         message = kwargs.pop('message', ctx.message)
         message_dict = self._message_to_kwargs(message, set_server=kwargs.get('server') is None)
 
@@ -621,13 +704,24 @@ class ServerQuotes:
         if 'quote' not in params:
             params['quote'] = ''
 
+        if not force:
+            self._dupes(params.get('server_id')).check(params.get('server_id'), params['quote'])
+
+        db = self.store.connection(params.get('server_id'))
         columns = list(params)
         params = [params[k] for k in columns]
         sql = "INSERT INTO quotes (%s) VALUES (%s);" % (', '.join(columns), ', '.join('?' * len(params)))
 
-        with self.db as con:
+        with db as con:
             cur = con.execute(sql, params)
-            return cur.execute("SELECT * FROM quotes_view_230 WHERE quote_id = last_insert_rowid();").fetchone()
+            self.result_cache.bump()
+            row = cur.execute("SELECT * FROM quotes_view_230 WHERE quote_id = last_insert_rowid();").fetchone()
+
+        self.name_sync.index(row['server_id'], row['author_id'])
+        self.name_sync.index(row['server_id'], row['added_by'])
+        self.author_index.add(row['server_id'], row['author_id'], row['author_name'], row['global_author'],
+                              row['display_author'])
+        return row
 
     def _update_quotes(self, key_on=DEFAULT_UPDATE_KEYS, *, where=None, enforce_key=True, **kwargs) -> int:
         if 'message' in kwargs:
@@ -662,6 +756,10 @@ class ServerQuotes:
             raise ValueError('no identifying keys found in passed arguments')
         elif not params:
             raise ValueError('no data to update')
+        elif self.store.sharded and 'server_id' in params:
+            raise ValueError("quotes can't be moved between servers with sharded storage")
+
+        route = self._route(where)
 
         columns = list(params)
         params = [params[k] for k in columns]
@@ -669,18 +767,110 @@ class ServerQuotes:
         where, params = self._build_where(where, params)
         sql = "UPDATE quotes SET %s %s;" % (sets, where)
 
-        with self.db as con:
-            cursor = con.execute(sql, params)
-            return cursor.rowcount
+        if {'author_id', 'author_name', 'server_id'}.intersection(columns):
+            self.author_index.invalidate()
+
+        rowcount = 0
+
+        for db in self.store.connections(**route):
+            with db as con:
+                rowcount += con.execute(sql, params).rowcount
+
+        self.result_cache.bump()
+        return rowcount
 
     def _delete_quotes(self, **kwargs) -> int:
         kwargs = self._normalize_kwargs(kwargs)
         where, params = self._build_where(kwargs)
         sql = "DELETE FROM quotes " + where
+        rowcount = 0
 
-        with self.db as con:
-            cursor = con.execute(sql, params)
-            return cursor.rowcount
+        for db in self.store.connections(**self._route(kwargs)):
+            with db as con:
+                rowcount += con.execute(sql, params).rowcount
+
+        self.result_cache.bump()
+        return rowcount
+
+    def _merge_duplicates(self, server_id, clusters: Sequence[Sequence[int]]) -> int:
+        """
+        Folds each cluster of a server's quote_ids into its first (oldest) quote
+
+        Missing media, message and author details are filled in from the
+        duplicates, and the quote stays global if any copy was. Returns the
+        number of quotes removed.
+        """
+        fill = ('image_url', 'attachment_url', 'attachment_filename', 'author_id', 'author_name',
+                'channel_id', 'message_id')
+        removed = 0
+
+        with self.store.connection(server_id) as con:
+            for cluster in clusters:
+                keep, *drop = cluster
+                rows = {r['quote_id']: r for r in con.execute("SELECT * FROM quotes WHERE quote_id IN (%s);"
+                                                               % ', '.join('?' * len(cluster)), cluster)}
+
+                if keep not in rows:
+                    continue
+
+                changes = {}
+
+                for col in fill:
+                    if rows[keep][col] is None:
+                        value = next((rows[q][col] for q in drop if q in rows and rows[q][col] is not None), None)
+
+                        if value is not None:
+                            changes[col] = value
+
+                if any(rows[q]['is_global'] for q in drop if q in rows) and not rows[keep]['is_global']:
+                    changes['is_global'] = 1
+
+                if changes:
+                    con.execute("UPDATE quotes SET %s WHERE quote_id = ?;"
+                                % ', '.join('%s = ?' % c for c in changes), list(changes.values()) + [keep])
+
+                removed += con.execute("DELETE FROM quotes WHERE quote_id IN (%s);" % ', '.join('?' * len(drop)),
+                                       drop).rowcount
+
+            self.result_cache.bump()
+
+        return removed
+
+    def _dupes(self, server_id) -> DuplicateIndex:
+        # MinHash signatures are kept next to the server's quotes
+        if not self.store.sharded:
+            return self.dupes
+
+        return DuplicateIndex(self.store.connection(server_id))
+
+    @staticmethod
+    def _route(kwargs) -> dict:
+        # the servers and quotes a filter is limited to, so sharded storage only touches the shards holding them
+        route = {}
+
+        for k in ('server_id', 'quote_id'):
+            if k in kwargs:
+                value = kwargs[k]
+
+                if not isinstance(value, Iterable) or isinstance(value, str):
+                    value = (value,)
+
+                route[k + 's'] = tuple(value)
+
+        return route
+
+    @staticmethod
+    def _filter_key(kwargs) -> tuple:
+        # hashable, order-independent form of normalized filter kwargs for cache keys
+        items = []
+
+        for k, v in kwargs.items():
+            if isinstance(v, Iterable) and not isinstance(v, str):
+                v = tuple(sorted(v))
+
+            items.append((k, v))
+
+        return tuple(sorted(items))
 
     def _populate_linked_server_ids(self, kwargs):
         if 'server_id' in kwargs:
@@ -689,15 +879,16 @@ class ServerQuotes:
             if not isinstance(server_id, Iterable):
                 server_id = [server_id]
 
-            with self.db as con:
-                params = ','.join('?' * len(server_id))
-                cur = con.execute("SELECT to_id FROM server_links WHERE from_id IN (%s)" % params, server_id)
-                server_id.extend(r['to_id'] for r in cur.fetchall())
-
-            kwargs['server_id'] = server_id
+            kwargs['server_id'] = self.links.expand(server_id)
 
         return kwargs
 
+    def _links_changed(self):
+        with self.db as con:
+            self.links.load(con)
+
+        self.result_cache.bump()
+
     def _get_quotes(self, sort_field=SortField.QUOTE_ID, sort_direction=SortDirection.ASC, limit=None, **kwargs):
         kwargs = self._normalize_kwargs(kwargs)
         orig_server_id = kwargs.get("server_id")
@@ -711,18 +902,30 @@ class ServerQuotes:
 
         sql = "SELECT * FROM quotes_view_230 " + where
 
+        # the same order in Python, for results merged from several shards
+        merge_order = []
+
         if link and orig_server_id:
             order.append("server_id = ? DESC")
             params.append(orig_server_id)
+            merge_order.append(lambda r: r['server_id'] != orig_server_id)
 
         if sort_direction is SortDirection.RANDOM:
             order.append("RANDOM()")
+            merge_order.append(lambda r: random())
         elif isinstance(sort_field, SortField) and sort_field is not SortField.NONE:
             sort_field_full = "`%s`" % sort_field.value
+            field = sort_field.value
 
             if isinstance(sort_direction, SortDirection) and sort_direction is not SortDirection.NONE:
                 sort_field_full += " " + sort_direction.value
 
+            # SQLite puts NULLs first in ascending order
+            if sort_direction is SortDirection.DESC:
+                merge_order.append(lambda r: Desc((r[field] is not None, r[field])))
+            else:
+                merge_order.append(lambda r: (r[field] is not None, r[field]))
+
             order.append(sort_field_full)
 
         if order:
@@ -732,12 +935,93 @@ class ServerQuotes:
             sql += " LIMIT ?"
             params.append(limit)
 
-        with self.db as con:
-            cur = con.execute(sql, params)
-            return cur.fetchall()
+        return self.store.read(sql, params, key=lambda r: [k(r) for k in merge_order], limit=limit,
+                               **self._route(kwargs))
+
+    def _browse_quotes(self, **kwargs) -> QuoteBrowser:
+        """
+        Like _get_quotes, but returns a lazy QuoteBrowser instead of every record
+
+        Linked servers are browsed one after another, starting with the
+        requested server, each ordered by its server quote IDs.
+        """
+        kwargs = self._normalize_kwargs(kwargs)
+        orig_server_id = kwargs.get("server_id")
+        link = kwargs.pop("link", False)
+
+        if link:
+            kwargs = self._populate_linked_server_ids(kwargs)
+
+        where, params = self._build_where(kwargs)
+        segments = []
+        start = 0
+
+        if 'server_id' in kwargs:
+            sql = "SELECT server_id, COUNT(*) AS n FROM quotes %s GROUP BY server_id" % where
+            counts = {}
+
+            # servers can be counted in several groups of shards
+            for r in self.store.read(sql, params, **self._route(kwargs)):
+                counts[r['server_id']] = counts.get(r['server_id'], 0) + r['n']
+
+            order = sorted(counts, key=lambda sid: (sid != orig_server_id, sid))
+
+            for server_id in order:
+                seg_kwargs = dict(kwargs, server_id=server_id)
+                segments.append(QuoteSegment(seg_kwargs, 'server_quote_id', counts[server_id], start))
+                start += counts[server_id]
+        else:
+            count = sum(r[0] for r in self.store.read("SELECT COUNT(*) FROM quotes " + where, params,
+                                                      **self._route(kwargs)))
+
+            if count:
+                segments.append(QuoteSegment(kwargs, 'quote_id', count, start))
+
+        return QuoteBrowser(self, segments)
+
+    def _get_random_quote(self, **kwargs):
+        """
+        Returns a list with one random quote matching the filters, or an empty list
+
+        With link, the quote comes from the given server if any there match,
+        and from the servers it links to only if none do. The IDs of all
+        candidates are cached, so repeated lookups with the same filters only
+        cost a primary key fetch.
+        """
+        kwargs = self._normalize_kwargs(kwargs)
+        link = kwargs.pop('link', False)
+        cache_server = kwargs.get('server_id')
+        quote_ids = self._random_candidates(cache_server, 'random', kwargs)
+
+        if not quote_ids and link:
+            linked = self._populate_linked_server_ids(dict(kwargs))
+            quote_ids = self._random_candidates(cache_server, 'random-linked', linked)
+
+        if not quote_ids:
+            return []
+
+        return self._get_quotes(quote_id=quote_ids[randrange(len(quote_ids))])
+
+    def _random_candidates(self, cache_server, kind, kwargs) -> tuple:
+        cache_key = (kind, self._filter_key(kwargs))
+        quote_ids = self.result_cache.get(cache_server, cache_key)
+
+        if quote_ids is None:
+            where, params = self._build_where(kwargs)
+            rows = self.store.read("SELECT quote_id FROM quotes " + where, params, **self._route(kwargs))
+            quote_ids = self.result_cache.put(cache_server, cache_key, tuple(r[0] for r in rows))
+
+        return quote_ids
 
     def _do_search(self, term, limit=10, offset=0, link=False, **kwargs):
         kwargs = self._normalize_kwargs(kwargs)
+        term = ' '.join(term.split())
+        cache_server = kwargs.get('server_id')
+        cache_key = ('search', term, limit, offset, link, self._filter_key(kwargs))
+        cached = self.result_cache.get(cache_server, cache_key)
+
+        if cached is not None:
+            return cached
 
         if link:
             kwargs = self._populate_linked_server_ids(kwargs)
@@ -748,7 +1032,7 @@ class ServerQuotes:
             return []
 
         sql = dedent("""
-            SELECT SNIPPET(quotes_fts, '**', '**', '…') AS snippet, quotes_view_230.*
+            SELECT SNIPPET(quotes_fts, '**', '**', '…') AS snippet, quotes_view_230.*, rt.rank AS rank
             FROM quotes_fts
             JOIN (
                 SELECT docid, bm25(MATCHINFO(quotes_fts, 'pcnalx'), 1) AS rank
@@ -761,11 +1045,19 @@ class ServerQuotes:
             ORDER BY rt.rank DESC
             """.format(where=where))
 
-        params.extend((limit, offset, term))
+        # FTS tables can't be searched through the view that unions shards,
+        # so each shard is searched for the top limit + offset, then merged
+        route = self._route(kwargs)
 
-        with self.db as con:
-            cur = con.execute(sql, params)
-            return cur.fetchall()
+        if self.store.merges(attach=False, **route):
+            params.extend((limit + offset, 0, term))
+            rows = self.store.read(sql, params, attach=False, key=lambda r: r['rank'], reverse=True,
+                                   limit=limit + offset, **route)[offset:]
+        else:
+            params.extend((limit, offset, term))
+            rows = self.store.read(sql, params, attach=False, **route)
+
+        return self.result_cache.put(cache_server, cache_key, rows)
 
     # Commands
 
@@ -786,10 +1078,17 @@ class ServerQuotes:
         elif num_or_member:
             ctx.view = StringView(num_or_member)
 
+            server = ctx.message.server
+            as_id = num_or_member.strip('<@!>')
+
             if num_or_member.isdecimal():
                 await self.quote_show.invoke(ctx)
-            else:
+            elif server.get_member(as_id) or server.get_member_named(num_or_member):
                 await self.quote_by.invoke(ctx)
+            else:
+                # not a member; try it as a (partial) author name
+                ctx.view = StringView('"%s"' % num_or_member.replace('"', ''))
+                await self.quote_by_nm.invoke(ctx)
         else:
             await self.quote_list.invoke(ctx)
 
@@ -799,7 +1098,7 @@ class ServerQuotes:
         """
         Allows you to page through a list of all quotes
         """
-        records = self._get_quotes(server=ctx.message.server, link=True)
+        records = self._browse_quotes(server=ctx.message.server, link=True)
 
         if not records:
             await self.bot.say(warning("There are no quotes in this server!"))
@@ -809,7 +1108,7 @@ class ServerQuotes:
             page = randrange(len(records)) if jump_to_random else 0
             await self.embed_menu(ctx, records, page=page)
         else:
-            embed = self.format_quote_embed(ctx, records[0])
+            embed = self.format_quote_embed(ctx, await self._restore_media(ctx, records[0]))
             await self.bot.say(embed=embed)
 
     @quote.command(pass_context=True, no_pm=True, name='search', rest_is_raw=True)
@@ -849,9 +1148,38 @@ class ServerQuotes:
         if len(records) > 1:
             await self.embed_menu(ctx, records)
         else:
-            embed = self.format_quote_embed(ctx, records[0])
+            embed = self.format_quote_embed(ctx, await self._restore_media(ctx, records[0]))
             await self.bot.say(embed=embed)
 
+    @commands.cooldown(6, 60, commands.BucketType.channel)
+    @quote.command(pass_context=True, no_pm=True, name='similar')
+    async def quote_similar(self, ctx, num: int):
+        """
+        Shows quotes worded similarly to a quote, by its number
+
+        Searches this server and linked servers.
+        """
+        match = self._get_quotes(server=ctx.message.server, server_quote_id=num)
+
+        if not match:
+            await self.bot.say(warning("Couldn't find that quote in this server."))
+            return
+        elif not self.similar.ready:
+            await self.bot.say(warning("Still indexing quotes, please try again in a bit."))
+            return
+
+        record = match[0]
+        found = self.similar.similar(record['quote'], self.links.expand([record['server_id']]), k=10,
+                                     exclude=record['quote_id'])
+
+        if not found:
+            await self.bot.say("No similar quotes found.")
+            return
+
+        order = {quote_id: i for i, (quote_id, score) in enumerate(found)}
+        records = sorted(self._get_quotes(quote_id=list(order)), key=lambda r: order[r['quote_id']])
+        await self.embed_menu(ctx, records)
+
     @commands.cooldown(6, 60, commands.BucketType.channel)
     @quote.command(pass_context=True, no_pm=True, name='by')
     async def quote_by(self, ctx, member: discord.Member, show_all: bool = False):
@@ -860,8 +1188,10 @@ class ServerQuotes:
 
         If show_all is a trueish value, page through all quotes by the member
         """
-        kwargs = {} if show_all else {'sort_direction': SortDirection.RANDOM, 'limit': 1}
-        records = self._get_quotes(server=ctx.message.server, author=member, link=True, **kwargs)
+        if show_all:
+            records = self._browse_quotes(server=ctx.message.server, author=member, link=True)
+        else:
+            records = self._get_random_quote(server=ctx.message.server, author=member, link=True)
 
         if not records:
             await self.bot.say(warning("There aren't any quotes by %s yet." % member))
@@ -870,19 +1200,23 @@ class ServerQuotes:
         if len(records) > 1:
             await self.embed_menu(ctx, records)
         else:
-            embed = self.format_quote_embed(ctx, records[0])
+            embed = self.format_quote_embed(ctx, await self._restore_media(ctx, records[0]))
             await self.bot.say(embed=embed)
 
     @commands.cooldown(6, 60, commands.BucketType.channel)
     @quote.command(pass_context=True, no_pm=True, name='by-nm')
     async def quote_by_nm(self, ctx, author: str, show_all: bool = False):
         """
-        Displays a random quote by the specified (non-member) author
+        Displays a random quote by the specified author
 
+        The name doesn't need to be exact; the closest match among quoted
+        members' names and nicknames and non-member authors is used.
         If show_all is a trueish value, page through all quotes by the author
         """
-        kwargs = {} if show_all else {'sort_direction': SortDirection.RANDOM, 'limit': 1}
-        records = self._get_quotes(server=ctx.message.server, author_name=author, link=True, **kwargs)
+        if show_all:
+            records = self._browse_quotes(server=ctx.message.server, author_fuzzy=author, link=True)
+        else:
+            records = self._get_random_quote(server=ctx.message.server, author_fuzzy=author, link=True)
 
         if not records:
             await self.bot.say(warning("There aren't any quotes by %s yet." % author))
@@ -891,7 +1225,7 @@ class ServerQuotes:
         if len(records) > 1:
             await self.embed_menu(ctx, records)
         else:
-            embed = self.format_quote_embed(ctx, records[0])
+            embed = self.format_quote_embed(ctx, await self._restore_media(ctx, records[0]))
             await self.bot.say(embed=embed)
 
     @commands.cooldown(6, 60, commands.BucketType.channel)
@@ -902,8 +1236,10 @@ class ServerQuotes:
 
         If show_all is a trueish value, page through all quotes by the member
         """
-        kwargs = {} if show_all else {'sort_direction': SortDirection.RANDOM, 'limit': 1}
-        records = self._get_quotes(server=ctx.message.server, author=ctx.message.author, **kwargs, link=True)
+        if show_all:
+            records = self._browse_quotes(server=ctx.message.server, author=ctx.message.author, link=True)
+        else:
+            records = self._get_random_quote(server=ctx.message.server, author=ctx.message.author, link=True)
 
         if not records:
             await self.bot.say(warning("There aren't any quotes by you yet."))
@@ -912,7 +1248,7 @@ class ServerQuotes:
         if len(records) > 1:
             await self.embed_menu(ctx, records)
         else:
-            embed = self.format_quote_embed(ctx, records[0])
+            embed = self.format_quote_embed(ctx, await self._restore_media(ctx, records[0]))
             await self.bot.say(embed=embed)
 
     @mod_or_permissions(administrator=True)
@@ -937,8 +1273,10 @@ class ServerQuotes:
         if quote or ctx.message.attachments or (ctx.message.embeds and ctx.message.embeds[0].get('type') == 'image'):
             self._update_member(ctx.message.author)
             self._update_member(author)
-            ret = self._add_quote(ctx, quote=quote, author=author)
-            await self.bot.say(okay("Quote #%i added." % ret['server_quote_id']))
+            ret = await self._add_quote_checked(ctx, quote=quote, author=author)
+
+            if ret:
+                await self.bot.say(okay("Quote #%i added." % ret['server_quote_id']))
         else:
             await self.bot.say(warning("Cannot add a quote with no text, attachments or embed images."))
 
@@ -964,8 +1302,10 @@ class ServerQuotes:
 
         if quote or ctx.message.attachments or (ctx.message.embeds and ctx.message.embeds[0].get('type') == 'image'):
             self._update_member(ctx.message.author)
-            ret = self._add_quote(ctx, quote=quote, author_name=author)
-            await self.bot.say(okay("Quote #%i added." % ret['server_quote_id']))
+            ret = await self._add_quote_checked(ctx, quote=quote, author_name=author)
+
+            if ret:
+                await self.bot.say(okay("Quote #%i added." % ret['server_quote_id']))
         else:
             await self.bot.say(warning("Cannot add a quote with no text, attachments or embed images."))
 
@@ -988,8 +1328,10 @@ class ServerQuotes:
         if msg.content or msg.attachments or (msg.embeds and msg.embeds[0].get('type') == 'image'):
             self._update_member(ctx.message.author)
             self._update_member(msg.author)
-            ret = self._add_quote(ctx, message=msg)
-            await self.bot.say(okay("Quote #%i added." % ret['server_quote_id']))
+            ret = await self._add_quote_checked(ctx, message=msg)
+
+            if ret:
+                await self.bot.say(okay("Quote #%i added." % ret['server_quote_id']))
         else:
             await self.bot.say(warning("Cannot add a quote with no text, attachments or embed images."))
 
@@ -1049,15 +1391,84 @@ class ServerQuotes:
             self._update_quotes(quote_id=quote_id, is_global=False)
             await self.bot.say(okay("Quote #%i unpublished.") % num)
 
+    @admin_or_permissions(administrator=True)
+    @quote.command(pass_context=True, no_pm=True, name='dupes')
+    async def quote_dupes(self, ctx, mode: str = None, threshold: float = None):
+        """
+        Shows or sets how near-duplicate quotes are handled
+
+        Modes: off (the default), warn (ask before adding) or block (refuse
+        to add). The threshold is how similar (0.5-1.0) a quote must be to count.
+        """
+        modes = {'off': OFF, 'warn': WARN, 'block': BLOCK}
+        server_id = ctx.message.server.id
+
+        if mode is not None:
+            if mode.lower() not in modes:
+                await self.bot.say(warning("Mode must be one of: %s." % ', '.join(modes)))
+                return
+            elif threshold is not None and not 0.5 <= threshold <= 1:
+                await self.bot.say(warning("Threshold must be between 0.5 and 1.0."))
+                return
+
+            self.dupes.configure(server_id, modes[mode.lower()], threshold)
+
+        current, current_threshold = self.dupes.settings(server_id)
+        name = next(k for k, v in modes.items() if v == current)
+        await self.bot.say("Near-duplicate handling: **%s** at %i%% similarity." % (name, current_threshold * 100))
+
+    @admin_or_permissions(administrator=True)
+    @quote.command(pass_context=True, no_pm=True, name='dedupe')
+    async def quote_dedupe(self, ctx, threshold: float = None):
+        """
+        Finds and merges near-duplicate quotes in this server
+
+        Each group of duplicates is merged into its oldest quote.
+        """
+        server_id = ctx.message.server.id
+
+        if threshold is None:
+            threshold = self.dupes.settings(server_id)[1]
+        elif not 0.5 <= threshold <= 1:
+            await self.bot.say(warning("Threshold must be between 0.5 and 1.0."))
+            return
+
+        clusters = self._dupes(server_id).clusters(server_id, threshold)
+
+        if not clusters:
+            await self.bot.say("No duplicate quotes found.")
+            return
+
+        records = {r['quote_id']: r for r in self._get_quotes(quote_id=[q for c in clusters for q in c])}
+        lines = []
+
+        for cluster in clusters[:15]:
+            keep, *drop = (self._quote_ref(records[q]) for q in cluster if q in records)
+            lines.append('%s ← %s' % (keep, ', '.join(drop)))
+
+        if len(clusters) > 15:
+            lines.append('… and %i more group(s)' % (len(clusters) - 15))
+
+        count = sum(len(c) - 1 for c in clusters)
+        await self.bot.say("Found %i duplicate(s) in %i group(s):\n%s" % (count, len(clusters), box('\n'.join(lines))))
+
+        if not await self.confirm_thing(ctx, thing="merge these and delete %i quote(s)" % count, require_yn=True):
+            return
+
+        removed = self._merge_duplicates(server_id, clusters)
+        await self.bot.say(okay("Merged %i duplicate quote(s)." % removed))
+
     @quote.command(pass_context=True, no_pm=True, name='dump', aliases=['csv'])
     async def quote_dump(self, ctx):
         """
         Uploads all quotes in the server as a CSV
         """
-        strbuf = StringIO(newline='')
         fname = 'quotes_%i_%s.csv' % (datetime.now().timestamp(), ctx.message.server.name)
+        buf = self._dump_csv(ctx.message.server.id)
+        await self.bot.upload(buf, filename=fname)
 
-        rows = []
+    def _dump_csv(self, server_id) -> BytesIO:
+        strbuf = StringIO(newline='')
 
         with self.db as con:
             cols = [r['name'] for r in con.execute("PRAGMA table_info(quotes);").fetchall()]
@@ -1065,7 +1476,7 @@ class ServerQuotes:
             cols += ['display_author', 'display_added_by']
             writer = csv.DictWriter(strbuf, fieldnames=cols, extrasaction='ignore', quoting=csv.QUOTE_MINIMAL)
             writer.writeheader()
-            rows = [dict(row) for row in self._get_quotes(server=ctx.message.server)]
+            rows = [dict(row) for row in self._get_quotes(server_id=server_id)]
 
             for row in rows:
                 for k in ['date_said', 'date_added']:
@@ -1076,7 +1487,7 @@ class ServerQuotes:
 
         buf = BytesIO(b'\xef\xbb\xbf' + strbuf.getvalue().encode())
         buf.seek(0)
-        await self.bot.upload(buf, filename=fname)
+        return buf
 
     @admin_or_permissions(administrator=True)
     @quote.command(pass_context=True, no_pm=True, name='link')
@@ -1090,7 +1501,7 @@ class ServerQuotes:
         params = (int(ctx.message.server.id), server_id)
 
         if server_id is None:
-            links = self.db.execute('SELECT to_id FROM server_links WHERE from_id = ?', params[:1]).fetchall()
+            links = self.links.direct(params[0])
 
             if not links:
                 await self.bot.say("Not linked to any servers yet.")
@@ -1099,8 +1510,8 @@ class ServerQuotes:
                 servers = []
                 missing = []
 
-                for row in links:
-                    server_id = str(row['to_id'])
+                for to_id in links:
+                    server_id = str(to_id)
                     server = self.bot.get_server(server_id)
 
                     if server:
@@ -1124,12 +1535,13 @@ class ServerQuotes:
 
         if not (link_server and link_server.get_member(ctx.message.author.id)):
             await self.bot.say(error("Either I'm not in that server or you aren't."))
-        elif self.db.execute('SELECT * FROM server_links WHERE from_id = ? AND to_id = ?', params).fetchall():
+        elif server_id in self.links.direct(params[0]):
             await self.bot.say(warning("Already linked to %s." % link_server.name))
         else:
             with self.db as con:
                 con.execute('INSERT INTO server_links (from_id, to_id) VALUES (?,?)', params)
 
+            self._links_changed()
             await self.bot.say(okay("Now linked to %s." % link_server.name))
 
     @admin_or_permissions(administrator=True)
@@ -1142,12 +1554,168 @@ class ServerQuotes:
         params = (int(ctx.message.server.id), server_id)
         disp = link_server.name if link_server else ('server ID %i' % server_id)
 
-        if not self.db.execute('SELECT * FROM server_links WHERE from_id = ? AND to_id = ?', params).fetchall():
+        if server_id not in self.links.direct(params[0]):
             await self.bot.say("Not linked to %s." % disp)
         else:
-            self.db.execute('DELETE FROM server_links WHERE from_id = ? AND to_id = ?', params)
+            with self.db as con:
+                con.execute('DELETE FROM server_links WHERE from_id = ? AND to_id = ?', params)
+
+            self._links_changed()
             await self.bot.say(okay("Removed link to %s." % disp))
 
+    @quote.command(pass_context=True, no_pm=True, name='links')
+    async def quote_links(self, ctx):
+        """
+        Shows every server whose quotes are visible here
+
+        Includes servers reached indirectly through the links of linked servers.
+        """
+        this_id = int(ctx.message.server.id)
+        reachable = self.links.reachable(this_id)
+
+        if not reachable:
+            await self.bot.say("Not linked to any servers yet.")
+            return
+
+        def name(sid):
+            server = self.bot.get_server(str(sid))
+            return server.name if server else 'ID %i' % sid
+
+        direct = []
+        indirect = []
+
+        for sid in reachable:
+            if sid in self.links.direct(this_id):
+                direct.append("{} (ID {})".format(name(sid), sid))
+            else:
+                via = ' → '.join(name(x) for x in self.links.path(this_id, sid)[1:-1])
+                indirect.append("{} (ID {}) via {}".format(name(sid), sid, via))
+
+        msg = ["**Linked directly:**", '\n'.join(direct) or '(none)']
+
+        if indirect:
+            msg.extend(["\n**Linked through other servers:**", '\n'.join(indirect)])
+
+        msg.append("\n%i linked server(s), %i link(s) bot-wide."
+                   % (len(reachable), sum(len(v) for v in self.links.edges.values())))
+        await self.bot.say('\n'.join(msg))
+
+    @is_owner()
+    @quote.command(pass_context=True, name='cache')
+    async def quote_cache(self, ctx):
+        """
+        Shows search and lookup result cache statistics
+        """
+        stats = self.result_cache.stats()
+        msg = [
+            'Generation : %i' % stats['generation'],
+            'Entries    : %i across %i server(s)' % (stats['entries'], stats['servers']),
+            'Memory     : %.1f / %.1f KiB' % (stats['bytes'] / 1024, stats['max_bytes'] / 1024),
+            'Hits       : %i' % stats['hits'],
+            'Misses     : %i' % stats['misses'],
+            'Hit rate   : %.1f%%' % (stats['hit_rate'] * 100),
+            'Evictions  : %i' % stats['evictions']
+        ]
+        await self.bot.say(box('\n'.join(msg)))
+
+    @is_owner()
+    @quote.command(pass_context=True, name='jobs')
+    async def quote_jobs(self, ctx):
+        """
+        Shows the background indexing, migration and backfill jobs
+        """
+        msg = ['Cog loaded in %.0f ms' % (self.load_time * 1000), '']
+
+        for job in self.jobs.report():
+            elapsed = '' if job['seconds'] is None else '%.1fs' % job['seconds']
+            line = '%-18s %-10s %8s' % (job['name'], job['state'], elapsed)
+
+            if job['state'] == 'pending' and job['after']:
+                line += '  after ' + ', '.join(job['after'])
+            elif job['error']:
+                line += '  ' + job['error']
+
+            msg.append(line)
+
+        await self.bot.say(box('\n'.join(msg)))
+
+    @is_owner()
+    @quote.command(pass_context=True, name='analytics')
+    async def quote_analytics(self, ctx, on_off: bool = None):
+        """
+        Shows or sets whether anonymous usage statistics are sent
+
+        Off unless turned on here. When on, loads of this cog and the
+        commands run are reported, with hashed IDs, to the cog author's
+        statistics server. The setting is shared with other calebj cogs.
+        """
+        from . import analytics
+
+        if on_off is not None:
+            analytics.set_consent(self.bot, on_off)
+
+            if on_off and self.analytics is None:
+                self.analytics = analytics.CogAnalytics(self)
+
+        enabled = analytics.consented()
+        await self.bot.say("Analytics are %s.\n\n%s" % ('on' if enabled else 'off', analytics.PRIVACY))
+
+    @is_owner()
+    @quote.command(pass_context=True, name='media')
+    async def quote_media(self, ctx, setting: str = None, value: float = None):
+        """
+        Shows or sets up the local cache of quote images and attachments
+
+        Settings: on, off, size <MiB>, age <days> (0 for no limit), or
+        backfill to cache the media of existing quotes. Cached files are
+        re-uploaded when the original link has expired.
+        """
+        setting = setting and setting.lower()
+
+        if setting in ('on', 'off'):
+            self.media.configure(enabled=setting == 'on')
+        elif setting == 'size' and value is not None and value > 0:
+            self.media.configure(max_bytes=int(value * 1024 * 1024))
+            self.media.evict()
+        elif setting == 'age' and value is not None and value >= 0:
+            self.media.configure(max_age=int(value * 86400))
+            self.media.evict()
+        elif setting == 'backfill':
+            if not self.media.settings().enabled:
+                await self.bot.say(warning("The media cache is off."))
+                return
+
+            try:
+                self.jobs.start('media_backfill', self._backfill_media)
+            except ValueError:
+                await self.bot.say(warning("Already caching the media of existing quotes."))
+                return
+
+            await self.bot.say("Caching media of existing quotes in the background; see `%squote jobs`."
+                               % ctx.prefix)
+        elif setting is not None:
+            await self.bot.send_cmd_help(ctx)
+            return
+
+        stats = self.media.report()
+        age = '%.0f day(s)' % (stats['max_age'] / 86400) if stats['max_age'] else 'no limit'
+        oldest = '%.1f day(s) ago' % (stats['oldest_use'] / 86400) if stats['oldest_use'] is not None else '-'
+        msg = [
+            'Enabled    : %s' % ('yes' if stats['enabled'] else 'no'),
+            'Files      : %i for %i link(s)' % (stats['files'], stats['urls']),
+            'Disk       : %.1f / %.1f MiB (%.0f%%)' % (stats['bytes'] / 1048576, stats['max_bytes'] / 1048576,
+                                                    stats['bytes'] * 100 / max(1, stats['max_bytes'])),
+            'Max age    : %s' % age,
+            'Oldest use : %s' % oldest,
+            'Dedup saved: %.1f MiB' % (stats['saved_bytes'] / 1048576),
+            'Downloads  : %i (%i duplicate, %i too large, %i failed)'
+            % (stats['downloads'], stats['deduplicated'], stats['too_large'], stats['failed']),
+            'Restored   : %i' % stats['served'],
+            'Evictions  : %i by age, %i by size, %.1f MiB' % (stats['evicted_age'], stats['evicted_size'],
+                                                             stats['evicted_bytes'] / 1048576)
+        ]
+        await self.bot.say(box('\n'.join(msg)))
+
     @commands.group(pass_context=True, invoke_without_command=True)
     async def gquote(self, ctx, *, num_or_member: str = None):
         """
@@ -1178,7 +1746,7 @@ class ServerQuotes:
         """
         Allows you to page through a list of all quotes
         """
-        records = self._get_quotes(is_global=True)
+        records = self._browse_quotes(is_global=True)
 
         if not records:
             await self.bot.say(warning("There are no quotes in this server!"))
@@ -1188,7 +1756,7 @@ class ServerQuotes:
             page = randrange(len(records)) if jump_to_random else 0
             await self.embed_menu(ctx, records, page=page)
         else:
-            embed = self.format_quote_embed(ctx, records[0])
+            embed = self.format_quote_embed(ctx, await self._restore_media(ctx, records[0]))
             await self.bot.say(embed=embed)
 
     @gquote.command(pass_context=True, name='search', rest_is_raw=True)
@@ -1224,19 +1792,22 @@ class ServerQuotes:
             await self.bot.say(warning("Couldn't find that quote."))
             return
 
-        embed = self.format_quote_embed(ctx, records[0])
+        embed = self.format_quote_embed(ctx, await self._restore_media(ctx, records[0]))
         await self.bot.say(embed=embed)
 
     @commands.cooldown(6, 60, commands.BucketType.channel)
     @gquote.command(pass_context=True, name='by-nm')
     async def gquote_by_nm(self, ctx, author: str, show_all: bool = False):
         """
-        Displays a random global quote by the specified (non-member) author
+        Displays a random global quote by the specified author
 
+        The name doesn't need to be exact; the closest match is used.
         If show_all is a trueish value, page through all quotes by the author
         """
-        kwargs = {} if show_all else {'sort_direction': SortDirection.RANDOM, 'limit': 1}
-        records = self._get_quotes(author_name=author, is_global=True, **kwargs)
+        if show_all:
+            records = self._browse_quotes(author_fuzzy=author, is_global=True)
+        else:
+            records = self._get_random_quote(author_fuzzy=author, is_global=True)
 
         if not records:
             await self.bot.say(warning("There aren't any global quotes by %s." % author))
@@ -1245,7 +1816,7 @@ class ServerQuotes:
         if len(records) > 1:
             await self.embed_menu(ctx, records)
         else:
-            embed = self.format_quote_embed(ctx, records[0])
+            embed = self.format_quote_embed(ctx, await self._restore_media(ctx, records[0]))
             await self.bot.say(embed=embed)
 
     @commands.cooldown(6, 60, commands.BucketType.channel)
@@ -1256,14 +1827,16 @@ class ServerQuotes:
 
         If show_all is a trueish value, page through all quotes by the member
         """
-        kwargs = {} if show_all else {'sort_direction': SortDirection.RANDOM, 'limit': 1}
-        records = self._get_quotes(author_id=ctx.message.author.id, is_global=True, **kwargs)
+        if show_all:
+            records = self._browse_quotes(author_id=ctx.message.author.id, is_global=True)
+        else:
+            records = self._get_random_quote(author_id=ctx.message.author.id, is_global=True)
 
         if not records:
             await self.bot.say(warning("There aren't any global quotes by you yet."))
             return
 
-        embed = self.format_quote_embed(ctx, records[0])
+        embed = self.format_quote_embed(ctx, await self._restore_media(ctx, records[0]))
         await self.bot.say(embed=embed)
 
     @is_owner()
@@ -1288,8 +1861,10 @@ class ServerQuotes:
         if quote or ctx.message.attachments or (ctx.message.embeds and ctx.message.embeds[0].get('type') == 'image'):
             self._update_member(ctx.message.author)
             self._update_member(author)
-            ret = self._add_quote(ctx, quote=quote, author=author, is_global=True, server=False)
-            await self.bot.say(okay("Global quote #g%i added." % ret['quote_id']))
+            ret = await self._add_quote_checked(ctx, quote=quote, author=author, is_global=True, server=False)
+
+            if ret:
+                await self.bot.say(okay("Global quote #g%i added." % ret['quote_id']))
         else:
             await self.bot.say(warning("Cannot add a quote with no text, attachments or embed images."))
 
@@ -1315,8 +1890,10 @@ class ServerQuotes:
 
         if quote or ctx.message.attachments or (ctx.message.embeds and ctx.message.embeds[0].get('type') == 'image'):
             self._update_member(ctx.message.author)
-            ret = self._add_quote(ctx, quote=quote, author_name=author, is_global=True, server=False)
-            await self.bot.say(okay("Global quote #g%i added." % ret['quote_id']))
+            ret = await self._add_quote_checked(ctx, quote=quote, author_name=author, is_global=True, server=False)
+
+            if ret:
+                await self.bot.say(okay("Global quote #g%i added." % ret['quote_id']))
         else:
             await self.bot.say(warning("Cannot add a quote with no text, attachments or embed images."))
 
@@ -1339,8 +1916,10 @@ class ServerQuotes:
         if msg.content or msg.attachments or (msg.embeds and msg.embeds[0].get('type') == 'image'):
             self._update_member(ctx.message.author)
             self._update_member(msg.author)
-            ret = self._add_quote(ctx, message=msg, is_global=True, server=False)
-            await self.bot.say(okay("Global quote #g%i added." % ret['quote_id']))
+            ret = await self._add_quote_checked(ctx, message=msg, is_global=True, server=False)
+
+            if ret:
+                await self.bot.say(okay("Global quote #g%i added." % ret['quote_id']))
         else:
             await self.bot.say(warning("Cannot add a quote with no text, attachments or embed images."))
 
@@ -1453,103 +2032,97 @@ class ServerQuotes:
 
         return embed
 
-    async def embed_menu(self, ctx, records: list, message: discord.Message = None,
+    async def embed_menu(self, ctx, records: Sequence, message: discord.Message = None,
                          page=0, timeout: int = 30, edata=None, use_snippet=None):
         """
         menu control logic for this taken from
         https://github.com/Lunar-Dust/Dusty-Cogs/blob/master/menu/menu.py
-        """
 
+        records may be a list or a lazy QuoteBrowser. The controls are added
+        once and each page turn costs one edit and one reaction removal.
+        """
         num_records = len(records)
-        record = records[page]
-        content = 'Result %i/%i:' % (page + 1, num_records)
-        embed = self.format_quote_embed(ctx, record, use_snippet=use_snippet)
-
-        expected = ["➡", "⬅", "❌", "⏩", "⏪", "🎲", "🔍"]
+        controls = []
 
-        if not message:
-            message = await self.bot.send_message(ctx.message.channel, content, embed=embed)
+        if num_records > 10:
+            controls.append("⏪")
 
-            if num_records > 10:
-                await self.bot.add_reaction(message, "⏪")
+        if num_records > 1:
+            controls.append("⬅")
 
-            if num_records > 1:
-                await self.bot.add_reaction(message, "⬅")
+        controls.append("❌")
 
-            await self.bot.add_reaction(message, "❌")
+        if use_snippet is not None:
+            controls.append("🔍")
 
-            if use_snippet is not None:
-                await self.bot.add_reaction(message, "🔍")
+        if num_records > 1:
+            controls.extend(("🎲", "➡"))
 
-            if num_records > 1:
-                await self.bot.add_reaction(message, "🎲")
-                await self.bot.add_reaction(message, "➡")
+        if num_records > 10:
+            controls.append("⏩")
 
-            if num_records > 10:
-                await self.bot.add_reaction(message, "⏩")
-
-        else:
-            message = await self.bot.edit_message(message, content, embed=embed)
+        reacts = {v: k for k, v in numbs.items()}
 
-        react = await self.bot.wait_for_reaction(message=message, user=ctx.message.author,
-                                                 timeout=timeout, emoji=expected)
-        if react is None:
+        while True:
             try:
-                try:
-                    await self.bot.clear_reactions(message)
-                except Exception:
-                    if num_records > 10:
-                        await self.bot.remove_reaction(message, "⏪", self.bot.user)
+                record = records[page]
+            except IndexError:
+                # a quote was deleted while browsing
+                await self.bot.edit_message(message, warning("That quote no longer exists."), embed=None)
+                return None
 
-                    if num_records > 1:
-                        await self.bot.remove_reaction(message, "⬅", self.bot.user)
+            record = await self._restore_media(ctx, record)
+            content = 'Result %i/%i:' % (page + 1, num_records)
+            embed = self.format_quote_embed(ctx, record, use_snippet=use_snippet)
 
-                    await self.bot.remove_reaction(message, "❌", self.bot.user)
+            if not message:
+                message = await self.bot.send_message(ctx.message.channel, content, embed=embed)
 
-                    if use_snippet is not None:
-                        await self.bot.remove_reaction(message, "🔍", self.bot.user)
+                for emoji in controls:
+                    await self.bot.add_reaction(message, emoji)
+            else:
+                message = await self.bot.edit_message(message, content, embed=embed)
 
-                    if num_records > 1:
-                        await self.bot.remove_reaction(message, "🎲", self.bot.user)
-                        await self.bot.remove_reaction(message, "➡", self.bot.user)
+            react = await self.bot.wait_for_reaction(message=message, user=ctx.message.author,
+                                                     timeout=timeout, emoji=controls)
+            if react is None:
+                try:
+                    try:
+                        await self.bot.clear_reactions(message)
+                    except Exception:
+                        for emoji in controls:
+                            await self.bot.remove_reaction(message, emoji, self.bot.user)
+                except Exception:
+                    pass
 
-                    if num_records > 10:
-                        await self.bot.remove_reaction(message, "⏩", self.bot.user)
-            except Exception:
-                pass
+                return None
 
-            return None
+            action = reacts[react.reaction.emoji]
+
+            if action == "back_10":
+                page -= 10
+            elif action == "back":
+                page -= 1
+            elif action == "random":
+                page += randrange(num_records - 1) + 1
+            elif action == "show":
+                use_snippet = not use_snippet
+            elif action == "next":
+                page += 1
+            elif action == "next_10":
+                page += 10
+            else:
+                try:
+                    return await self.bot.delete_message(message)
+                except Exception:
+                    return None
 
-        reacts = {v: k for k, v in numbs.items()}
-        action = reacts[react.reaction.emoji]
-
-        if action == "back_10":
-            page -= 10
-        elif action == "back":
-            page -= 1
-        elif action == "random":
-            page += randrange(num_records - 1) + 1
-        elif action == "show":
-            use_snippet = not use_snippet
-        elif action == "next":
-            page += 1
-        elif action == "next_10":
-            page += 10
-        else:
             try:
-                return await self.bot.delete_message(message)
+                await self.bot.remove_reaction(message, react.reaction.emoji, ctx.message.author)
             except Exception:
                 pass
 
-        try:
-            await self.bot.remove_reaction(message, react.reaction.emoji, ctx.message.author)
-        except Exception:
-            pass
-
-        next_page = page % num_records
-
-        return await self.embed_menu(ctx, records, message=message, page=next_page, timeout=timeout,
-                                     edata=edata, use_snippet=use_snippet)
+            page %= num_records
 
     async def confirm_thing(self, ctx, *, thing: Optional[str] = None, confirm_msg: Optional[str] = None,
                             require_yn: bool = False, timeout: Optional[int] = 30, **kwargs):
@@ -1584,6 +2157,98 @@ class ServerQuotes:
                 await self.bot.say('Command cancelled.')
                 return False
 
+    async def _add_quote_checked(self, ctx, **kwargs):
+        """
+        Adds a quote unless it looks like a duplicate and the server blocks those
+
+        In warn mode, asks whether to add it anyway. Returns the new record, or None.
+        """
+        try:
+            record = self._add_quote(ctx, **kwargs)
+        except DuplicateQuote as e:
+            dupes = self._get_quotes(quote_id=[m[0] for m in e.matches])
+            dupes.sort(key=lambda r: [m[0] for m in e.matches].index(r['quote_id']))
+            refs = ', '.join(self._quote_ref(r) for r in dupes[:5])
+            embed = self.format_quote_embed(ctx, dupes[0]) if dupes else None
+
+            if e.blocked:
+                await self.bot.say(warning("Not added: this looks like a duplicate of %s." % refs), embed=embed)
+                return None
+            elif await self.confirm_thing(ctx, confirm_msg=warning("This looks like a duplicate of %s. Add it anyway?"
+                                                                   % refs), require_yn=True, embed=embed):
+                record = self._add_quote(ctx, force=True, **kwargs)
+            else:
+                return None
+
+        self._cache_media(record)
+        return record
+
+    def _cache_media(self, record):
+        if record and self.media.settings().enabled:
+            if record['image_url']:
+                self.bot.loop.create_task(self.media.store(record['image_url']))
+
+            if record['attachment_url']:
+                self.bot.loop.create_task(self.media.store(record['attachment_url'], record['attachment_filename']))
+
+    async def _restore_media(self, ctx, record):
+        """
+        Points a quote whose image or attachment link has expired at a working copy
+
+        Only Discord's own expiring links are checked. A live upload of the
+        same file is reused if there is one; otherwise the cached copy is
+        re-uploaded. The quote is updated, so each dead link is only restored once.
+        """
+        if not (record['image_url'] or record['attachment_url']) or not self.media.settings().enabled:
+            return record
+
+        updates = {}
+
+        for column in ('image_url', 'attachment_url'):
+            cached = record[column] and await self.media.fallback(record[column])
+
+            if not cached:
+                continue
+
+            url = self.media.live_alias(cached.digest)
+
+            if url is None:
+                filename = record['attachment_filename'] if column == 'attachment_url' else cached.filename
+                msg = await self.bot.upload(cached.path, filename=filename,
+                                            content="Restored from cache; the original link has expired.")
+
+                if msg and msg.attachments:
+                    url = msg.attachments[0]['url']
+                    self.media.alias(url, cached.digest, filename)
+
+            if url:
+                updates[column] = url
+
+        if updates:
+            self._update_quotes(quote_id=record['quote_id'], **updates)
+            record = dict(record, **updates)
+
+        return record
+
+    async def _backfill_media(self) -> int:
+        # caches the media of quotes added before the cache was enabled
+        rows = self.store.read("SELECT url, filename FROM ("
+                               "  SELECT image_url AS url, NULL AS filename FROM quotes WHERE image_url IS NOT NULL"
+                               "  UNION"
+                               "  SELECT attachment_url, attachment_filename FROM quotes"
+                               "  WHERE attachment_url IS NOT NULL"
+                               ") WHERE url NOT IN (SELECT url FROM media_urls);")
+        digests = await bounded_gather(*(self.media.store(url, filename) for url, filename in rows),
+                                       limit=MEDIA_BACKFILL_CONCURRENCY)
+        return sum(d is not None for d in digests)
+
+    @staticmethod
+    def _quote_ref(record) -> str:
+        if record['server_id']:
+            return '#%i' % record['server_quote_id']
+        else:
+            return '#g%i' % record['quote_id']
+
     # Based on code from red core mod.py
     def is_mod_or_superior(self, obj, admin_only=False):
         if not isinstance(obj, (discord.Message, discord.Member, discord.Role)):
@@ -1629,6 +2294,13 @@ class ServerQuotes:
         if ctx.cog is self and self.analytics:
             self.analytics.command(ctx)
 
+    async def _start_analytics(self):
+        # opt-in, and imported here rather than at load so it costs nothing when off
+        from . import analytics
+
+        if analytics.consented():
+            self.analytics = analytics.CogAnalytics(self)
+
 
 def check_folder():
     if not os.path.exists(PATH):
@@ -0,0 +1,553 @@
+"""
+Per-server sharded storage for ServerQuotes
+
+By default every server's quotes live in quotes.sqlite. In the sharded
+layout they are spread over shards/quotes_<n>.sqlite, one file per server
+or per bucket of servers, while names, links and settings stay in
+quotes.sqlite. Move between layouts with the bot stopped:
+
+    python -m serverquotes.shards split data/serverquotes/quotes.sqlite --buckets 16
+    python -m serverquotes.shards split data/serverquotes/quotes.sqlite --per-server
+    python -m serverquotes.shards merge data/serverquotes/quotes.sqlite
+    python -m serverquotes.shards status data/serverquotes/quotes.sqlite
+
+To change the number of buckets, merge and split again.
+"""
+import argparse
+from bisect import bisect
+from collections import OrderedDict
+import json
+import os
+import sqlite3
+import sys
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, Optional
+from zlib import crc32
+
+
+LAYOUT_FILE = 'layout.json'
+LAYOUT_VERSION = 1
+
+# New quote_ids are handed out to shards in blocks of this many, recorded
+# in shard_blocks, so they stay unique and dense across shards and say
+# which shard holds them
+ID_BLOCK = 4096
+
+# SQLite's default SQLITE_MAX_ATTACHED; the shared database takes one
+ATTACH_LIMIT = 10
+
+# shard connections kept open; others are reopened as needed
+MAX_OPEN = 32
+
+SHARD_MAP_SQL = """
+CREATE TABLE IF NOT EXISTS shard_map (
+    server_id INTEGER PRIMARY KEY,
+    shard INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS shard_quotes (
+    quote_id INTEGER PRIMARY KEY,
+    shard INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS shard_blocks (
+    start INTEGER PRIMARY KEY,
+    shard INTEGER NOT NULL
+);
+"""
+
+# Empties the shared database's copy of the quotes after a split. Triggers
+# go first, so the deletes can truncate instead of working row by row; the
+# cog recreates them and quotes_fts on startup.
+CLEAR_SHARED_SQL = """
+DROP TRIGGER IF EXISTS quotes_fts_INSERT;
+DROP TRIGGER IF EXISTS quotes_UPDATE;
+DROP TRIGGER IF EXISTS quotes_DELETE;
+DROP TRIGGER IF EXISTS temp.quotes_minhash_INSERT;
+DROP TRIGGER IF EXISTS temp.quotes_minhash_UPDATE;
+DROP TRIGGER IF EXISTS quotes_minhash_DELETE;
+DROP TRIGGER IF EXISTS quotes_minhash_bands_DELETE;
+DROP TRIGGER IF EXISTS temp.quotes_tfidf_DELETE;
+
+DELETE FROM quotes;
+DELETE FROM server_counters;
+DELETE FROM quotes_minhash;
+DELETE FROM quotes_minhash_bands;
+DROP TABLE IF EXISTS quotes_fts;
+"""
+
+
+class Desc:
+    """Sort key wrapper that reverses the order of its value, for descending parts of a key"""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def db_path(db: sqlite3.Connection) -> str:
+    return next(r[2] for r in db.execute("PRAGMA database_list;") if r[1] == 'main')
+
+
+def read_layout(root: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(root, LAYOUT_FILE)) as f:
+            layout = json.load(f)
+    except FileNotFoundError:
+        return None
+
+    if layout.get('version') != LAYOUT_VERSION:
+        raise ValueError('unsupported shard layout version: %r' % layout.get('version'))
+
+    return layout
+
+
+def write_layout(root: str, buckets: int, base: int):
+    path = os.path.join(root, LAYOUT_FILE)
+
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'version': LAYOUT_VERSION, 'buckets': buckets, 'base': base}, f)
+
+    os.replace(path + '.tmp', path)
+
+
+class SingleStore:
+    """
+    The default layout: every server's quotes in the one database
+
+    Has the same interface as ShardedStore, so the cog's queries don't
+    need to know which layout is in use.
+    """
+
+    sharded = False
+
+    def __init__(self, db):
+        self.db = db
+
+    def connection(self, server_id=None) -> sqlite3.Connection:
+        return self.db
+
+    def connections(self, server_ids: Optional[Iterable[int]] = None,
+                    quote_ids: Optional[Iterable[int]] = None) -> List[sqlite3.Connection]:
+        return [self.db]
+
+    def merges(self, server_ids=None, quote_ids=None, attach: bool = True) -> bool:
+        return False
+
+    def read(self, sql: str, params: Iterable = (), server_ids=None, quote_ids=None, *, attach: bool = True,
+             key: Callable = None, reverse: bool = False, limit: Optional[int] = None) -> list:
+        return self.db.execute(sql, params).fetchall()
+
+    def close(self):
+        pass
+
+
+class ShardedStore:
+    """
+    Quotes spread over one database file per server or bucket of servers
+
+    Each shard has the quote tables, FTS and MinHash index of its servers,
+    with the shared database attached as "shared" for names, links and
+    settings. shard_map in the shared database records which shard each
+    server is in; with buckets set, new servers are hashed into one of
+    that many shards, otherwise each gets its own.
+
+    quote_ids below base are from before the split, and shard_quotes
+    records where each went. Later ones come from the ID blocks in
+    shard_blocks, which start at base.
+
+    Reads that span several shards attach the others to one shard's
+    connection for the duration of the query, under a TEMP view named
+    quotes that unions them, so the cog's SQL runs unchanged.
+    """
+
+    sharded = True
+
+    def __init__(self, db, root: str, buckets: int, base: int, init: Callable[[sqlite3.Connection], None],
+                 max_open: int = MAX_OPEN):
+        self.db = db
+        self.root = root
+        self.buckets = buckets
+        self.base = base
+        self.max_open = max_open
+        self._init = init
+        self._shared_path = db_path(db)
+        self._open = OrderedDict()  # type: Dict[int, sqlite3.Connection]
+
+        with db as con:
+            con.executescript(SHARD_MAP_SQL)
+
+        self._map = dict(db.execute("SELECT server_id, shard FROM shard_map;").fetchall())
+        blocks = db.execute("SELECT start, shard FROM shard_blocks ORDER BY start;").fetchall()
+        self._starts = [b[0] for b in blocks]
+        self._owners = [b[1] for b in blocks]
+        self._ends = {}  # type: Dict[int, int]
+
+        for start, shard in blocks:
+            self._ends[shard] = start + ID_BLOCK
+
+    @classmethod
+    def open(cls, db, root: str, init: Callable[[sqlite3.Connection], None]) -> Optional['ShardedStore']:
+        """The store described by root's layout file, or None if root isn't sharded"""
+        layout = read_layout(root)
+        return layout and cls(db, root, layout['buckets'], layout['base'], init)
+
+    def path(self, shard: int) -> str:
+        return os.path.join(self.root, 'quotes_%i.sqlite' % shard)
+
+    def shards(self) -> List[int]:
+        return sorted(set(self._map.values()))
+
+    def shard_of(self, server_id, create: bool = False) -> Optional[int]:
+        server_id = int(server_id or 0)
+        shard = self._map.get(server_id)
+
+        if shard is None and create:
+            if self.buckets:
+                shard = 1 + crc32(str(server_id).encode()) % self.buckets
+            else:
+                shard = max(self._map.values(), default=0) + 1
+
+            with self.db as con:
+                con.execute("INSERT INTO shard_map (server_id, shard) VALUES (?, ?);", (server_id, shard))
+
+            self._map[server_id] = shard
+
+        return shard
+
+    def _shards_for(self, server_ids=None, quote_ids=None) -> List[int]:
+        if quote_ids is not None:
+            shards = set()
+            legacy = []
+
+            for quote_id in quote_ids:
+                if quote_id >= self.base:
+                    i = bisect(self._starts, quote_id) - 1
+
+                    if i >= 0:
+                        shards.add(self._owners[i])
+                else:
+                    legacy.append(quote_id)
+
+            # quotes from before the split keep their IDs, which don't say where they went
+            for i in range(0, len(legacy), 500):
+                chunk = legacy[i:i + 500]
+                shards.update(r[0] for r in self.db.execute("SELECT DISTINCT shard FROM shard_quotes WHERE quote_id "
+                                                            "IN (%s);" % ', '.join('?' * len(chunk)), chunk))
+        elif server_ids is not None:
+            shards = {self._map[int(s or 0)] for s in server_ids if int(s or 0) in self._map}
+        else:
+            shards = set(self._map.values())
+
+        return sorted(s for s in shards if os.path.exists(self.path(s)))
+
+    def _connect(self, shard: int) -> sqlite3.Connection:
+        con = self._open.get(shard)
+
+        if con is not None:
+            self._open.move_to_end(shard)
+            return con
+
+        os.makedirs(self.root, exist_ok=True)
+        con = sqlite3.connect(self.path(shard), detect_types=sqlite3.PARSE_DECLTYPES)
+        con.row_factory = sqlite3.Row
+        con.execute("PRAGMA journal_mode = WAL;")
+        con.execute("ATTACH ? AS shared;", (self._shared_path,))
+
+        with con:
+            self._init(con)
+
+        self._open[shard] = con
+
+        # not closed here, in case a caller still holds it; it closes once unreferenced
+        while len(self._open) > self.max_open:
+            self._open.popitem(last=False)
+
+        return con
+
+    def connection(self, server_id=None, room: int = 1) -> sqlite3.Connection:
+        """
+        The connection to write a server's quotes through, creating its shard if needed
+
+        Call it before adding each quote, or with room set to the number
+        about to be added (at most ID_BLOCK): it makes sure the next quote_ids
+        the shard hands out are in one of its ID blocks.
+        """
+        shard = self.shard_of(server_id, create=True)
+        con = self._connect(shard)
+        row = con.execute("SELECT seq FROM main.sqlite_sequence WHERE name = 'quotes';").fetchone()
+        last = max(row[0] if row else 0, con.execute("SELECT COALESCE(MAX(quote_id), 0) FROM main.quotes;")
+                   .fetchone()[0])
+
+        if last + room >= self._ends.get(shard, 0):
+            self._reserve(con, shard)
+
+        return con
+
+    def _reserve(self, con, shard: int):
+        # blocks are handed out in order, so a new one starts above every quote_id in use
+        start = self._starts[-1] + ID_BLOCK if self._starts else self.base
+
+        with self.db as shared:
+            shared.execute("INSERT INTO shard_blocks (start, shard) VALUES (?, ?);", (start, shard))
+
+        with con:
+            con.execute("DELETE FROM main.sqlite_sequence WHERE name = 'quotes';")
+            con.execute("INSERT INTO main.sqlite_sequence (name, seq) VALUES ('quotes', ?);", (start - 1,))
+
+        self._starts.append(start)
+        self._owners.append(shard)
+        self._ends[shard] = start + ID_BLOCK
+
+    def connections(self, server_ids: Optional[Iterable[int]] = None,
+                    quote_ids: Optional[Iterable[int]] = None) -> List[sqlite3.Connection]:
+        """Connections to every shard holding any of the servers or quotes given, or to all shards"""
+        return [self._connect(s) for s in self._shards_for(server_ids, quote_ids)]
+
+    def merges(self, server_ids=None, quote_ids=None, attach: bool = True) -> bool:
+        """Whether read() would have to combine the results of several queries"""
+        return len(self._shards_for(server_ids, quote_ids)) > (ATTACH_LIMIT - 1 if attach else 1)
+
+    def read(self, sql: str, params: Iterable = (), server_ids=None, quote_ids=None, *, attach: bool = True,
+             key: Callable = None, reverse: bool = False, limit: Optional[int] = None) -> list:
+        """
+        Runs a query over the quotes of the given servers or quote IDs, or of all shards
+
+        Up to ATTACH_LIMIT - 1 shards are queried at once through one
+        connection. With more than that, or one at a time with attach=False
+        (FTS tables can't be queried through a view), the results of each
+        query are concatenated, then sorted by key and cut to limit if given.
+        """
+        shards = self._shards_for(server_ids, quote_ids)
+        size = ATTACH_LIMIT - 1 if attach else 1
+        params = list(params)
+
+        if not shards:
+            # the shared database's quotes table is empty, so this gives
+            # an empty result of the right shape (zero counts and so on)
+            return self.db.execute(sql, params).fetchall()
+
+        rows = []
+
+        for i in range(0, len(shards), size):
+            rows.extend(self._read_group(shards[i:i + size], sql, params))
+
+        if len(shards) > size:
+            if key is not None:
+                rows.sort(key=key, reverse=reverse)
+
+            if limit is not None:
+                del rows[limit:]
+
+        return rows
+
+    def _read_group(self, shards: List[int], sql: str, params: list) -> list:
+        con = self._connect(shards[0])
+
+        if len(shards) == 1:
+            return con.execute(sql, params).fetchall()
+
+        attached = []
+
+        try:
+            for shard in shards[1:]:
+                con.execute("ATTACH ? AS shard_%i;" % shard, (self.path(shard),))
+                attached.append('shard_%i' % shard)
+
+            # shadows main.quotes for this connection until dropped below
+            con.execute("CREATE TEMP VIEW quotes AS %s;"
+                        % ' UNION ALL '.join('SELECT * FROM %s.quotes' % s for s in ['main'] + attached))
+            return con.execute(sql, params).fetchall()
+        finally:
+            con.execute("DROP VIEW IF EXISTS temp.quotes;")
+
+            for schema in attached:
+                con.execute("DETACH %s;" % schema)
+
+    def close(self):
+        for con in self._open.values():
+            con.close()
+
+        self._open.clear()
+
+
+# Migration
+
+def split(cog, buckets: int) -> dict:
+    """Moves the quotes of a single-file database into shards, returning a summary"""
+    db = cog.db
+    root = cog.shard_root
+
+    if cog.store.sharded:
+        raise ValueError('already sharded; merge first to change the layout')
+    elif os.path.isdir(root) and any(f.startswith('quotes_') for f in os.listdir(root)):
+        raise ValueError('%s already holds shard files' % root)
+
+    start = perf_counter()
+    base = db.execute("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'quotes';").fetchone()[0]
+    base = max(base, db.execute("SELECT COALESCE(MAX(quote_id), 0) FROM quotes;").fetchone()[0]) + 1
+    store = ShardedStore(db, root, buckets, base, cog._init_shard)
+    groups = {}  # type: Dict[int, List[int]]
+
+    for (server_id,) in db.execute("SELECT DISTINCT server_id FROM quotes;").fetchall():
+        groups.setdefault(store.shard_of(server_id, create=True), []).append(server_id)
+
+    columns = ', '.join('"%s"' % r[1] for r in db.execute("PRAGMA table_info(quotes);"))
+    moved = 0
+
+    for shard, server_ids in sorted(groups.items()):
+        con = store._connect(shard)
+        marks = ', '.join('?' * len(server_ids))
+
+        with con:
+            moved += con.execute("INSERT INTO main.quotes ({0}) SELECT {0} FROM shared.quotes WHERE server_id "
+                                 "IN ({1}) ORDER BY quote_id;".format(columns, marks), server_ids).rowcount
+            con.execute("INSERT OR REPLACE INTO main.server_counters (server_id, last_qid) SELECT server_id, "
+                        "last_qid FROM shared.server_counters WHERE server_id IN (%s);" % marks, server_ids)
+            con.execute("INSERT INTO shared.shard_quotes (quote_id, shard) SELECT quote_id, ? FROM main.quotes;",
+                        (shard,))
+
+    total = db.execute("SELECT COUNT(*) FROM quotes;").fetchone()[0]
+
+    if moved != total:
+        raise RuntimeError('copied %i of %i quotes; the single-file layout is still in use' % (moved, total))
+
+    store.close()
+    write_layout(root, buckets, base)
+
+    with db as con:
+        con.executescript(CLEAR_SHARED_SQL)
+
+    db.execute("VACUUM;")
+    return {'quotes': moved, 'servers': sum(map(len, groups.values())), 'shards': len(groups),
+            'seconds': perf_counter() - start}
+
+
+def merge(cog) -> dict:
+    """Moves every shard's quotes back into the shared database, returning a summary"""
+    db = cog.db
+    store = cog.store
+
+    if not store.sharded:
+        raise ValueError('not sharded')
+
+    start = perf_counter()
+    shards = store.shards()
+    columns = ', '.join('"%s"' % r[1] for r in db.execute("PRAGMA table_info(quotes);"))
+    expected = moved = 0
+    store.close()
+
+    for shard in shards:
+        if not os.path.exists(store.path(shard)):
+            continue
+
+        db.execute("ATTACH ? AS src;", (store.path(shard),))
+
+        try:
+            with db as con:
+                expected += con.execute("SELECT COUNT(*) FROM src.quotes;").fetchone()[0]
+                moved += con.execute("INSERT INTO main.quotes ({0}) SELECT {0} FROM src.quotes ORDER BY quote_id;"
+                                     .format(columns)).rowcount
+                con.execute("INSERT OR REPLACE INTO main.server_counters (server_id, last_qid) "
+                            "SELECT server_id, last_qid FROM src.server_counters;")
+        finally:
+            db.execute("DETACH src;")
+
+    if moved != expected:
+        raise RuntimeError('copied %i of %i quotes; the sharded layout is still in use' % (moved, expected))
+
+    os.remove(os.path.join(store.root, LAYOUT_FILE))
+
+    with db as con:
+        con.execute("DELETE FROM shard_map;")
+        con.execute("DELETE FROM shard_quotes;")
+        con.execute("DELETE FROM shard_blocks;")
+
+    for shard in shards:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(store.path(shard) + suffix):
+                os.remove(store.path(shard) + suffix)
+
+    return {'quotes': moved, 'shards': len(shards), 'seconds': perf_counter() - start}
+
+
+def status(cog) -> dict:
+    store = cog.store
+
+    if not store.sharded:
+        return {'layout': 'single', 'quotes': cog.db.execute("SELECT COUNT(*) FROM quotes;").fetchone()[0],
+                'bytes': os.path.getsize(db_path(cog.db))}
+
+    shards = OrderedDict()
+
+    for shard in store.shards():
+        con = store._connect(shard)
+        shards[shard] = {
+            'servers': sum(1 for s in store._map.values() if s == shard),
+            'quotes': con.execute("SELECT COUNT(*) FROM main.quotes;").fetchone()[0],
+            'bytes': os.path.getsize(store.path(shard))
+        }
+
+    return {'layout': 'buckets' if store.buckets else 'per-server', 'buckets': store.buckets,
+            'quotes': sum(s['quotes'] for s in shards.values()), 'shared_bytes': os.path.getsize(store._shared_path),
+            'shards': shards}
+
+
+def open_cog(path: str):
+    from .serverquotes import ServerQuotes
+
+    # the storage layer only needs a connection, not a bot
+    cog = ServerQuotes.__new__(ServerQuotes)
+    cog.bot = None
+    cog._open_db(path)
+    return cog
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m serverquotes.shards', description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+
+    p = sub.add_parser('split', help='move quotes from quotes.sqlite into shards')
+    p.add_argument('db')
+    group = p.add_mutually_exclusive_group(required=True)
+    group.add_argument('--buckets', type=int, help='number of shards to hash servers into')
+    group.add_argument('--per-server', action='store_true', help='one shard per server')
+
+    p = sub.add_parser('merge', help='move quotes from the shards back into quotes.sqlite')
+    p.add_argument('db')
+
+    p = sub.add_parser('status', help='show the layout and shard sizes')
+    p.add_argument('db')
+
+    args = parser.parse_args(argv)
+    cog = open_cog(args.db)
+
+    try:
+        if args.command == 'split':
+            if args.buckets is not None and args.buckets < 1:
+                parser.error('--buckets must be at least 1')
+
+            result = split(cog, 0 if args.per_server else args.buckets)
+        elif args.command == 'merge':
+            result = merge(cog)
+        else:
+            result = status(cog)
+    except (ValueError, RuntimeError) as e:
+        sys.exit(str(e))
+    finally:
+        cog.store.close()
+        cog.db.close()
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
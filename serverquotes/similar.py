@@ -0,0 +1,312 @@
+from array import array
+from collections import Counter
+import heapq
+import math
+import os
+import pickle
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+FORMAT_VERSION = 1
+
+# Quotes sharing only terms this common aren't meaningfully similar, and
+# walking their postings would approach a full scan.
+MAX_DF_RATIO = 0.05
+MIN_DF_CAP = 1000
+
+# Norms are computed with the IDFs of the moment; recompute them all once
+# the quote count drifts this far from when they last were. Scores are
+# clamped, as norms can lag slightly behind in between.
+RENORM_DRIFT = 0.1
+
+STOPWORDS = frozenset("""
+a about after all also am an and any are as at be because been but by can could did do does doing don for from
+get got had has have he her him his how i if im in into is it its just like me more my no not now of on one or
+our out so some than that the their them then there they this to too up us was we were what when which who will
+with would you your
+""".split())
+
+_WORDS = re.compile(r"[^\W_]+(?:'[^\W_]+)?")
+
+# Keeps the in-memory index in step with every write to quotes, whichever
+# code path makes it. TEMP, so only the connection that has the index
+# registered fires them.
+TFIDF_TRIGGERS_SQL = """
+CREATE TEMP TRIGGER IF NOT EXISTS quotes_tfidf_INSERT AFTER INSERT ON main.quotes
+  BEGIN
+    SELECT tfidf_add(NEW.quote_id, NEW.server_id, NEW.quote);
+  END;
+
+CREATE TEMP TRIGGER IF NOT EXISTS quotes_tfidf_UPDATE AFTER UPDATE ON main.quotes
+  WHEN OLD.quote IS NOT NEW.quote OR OLD.server_id IS NOT NEW.server_id
+  BEGIN
+    SELECT tfidf_remove(OLD.quote_id, OLD.quote);
+    SELECT tfidf_add(NEW.quote_id, NEW.server_id, NEW.quote);
+  END;
+
+CREATE TEMP TRIGGER IF NOT EXISTS quotes_tfidf_DELETE AFTER DELETE ON main.quotes
+  BEGIN
+    SELECT tfidf_remove(OLD.quote_id, OLD.quote);
+  END;
+"""
+
+
+def tokenize(text: Optional[str]) -> Counter:
+    return Counter(w for w in _WORDS.findall((text or '').lower()) if len(w) > 1 and w not in STOPWORDS)
+
+
+class TfidfIndex:
+    """
+    Sparse TF-IDF vectors of quote text, for "similar quotes" lookups
+
+    Stored as an inverted index: per term, parallel arrays of quote IDs and
+    log-scaled term frequencies. Per-quote norms and server IDs live in
+    arrays indexed by quote_id. A lookup only walks the postings of the
+    query quote's own terms, rarest first, skipping terms so common their
+    postings would approach a full scan.
+
+    Quotes are added and removed one at a time as they change, and the
+    whole index is pickled to `path` between runs.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.terms = {}  # type: Dict[str, int]
+        self.df = array('I')
+        self.postings = []  # type: List[Tuple[array, array]]
+        self.norms = array('f')
+        self.servers = array('q')
+        self.present = bytearray()
+        self.docs = 0
+        self.normalized_docs = 0
+        self.dirty = False
+        self.ready = False
+
+    def __len__(self):
+        return self.docs
+
+    def __contains__(self, quote_id):
+        return quote_id < len(self.present) and self.present[quote_id]
+
+    def register(self, con):
+        """Adds the SQL functions and TEMP triggers that keep the index up to date on a connection"""
+        con.create_function('tfidf_add', 3, self.add)
+        con.create_function('tfidf_remove', 2, self.remove)
+        con.executescript(TFIDF_TRIGGERS_SQL)
+
+    def idf(self, term_id: int) -> float:
+        # smoothed, so a term in every quote still counts a little
+        return math.log((1 + self.docs) / (1 + self.df[term_id])) + 1
+
+    def _grow(self, quote_id: int):
+        if quote_id >= len(self.present):
+            extra = quote_id + 1024 - len(self.present)
+            self.norms.extend([0.0] * extra)
+            self.servers.extend([0] * extra)
+            self.present.extend(bytes(extra))
+
+    def _norm(self, tf: Dict[int, float]) -> float:
+        return math.sqrt(sum((w * self.idf(t)) ** 2 for t, w in tf.items()))
+
+    def _vector(self, text: Optional[str], create: bool = False) -> Dict[int, float]:
+        vec = {}
+
+        for word, count in tokenize(text).items():
+            term_id = self.terms.get(word)
+
+            if term_id is None:
+                if not create:
+                    continue
+
+                term_id = self.terms[word] = len(self.df)
+                self.df.append(0)
+                self.postings.append((array('I'), array('f')))
+
+            vec[term_id] = 1 + math.log(count)
+
+        return vec
+
+    def add(self, quote_id: int, server_id: int, text: Optional[str], update_norm: bool = True):
+        if quote_id in self:
+            return
+
+        self._grow(quote_id)
+        vec = self._vector(text, create=True)
+
+        for term_id, weight in vec.items():
+            ids, weights = self.postings[term_id]
+            ids.append(quote_id)
+            weights.append(weight)
+            self.df[term_id] += 1
+
+        self.docs += 1
+        self.present[quote_id] = 1
+        self.servers[quote_id] = server_id or 0
+        self.norms[quote_id] = self._norm(vec) if update_norm else 0.0
+        self.dirty = True
+
+        if update_norm and abs(self.docs - self.normalized_docs) > self.normalized_docs * RENORM_DRIFT:
+            self.renormalize()
+
+    def remove(self, quote_id: int, text: Optional[str]):
+        """Removes a quote, given the text it was indexed with"""
+        if quote_id not in self:
+            return
+
+        for term_id in self._vector(text):
+            ids, weights = self.postings[term_id]
+
+            try:
+                i = ids.index(quote_id)
+            except ValueError:
+                continue
+
+            del ids[i]
+            del weights[i]
+            self.df[term_id] -= 1
+
+        self.docs -= 1
+        self.present[quote_id] = 0
+        self.norms[quote_id] = 0.0
+        self.dirty = True
+
+    def purge(self, quote_ids: Iterable[int]):
+        """Drops quotes whose text is no longer known, by filtering every posting list"""
+        gone = {q for q in quote_ids if q in self}
+
+        if not gone:
+            return
+
+        for term_id, (ids, weights) in enumerate(self.postings):
+            if not gone.isdisjoint(ids):
+                keep = [i for i, q in enumerate(ids) if q not in gone]
+                self.postings[term_id] = (array('I', (ids[i] for i in keep)), array('f', (weights[i] for i in keep)))
+                self.df[term_id] = len(keep)
+
+        for q in gone:
+            self.present[q] = 0
+            self.norms[q] = 0.0
+
+        self.docs -= len(gone)
+        self.dirty = True
+
+    def renormalize(self):
+        """Recomputes every quote's norm with the current IDFs, after bulk adds"""
+        sums = array('d', bytes(8 * len(self.norms)))
+
+        for term_id, (ids, weights) in enumerate(self.postings):
+            idf = self.idf(term_id)
+
+            for q, w in zip(ids, weights):
+                sums[q] += (w * idf) ** 2
+
+        self.norms = array('f', map(math.sqrt, sums))
+        self.normalized_docs = self.docs
+        self.dirty = True
+
+    def similar(self, text: Optional[str], server_ids: Optional[Iterable[int]] = None, k: int = 10,
+                exclude: Optional[int] = None) -> List[Tuple[int, float]]:
+        """(quote_id, cosine similarity) of the k quotes most like text, limited to server_ids if given"""
+        vec = {t: w * self.idf(t) for t, w in self._vector(text).items()}
+        norm = math.sqrt(sum(w * w for w in vec.values()))
+
+        if not norm:
+            return []
+
+        scope = None if server_ids is None else set(server_ids)
+        cap = max(MIN_DF_CAP, int(self.docs * MAX_DF_RATIO))
+        scores = {}  # type: Dict[int, float]
+
+        for term_id in sorted(vec, key=self.df.__getitem__):
+            if self.df[term_id] > cap:
+                break
+
+            ids, weights = self.postings[term_id]
+            qw = vec[term_id] * self.idf(term_id)
+
+            for q, w in zip(ids, weights):
+                scores[q] = scores.get(q, 0.0) + qw * w
+
+        norms = self.norms
+        servers = self.servers
+        ranked = ((q, min(1.0, s / (norm * norms[q]))) for q, s in scores.items()
+                  if q != exclude and norms[q] and (scope is None or servers[q] in scope))
+        return heapq.nlargest(k, ranked, key=lambda x: x[1])
+
+    def sync(self, *cons, batch_size: int = 2000):
+        """
+        Brings the index up to date with the quotes tables of cons, one batch per step
+
+        A generator, so callers can yield to the event loop between batches.
+        """
+        ids = [{r[0] for r in con.execute("SELECT quote_id FROM quotes;")} for con in cons]
+        add, purge = self.missing(set().union(*ids))
+        self.purge(purge)
+        bulk = len(add) > self.docs
+
+        for con, con_ids in zip(cons, ids):
+            con_add = [q for q in add if q in con_ids]
+
+            for i in range(0, len(con_add), batch_size):
+                batch = con_add[i:i + batch_size]
+
+                for row in con.execute("SELECT quote_id, server_id, quote FROM quotes WHERE quote_id IN (%s);"
+                                       % ', '.join('?' * len(batch)), batch):
+                    self.add(*row, update_norm=not bulk)
+
+                yield
+
+        # IDFs moved a lot; norms computed along the way are stale
+        if bulk:
+            self.renormalize()
+
+        self.ready = True
+
+    # Persistence
+
+    def save(self):
+        if not self.path:
+            return
+
+        state = {
+            'version'        : FORMAT_VERSION,
+            'terms'          : self.terms,
+            'df'             : self.df,
+            'postings'       : self.postings,
+            'norms'          : self.norms,
+            'servers'        : self.servers,
+            'present'        : self.present,
+            'docs'           : self.docs,
+            'normalized_docs': self.normalized_docs
+        }
+        tmp = self.path + '.tmp'
+
+        with open(tmp, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+    def load(self) -> bool:
+        """Loads the saved index, returning False if there is none or it is unusable"""
+        try:
+            with open(self.path, 'rb') as f:
+                state = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, TypeError):
+            return False
+
+        if not isinstance(state, dict) or state.get('version') != FORMAT_VERSION:
+            return False
+
+        for k in ('terms', 'df', 'postings', 'norms', 'servers', 'present', 'docs', 'normalized_docs'):
+            setattr(self, k, state[k])
+
+        self.dirty = False
+        return True
+
+    def missing(self, db_ids: Iterable[int]) -> Tuple[List[int], List[int]]:
+        """Compares the index to the quote IDs in the DB, returning (IDs to add, IDs to purge)"""
+        db_ids = set(db_ids)
+        indexed = {q for q, p in enumerate(self.present) if p}
+        return sorted(db_ids - indexed), sorted(indexed - db_ids)
@@ -1,10 +1,12 @@
 from __future__ import annotations
 import asyncio
+import collections.abc
+import inspect
 import json
 import logging
 from asyncio import as_completed, Semaphore
 from asyncio.futures import isfuture
-from itertools import chain
+from itertools import chain, islice
 from pathlib import Path
 from typing import (
     TYPE_CHECKING,
@@ -188,13 +190,73 @@ async def _sem_wrapper(sem, task):
         return await task
 
 
+async def _run_bounded(
+    awaitables: Union[Iterator[Awaitable[_T]], AsyncIterator[Awaitable[_T]]],
+    limit: int,
+    *,
+    ordered: bool,
+    semaphore: Optional[Semaphore] = None,
+) -> AsyncIterator[_T]:
+    # Awaitables are only taken from the source as running ones finish, so
+    # no more than `limit` exist at once however long the source is.
+    is_async = isinstance(awaitables, collections.abc.AsyncIterator)
+    running = collections.deque()
+    # unordered results are collected as tasks finish, rather than calling
+    # asyncio.wait over every running task for each one
+    finished = collections.deque()
+    waiter = None
+
+    def on_done(task):
+        finished.append(task)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(running) - len(finished) < limit:
+                try:
+                    aw = await awaitables.__anext__() if is_async else next(awaitables)
+                except (StopIteration, StopAsyncIteration):
+                    exhausted = True
+                else:
+                    if semaphore is not None:
+                        aw = _sem_wrapper(semaphore, aw)
+                    task = asyncio.ensure_future(aw)
+                    running.append(task)
+                    if not ordered:
+                        task.add_done_callback(on_done)
+            if not running:
+                return
+            if ordered:
+                # the results of later tasks wait here until it's their turn
+                task = running[0]
+                yield await task
+                running.popleft()
+            else:
+                if not finished:
+                    waiter = asyncio.get_running_loop().create_future()
+                    await waiter
+                task = finished.popleft()
+                running.remove(task)
+                yield task.result()
+    finally:
+        for task in running:
+            task.cancel()
+
+
 def bounded_gather_iter(
     *coros_or_futures, limit: int = 4, semaphore: Optional[Semaphore] = None
-) -> Iterator[Awaitable[Any]]:
+) -> Union[Iterator[Awaitable[Any]], AsyncIterator[Any]]:
     """
     An iterator that returns tasks as they are ready, but limits the
     number of tasks running at a time.
 
+    If a single iterable or async iterable of awaitables is passed instead,
+    an async iterator of their results, in the order they finish, is
+    returned. Awaitables are only taken from it as running ones finish,
+    so no more than ``limit`` exist at once, however many it yields.
+
     Parameters
     ----------
     *coros_or_futures
@@ -210,9 +272,30 @@ def bounded_gather_iter(
     ------
     TypeError
         When invalid parameters are passed
+
+    Examples
+    --------
+    >>> from redbot.core.utils import bounded_gather_iter
+    >>> async for member in bounded_gather_iter(
+    ...     (guild.fetch_member(user_id) for user_id in user_ids), limit=8
+    ... ):
+    ...     print(member)
+
     """
     loop = asyncio.get_running_loop()
 
+    if len(coros_or_futures) == 1 and not inspect.isawaitable(coros_or_futures[0]):
+        source = coros_or_futures[0]
+        if isinstance(source, collections.abc.AsyncIterable):
+            awaitables = source.__aiter__()
+        elif isinstance(source, collections.abc.Iterable):
+            awaitables = iter(source)
+        else:
+            raise TypeError("expected awaitables, or an iterable of them")
+        if not isinstance(limit, int) or limit <= 0:
+            raise TypeError("limit must be an int > 0")
+        return _run_bounded(awaitables, limit, ordered=False, semaphore=semaphore)
+
     if semaphore is None:
         if not isinstance(limit, int) or limit <= 0:
             raise TypeError("limit must be an int > 0")
@@ -534,6 +617,95 @@ class AsyncIter(AsyncIterator[_T], Awaitable[List[_T]]):  # pylint: disable=dupl
         self._map = func
         return self
 
+    async def chunks(self, n: int) -> AsyncIterator[List[_T]]:
+        """Iterates over lists of up to ``n`` items at a time.
+
+        This is much faster than taking items one by one over a large
+        iterable. Rather than sleeping between items, it sleeps once per
+        chunk, for as long as the items in it would have slept in total.
+
+        Parameters
+        ----------
+        n: int
+            The number of items in each chunk. The last may have fewer.
+
+        Raises
+        ------
+        ValueError
+            When ``n`` is lower than 1.
+
+        Examples
+        --------
+        >>> from redbot.core.utils import AsyncIter
+        >>> async for chunk in AsyncIter(range(5)).chunks(2):
+        ...     print(chunk)
+        [0, 1]
+        [2, 3]
+        [4]
+
+        """
+        if n < 1:
+            raise ValueError("Chunks must have at least 1 item")
+        while True:
+            chunk = list(islice(self._iterator, n))
+            if not chunk:
+                return
+            # the sleeps __anext__ would have taken over these items
+            sleeps = (self._i + len(chunk) - 1) // self._steps
+            self._i = (self._i + len(chunk) - 1) % self._steps + 1
+            if sleeps:
+                await asyncio.sleep(self._delay * sleeps)
+            if self._map is not None:
+                chunk = [await maybe_coroutine(self._map, item) for item in chunk]
+            yield chunk
+
+    def map_concurrent(
+        self,
+        func: Callable[[_T], Union[_S, Awaitable[_S]]],
+        limit: int = 4,
+        *,
+        ordered: bool = True,
+    ) -> AsyncIterator[_S]:
+        """Iterates over the results of ``func`` on each item, running up to ``limit`` at once.
+
+        Items are only taken as running calls finish, so a slow consumer
+        or a very long iterable doesn't pile up pending work.
+
+        Parameters
+        ----------
+        func: Union[Callable, Coroutine]
+            The function to call on each item. The function provided can be a coroutine.
+        limit: int
+            The maximum number of calls running at once. Defaults to 4.
+        ordered: bool
+            Whether to yield results in the order of the items. If ``False``,
+            they're yielded as soon as they're ready. Defaults to ``True``.
+
+        Raises
+        ------
+        TypeError
+            When ``func`` is not a callable, or ``limit`` isn't an int > 0.
+
+        Examples
+        --------
+        >>> from redbot.core.utils import AsyncIter
+        >>> async for member in AsyncIter(user_ids).map_concurrent(guild.fetch_member, 8):
+        ...     print(member)
+
+        """
+        if not callable(func):
+            raise TypeError("Mapping must be a callable.")
+        if not isinstance(limit, int) or limit <= 0:
+            raise TypeError("limit must be an int > 0")
+
+        async def calls():
+            # in chunks, so the iterator's delay isn't taken between every call
+            async for chunk in self.chunks(limit):
+                for item in chunk:
+                    yield maybe_coroutine(func, item)
+
+        return _run_bounded(calls(), limit, ordered=ordered)
+
 
 def get_end_user_data_statement(file: Union[Path, str]) -> Optional[str]:
     """
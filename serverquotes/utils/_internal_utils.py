@@ -3,25 +3,33 @@ from __future__ import annotations
 import asyncio
 import collections.abc
 import contextlib
+import hashlib
+import io
 import json
 import logging
 import os
 import re
 import shutil
+import sqlite3
 import tarfile
+import tempfile
 import warnings
+import weakref
 from datetime import datetime
 from pathlib import Path
+from time import monotonic
 from typing import (
     AsyncIterable,
     AsyncIterator,
     Awaitable,
     Callable,
+    Dict,
     Generator,
     Iterable,
     Iterator,
     List,
     Optional,
+    Set,
     Union,
     TypeVar,
     TYPE_CHECKING,
@@ -52,6 +60,9 @@ __all__ = (
     "fuzzy_command_search",
     "format_fuzzy_results",
     "create_backup",
+    "create_incremental_backup",
+    "restore_backup",
+    "BackupReport",
     "send_to_owners_with_preprocessor",
     "send_to_owners_with_prefix_replaced",
     "expected_version",
@@ -85,6 +96,93 @@ def _fuzzy_log_filter(record):
 logging.getLogger().addFilter(_fuzzy_log_filter)
 
 
+def _trigrams(text: str) -> Set[str]:
+    # padded so that the ends of short names still make trigrams
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class _CommandIndex:
+    """Trigram index of a bot's command names and aliases.
+
+    Names are processed for scoring once, when the index is built, and
+    searching only scores those sharing a trigram with the term, rather
+    than walking and scoring every command. The index is marked
+    stale when a cog is added or removed and rebuilt on the next search,
+    so loading many cogs at startup rebuilds it only once.
+    """
+
+    def __init__(self):
+        self.stale = True
+        self.builds = 0
+        self._names: List[str] = []
+        self._commands: List[Command] = []
+        self._postings: Dict[str, List[int]] = {}
+        self._top_level = 0
+
+    def build(self, bot: Red) -> None:
+        names, commands, postings = [], [], {}
+        for command in bot.walk_commands():
+            qualified = [command.qualified_name]
+            qualified.extend(f"{command.full_parent_name} {a}".lstrip() for a in command.aliases)
+            for name in map(rapidfuzz.utils.default_process, qualified):
+                for trigram in _trigrams(name):
+                    postings.setdefault(trigram, []).append(len(names))
+                names.append(name)
+                commands.append(command)
+
+        self._names, self._commands, self._postings = names, commands, postings
+        self._top_level = len(bot.all_commands)
+        self.stale = False
+        self.builds += 1
+
+    def needs_build(self, bot: Red) -> bool:
+        # top-level commands can also be added without a cog
+        return self.stale or self._top_level != len(bot.all_commands)
+
+    def search(
+        self, term: str, *, limit: int = 5, min_score: int = 0
+    ) -> List[Tuple[Command, float]]:
+        """The best matching commands scoring at least ``min_score``, best first."""
+        term = rapidfuzz.utils.default_process(term)
+        hits = set().union(*(self._postings.get(trigram, ()) for trigram in _trigrams(term)))
+        if not hits:
+            return []
+
+        # the final ranking is left to the same scorer as a full search
+        extracted = rapidfuzz.process.extract(
+            term,
+            {i: self._names[i] for i in hits},
+            limit=None,
+            scorer=rapidfuzz.fuzz.QRatio,
+            score_cutoff=min_score,
+        )
+        results = {}
+        for __, score, i in extracted:
+            # a command matched by an alias as well as its name is listed once
+            results.setdefault(self._commands[i], score)
+            if len(results) == limit:
+                break
+        return list(results.items())
+
+    async def _on_cog_change(self, cog) -> None:
+        self.stale = True
+
+
+_command_indexes: weakref.WeakKeyDictionary[Red, _CommandIndex] = weakref.WeakKeyDictionary()
+
+
+def _get_command_index(bot: Red) -> _CommandIndex:
+    index = _command_indexes.get(bot)
+    if index is None:
+        index = _command_indexes[bot] = _CommandIndex()
+        bot.add_listener(index._on_cog_change, "on_cog_add")
+        bot.add_listener(index._on_cog_change, "on_cog_remove")
+    if index.needs_build(bot):
+        index.build(bot)
+    return index
+
+
 async def fuzzy_command_search(
     ctx: Context,
     term: Optional[str] = None,
@@ -106,7 +204,8 @@ async def fuzzy_command_search(
         `Context.invoked_with` will be used instead.
     commands : Optional[Union[AsyncIterator[commands.Command], Iterator[commands.Command]]]
         The commands available to choose from when doing a fuzzy match.
-        When omitted, `Bot.walk_commands` will be used instead.
+        When omitted, all of the bot's commands and their aliases are
+        searched, through an index kept up to date as cogs load and unload.
     min_score : int
         The minimum score for matched commands to reach. Defaults to 80.
 
@@ -147,26 +246,31 @@ async def fuzzy_command_search(
             return None
 
     if commands is None:
-        choices = {c: c.qualified_name for c in ctx.bot.walk_commands()}
-    elif isinstance(commands, collections.abc.AsyncIterator):
-        choices = {c: c.qualified_name async for c in commands}
+        # `extracted` is a list of tuples in the form `(cmd, score)`
+        extracted = _get_command_index(ctx.bot).search(term, limit=5, min_score=min_score)
     else:
-        choices = {c: c.qualified_name for c in commands}
-
-    # Do the scoring. `extracted` is a list of tuples in the form `(cmd_name, score, cmd)`
-    extracted = rapidfuzz.process.extract(
-        term,
-        choices,
-        limit=5,
-        scorer=rapidfuzz.fuzz.QRatio,
-        processor=rapidfuzz.utils.default_process,
-    )
+        if isinstance(commands, collections.abc.AsyncIterator):
+            choices = {c: c.qualified_name async for c in commands}
+        else:
+            choices = {c: c.qualified_name for c in commands}
+
+        # Do the scoring. `extracted` is a list of tuples in the form `(cmd, score)`
+        extracted = [
+            (command, score)
+            for __, score, command in rapidfuzz.process.extract(
+                term,
+                choices,
+                limit=5,
+                scorer=rapidfuzz.fuzz.QRatio,
+                processor=rapidfuzz.utils.default_process,
+            )
+        ]
     if not extracted:
         return None
 
     # Filter through the fuzzy-matched commands.
     matched_commands = []
-    for __, score, command in extracted:
+    for command, score in extracted:
         if score < min_score:
             # Since the list is in decreasing order of score, we can exit early.
             break
@@ -216,15 +320,360 @@ async def format_fuzzy_results(
         return "Perhaps you wanted one of these? " + box("\n".join(lines), lang="vhdl")
 
 
-async def create_backup(dest: Path = Path.home()) -> Optional[Path]:
+class BackupReport:
+    """What a backup wrote and how long it took.
+
+    Attributes
+    ----------
+    path : pathlib.Path
+        The archive written.
+    incremental : bool
+        Whether the archive only holds what changed since the last backup
+        to the same destination. If not, it holds everything.
+    files : int
+        How many files were archived.
+    unchanged : int
+        How many files were left out because they hadn't changed.
+    deleted : int
+        How many files were deleted since the last backup.
+    bytes_read : int
+        The uncompressed size of the files archived.
+    bytes_written : int
+        The size of the archive.
+    """
+
+    __slots__ = (
+        "path",
+        "incremental",
+        "files",
+        "unchanged",
+        "deleted",
+        "bytes_read",
+        "bytes_written",
+        "started",
+        "finished",
+    )
+
+    def __init__(self, path: Path, incremental: bool):
+        self.path = path
+        self.incremental = incremental
+        self.files = 0
+        self.unchanged = 0
+        self.deleted = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.started = monotonic()
+        self.finished: Optional[float] = None
+
+    def __repr__(self) -> str:
+        return (
+            f"<BackupReport path={str(self.path)!r} incremental={self.incremental}"
+            f" files={self.files} unchanged={self.unchanged} deleted={self.deleted}"
+            f" bytes_written={self.bytes_written} elapsed={self.elapsed:.2f}>"
+        )
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds taken, so far if the backup is still running."""
+        return (self.finished or monotonic()) - self.started
+
+
+_BACKUP_CHUNK_SIZE = 1 << 20
+_SQLITE_HEADER = b"SQLite format 3\x00"
+_SQLITE_SIDECARS = ("-wal", "-shm", "-journal")
+#: Archive members listing the files deleted since the previous backup, and
+#: the new sizes of databases archived as changed chunks under _CHUNKS_DIR.
+_DELETED_MEMBER = ".backup/deleted.json"
+_PATCHES_MEMBER = ".backup/patches.json"
+_CHUNKS_DIR = ".backup/chunks/"
+
+
+def _is_sqlite(path: Path) -> bool:
+    try:
+        with path.open("rb") as fp:
+            return fp.read(len(_SQLITE_HEADER)) == _SQLITE_HEADER
+    except OSError:
+        return False
+
+
+def _stat_key(path: Path, sqlite: bool) -> List[int]:
+    # a database in WAL mode can change without its main file being touched
+    paths = [path, path.with_name(path.name + "-wal")] if sqlite else [path]
+    key = []
+    for p in paths:
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            key.extend((-1, -1))
+        else:
+            key.extend((st.st_size, st.st_mtime_ns))
+    return key
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as fp:
+        for chunk in iter(lambda: fp.read(_BACKUP_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _chunk_digests(path: Path) -> List[str]:
+    with path.open("rb") as fp:
+        return [
+            hashlib.sha256(chunk).hexdigest()
+            for chunk in iter(lambda: fp.read(_BACKUP_CHUNK_SIZE), b"")
+        ]
+
+
+def _snapshot_sqlite(src: Path, dst: Path) -> None:
+    # the online backup API gives a consistent copy while the bot keeps writing
+    with contextlib.closing(sqlite3.connect(str(src))) as source, contextlib.closing(
+        sqlite3.connect(str(dst))
+    ) as target:
+        source.backup(target, pages=1024)
+
+
+def _add_bytes(tar: tarfile.TarFile, name: str, data: bytes) -> None:
+    tarinfo = tarfile.TarInfo(name)
+    tarinfo.size = len(data)
+    tar.addfile(tarinfo, io.BytesIO(data))
+
+
+def _write_archive(
+    archive: Path,
+    data_path: Path,
+    to_backup: List[Path],
+    old_files: Dict[str, dict],
+    report: BackupReport,
+) -> Dict[str, dict]:
+    databases = {f for f in to_backup if _is_sqlite(f)}
+    # sidecars are part of the snapshot of their database
+    skip = {db.with_name(db.name + ext) for db in databases for ext in _SQLITE_SIDECARS}
+    files = {}
+    patches = {}
+
+    with tempfile.TemporaryDirectory() as tmpdir, archive.open("wb") as raw:
+        # a stream, so nothing is held in memory or seeked back over
+        with tarfile.open(fileobj=raw, mode="w|gz") as tar:
+            for f in to_backup:
+                if f in skip:
+                    continue
+                name = f.relative_to(data_path).as_posix()
+                sqlite = f in databases
+                key = _stat_key(f, sqlite)
+                entry = old_files.get(name)
+                if entry is not None and entry["key"] == key:
+                    files[name] = entry
+                    report.unchanged += 1
+                    continue
+
+                if sqlite:
+                    source = Path(tmpdir, "snapshot.sqlite")
+                    with contextlib.suppress(FileNotFoundError):
+                        source.unlink()
+                    _snapshot_sqlite(f, source)
+                    chunks = _chunk_digests(source)
+                    digest = hashlib.sha256("".join(chunks).encode()).hexdigest()
+                    files[name] = {"key": key, "sha256": digest, "chunks": chunks}
+                else:
+                    source = f
+                    chunks = None
+                    files[name] = {"key": key, "sha256": _sha256(source)}
+                if entry is not None and entry["sha256"] == files[name]["sha256"]:
+                    report.unchanged += 1
+                    continue
+
+                report.files += 1
+                old_chunks = entry and entry.get("chunks")
+                if chunks is not None and old_chunks is not None:
+                    # a big database mostly changes in a few places, so only
+                    # the chunks that differ are archived
+                    with source.open("rb") as fp:
+                        for index, chunk in enumerate(chunks):
+                            if index < len(old_chunks) and old_chunks[index] == chunk:
+                                continue
+                            fp.seek(index * _BACKUP_CHUNK_SIZE)
+                            data = fp.read(_BACKUP_CHUNK_SIZE)
+                            _add_bytes(tar, f"{_CHUNKS_DIR}{name}/{index}", data)
+                            report.bytes_read += len(data)
+                    patches[name] = source.stat().st_size
+                    continue
+
+                tarinfo = tar.gettarinfo(str(source), arcname=name)
+                tarinfo.mtime = f.stat().st_mtime
+                with source.open("rb") as fp:
+                    tar.addfile(tarinfo, fp)
+                report.bytes_read += tarinfo.size
+
+            if report.incremental:
+                deleted = sorted(set(old_files) - set(files))
+                report.deleted = len(deleted)
+                _add_bytes(tar, _PATCHES_MEMBER, json.dumps(patches).encode())
+                _add_bytes(tar, _DELETED_MEMBER, json.dumps(deleted).encode())
+    return files
+
+
+def _write_backup(
+    data_path: Path, to_backup: List[Path], archive: Path, manifest_path: Path, incremental: bool
+) -> BackupReport:
+    previous = {}
+    if incremental:
+        try:
+            with manifest_path.open() as fs:
+                previous = json.load(fs)
+        except (OSError, ValueError):
+            # no usable manifest, so start over with a full backup
+            previous = {}
+    old_files = previous.get("files", {})
+    report = BackupReport(archive, incremental=bool(old_files))
+
+    partial = archive.with_name(archive.name + ".partial")
+    try:
+        files = _write_archive(partial, data_path, to_backup, old_files, report)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            partial.unlink()
+        raise
+    partial.replace(archive)
+
+    # the manifest is only updated once the archive it describes is complete
+    archives = previous.get("archives", []) if report.incremental else []
+    manifest = {"archives": archives + [archive.name], "files": files}
+    tmp_manifest = manifest_path.with_name(manifest_path.name + ".partial")
+    with tmp_manifest.open("w") as fs:
+        json.dump(manifest, fs)
+    tmp_manifest.replace(manifest_path)
+
+    report.bytes_written = archive.stat().st_size
+    report.finished = monotonic()
+    return report
+
+
+def _restore_target(dest: Path, name: str) -> Path:
+    # archives name the files they patch or delete; none may point outside dest
+    target = (dest / name).resolve()
+    try:
+        target.relative_to(dest)
+    except ValueError:
+        raise ValueError(f"backup member {name!r} is outside of {dest}") from None
+    return target
+
+
+def restore_backup(manifest: Path, dest: Path) -> None:
+    """Restore the data backed up by `create_incremental_backup`.
+
+    Every archive listed in the manifest, from the last full backup on,
+    is applied to ``dest`` in order.
+
+    Raises
+    ------
+    ValueError
+        An archive names a file outside of ``dest``.
+
+    Parameters
+    ----------
+    manifest : pathlib.Path
+        The manifest left next to the archives.
+    dest : pathlib.Path
+        The directory to restore the data to.
+
+    """
+    with manifest.open() as fs:
+        archives = json.load(fs)["archives"]
+
+    dest.mkdir(parents=True, exist_ok=True)
+    dest = dest.resolve()
+    for name in archives:
+        patches, deleted = {}, []
+        with tarfile.open(str(manifest.parent / name), "r|gz") as tar:
+            for member in tar:
+                if member.name == _PATCHES_MEMBER:
+                    patches = json.load(tar.extractfile(member))
+                elif member.name == _DELETED_MEMBER:
+                    deleted = json.load(tar.extractfile(member))
+                elif member.name.startswith(_CHUNKS_DIR):
+                    target, __, index = member.name[len(_CHUNKS_DIR) :].rpartition("/")
+                    with _restore_target(dest, target).open("r+b") as fp:
+                        fp.seek(int(index) * _BACKUP_CHUNK_SIZE)
+                        shutil.copyfileobj(tar.extractfile(member), fp)
+                else:
+                    tar.extract(member, str(dest), filter="data")
+        for target, size in patches.items():
+            os.truncate(_restore_target(dest, target), size)
+        for target in deleted:
+            with contextlib.suppress(FileNotFoundError):
+                _restore_target(dest, target).unlink()
+
+
+async def create_incremental_backup(
+    dest: Path = Path.home(), *, incremental: bool = True
+) -> Optional[BackupReport]:
+    """Back up the instance's data, only archiving what changed since the last backup.
+
+    Each backup to ``dest`` leaves a manifest of content hashes, and the
+    next one only archives files whose content differs from it. Files
+    whose size and modification time haven't changed aren't read at
+    all. Live SQLite databases are copied with SQLite's backup API, so
+    the copy is consistent while the bot keeps writing to them.
+
+    Changed databases are compared in 1 MiB chunks, and only the chunks
+    that differ are archived.
+
+    The first backup, or one made with ``incremental=False``, holds
+    everything. Use `restore_backup` with the manifest to restore the
+    full backup and the changes since.
+
+    Parameters
+    ----------
+    dest : pathlib.Path
+        The directory to write the archive and manifest to.
+    incremental : bool
+        Whether to only archive changes. Defaults to True.
+
+    Returns
+    -------
+    Optional[BackupReport]
+        What was written, or ``None`` if there's no data to back up.
+
+    """
     data_path = Path(data_manager.core_data_path().parent)
     if not data_path.exists():
         return None
 
     dest.mkdir(parents=True, exist_ok=True)
     timestr = datetime.utcnow().strftime("%Y-%m-%dT%H-%M-%S")
-    backup_fpath = dest / f"redv3_{data_manager.instance_name()}_{timestr}.tar.gz"
+    instance = data_manager.instance_name()
+    manifest_path = dest / f"redv3_{instance}.manifest.json"
+    backup_fpath = dest / f"redv3_{instance}_{timestr}.tar.gz"
+
+    to_backup = await _files_to_backup(data_path)
+    report = await asyncio.get_running_loop().run_in_executor(
+        None, _write_backup, data_path, to_backup, backup_fpath, manifest_path, incremental
+    )
+    main_log.info(
+        "Backed up %d files (%d unchanged, %d deleted) to %s: %d bytes in %.1fs",
+        report.files,
+        report.unchanged,
+        report.deleted,
+        report.path,
+        report.bytes_written,
+        report.elapsed,
+    )
+    return report
+
+
+async def create_backup(dest: Path = Path.home(), *, incremental: bool = False) -> Optional[Path]:
+    """Back up the instance's data to a ``.tar.gz`` archive in ``dest``.
 
+    With ``incremental``, only what changed since the last backup to
+    ``dest`` is archived. See `create_incremental_backup`.
+    """
+    report = await create_incremental_backup(dest, incremental=incremental)
+    return report and report.path
+
+
+async def _files_to_backup(data_path: Path) -> List[Path]:
     to_backup = []
     exclusions = [
         "__pycache__",
@@ -252,11 +701,7 @@ async def create_backup(dest: Path = Path.home()) -> Optional[Path]:
     for f in data_path.glob("**/*"):
         if not any(ex in str(f) for ex in exclusions) and f.is_file():
             to_backup.append(f)
-
-    with tarfile.open(str(backup_fpath), "w:gz") as tar:
-        for f in to_backup:
-            tar.add(str(f), arcname=str(f.relative_to(data_path)), recursive=False)
-    return backup_fpath
+    return to_backup
 
 
 # this might be worth moving to `bot.send_to_owners` at later date
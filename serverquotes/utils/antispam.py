@@ -1,10 +1,9 @@
-from datetime import datetime, timedelta
-from typing import Tuple, List
-from collections import namedtuple
+from collections import OrderedDict, deque
+from datetime import timedelta
+from time import monotonic
+from typing import Callable, Deque, Hashable, List, Optional, Tuple
 
-__all__ = ("AntiSpam",)
-
-_AntiSpamInterval = namedtuple("_AntiSpamInterval", ["period", "frequency"])
+__all__ = ("AntiSpam", "AntiSpamRegistry")
 
 
 class AntiSpam:
@@ -82,6 +81,13 @@ class AntiSpam:
         * 5 per 1 minute
         * 10 per 1 hour
         * 24 per 1 day
+    clock : Callable[[], float]
+        Returns the current time in seconds. Defaults to `time.monotonic`,
+        so changes to the system clock don't affect the intervals.
+
+    Each interval keeps only the times of its last ``frequency`` events, so
+    checking and stamping take constant time however many events there
+    were, and the memory used is bounded by the frequencies.
     """
 
     # TODO : Decorator interface for command check using `spammy`
@@ -95,17 +101,22 @@ class AntiSpam:
         (timedelta(days=1), 24),
     ]
 
-    def __init__(self, intervals: List[Tuple[timedelta, int]]):
-        self.__event_timestamps = []
-        _itvs = intervals or self.default_intervals
-        self.__intervals = [_AntiSpamInterval(*x) for x in _itvs]
-        self.__discard_after = max([x.period for x in self.__intervals])
+    __slots__ = ("__intervals", "__clock", "__last_stamp", "__discard_after")
 
-    def __interval_check(self, interval: _AntiSpamInterval):
-        return (
-            len([t for t in self.__event_timestamps if (t + interval.period) > datetime.utcnow()])
-            >= interval.frequency
-        )
+    def __init__(
+        self,
+        intervals: List[Tuple[timedelta, int]],
+        *,
+        clock: Callable[[], float] = monotonic,
+    ):
+        _itvs = intervals or self.default_intervals
+        # (period in seconds, times of at most the last `frequency` events)
+        self.__intervals: List[Tuple[float, Deque[float]]] = [
+            (period.total_seconds(), deque(maxlen=max(frequency, 0))) for period, frequency in _itvs
+        ]
+        self.__clock = clock
+        self.__last_stamp: Optional[float] = None
+        self.__discard_after = max(period for period, _ in self.__intervals)
 
     @property
     def spammy(self):
@@ -113,7 +124,15 @@ class AntiSpam:
         Whether, for any interval, the number of events that happened
         within that interval exceeds the number specified for that interval.
         """
-        return any(self.__interval_check(x) for x in self.__intervals)
+        now = self.__clock()
+
+        # an interval is full when its oldest kept event is still inside it;
+        # one that allows no events at all is always full
+        for period, stamps in self.__intervals:
+            if not stamps.maxlen or (len(stamps) == stamps.maxlen and stamps[0] + period > now):
+                return True
+
+        return False
 
     def stamp(self):
         """
@@ -123,7 +142,104 @@ class AntiSpam:
         The stamp will last until the corresponding interval duration
         has expired (set when this AntiSpam object was initiated).
         """
-        self.__event_timestamps.append(datetime.utcnow())
-        self.__event_timestamps = [
-            t for t in self.__event_timestamps if t + self.__discard_after > datetime.utcnow()
-        ]
+        now = self.__last_stamp = self.__clock()
+
+        for _, stamps in self.__intervals:
+            stamps.append(now)
+
+    @property
+    def idle(self) -> bool:
+        """Whether every stamp has expired, so this is no different from a new instance."""
+        return self.__last_stamp is None or self.__last_stamp + self.__discard_after <= self.__clock()
+
+
+class AntiSpamRegistry:
+    """
+    `AntiSpam` instances for many keys, such as ``(guild_id, user_id)`` or
+    channel IDs, sharing one set of intervals.
+
+    Instances are created on first use. At most ``max_keys`` are kept,
+    evicting the least recently used; an evicted key starts over with no
+    stamps, so size it to comfortably exceed the number of keys active
+    within the longest interval. `prune` drops instances whose stamps have
+    all expired.
+
+    Examples
+    --------
+    .. code-block:: python
+
+        self.report_limits = AntiSpamRegistry(INTERVALS)
+
+        key = (ctx.guild.id, ctx.author.id)
+
+        if self.report_limits.spammy(key):
+            return await ctx.send("You've sent too many reports recently, please try again later.")
+
+        self.report_limits.stamp(key)
+
+    Parameters
+    ----------
+    intervals : List[Tuple[datetime.timedelta, int]]
+        As for `AntiSpam`; an empty list uses its defaults.
+    max_keys : int
+        How many keys to track at most.
+    clock : Callable[[], float]
+        As for `AntiSpam`.
+    """
+
+    def __init__(
+        self,
+        intervals: List[Tuple[timedelta, int]],
+        *,
+        max_keys: int = 10000,
+        clock: Callable[[], float] = monotonic,
+    ):
+        if max_keys < 1:
+            raise ValueError("max_keys must be at least 1")
+
+        self.intervals = intervals
+        self.max_keys = max_keys
+        self.evictions = 0
+        self._clock = clock
+        self._limiters: "OrderedDict[Hashable, AntiSpam]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._limiters)
+
+    def __contains__(self, key: Hashable):
+        return key in self._limiters
+
+    def get(self, key: Hashable) -> AntiSpam:
+        """The `AntiSpam` for a key, created if needed."""
+        limiter = self._limiters.get(key)
+
+        if limiter is None:
+            limiter = self._limiters[key] = AntiSpam(self.intervals, clock=self._clock)
+
+            if len(self._limiters) > self.max_keys:
+                self._limiters.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._limiters.move_to_end(key)
+
+        return limiter
+
+    def spammy(self, key: Hashable) -> bool:
+        """Whether the key has hit any interval's limit. Keys never stamped aren't tracked."""
+        if key not in self._limiters:
+            return False
+
+        return self.get(key).spammy
+
+    def stamp(self, key: Hashable):
+        """Records an event for the key."""
+        self.get(key).stamp()
+
+    def prune(self) -> int:
+        """Drops the instances whose stamps have all expired, returning how many were dropped."""
+        idle = [key for key, limiter in self._limiters.items() if limiter.idle]
+
+        for key in idle:
+            del self._limiters[key]
+
+        return len(idle)
@@ -3,9 +3,20 @@ from __future__ import annotations
 import datetime
 import itertools
 import math
+import re
 import textwrap
 from io import BytesIO
-from typing import Iterator, List, Optional, Sequence, SupportsInt, Union
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    SupportsInt,
+    Union,
+)
 
 import discord
 from babel.lists import format_list as babel_list
@@ -25,6 +36,7 @@ __all__ = (
     "italics",
     "spoiler",
     "pagify",
+    "apagify",
     "strikethrough",
     "underline",
     "quote",
@@ -226,6 +238,11 @@ def spoiler(text: str, escape_formatting: bool = True) -> str:
     return f"||{escape(text, formatting=escape_formatting)}||"
 
 
+def _escaped_length(text: str, start: int, end: int) -> int:
+    # escaping adds a zero-width space to each mass mention
+    return end - start + text.count("@here", start, end) + text.count("@everyone", start, end)
+
+
 class pagify(Iterator[str]):
     """Generate multiple pages from the given text.
 
@@ -233,7 +250,8 @@ class pagify(Iterator[str]):
 
     Note
     ----
-    This does not respect code blocks or inline code.
+    This does not respect code blocks or inline code. See `apagify` for
+    a version that does, and that also takes text in chunks.
 
     Parameters
     ----------
@@ -314,7 +332,9 @@ class pagify(Iterator[str]):
         start = self._start
         end = self._end
 
-        while (end - start) > page_length:
+        while (end - start) > page_length or (
+            escape_mass_mentions and _escaped_length(text, start, end) > page_length
+        ):
             stop = start + page_length
             if escape_mass_mentions:
                 stop -= text.count("@here", start, stop) + text.count("@everyone", start, stop)
@@ -342,6 +362,216 @@ class pagify(Iterator[str]):
         raise StopIteration
 
 
+_FENCE_RE = re.compile(r"```([\w+-]*)")
+
+
+class _Paginator:
+    """Cuts text, fed in chunks, into pages in a single pass; the engine behind `apagify`.
+
+    Only the text not yet paged is kept, and each page is found by searching
+    at most one page's worth of it, so the work is linear in the length of
+    the text however it's chunked. When ``code_blocks`` is set, a page
+    ending inside a fenced code block is closed, and the next one reopens
+    the block with the same language.
+    """
+
+    def __init__(
+        self,
+        delims: Sequence[str],
+        priority: bool,
+        escape_mass_mentions: bool,
+        page_length: int,
+        code_blocks: bool,
+    ) -> None:
+        self._delims = delims
+        self._priority = priority
+        self._escape_mass_mentions = escape_mass_mentions
+        self._page_length = page_length
+        self._code_blocks = code_blocks
+
+        self._text = ""
+        self._start = 0
+        self._chunks: List[str] = []
+        self._pending = 0
+        # the fence to open the next page with, when the last one was cut inside a code block
+        self._reopen = ""
+
+    def feed(self, chunk: str) -> List[str]:
+        """Adds text, returning the pages it completes."""
+        self._chunks.append(chunk)
+        self._pending += len(chunk)
+
+        # joining for every small chunk would copy the page being built over and over
+        if len(self._text) - self._start + self._pending <= self._page_length:
+            return []
+
+        self._join()
+        return self._cut()
+
+    def close(self) -> List[str]:
+        """Returns the pages left, once all text has been fed."""
+        self._join()
+        pages = self._cut()
+        page = self._page(self._start, len(self._text))
+
+        if page is not None:
+            pages.append(page)
+
+        self._text = ""
+        self._start = 0
+        return pages
+
+    def _join(self) -> None:
+        self._text = self._text[self._start :] + "".join(self._chunks)
+        self._start = 0
+        self._chunks.clear()
+        self._pending = 0
+
+    def _cut(self) -> List[str]:
+        text = self._text
+        end = len(text)
+        pages = []
+
+        while True:
+            start = self._start
+            limit = self._page_length
+            if self._code_blocks:
+                # room to reopen a code block at the start and close one at the end
+                limit -= len(self._reopen) + len("\n```")
+            if end - start <= limit and (
+                not self._escape_mass_mentions or _escaped_length(text, start, end) <= limit
+            ):
+                return pages
+
+            stop = start + limit
+            if self._escape_mass_mentions:
+                stop -= text.count("@here", start, stop) + text.count("@everyone", start, stop)
+            closest_delim_it = (text.rfind(d, start + 1, stop) for d in self._delims)
+            if self._priority:
+                closest_delim = next((x for x in closest_delim_it if x > 0), -1)
+            else:
+                closest_delim = max(closest_delim_it)
+            if closest_delim != -1:
+                stop = closest_delim
+            elif self._code_blocks:
+                # don't split a fence across pages
+                while stop > start + 1 and text[stop - 1] == "`" and text[stop] == "`":
+                    stop -= 1
+
+            page = self._page(start, stop)
+            self._start = stop
+            if page is not None:
+                pages.append(page)
+
+    def _page(self, start: int, stop: int) -> Optional[str]:
+        page = self._text[start:stop]
+        if not page.strip():
+            return None
+
+        if self._code_blocks:
+            if self._reopen:
+                # the delimiter the last page was cut at would leave a blank first line
+                page = self._reopen + (page[1:] if page.startswith("\n") else page)
+                self._reopen = ""
+
+            lang = None
+            for match in _FENCE_RE.finditer(page):
+                if lang is None:
+                    lang = match.group(1) if page.startswith("\n", match.end()) else ""
+                else:
+                    lang = None
+
+            if lang is not None:
+                page += "```" if page.endswith("\n") else "\n```"
+                self._reopen = f"```{lang}\n"
+
+        if self._escape_mass_mentions:
+            page = escape(page, mass_mentions=True)
+        return page
+
+
+async def apagify(
+    source: Union[str, Iterable[str], AsyncIterable[str]],
+    delims: Sequence[str] = ("\n",),
+    *,
+    priority: bool = False,
+    escape_mass_mentions: bool = True,
+    shorten_by: int = 8,
+    page_length: int = 2000,
+    code_blocks: bool = True,
+) -> AsyncIterator[str]:
+    """Generate pages from text, or from an iterable or async iterable of chunks of it.
+
+    Chunks, such as lines with their line endings, are joined as they are,
+    and pages are yielded as soon as they're complete, so output can be
+    sent while it's still being produced. The text is only passed over
+    once, however it's chunked.
+
+    Examples
+    --------
+    .. code-block:: python
+
+        async def log_lines():
+            async with aiofiles.open(path) as f:
+                async for line in f:
+                    yield line
+
+        async for page in apagify(log_lines()):
+            await ctx.send(box(page))
+
+    Parameters
+    ----------
+    source : Union[str, Iterable[str], AsyncIterable[str]]
+        The content to pagify and send.
+    delims : `sequence` of `str`, optional
+        Characters where page breaks will occur. If no delimiters are found
+        in a page, the page will break after ``page_length`` characters.
+        By default this only contains the newline.
+
+    Other Parameters
+    ----------------
+    priority : `bool`
+        Set to :code:`True` to choose the page break delimiter based on the
+        order of ``delims``. Otherwise, the page will always break at the
+        last possible delimiter.
+    escape_mass_mentions : `bool`
+        If :code:`True`, any mass mentions (here or everyone) will be
+        silenced.
+    shorten_by : `int`
+        How much to shorten each page by. Defaults to 8.
+    page_length : `int`
+        The maximum length of each page. Defaults to 2000.
+    code_blocks : `bool`
+        If :code:`True`, a page that breaks inside a fenced code block
+        closes it, and the next page reopens it with the same language.
+        Set to :code:`False` to get the same pages as `pagify`.
+
+    Yields
+    ------
+    `str`
+        Pages of the given text.
+
+    """
+    paginator = _Paginator(
+        delims, priority, escape_mass_mentions, page_length - shorten_by, code_blocks
+    )
+
+    if isinstance(source, str):
+        source = (source,)
+
+    if isinstance(source, AsyncIterable):
+        async for chunk in source:
+            for page in paginator.feed(chunk):
+                yield page
+    else:
+        for chunk in source:
+            for page in paginator.feed(chunk):
+                yield page
+
+    for page in paginator.close():
+        yield page
+
+
 def strikethrough(text: str, escape_formatting: bool = True) -> str:
     """Get the given text with a strikethrough.
 
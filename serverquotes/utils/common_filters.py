@@ -1,4 +1,5 @@
 import re
+from typing import Callable, Dict, List, Match
 
 __all__ = [
     "URL_RE",
@@ -11,6 +12,7 @@ __all__ = [
     "normalize_smartquotes",
     "escape_spoilers",
     "escape_spoilers_and_mass_mentions",
+    "FilterPipeline",
 ]
 
 # regexes
@@ -172,4 +174,131 @@ def escape_spoilers_and_mass_mentions(content: str) -> str:
     str
         The escaped string.
     """
-    return escape_spoilers(filter_mass_mentions(content))
+    return _SPOILERS_AND_MASS_MENTIONS(content)
+
+
+class FilterPipeline:
+    """
+    Several of the filters above, applied in a single pass over the content.
+
+    The chosen filters' patterns are combined into one, and each match is
+    handed to the replacement for the filter it came from. The result is the
+    same as calling the filter functions one after another, in the order
+    they are listed in this module, whatever order they are given in.
+
+    Examples
+    --------
+    .. code-block:: python
+
+        sanitize = FilterPipeline(filter_urls, filter_invites, filter_mass_mentions)
+        await ctx.send(sanitize(content))
+
+    Parameters
+    ----------
+    *filters : Callable[[str], str]
+        Any of `filter_urls`, `filter_invites`, `filter_mass_mentions`,
+        `filter_various_mentions`, `normalize_smartquotes`, `escape_spoilers`
+        and `escape_spoilers_and_mass_mentions`.
+
+    Raises
+    ------
+    ValueError
+        If given anything else.
+    """
+
+    def __init__(self, *filters: Callable[[str], str]):
+        chosen = set()
+
+        for func in filters:
+            if func not in _PIPELINE_FILTERS:
+                raise ValueError(f"{func!r} can't be used in a FilterPipeline")
+            chosen.update(_PIPELINE_FILTERS[func])
+
+        self.filters = tuple(f for f in _PIPELINE_ORDER if f in chosen)
+        self._handlers: Dict[str, Callable[[Match], str]] = {
+            f.__name__: _PIPELINE_HANDLERS[f] for f in self.filters
+        }
+
+        if filter_urls in chosen and filter_invites in chosen:
+            # filtering URLs first leaves the end of a URL inside an invite's link for
+            # filter_invites to trip over, so repeat exactly that
+            self._handlers[filter_invites.__name__] = lambda m: filter_invites(filter_urls(m[0]))
+
+        # checking the first character up front lets most positions be skipped without trying
+        # every filter's pattern at each one
+        first_chars = "".join(_PIPELINE_FIRST_CHARS[f] for f in self.filters)
+        self._pattern = re.compile(
+            f"(?=[{re.escape(first_chars)}])(?:"
+            + "|".join(f"(?P<{f.__name__}>{_PIPELINE_PATTERNS[f]})" for f in self.filters)
+            + ")"
+        )
+
+    def __repr__(self):
+        return f"FilterPipeline({', '.join(f.__name__ for f in self.filters)})"
+
+    def __or__(self, other: "FilterPipeline") -> "FilterPipeline":
+        return FilterPipeline(*self.filters, *other.filters)
+
+    def __call__(self, content: str) -> str:
+        """Get the content with the pipeline's filters applied."""
+        parts: List[str] = []
+        spoilers: List[int] = []
+        handlers = self._handlers
+        last = 0
+
+        for match in self._pattern.finditer(content):
+            parts.append(content[last : match.start()])
+            if match.lastgroup == "escape_spoilers":
+                spoilers.append(len(parts))
+            parts.append(handlers[match.lastgroup](match))
+            last = match.end()
+
+        # spoiler bars are escaped in pairs, so a last one left open stays as it was
+        if len(spoilers) % 2:
+            parts[spoilers[-1]] = "||"
+
+        parts.append(content[last:])
+        return "".join(parts)
+
+
+_PIPELINE_ORDER = (
+    filter_urls,
+    filter_invites,
+    filter_mass_mentions,
+    filter_various_mentions,
+    normalize_smartquotes,
+    escape_spoilers,
+)
+
+_PIPELINE_FILTERS = {f: (f,) for f in _PIPELINE_ORDER}
+_PIPELINE_FILTERS[escape_spoilers_and_mass_mentions] = (filter_mass_mentions, escape_spoilers)
+
+_PIPELINE_PATTERNS = {
+    filter_urls: f"(?i:{URL_RE.pattern})",
+    filter_invites: f"(?i:{INVITE_URL_RE.pattern})",
+    filter_mass_mentions: MASS_MENTION_RE.pattern,
+    filter_various_mentions: OTHER_MENTION_RE.pattern,
+    normalize_smartquotes: SMART_QUOTE_REPLACE_RE.pattern,
+    # each bar pair on its own; the pipeline pairs them up as SPOILER_CONTENT_RE would
+    escape_spoilers: r"(?<!\\)\|{2}",
+}
+
+_PIPELINE_FIRST_CHARS = {
+    filter_urls: "hHsSfF",
+    filter_invites: "dD",
+    filter_mass_mentions: "@",
+    filter_various_mentions: "<",
+    normalize_smartquotes: "".join(SMART_QUOTE_REPLACEMENT_DICT),
+    escape_spoilers: "|",
+}
+
+_PIPELINE_HANDLERS = {
+    filter_urls: lambda m: "[SANITIZED URL]",
+    filter_invites: lambda m: "[SANITIZED INVITE]",
+    filter_mass_mentions: lambda m: "@\u200b",
+    filter_various_mentions: lambda m: "<\\" + m[0][1:],
+    normalize_smartquotes: lambda m: SMART_QUOTE_REPLACEMENT_DICT[m[0]],
+    escape_spoilers: lambda m: "\\||",
+}
+
+_SPOILERS_AND_MASS_MENTIONS = FilterPipeline(escape_spoilers_and_mass_mentions)
@@ -1,12 +1,19 @@
 from __future__ import annotations
 
+import abc
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
-from typing import Generator, Union
+from typing import Any, AsyncIterator, Callable, Generator, Iterable, List, Optional, TypeVar, Union
 
 import apsw
 
-__all__ = ["APSWConnectionWrapper"]
+__all__ = ["APSWConnectionWrapper", "ThreadedAPSWConnection"]
+
+_T = TypeVar("_T")
 
 
 # TODO (mikeshardmind): make this inherit typing_extensions.Protocol
@@ -58,4 +65,234 @@ class APSWConnectionWrapper(apsw.Connection, ContextManagerMixin):
         super().__init__(str(filename), *args, **kwargs)
 
 
-# TODO (mikeshardmind): asyncio friendly ThreadedAPSWConnection class
+# These run on the connection's thread.
+
+
+def _execute(conn: apsw.Connection, sql: str, bindings) -> int:
+    c = conn.cursor()
+    try:
+        for _ in c.execute(sql, bindings):
+            pass
+    finally:
+        c.close()
+    return conn.changes()
+
+
+def _executemany(conn: apsw.Connection, sql: str, seq_of_bindings) -> int:
+    before = conn.totalchanges()
+    c = conn.cursor()
+    try:
+        for _ in c.executemany(sql, seq_of_bindings):
+            pass
+    finally:
+        c.close()
+    return conn.totalchanges() - before
+
+
+def _fetch(conn: apsw.Connection, sql: str, bindings, size: Optional[int]) -> List[tuple]:
+    c = conn.cursor()
+    try:
+        return list(islice(c.execute(sql, bindings), size))
+    finally:
+        c.close()
+
+
+class _AsyncCalls(abc.ABC):
+    """
+    The awaitable query API shared by connections and their transactions
+    """
+
+    @abc.abstractmethod
+    async def run(self, func: Callable[..., _T], *args: Any) -> _T:
+        """
+        Runs func(connection, *args) on the connection's thread
+        """
+
+    async def execute(self, sql: str, bindings: Optional[Iterable] = None) -> int:
+        """
+        Executes one or more statements, discarding any rows.
+        Returns the number of rows changed by the last statement.
+        """
+        return await self.run(_execute, sql, bindings)
+
+    async def executemany(self, sql: str, seq_of_bindings: Iterable[Iterable]) -> int:
+        """
+        Executes a statement once per set of bindings.
+        Returns the total number of rows changed.
+        """
+        # materialize here, so a lazy iterable isn't consumed off-loop
+        return await self.run(_executemany, sql, list(seq_of_bindings))
+
+    async def fetch(self, sql: str, bindings: Optional[Iterable] = None) -> List[tuple]:
+        """
+        Returns every row of a query
+        """
+        return await self.run(_fetch, sql, bindings, None)
+
+    async def fetchone(self, sql: str, bindings: Optional[Iterable] = None) -> Optional[tuple]:
+        """
+        Returns the first row of a query, or None
+        """
+        rows = await self.run(_fetch, sql, bindings, 1)
+        return rows[0] if rows else None
+
+
+class _ThreadedTransaction(_AsyncCalls):
+    def __init__(self, parent: ThreadedAPSWConnection):
+        self._parent = parent
+
+    async def run(self, func: Callable[..., _T], *args: Any) -> _T:
+        # the parent's lock is already held for the whole transaction
+        return await self._parent._submit(func, *args)
+
+    def stream(self, sql: str, bindings: Optional[Iterable] = None, *, batch_size: int = 100) -> AsyncIterator[tuple]:
+        """
+        Iterates over the rows of a query inside the transaction
+        """
+        return self._parent._stream(sql, bindings, batch_size, locked=True)
+
+
+class ThreadedAPSWConnection(_AsyncCalls):
+    """
+    An APSW connection owned by a dedicated thread, with an awaitable API.
+
+    The connection is created, used and closed on its own thread, so the
+    event loop never waits on SQLite. Calls are run one at a time in the
+    order they were made.
+
+    While a transaction is open, calls made directly on the connection
+    wait for it to finish; queries inside the transaction must go through
+    the object it yields.
+
+    .. code-block:: python
+
+        async with ThreadedAPSWConnection(path) as conn:
+            async with conn.transaction() as tx:
+                await tx.execute("INSERT INTO t VALUES (?)", (1,))
+
+            async for row in conn.stream("SELECT * FROM t"):
+                ...
+    """
+
+    def __init__(self, filename: Union[Path, str], *args, **kwargs):
+        self._filename = filename
+        self._args = args
+        self._kwargs = kwargs
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._conn: Optional[APSWConnectionWrapper] = None
+        self._lock = asyncio.Lock()
+
+    async def connect(self) -> ThreadedAPSWConnection:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="apsw")
+            self._conn = await self._submit(
+                lambda _: APSWConnectionWrapper(self._filename, *self._args, **self._kwargs)
+            )
+        return self
+
+    async def close(self) -> None:
+        if self._executor is None:
+            return
+
+        async with self._lock:
+            try:
+                await self._submit(lambda conn: conn.close())
+            finally:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+                self._conn = None
+
+    async def __aenter__(self) -> ThreadedAPSWConnection:
+        return await self.connect()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    def _submit(self, func: Callable[..., _T], *args: Any) -> asyncio.Future:
+        if self._executor is None:
+            raise RuntimeError("connection is not open")
+
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._executor, functools.partial(func, self._conn, *args))
+
+    async def run(self, func: Callable[..., _T], *args: Any) -> _T:
+        async with self._lock:
+            return await self._submit(func, *args)
+
+    def transaction(self, mode: str = "DEFERRED"):
+        """
+        An async context manager for a transaction, which is rolled back
+        on unhandled exception, or committed on non-exception exit.
+
+        mode is DEFERRED, IMMEDIATE or EXCLUSIVE.
+        """
+        if mode.upper() not in ("DEFERRED", "IMMEDIATE", "EXCLUSIVE"):
+            raise ValueError("Invalid transaction mode: %s" % mode)
+
+        return _TransactionContext(self, mode.upper())
+
+    async def _stream(
+        self, sql: str, bindings: Optional[Iterable], batch_size: int, locked: bool
+    ) -> AsyncIterator[tuple]:
+        cursor = None
+
+        async def next_batch(first: bool) -> List[tuple]:
+            def step(conn):
+                nonlocal cursor
+                if first:
+                    cursor = conn.cursor()
+                    cursor.execute(sql, bindings)
+                return list(islice(cursor, batch_size))
+
+            if locked:
+                return await self._submit(step)
+            async with self._lock:
+                return await self._submit(step)
+
+        try:
+            batch = await next_batch(True)
+            while batch:
+                for row in batch:
+                    yield row
+                if len(batch) < batch_size:
+                    break
+                batch = await next_batch(False)
+        finally:
+            if cursor is not None and self._executor is not None:
+                await asyncio.shield(self._submit(lambda _: cursor.close()))
+
+    def stream(self, sql: str, bindings: Optional[Iterable] = None, *, batch_size: int = 100) -> AsyncIterator[tuple]:
+        """
+        Iterates over the rows of a query, fetching batch_size rows at a time.
+
+        Other calls may run between batches.
+        """
+        return self._stream(sql, bindings, batch_size, locked=False)
+
+
+class _TransactionContext:
+    def __init__(self, parent: ThreadedAPSWConnection, mode: str):
+        self._parent = parent
+        self._mode = mode
+
+    async def __aenter__(self) -> _ThreadedTransaction:
+        await self._parent._lock.acquire()
+        try:
+            await self._parent._submit(_execute, "BEGIN %s TRANSACTION" % self._mode, None)
+        except BaseException:
+            self._parent._lock.release()
+            raise
+        return _ThreadedTransaction(self._parent)
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        try:
+            if exc_type is None:
+                try:
+                    await self._parent._submit(_execute, "COMMIT TRANSACTION", None)
+                except Exception:
+                    await self._parent._submit(_execute, "ROLLBACK TRANSACTION", None)
+                    raise
+            else:
+                await self._parent._submit(_execute, "ROLLBACK TRANSACTION", None)
+        finally:
+            self._parent._lock.release()
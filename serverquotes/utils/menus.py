@@ -10,9 +10,9 @@ from typing import Callable, Dict, Iterable, List, Mapping, Optional, TypeVar, U
 
 import discord
 
-from .. import commands
+from redbot.core import commands
 from .predicates import ReactionPredicate
-from .views import SimpleMenu, _SimplePageSource
+from .views import LazyPages, SimpleMenu, _as_lazy, _page_source
 
 __all__ = (
     "menu",
@@ -21,10 +21,11 @@ __all__ = (
     "close_menu",
     "start_adding_reactions",
     "DEFAULT_CONTROLS",
+    "LazyPages",
 )
 
 _T = TypeVar("_T")
-_PageList = TypeVar("_PageList", List[str], List[discord.Embed])
+_PageList = TypeVar("_PageList", List[str], List[discord.Embed], LazyPages)
 _ReactableEmoji = Union[str, discord.Emoji]
 _ControlCallable = Callable[[commands.Context, _PageList, discord.Message, int, float, str], _T]
 
@@ -79,8 +80,9 @@ async def menu(
     ----------
     ctx: commands.Context
         The command context
-    pages: `list` of `str` or `discord.Embed`
-        The pages of the menu.
+    pages: `list` of `str` or `discord.Embed`, or `LazyPages`
+        The pages of the menu. With `LazyPages`, or any object with a
+        ``get_page`` method, pages are only built when they're shown.
     controls: Optional[Mapping[str, Callable]]
         A mapping of emoji to the function which handles the action for the
         emoji. The signature of the function should be the same as of this function
@@ -107,20 +109,24 @@ async def menu(
         # context.
         view = _active_menus[message.id]
         if pages != view.source.entries:
-            view._source = _SimplePageSource(pages)
+            view._source = _page_source(_as_lazy(pages) or pages)
         new_page = await view.get_page(page)
         view.current_page = page
         view.timeout = timeout
         await view.message.edit(**new_page)
         return
-    if not isinstance(pages[0], (discord.Embed, str)):
+    lazy = _as_lazy(pages)
+    if lazy is not None:
+        # pages are checked one at a time as they're built
+        pages = lazy
+    elif not isinstance(pages[0], (discord.Embed, str)):
         raise RuntimeError("Pages must be of type discord.Embed or str")
-    if not all(isinstance(x, discord.Embed) for x in pages) and not all(
+    elif not all(isinstance(x, discord.Embed) for x in pages) and not all(
         isinstance(x, str) for x in pages
     ):
         raise RuntimeError("All pages must be of the same type")
     if controls is None:
-        if len(pages) == 1:
+        if _page_count(pages) == 1:
             controls = {"\N{CROSS MARK}": close_menu}
         else:
             controls = DEFAULT_CONTROLS
@@ -177,7 +183,17 @@ async def menu(
             await view.wait()
             del _active_menus[view.message.id]
             return
-    current_page = pages[page]
+    if lazy is not None:
+        try:
+            current_page = await pages.get(page)
+        except IndexError:
+            # ran off the end of a source with no known length
+            page = 0
+            current_page = await pages.get(page)
+        if not isinstance(current_page, (discord.Embed, str)):
+            raise RuntimeError("Pages must be of type discord.Embed or str")
+    else:
+        current_page = pages[page]
 
     if not message:
         if isinstance(current_page, discord.Embed):
@@ -251,7 +267,8 @@ async def next_page(
     Function for showing next page which is suitable
     for use in ``controls`` mapping that is passed to `menu()`.
     """
-    if page >= len(pages) - 1:
+    page_count = _page_count(pages)
+    if page_count is not None and page >= page_count - 1:
         page = 0  # Loop around to the first item
     else:
         page = page + 1
@@ -272,7 +289,8 @@ async def prev_page(
     for use in ``controls`` mapping that is passed to `menu()`.
     """
     if page <= 0:
-        page = len(pages) - 1  # Loop around to the last item
+        # Loop around to the last item, or stay put if we don't know which that is
+        page = (_page_count(pages) or 1) - 1
     else:
         page = page - 1
     return await menu(ctx, pages, controls, message=message, page=page, timeout=timeout)
@@ -295,6 +313,10 @@ async def close_menu(
         await message.delete()
 
 
+def _page_count(pages: Union[list, LazyPages]) -> Optional[int]:
+    return pages.length if isinstance(pages, LazyPages) else len(pages)
+
+
 def start_adding_reactions(
     message: discord.Message, emojis: Iterable[_ReactableEmoji]
 ) -> asyncio.Task:
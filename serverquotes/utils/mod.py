@@ -1,8 +1,22 @@
 import asyncio
+from collections import deque
 from datetime import timedelta
-from typing import List, Iterable, Union, TYPE_CHECKING, Dict, Optional
+from time import monotonic
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    List,
+    Iterable,
+    Union,
+    TYPE_CHECKING,
+    Dict,
+    Optional,
+)
 
 import discord
+from discord.utils import maybe_coroutine
 
 if TYPE_CHECKING:
     from ..bot import Red
@@ -11,6 +25,8 @@ if TYPE_CHECKING:
 __all__ = (
     "mass_purge",
     "slow_deletion",
+    "adaptive_purge",
+    "PurgeReport",
     "get_audit_reason",
     "is_mod_or_superior",
     "strfdelta",
@@ -19,6 +35,315 @@ __all__ = (
 )
 
 
+_Channel = Union[discord.TextChannel, discord.VoiceChannel, discord.StageChannel, discord.Thread]
+
+# Discord only bulk deletes messages younger than 14 days; leave a margin for the time a purge takes
+BULK_DELETE_MAX_AGE = timedelta(days=14, minutes=-5)
+BULK_DELETE_LIMIT = 100
+# requests per second shared by every channel being purged, under Discord's global limit of 50
+GLOBAL_RATE = 40.0
+MAX_DELAY = 10.0
+MAX_RETRIES = 3
+
+
+class PurgeReport:
+    """Progress of a purge, passed to ``on_progress`` while it runs and returned when it's done.
+
+    Attributes
+    ----------
+    total : int
+        How many messages were to be deleted.
+    deleted : int
+        How many were deleted, or turned out to be gone already.
+    failed : int
+        How many couldn't be deleted.
+    requests : int
+        How many requests were made.
+    backoffs : int
+        How many times a channel slowed down after being rate limited.
+    channels : Dict[int, int]
+        Messages deleted, by channel ID.
+    """
+
+    __slots__ = (
+        "total",
+        "deleted",
+        "failed",
+        "requests",
+        "backoffs",
+        "channels",
+        "started",
+        "finished",
+    )
+
+    def __init__(self, total: int):
+        self.total = total
+        self.deleted = 0
+        self.failed = 0
+        self.requests = 0
+        self.backoffs = 0
+        self.channels: Dict[int, int] = {}
+        self.started = monotonic()
+        self.finished: Optional[float] = None
+
+    def __repr__(self) -> str:
+        return (
+            f"<PurgeReport deleted={self.deleted}/{self.total} failed={self.failed}"
+            f" requests={self.requests} elapsed={self.elapsed:.1f}s"
+            f" rate={self.messages_per_second:.1f}/s>"
+        )
+
+    @property
+    def done(self) -> bool:
+        return self.finished is not None
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the purge started, until it finished."""
+        return (self.finished or monotonic()) - self.started
+
+    @property
+    def messages_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.deleted / elapsed if elapsed else 0.0
+
+
+class _GlobalBudget:
+    """A token bucket of requests shared by every channel in a purge."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._tokens = rate
+        self._updated = monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class _Pacer:
+    """Spaces one channel's requests by how long Discord has been making them wait.
+
+    discord.py holds a request back until its rate limit bucket resets, so a
+    request taking well over the fastest one seen means the bucket ran out.
+    The delay between requests then grows to about that wait, and it shrinks
+    again while requests go through promptly.
+    """
+
+    def __init__(self):
+        self.delay = 0.0
+        self.fastest: Optional[float] = None
+
+    def observe(self, elapsed: float) -> bool:
+        """Records how long a request took, returning whether it was held back."""
+        if self.fastest is None or elapsed < self.fastest:
+            self.fastest = elapsed
+        waited = elapsed - self.fastest
+
+        if waited > max(0.25, self.fastest * 2):
+            self.backoff(waited)
+            return True
+
+        self.delay = self.delay * 0.8 if self.delay > 0.05 else 0.0
+        return False
+
+    def backoff(self, retry_after: float):
+        self.delay = min(max(self.delay * 2, retry_after), MAX_DELAY)
+
+
+def _retry_after(error: Union[discord.RateLimited, discord.HTTPException]) -> Optional[float]:
+    """How long to wait after a rate limit error, or None if it wasn't one."""
+    if isinstance(error, discord.RateLimited):
+        return error.retry_after
+    if error.status != 429:
+        return None
+    try:
+        return float(error.response.headers.get("Retry-After", 1))
+    except (AttributeError, ValueError):
+        return 1.0
+
+
+async def _purge_channel(
+    channel: _Channel,
+    messages: List[discord.Message],
+    *,
+    bulk: bool,
+    reason: Optional[str],
+    budget: _GlobalBudget,
+    report: PurgeReport,
+):
+    pacer = _Pacer()
+    cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+    young = [m for m in messages if bulk and m.created_at > cutoff]
+    work: Deque[List[discord.Message]] = deque(
+        young[i : i + BULK_DELETE_LIMIT] for i in range(0, len(young), BULK_DELETE_LIMIT)
+    )
+    work.extend([m] for m in messages if not (bulk and m.created_at > cutoff))
+    retries = 0
+
+    while work:
+        batch = work.popleft()
+
+        if len(batch) > 1:
+            # a long purge can outlast some messages' eligibility for bulk deletion
+            cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+            aged = [m for m in batch if m.created_at <= cutoff]
+            if aged:
+                batch = [m for m in batch if m.created_at > cutoff]
+                work.extend([m] for m in aged)
+                if not batch:
+                    continue
+
+        if pacer.delay:
+            await asyncio.sleep(pacer.delay)
+        await budget.acquire()
+        report.requests += 1
+        start = monotonic()
+
+        try:
+            if len(batch) > 1:
+                await channel.delete_messages(batch, reason=reason)
+            else:
+                await batch[0].delete()
+        except discord.NotFound:
+            # already gone, which is as good as deleted
+            pass
+        except discord.Forbidden:
+            report.failed += len(batch) + sum(map(len, work))
+            return
+        except (discord.RateLimited, discord.HTTPException) as e:
+            # RateLimited isn't an HTTPException; it's raised instead of waiting
+            # when the wait would be longer than the client's max_ratelimit_timeout
+            retry_after = _retry_after(e)
+            if retry_after is not None and retries < MAX_RETRIES:
+                pacer.backoff(retry_after)
+                report.backoffs += 1
+                retries += 1
+                work.appendleft(batch)
+            elif len(batch) > 1:
+                # one bad message fails the whole bulk deletion; try them one by one
+                work.extendleft([m] for m in reversed(batch))
+            else:
+                report.failed += 1
+            continue
+        finally:
+            if pacer.observe(monotonic() - start):
+                report.backoffs += 1
+
+        retries = 0
+        report.deleted += len(batch)
+        report.channels[channel.id] = report.channels.get(channel.id, 0) + len(batch)
+
+
+async def _purge(
+    channels: Dict[_Channel, List[discord.Message]],
+    *,
+    bulk: bool = True,
+    reason: Optional[str] = None,
+    max_channels: int = 4,
+    global_rate: float = GLOBAL_RATE,
+    on_progress: Optional[Callable[[PurgeReport], Union[Awaitable[Any], Any]]] = None,
+    progress_interval: float = 2.0,
+) -> PurgeReport:
+    report = PurgeReport(sum(map(len, channels.values())))
+    budget = _GlobalBudget(global_rate)
+    semaphore = asyncio.Semaphore(max_channels)
+
+    async def purge_channel(channel, messages):
+        async with semaphore:
+            await _purge_channel(
+                channel, messages, bulk=bulk, reason=reason, budget=budget, report=report
+            )
+
+    async def send_progress():
+        while True:
+            await asyncio.sleep(progress_interval)
+            await maybe_coroutine(on_progress, report)
+
+    progress = asyncio.create_task(send_progress()) if on_progress else None
+
+    try:
+        await asyncio.gather(*(purge_channel(c, m) for c, m in channels.items() if m))
+    finally:
+        if progress:
+            progress.cancel()
+        report.finished = monotonic()
+
+    if on_progress:
+        await maybe_coroutine(on_progress, report)
+    return report
+
+
+async def adaptive_purge(
+    messages: Iterable[discord.Message],
+    *,
+    bulk: bool = True,
+    reason: Optional[str] = None,
+    max_channels: int = 4,
+    global_rate: float = GLOBAL_RATE,
+    on_progress: Optional[Callable[[PurgeReport], Union[Awaitable[Any], Any]]] = None,
+    progress_interval: float = 2.0,
+) -> PurgeReport:
+    """Delete messages from any number of channels, as fast as Discord allows.
+
+    Messages young enough are bulk deleted 100 at a time, and older ones
+    one at a time. Several channels are purged at once, sharing a budget of
+    requests per second. Each channel paces itself from how long Discord
+    makes its requests wait, slowing down when its rate limit runs out and
+    speeding back up when it doesn't.
+
+    Messages that are already gone count as deleted. Other failures are
+    counted rather than raised, and a channel the bot can't delete messages
+    in is skipped.
+
+    Parameters
+    ----------
+    messages : `iterable` of `discord.Message`
+        The messages to delete.
+    bulk : bool
+        Set to ``False`` to delete every message one at a time, as
+        `slow_deletion` does.
+    reason : `str`, optional
+        The reason for bulk deletion, which will appear in the audit log.
+    max_channels : int
+        How many channels to purge at once.
+    global_rate : float
+        The most requests per second, across all channels.
+    on_progress : `callable`, optional
+        Called, or awaited, with the `PurgeReport` every ``progress_interval``
+        seconds, and once more when the purge is done.
+    progress_interval : float
+        Seconds between ``on_progress`` calls.
+
+    Returns
+    -------
+    PurgeReport
+        How many messages were deleted, how many failed, and how quickly.
+
+    """
+    channels: Dict[_Channel, List[discord.Message]] = {}
+    for message in messages:
+        channels.setdefault(message.channel, []).append(message)
+
+    return await _purge(
+        channels,
+        bulk=bulk,
+        reason=reason,
+        max_channels=max_channels,
+        global_rate=global_rate,
+        on_progress=on_progress,
+        progress_interval=progress_interval,
+    )
+
+
 async def mass_purge(
     messages: List[discord.Message],
     channel: Union[
@@ -29,13 +354,13 @@ async def mass_purge(
 ):
     """Bulk delete messages from a channel.
 
-    If more than 100 messages are supplied, the bot will delete 100 messages at
-    a time, sleeping between each action.
+    Messages are deleted 100 at a time, paced to the channel's rate limit.
+    Messages too old to bulk delete are deleted one at a time.
 
     Note
     ----
-    Messages must not be older than 14 days, and the bot must not be a user
-    account.
+    The bot must not be a user account. See `adaptive_purge` to purge
+    several channels at once, or to follow progress.
 
     Parameters
     ----------
@@ -46,30 +371,15 @@ async def mass_purge(
     reason : `str`, optional
         The reason for bulk deletion, which will appear in the audit log.
 
-    Raises
-    ------
-    discord.Forbidden
-        You do not have proper permissions to delete the messages or you’re not
-        using a bot account.
-    discord.HTTPException
-        Deleting the messages failed.
-
     """
-    while messages:
-        # discord.NotFound can be raised when `len(messages) == 1` and the message does not exist.
-        # As a result of this obscure behavior, this error needs to be caught just in case.
-        try:
-            await channel.delete_messages(messages[:100], reason=reason)
-        except discord.errors.HTTPException:
-            pass
-        messages = messages[100:]
-        await asyncio.sleep(1.5)
+    await _purge({channel: messages}, reason=reason)
 
 
 async def slow_deletion(messages: Iterable[discord.Message]):
     """Delete a list of messages one at a time.
 
     Any exceptions raised when trying to delete the message will be silenced.
+    Deletions are paced to each channel's rate limit.
 
     Parameters
     ----------
@@ -77,11 +387,7 @@ async def slow_deletion(messages: Iterable[discord.Message]):
         The messages to delete.
 
     """
-    for message in messages:
-        try:
-            await message.delete()
-        except discord.HTTPException:
-            pass
+    await adaptive_purge(messages, bulk=False)
 
 
 def get_audit_reason(author: discord.Member, reason: str = None, *, shorten: bool = False):
@@ -1,16 +1,67 @@
 import asyncio
+import aiohttp
 import discord
+from contextlib import AsyncExitStack, asynccontextmanager
 from datetime import datetime
 from redbot.core.utils.chat_formatting import pagify
 import io
+import tempfile
 import weakref
-from typing import List, Optional, Union
+from typing import AsyncIterator, List, Optional, Union
 from .common_filters import filter_mass_mentions
 
 __all__ = ("Tunnel",)
 
 _instances = weakref.WeakValueDictionary({})
 
+# what a bot can upload where there's no guild to raise it
+DEFAULT_UPLOAD_LIMIT = 26214400
+# attachments bigger than this are downloaded to a temporary file rather than memory
+SPOOL_THRESHOLD = 1048576
+# most attachment bytes being downloaded at once, across all tunnels
+DOWNLOAD_BUDGET = 67108864
+MAX_DOWNLOADS = 4
+CHUNK_SIZE = 65536
+
+
+class _ByteBudget:
+    """Holds back downloads while too many bytes are already on their way."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self.loop = asyncio.get_running_loop()
+        self._freed = asyncio.Event()
+
+    async def acquire(self, size: int) -> int:
+        # a file bigger than the whole budget waits to have it to itself
+        size = min(size, self.limit)
+        while self.used + size > self.limit:
+            self._freed.clear()
+            await self._freed.wait()
+        self.used += size
+        return size
+
+    def release(self, size: int):
+        # synchronous, so a cancellation in the caller's finally can't skip it
+        self.used -= size
+        self._freed.set()
+
+
+_budget: Optional[_ByteBudget] = None
+
+
+def _get_budget() -> _ByteBudget:
+    global _budget
+    if _budget is None or _budget.loop is not asyncio.get_running_loop():
+        _budget = _ByteBudget(DOWNLOAD_BUDGET)
+    return _budget
+
+
+def _upload_limit(destination: discord.abc.Messageable) -> int:
+    guild = getattr(destination, "guild", None)
+    return guild.filesize_limit if guild is not None else DEFAULT_UPLOAD_LIMIT
+
 
 class TunnelMeta(type):
     """
@@ -181,6 +232,117 @@ class Tunnel(metaclass=TunnelMeta):
     # Backwards-compatible typo fix (GH-2496)
     files_from_attatch = files_from_attach
 
+    @staticmethod
+    @asynccontextmanager
+    async def streamed_files(
+        m: discord.Message,
+        destination: discord.abc.Messageable,
+        *,
+        use_cached: bool = False,
+        images_only: bool = False,
+    ) -> AsyncIterator[List[discord.File]]:
+        """
+        Downloads a message's attachments for forwarding, closing them afterwards.
+
+        Unlike `files_from_attach`, the attachments are checked against what
+        can be uploaded to ``destination`` before anything is downloaded, and
+        are downloaded at the same time, in chunks. Ones larger than
+        ``SPOOL_THRESHOLD`` are written to temporary files rather than kept in
+        memory, and the bytes downloading at once across all tunnels are
+        capped at ``DOWNLOAD_BUDGET``.
+
+        Parameters
+        ---------
+        m: `discord.Message`
+            A message to get attachments from
+        destination: `discord.abc.Messageable`
+            Where the files will be sent
+        use_cached: `bool`
+            Whether to use ``proxy_url`` rather than ``url`` when downloading the attachment
+        images_only: `bool`
+            Whether only image attachments should be added to returned list
+
+        Yields
+        ------
+        list of `discord.File`
+            The files, or an empty list if there are none or they are too
+            large to send to ``destination`` together.
+
+        Raises
+        ------
+        discord.HTTPException
+            Downloading an attachment failed.
+        """
+        # if this is None, it's not an image
+        attachments = [a for a in m.attachments if not images_only or a.height is not None]
+        limit = _upload_limit(destination)
+
+        async with AsyncExitStack() as stack:
+            files = []
+            if attachments and sum(a.size for a in attachments) <= limit:
+                semaphore = asyncio.Semaphore(MAX_DOWNLOADS)
+                budget = _get_budget()
+
+                async def fetch(a: discord.Attachment) -> Optional[discord.File]:
+                    async with semaphore:
+                        reserved = await budget.acquire(a.size)
+                        try:
+                            fp = await Tunnel._download(
+                                session, a, use_cached=use_cached, max_size=limit
+                            )
+                        except discord.HTTPException as e:
+                            # this is required, because animated webp files aren't cached
+                            if e.status == 415 and images_only and use_cached:
+                                return None
+                            raise
+                        finally:
+                            budget.release(reserved)
+                    if fp is None:
+                        # too large on its own, so all of them are
+                        sizes.append(limit + 1)
+                        return None
+                    stack.callback(fp.close)
+                    sizes.append(fp.tell())
+                    fp.seek(0)
+                    return discord.File(
+                        fp, filename=a.filename, spoiler=a.is_spoiler(), description=a.description
+                    )
+
+                sizes: List[int] = []
+                async with aiohttp.ClientSession() as session:
+                    results = await asyncio.gather(*map(fetch, attachments))
+                # attachment sizes are as Discord reported them; check what actually arrived too
+                if sum(sizes) <= limit:
+                    files = [f for f in results if f is not None]
+            yield files
+
+    @staticmethod
+    async def _download(
+        session: aiohttp.ClientSession, a: discord.Attachment, *, use_cached: bool, max_size: int
+    ) -> Optional[io.IOBase]:
+        """Downloads an attachment in chunks, or returns None once it's bigger than max_size."""
+        url = a.proxy_url if use_cached else a.url
+        fp: io.IOBase = io.BytesIO()
+        try:
+            async with session.get(url) as resp:
+                if resp.status != 200:
+                    raise discord.HTTPException(resp, "failed to get attachment")
+                async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                    size = fp.tell() + len(chunk)
+                    if size > max_size:
+                        fp.close()
+                        return None
+                    if isinstance(fp, io.BytesIO) and size > SPOOL_THRESHOLD:
+                        spooled = tempfile.TemporaryFile()
+                        spooled.write(fp.getvalue())
+                        fp.close()
+                        fp = spooled
+                    fp.write(chunk)
+        except BaseException:
+            fp.close()
+            raise
+        return fp
+
     async def close_because_disabled(self, close_message: str):
         """
         Sends a message to both ends of the tunnel that the tunnel is now closed.
@@ -236,18 +398,15 @@ class Tunnel(metaclass=TunnelMeta):
         else:
             content = topic
 
-        if message.attachments:
-            attach = await self.files_from_attach(message)
-            if not attach:
+        async with self.streamed_files(message, send_to) as attach:
+            if message.attachments and not attach:
                 await message.channel.send(
                     "Could not forward attachments. "
                     "Total size of attachments in a single "
-                    "message must be less than 8MB."
+                    "message must be less than {}MB.".format(_upload_limit(send_to) // 1048576)
                 )
-        else:
-            attach = []
 
-        rets = await self.message_forwarder(destination=send_to, content=content, files=attach)
+            rets = await self.message_forwarder(destination=send_to, content=content, files=attach)
 
         await message.add_reaction("\N{WHITE HEAVY CHECK MARK}")
         await message.add_reaction("\N{NEGATIVE SQUARED CROSS MARK}")
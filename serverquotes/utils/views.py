@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+from collections import OrderedDict
+
 import discord
 
 from discord.ext.commands import BadArgument
-from typing import TYPE_CHECKING, Any, List, Optional, Union, Dict
+from discord.utils import maybe_coroutine
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, List, Optional, Union, Dict
 from redbot.core.i18n import Translator
 from redbot.vendored.discord.ext import menus
 from redbot.core.commands.converter import get_dict_converter
@@ -11,7 +14,7 @@ from redbot.core.commands.converter import get_dict_converter
 if TYPE_CHECKING:
     from redbot.core.commands import Context
 
-__all__ = ("SimpleMenu", "SetApiModal", "SetApiView", "ConfirmView")
+__all__ = ("SimpleMenu", "LazyPages", "SetApiModal", "SetApiView", "ConfirmView")
 
 _ = Translator("UtilsViews", __file__)
 
@@ -28,6 +31,128 @@ class _SimplePageSource(menus.ListPageSource):
         return page
 
 
+class LazyPages:
+    """
+    Menu pages built only when they're shown
+
+    Pass this to `SimpleMenu` or `menu() <redbot.core.utils.menus.menu>` in place
+    of a list, so that a menu over hundreds of pages only builds the few that
+    are viewed. The most recently shown pages are kept, so paging back and
+    forth doesn't build them again.
+
+    Parameters
+    ----------
+    source
+        Either a function taking a page number and returning the page, or
+        an object with such a ``get_page`` method. Either may be a coroutine
+        function. Pages are `str`, `discord.Embed`, or `dict` as for
+        `SimpleMenu`. If the source has a ``__len__``, that's the number of
+        pages, unless ``length`` is given. With no length, the menu pages on
+        until the source raises `IndexError`.
+    length: Optional[int]
+        The number of pages.
+    cache_size: int
+        How many built pages to keep. Defaults to 3.
+
+    Examples
+    --------
+        Building one leaderboard page at a time::
+
+            def leaderboard_page(num):
+                rows = scores[num * 10 : num * 10 + 10]
+                return discord.Embed(description="\\n".join(rows))
+
+            pages = LazyPages(leaderboard_page, length=math.ceil(len(scores) / 10))
+            await SimpleMenu(pages).start(ctx)
+
+    """
+
+    def __init__(
+        self,
+        source: Union[Callable[[int], Union[_ACCEPTABLE_PAGE_TYPES, Awaitable[Any]]], Any],
+        *,
+        length: Optional[int] = None,
+        cache_size: int = 3,
+    ) -> None:
+        get_page = getattr(source, "get_page", source)
+        if not callable(get_page):
+            raise TypeError("source must be callable or have a get_page method")
+        if length is None:
+            try:
+                length = len(source)
+            except TypeError:
+                pass
+        self.source = source
+        self.length: Optional[int] = length
+        self.cache_size = max(1, cache_size)
+        self.built = 0
+        self._get_page = get_page
+        self._cache: OrderedDict[int, _ACCEPTABLE_PAGE_TYPES] = OrderedDict()
+
+    def __repr__(self) -> str:
+        return f"<LazyPages source={self.source!r} length={self.length!r} built={self.built}>"
+
+    async def get(self, page_num: int) -> _ACCEPTABLE_PAGE_TYPES:
+        """Get a page, building it if it isn't kept.
+
+        Negative numbers count from the end when the length is known.
+
+        Raises
+        ------
+        IndexError
+            There is no such page.
+        """
+        if self.length is not None and page_num < 0:
+            page_num += self.length
+        if page_num < 0 or (self.length is not None and page_num >= self.length):
+            raise IndexError(page_num)
+
+        if page_num in self._cache:
+            self._cache.move_to_end(page_num)
+            return self._cache[page_num]
+
+        page = await maybe_coroutine(self._get_page, page_num)
+        self.built += 1
+        self._cache[page_num] = page
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return page
+
+
+class _LazyPageSource(menus.PageSource):
+    def __init__(self, pages: LazyPages):
+        self.entries = pages
+
+    def is_paginating(self) -> bool:
+        return self.entries.length is None or self.entries.length > 1
+
+    def get_max_pages(self) -> Optional[int]:
+        return self.entries.length
+
+    async def get_page(self, page_number: int) -> _ACCEPTABLE_PAGE_TYPES:
+        return await self.entries.get(page_number)
+
+    async def format_page(
+        self, view: discord.ui.View, page: _ACCEPTABLE_PAGE_TYPES
+    ) -> Union[str, discord.Embed]:
+        return page
+
+
+def _as_lazy(pages: Any) -> Optional[LazyPages]:
+    """The pages as `LazyPages` if they're built on demand, or None for a list."""
+    if isinstance(pages, LazyPages):
+        return pages
+    if hasattr(pages, "get_page"):
+        return LazyPages(pages)
+    return None
+
+
+def _page_source(pages: Union[List[_ACCEPTABLE_PAGE_TYPES], LazyPages]) -> menus.PageSource:
+    if isinstance(pages, LazyPages):
+        return _LazyPageSource(pages)
+    return _SimplePageSource(pages)
+
+
 class _SelectMenu(discord.ui.Select):
     def __init__(self, options: List[discord.SelectOption]):
         super().__init__(
@@ -77,10 +202,11 @@ class SimpleMenu(discord.ui.View):
 
     Parameters
     ----------
-    pages: `list` of `str`, `discord.Embed`, or `dict`.
+    pages: `list` of `str`, `discord.Embed`, or `dict`, or `LazyPages`.
         The pages of the menu.
         if the page is a `dict` its keys must be valid messageable args.
         e,g. "content", "embed", etc.
+        Use `LazyPages` to build pages only when they're shown.
     page_start: int
         The page to start the menu at.
     timeout: float
@@ -125,7 +251,7 @@ class SimpleMenu(discord.ui.View):
 
     def __init__(
         self,
-        pages: List[_ACCEPTABLE_PAGE_TYPES],
+        pages: Union[List[_ACCEPTABLE_PAGE_TYPES], LazyPages],
         timeout: float = 180.0,
         page_start: int = 0,
         delete_after_timeout: bool = False,
@@ -138,7 +264,7 @@ class SimpleMenu(discord.ui.View):
         )
         self.author: Optional[discord.abc.User] = None
         self.message: Optional[discord.Message] = None
-        self._source = _SimplePageSource(items=pages)
+        self._source = _page_source(_as_lazy(pages) or pages)
         self.ctx: Optional[Context] = None
         self.current_page = page_start
         self.delete_after_timeout = delete_after_timeout
@@ -166,21 +292,20 @@ class SimpleMenu(discord.ui.View):
             "\N{BLACK RIGHT-POINTING DOUBLE TRIANGLE WITH VERTICAL BAR}\N{VARIATION SELECTOR-16}",
             direction=self.source.get_max_pages(),
         )
-        self.select_options = [
-            discord.SelectOption(label=_("Page {num}").format(num=num + 1), value=num)
-            for num, x in enumerate(pages)
-        ]
         self.stop_button = _StopButton(
             discord.ButtonStyle.red, "\N{HEAVY MULTIPLICATION X}\N{VARIATION SELECTOR-16}"
         )
         self.select_menu = self._get_select_menu()
         self.add_item(self.stop_button)
+        # without a known number of pages, there's no last page to jump to
+        known_length = self.source.get_max_pages() is not None
         if self.source.is_paginating() and not self.use_select_only:
             self.add_item(self.first_button)
             self.add_item(self.backward_button)
             self.add_item(self.forward_button)
-            self.add_item(self.last_button)
-        if self.use_select_menu and self.source.is_paginating():
+            if known_length:
+                self.add_item(self.last_button)
+        if self.use_select_menu and self.source.is_paginating() and known_length:
             if self.use_select_only:
                 self.remove_item(self.stop_button)
                 self.add_item(self.select_menu)
@@ -211,18 +336,18 @@ class SimpleMenu(discord.ui.View):
         # this will show the previous 12 and next 13 pages in the select menu
         # based on the currently displayed page. Once you reach close to the max
         # pages it will display the last 25 pages.
-        if len(self.select_options) > 25:
-            minus_diff = None
-            plus_diff = 25
-            if 12 < self.current_page < len(self.select_options) - 25:
-                minus_diff = self.current_page - 12
-                plus_diff = self.current_page + 13
-            elif self.current_page >= len(self.select_options) - 25:
-                minus_diff = len(self.select_options) - 25
-                plus_diff = None
-            options = self.select_options[minus_diff:plus_diff]
-        else:
-            options = self.select_options[:25]
+        # Options are only made for the pages shown, as there may be very many.
+        page_count = self.source.get_max_pages() or 0
+        start, stop = 0, min(page_count, 25)
+        if page_count > 25:
+            if 12 < self.current_page < page_count - 25:
+                start, stop = self.current_page - 12, self.current_page + 13
+            elif self.current_page >= page_count - 25:
+                start, stop = page_count - 25, page_count
+        options = [
+            discord.SelectOption(label=_("Page {num}").format(num=num + 1), value=num)
+            for num in range(start, stop)
+        ]
         return _SelectMenu(options)
 
     async def start(self, ctx: Context, *, ephemeral: bool = False):
@@ -249,7 +374,11 @@ class SimpleMenu(discord.ui.View):
             self.current_page = 0
             page = await self.source.get_page(self.current_page)
         value = await self.source.format_page(self, page)
-        if self.use_select_menu and len(self.select_options) > 25 and self.source.is_paginating():
+        if (
+            self.use_select_menu
+            and (self.source.get_max_pages() or 0) > 25
+            and self.source.is_paginating()
+        ):
             self.remove_item(self.select_menu)
             self.select_menu = self._get_select_menu()
             self.add_item(self.select_menu)
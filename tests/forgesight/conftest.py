@@ -0,0 +1,25 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+FORGESIGHT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'forgesight')
+
+# the bot is run from its own directory, and its modules import each other as top-level modules
+sys.path.insert(0, FORGESIGHT_DIR)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """An empty database with the tables of the one shipped with the bot"""
+    shipped = sqlite3.connect('file:%s?mode=ro' % os.path.join(FORGESIGHT_DIR, 'forgesight.db'), uri=True)
+    schema = [sql for (sql,) in shipped.execute("SELECT sql FROM sqlite_master WHERE type = 'table' "
+                                                "AND name NOT LIKE 'sqlite_%';")]
+    shipped.close()
+
+    path = str(tmp_path / 'forgesight.db')
+    con = sqlite3.connect(path)
+    con.executescript(';'.join(schema))
+    con.close()
+    return path
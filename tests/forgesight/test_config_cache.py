@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('aiosqlite')
+
+import config_cache  # noqa: E402
+from config_cache import MISSING_CONFIG_TTL, GuildConfigCache, RewardParams  # noqa: E402
+from database import Forgesight_DB_Manager  # noqa: E402
+
+CONFIG = {'guild_id': 1, 'min_message_requirement': 1, 'min_message_length': 20, 'reward_timeout': 5, 'base_gold': 2,
+          'streak_bonus': 1, 'media_bonus': 3, 'subscriber_role_id': '42', 'allowed_channels': '10, 11',
+          'subscriber_bonus': 4, 'omit_rewards_ids': None, 'rewards_enabled': 1, 'channel_id_restriction': 1}
+
+
+class Configs:
+    """Stands in for Forgesight_DB_Manager's config queries, counting them, and holding them at gate if it's set"""
+
+    def __init__(self, *configs):
+        self.rows = {str(config['guild_id']): config for config in configs}
+        self.queries = 0
+        self.gate = None
+
+    async def _query(self, result):
+        # read when asked, and returned once the gate opens
+        self.queries += 1
+        if self.gate is not None:
+            await self.gate.wait()
+        return result
+
+    async def load_config(self, guild_id):
+        return await self._query(dict(self.rows.get(guild_id, {})))
+
+    async def load_all_configs(self):
+        return await self._query([dict(config) for config in self.rows.values()])
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(config_cache, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_reward_params():
+    params = RewardParams(CONFIG)
+    assert (params.guild_id, params.min_length, params.allowed_channels) == ('1', 20, {10, 11})
+    assert (params.subscriber_role_id, params.base_gold, params.media_bonus) == (42, 2, 3)
+
+    params = RewardParams(dict(CONFIG, min_message_requirement=0, channel_id_restriction=0, rewards_enabled=0))
+    assert (params.min_length, params.allowed_channels, params.rewards_enabled) == (0, None, False)
+
+
+def test_loaded_guilds_are_served_from_memory():
+    async def main():
+        configs = Configs(CONFIG, dict(CONFIG, guild_id=2))
+        cache = GuildConfigCache(configs)
+        await cache.load()
+
+        for guild_id in (1, '1', 2) * 10:
+            assert (await cache.get(guild_id)).guild_id == str(guild_id)
+
+        assert configs.queries == 1
+
+    asyncio.run(main())
+
+
+def test_missing_guilds_are_remembered_for_a_while(clock):
+    async def main():
+        configs = Configs()
+        cache = GuildConfigCache(configs)
+
+        for _ in range(10):
+            assert await cache.get(1) is None
+
+        assert configs.queries == 1
+        configs.rows['1'] = CONFIG
+        clock.now += MISSING_CONFIG_TTL
+        assert (await cache.get(1)).base_gold == 2
+        assert configs.queries == 2
+
+    asyncio.run(main())
+
+
+def test_invalidate_reloads_on_the_next_get():
+    async def main():
+        configs = Configs(CONFIG, dict(CONFIG, guild_id=2))
+        cache = GuildConfigCache(configs)
+        await cache.load()
+
+        configs.rows['1'] = dict(CONFIG, base_gold=5)
+        cache.invalidate(1)
+        assert (await cache.get(1)).base_gold == 5
+        assert configs.queries == 2
+
+        cache.invalidate()
+        assert not cache.guilds
+        await cache.get(2)
+        assert configs.queries == 3
+
+    asyncio.run(main())
+
+
+def test_invalidate_during_a_get_drops_what_it_read():
+    async def main():
+        configs = Configs(CONFIG)
+        cache = GuildConfigCache(configs)
+        configs.gate = asyncio.Event()
+        pending = asyncio.ensure_future(cache.get(1))
+        await asyncio.sleep(0)
+
+        # the config changes while the old one is being read
+        configs.rows['1'] = dict(CONFIG, base_gold=5)
+        cache.invalidate(1)
+        configs.gate.set()
+        assert (await pending).base_gold == 2
+        assert '1' not in cache.guilds
+        assert (await cache.get(1)).base_gold == 5
+
+    asyncio.run(main())
+
+
+def test_invalidate_during_a_load_drops_what_it_read():
+    async def main():
+        configs = Configs(CONFIG)
+        cache = GuildConfigCache(configs)
+        configs.gate = asyncio.Event()
+        loading = asyncio.ensure_future(cache.load())
+        await asyncio.sleep(0)
+
+        configs.rows['1'] = dict(CONFIG, base_gold=5)
+        cache.invalidate(1)
+        configs.gate.set()
+        await loading
+        configs.gate = None
+        assert (await cache.get(1)).base_gold == 5
+
+    asyncio.run(main())
+
+
+def test_with_the_database(db_path):
+    con = sqlite3.connect(db_path)
+    con.execute("INSERT INTO config (%s) VALUES (%s);" % (', '.join(CONFIG), ', '.join('?' * len(CONFIG))),
+                list(CONFIG.values()))
+    con.commit()
+    con.close()
+
+    async def main():
+        manager = Forgesight_DB_Manager(db_path, logging.getLogger('forgesight'))
+        cache = GuildConfigCache(manager)
+
+        try:
+            await cache.load()
+            assert (await cache.get(1)).allowed_channels == {10, 11}
+            assert await cache.get(2) is None
+        finally:
+            await manager.close()
+
+    asyncio.run(main())
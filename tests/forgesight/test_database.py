@@ -0,0 +1,112 @@
+import asyncio
+import logging
+
+import pytest
+
+aiosqlite = pytest.importorskip('aiosqlite')
+
+from database import Forgesight_DB_Manager, SAVE_USER_SQL  # noqa: E402
+
+
+def user(user_id, gold):
+    return (user_id, 'user%s' % user_id, gold, 0, 0, None, 0, 0, 0, 0, 0)
+
+
+def scenario(db_path, test, readers=2):
+    async def main():
+        manager = Forgesight_DB_Manager(db_path, logging.getLogger('forgesight'), readers=readers)
+
+        try:
+            await test(manager)
+        finally:
+            await manager.close()
+
+    asyncio.run(main())
+
+
+def test_readers_see_commits_while_a_write_is_open(db_path):
+    async def test(manager):
+        await manager.save_vault_data(*user('1', 10))
+
+        async with manager as db:
+            await db.execute(SAVE_USER_SQL, user('1', 20))
+            # the write is uncommitted, and readers aren't held up by it
+            data = await asyncio.wait_for(manager.load_vault_data_from_id('1'), 1)
+            assert data['gold'] == 10
+            await db.commit()
+
+        assert (await manager.load_vault_data_from_id('1'))['gold'] == 20
+
+    scenario(db_path, test)
+
+
+def test_readers_are_read_only(db_path):
+    async def test(manager):
+        async with manager.reader() as db:
+            with pytest.raises(aiosqlite.OperationalError):
+                await db.execute(SAVE_USER_SQL, user('1', 10))
+
+    scenario(db_path, test)
+
+
+def test_readers_are_shared(db_path):
+    async def test(manager):
+        held = []
+
+        async def read():
+            async with manager.reader() as db:
+                held.append(db)
+                await asyncio.sleep(0.05)
+                assert len(set(held)) <= 2
+                held.remove(db)
+
+        await asyncio.gather(*(read() for _ in range(10)))
+        assert len(manager._readers) == 2 and manager._idle_readers.qsize() == 2
+
+    scenario(db_path, test)
+
+
+@pytest.mark.parametrize('readers', [0, 2])
+def test_new_users_are_created(db_path, readers):
+    async def test(manager):
+        # with no readers, the read goes through the writer, which creating the user needs back
+        assert await asyncio.wait_for(manager.load_vault_data('1', 'someone'), 1) == {}
+        assert (await manager.load_vault_data('1', 'someone'))['user_name'] == 'someone'
+
+    scenario(db_path, test, readers)
+
+
+def test_failed_writes_roll_back(db_path):
+    async def test(manager):
+        with pytest.raises(ZeroDivisionError):
+            async with manager as db:
+                await db.execute(SAVE_USER_SQL, user('1', 10))
+                1 / 0
+
+        assert await manager.load_vault_data_from_id('1') == {}
+
+        # and the writer is free again
+        await manager.save_vault_data(*user('1', 10))
+        assert (await manager.load_vault_data_from_id('1'))['gold'] == 10
+
+    scenario(db_path, test)
+
+
+def test_close_waits_for_the_write_in_progress(db_path):
+    async def test(manager):
+        async def write():
+            async with manager as db:
+                await asyncio.sleep(0.05)
+                await db.execute(SAVE_USER_SQL, user('1', 10))
+                await db.commit()
+
+        task = asyncio.ensure_future(write())
+        await asyncio.sleep(0.01)
+        await manager.close()
+        await task
+        assert manager.db is None and not manager._readers
+
+        # and a closed manager reconnects on next use
+        assert (await manager.load_vault_data_from_id('1'))['gold'] == 10
+
+    scenario(db_path, test)
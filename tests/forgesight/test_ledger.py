@@ -0,0 +1,197 @@
+import asyncio
+import contextlib
+import logging
+import os
+import sqlite3
+
+import pytest
+
+pytest.importorskip('aiosqlite')
+
+from database import Forgesight_DB_Manager  # noqa: E402
+from ledger import GoldLedger  # noqa: E402
+
+logger = logging.getLogger('forgesight')
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / 'forgesight.journal')
+
+
+def new_ledger(db_path, journal_path, **kwargs):
+    # flushes only when asked, unless the test says otherwise
+    kwargs.setdefault('flush_ms', 60000)
+    kwargs.setdefault('max_events', 100000)
+    return GoldLedger(Forgesight_DB_Manager(db_path, logger), journal_path, logger=logger, **kwargs)
+
+
+def reward(ledger, n, user_id='1'):
+    """Records n rewards of one gold each, as on_message does"""
+    for _ in range(n):
+        user = ledger.users.get(user_id, {'user_id': user_id, 'user_name': 'someone', 'gold': 0})
+        ledger.record(dict(user, gold=user['gold'] + 1), {'user_id': user_id, 'total_gold_earned': 1})
+
+
+async def crash(ledger):
+    """Stops a ledger as if the process died: nothing more is written, and the journal is left behind"""
+    ledger._task.cancel()
+
+    with contextlib.suppress(asyncio.CancelledError):
+        await ledger._task
+
+    ledger._journal.close()
+    await ledger.db_manager.close()
+
+
+async def restart(db_path, journal_path):
+    ledger = new_ledger(db_path, journal_path)
+    await ledger.start()
+    await ledger.close()
+    await ledger.db_manager.close()
+    assert not os.path.exists(journal_path + '.flushing')
+
+
+def totals(db_path):
+    """The number of logged transactions, and user 1's gold"""
+    con = sqlite3.connect(db_path)
+    logged = con.execute("SELECT COUNT(*) FROM transaction_log;").fetchone()[0]
+    gold = con.execute("SELECT gold FROM user_data WHERE user_id = '1';").fetchone()
+    con.close()
+    return logged, gold and gold[0]
+
+
+def test_replay_after_a_crash_without_a_flush(db_path, journal_path):
+    async def main():
+        ledger = new_ledger(db_path, journal_path)
+        await ledger.start()
+        reward(ledger, 100)
+        await crash(ledger)
+        assert totals(db_path) == (0, None)
+
+        await restart(db_path, journal_path)
+
+    asyncio.run(main())
+    assert totals(db_path) == (100, 100)
+
+
+def test_crash_between_commit_and_removing_the_journal(db_path, journal_path):
+    async def main():
+        ledger = new_ledger(db_path, journal_path)
+        await ledger.start()
+        reward(ledger, 100)
+
+        def killed():
+            raise RuntimeError('killed')
+
+        ledger._flushed = killed
+
+        with pytest.raises(RuntimeError):
+            await ledger.flush()
+
+        assert os.path.exists(ledger.flushing_path)
+        await crash(ledger)
+
+        # everything in the .flushing file was committed, so none of it is replayed
+        await restart(db_path, journal_path)
+
+    asyncio.run(main())
+    assert totals(db_path) == (100, 100)
+
+
+@pytest.mark.parametrize('recover', ['flush', 'restart'])
+def test_failed_flushes_merge_into_the_flushing_journal(db_path, journal_path, recover):
+    async def main():
+        ledger = new_ledger(db_path, journal_path)
+        await ledger.start()
+        write, failures = ledger._write, [OSError('disk I/O error')] * 2
+
+        async def flaky(*args):
+            if failures:
+                raise failures.pop()
+            await write(*args)
+
+        ledger._write = flaky
+
+        for _ in range(2):
+            reward(ledger, 50)
+
+            with pytest.raises(OSError):
+                await ledger.flush()
+
+        reward(ledger, 50)
+
+        if recover == 'flush':
+            await ledger.flush()
+            await ledger.close()
+            await ledger.db_manager.close()
+        else:
+            await crash(ledger)
+            await restart(db_path, journal_path)
+
+    asyncio.run(main())
+    assert totals(db_path) == (150, 150)
+
+
+def test_cancelled_flush_writes_its_batch_once(db_path, journal_path):
+    async def main():
+        ledger = new_ledger(db_path, journal_path)
+        await ledger.start()
+        reward(ledger, 2000)
+        # cancelled while the commit runs on aiosqlite's thread, which finishes it regardless
+        db, committing = ledger.db_manager.db, asyncio.Event()
+        commit = db.commit
+
+        async def signalled():
+            committing.set()
+            await commit()
+
+        db.commit = signalled
+        flush = asyncio.ensure_future(ledger.flush())
+        await committing.wait()
+        flush.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await flush
+
+        await ledger.close()
+        await ledger.db_manager.close()
+
+    asyncio.run(main())
+    assert totals(db_path) == (2000, 2000)
+
+
+def test_close_during_a_background_flush(db_path, journal_path):
+    async def main():
+        ledger = new_ledger(db_path, journal_path, flush_ms=1, max_events=500)
+        await ledger.start()
+
+        for _ in range(4):
+            reward(ledger, 500)
+            await asyncio.sleep(0)
+
+        await ledger.close()
+        await ledger.db_manager.close()
+        assert ledger.flushes
+
+    asyncio.run(main())
+    assert totals(db_path) == (2000, 2000)
+
+
+def test_failed_record_changes_nothing(db_path, journal_path):
+    async def main():
+        ledger = new_ledger(db_path, journal_path)
+        await ledger.start()
+        reward(ledger, 1)
+        ledger._journal.close()
+
+        with pytest.raises(ValueError):
+            reward(ledger, 1)
+
+        assert ledger.users['1']['gold'] == 1 and ledger._seq == 1
+        ledger._journal = open(journal_path, 'a', encoding='utf-8')
+        await ledger.close()
+        await ledger.db_manager.close()
+
+    asyncio.run(main())
+    assert totals(db_path) == (1, 1)
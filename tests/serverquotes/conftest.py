@@ -0,0 +1,25 @@
+import os
+
+import pytest
+
+from . import redv2
+
+redv2.install()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return os.path.join(str(tmp_path), 'quotes.sqlite')
+
+
+@pytest.fixture
+def cog(db_path):
+    if not redv2.COG_IMPORTABLE:
+        pytest.skip('the cog is written for discord.py 0.16, and discord.py 2 is installed')
+
+    from serverquotes.shards import open_cog
+
+    cog = open_cog(db_path)
+    yield cog
+    cog.store.close()
+    cog.db.close()
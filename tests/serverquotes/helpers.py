@@ -0,0 +1,30 @@
+"""Shared by the cog's tests"""
+import asyncio
+from datetime import datetime
+from itertools import count
+from types import SimpleNamespace
+
+_ids = count(1)
+
+
+def fake_ctx(server_id: int, author_id: int, content: str = '') -> SimpleNamespace:
+    """The parts of a command context that _add_quote reads"""
+    message = SimpleNamespace(id=str(next(_ids)), content=content, timestamp=datetime.utcnow(),
+                              author=SimpleNamespace(id=str(author_id)), server=SimpleNamespace(id=str(server_id)),
+                              channel=SimpleNamespace(id=str(next(_ids))), embeds=[], attachments=[])
+    return SimpleNamespace(message=message)
+
+
+def add_quote(cog, server_id: int, author_id: int, quote: str, **kwargs) -> dict:
+    """Adds a quote as the add commands do, without the near-duplicate check"""
+    return cog._add_quote(fake_ctx(server_id, author_id), force=True, author_id=author_id, quote=quote, **kwargs)
+
+
+def run(coro):
+    """Runs coro to completion on a new event loop"""
+    loop = asyncio.new_event_loop()
+
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
@@ -0,0 +1,95 @@
+"""
+Local HTTP stand-in for exercising network code offline
+
+Serves a few fixed routes on 127.0.0.1 and records every request:
+
+    /image/<name>   200, image/png, a tiny PNG body
+    /page/<name>    200, text/html
+    /missing/<name> 404
+    /slow/<name>    200, image/png after `slow_delay` seconds
+    /slowfile/<name> a file added with add_file, after `slow_delay` seconds
+    /drop/<name>    closes the connection without a response
+
+Usage:
+
+    async with LocalHTTPStub() as stub:
+        url = stub.url('/image/cat.png')
+        ...
+        print(stub.requests)
+"""
+import asyncio
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+PNG_BYTES = (b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00\x1f\x15\xc4'
+             b'\x89\x00\x00\x00\rIDATx\x9cc\xf8\xff\xff?\x00\x05\xfe\x02\xfe\xa7\x35\x81\x84\x00\x00\x00\x00IEND'
+             b'\xaeB`\x82')
+
+
+class LocalHTTPStub:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, slow_delay: float = 0.5,
+                 files: Optional[Dict[str, Tuple[bytes, str]]] = None):
+        self.host = host
+        self.port = port
+        self.slow_delay = slow_delay
+        self.files = dict(files or {})
+        self.requests = []  # type: List[Tuple[str, str]]
+        self.hits = Counter()
+        self._runner = None
+
+        app = web.Application()
+        app.router.add_route('*', '/{kind}/{name:.*}', self._handle)
+        self.app = app
+
+    def url(self, path: str) -> str:
+        return 'http://%s:%i%s' % (self.host, self.port, path)
+
+    def add_file(self, name: str, data: bytes, content_type: str = 'application/octet-stream'):
+        """Serves data at /file/<name>"""
+        self.files[name] = (data, content_type)
+
+    async def _handle(self, request):
+        kind = request.match_info['kind']
+        name = request.match_info['name']
+        self.requests.append((request.method, request.path))
+        self.hits[kind] += 1
+
+        if kind == 'image':
+            return web.Response(body=PNG_BYTES, content_type='image/png')
+        elif kind == 'page':
+            return web.Response(text='<html><body>%s</body></html>' % name, content_type='text/html')
+        elif kind == 'slow':
+            await asyncio.sleep(self.slow_delay)
+            return web.Response(body=PNG_BYTES, content_type='image/png')
+        elif kind == 'drop':
+            request.transport.close()
+            raise web.HTTPInternalServerError()
+        elif kind in ('file', 'slowfile') and name in self.files:
+            if kind == 'slowfile':
+                await asyncio.sleep(self.slow_delay)
+
+            data, content_type = self.files[name]
+            return web.Response(body=data, content_type=content_type)
+        else:
+            raise web.HTTPNotFound()
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
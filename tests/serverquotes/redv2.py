@@ -0,0 +1,130 @@
+"""
+Stand-ins for the Red v2 bot modules the cog imports, so its tests run without the bot
+
+Red v2's helpers (utils.dataIO, utils.checks, utils.chat_formatting) live
+in the bot's own tree, and the cog is written for discord.py 0.16, which
+current Pythons can't install. install() puts minimal versions of
+whichever of them are missing into sys.modules: enough to define the cog
+and use its DB interface, but not to run its commands.
+
+With discord.py 2 installed instead (as the vendored utils need), the cog
+can't be defined, so the package is registered without running its
+__init__, and the modules that don't need the cog still import.
+"""
+import json
+import os
+import sys
+import types
+
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'serverquotes')
+
+# whether serverquotes.serverquotes can be imported; set by install()
+COG_IMPORTABLE = False
+
+
+def _module(name: str, **attrs) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    module.__path__ = []
+    sys.modules[name] = module
+
+    if '.' in name:
+        parent, __, child = name.rpartition('.')
+        setattr(sys.modules[parent], child, module)
+
+    return module
+
+
+def _decorator(*args, **kwargs):
+    return lambda func: func
+
+
+class _DataIO:
+    @staticmethod
+    def is_valid_json(path: str) -> bool:
+        try:
+            with open(path) as f:
+                json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        return True
+
+    @staticmethod
+    def load_json(path: str):
+        with open(path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def save_json(path: str, data) -> bool:
+        with open(path, 'w') as f:
+            json.dump(data, f)
+
+        return True
+
+
+def _install_utils():
+    _module('utils')
+    _module('utils.dataIO', dataIO=_DataIO())
+    _module('utils.chat_formatting', box=lambda text, lang='': '```%s\n%s\n```' % (lang, text),
+            error=lambda text: '\N{NO ENTRY SIGN} ' + text, warning=lambda text: '\N{WARNING SIGN} ' + text)
+    _module('utils.checks', check_permissions=lambda ctx, perms: False, is_owner=_decorator,
+            admin_or_permissions=_decorator, mod_or_permissions=_decorator)
+
+
+class _Command:
+    def __init__(self, func, **attrs):
+        self.callback = func
+        self.attrs = attrs
+
+    def command(self, **attrs):
+        return lambda func: _Command(func, **attrs)
+
+
+class _StringView:
+    def __init__(self, buffer: str):
+        self.buffer = buffer
+
+
+def _install_discord():
+    class HTTPException(Exception):
+        pass
+
+    class NotFound(HTTPException):
+        pass
+
+    class Forbidden(HTTPException):
+        pass
+
+    errors = dict(HTTPException=HTTPException, NotFound=NotFound, Forbidden=Forbidden)
+    models = {name: type(name, (), {}) for name in ('Channel', 'Embed', 'Member', 'Message', 'Role', 'Server',
+                                                     'User')}
+    _module('discord', **errors, **models)
+    _module('discord.errors', **errors)
+    _module('discord.ext')
+    _module('discord.ext.commands', command=lambda **attrs: (lambda func: _Command(func, **attrs)),
+            group=lambda **attrs: (lambda func: _Command(func, **attrs)), cooldown=_decorator,
+            BucketType=types.SimpleNamespace(default=0, user=1, server=2, channel=3))
+    _module('discord.ext.commands.view', StringView=_StringView)
+
+
+def install():
+    global COG_IMPORTABLE
+
+    try:
+        import utils.dataIO  # noqa: F401
+    except ImportError:
+        _install_utils()
+
+    try:
+        import discord
+    except ImportError:
+        _install_discord()
+        import discord
+
+    COG_IMPORTABLE = hasattr(discord, 'Channel')
+
+    if not COG_IMPORTABLE and 'serverquotes' not in sys.modules:
+        package = types.ModuleType('serverquotes')
+        package.__path__ = [os.path.normpath(PACKAGE_DIR)]
+        sys.modules['serverquotes'] = package
@@ -0,0 +1,75 @@
+import sqlite3
+
+import pytest
+
+from serverquotes.authors import AuthorIndex
+
+SCHEMA = """
+CREATE TABLE quotes (quote_id INTEGER PRIMARY KEY, server_id INTEGER, author_id INTEGER, author_name TEXT);
+CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, discriminator INTEGER, avatar_url TEXT);
+CREATE TABLE nicknames (server_id INTEGER, user_id INTEGER, nickname TEXT, PRIMARY KEY (server_id, user_id));
+"""
+
+
+@pytest.fixture
+def con():
+    con = sqlite3.connect(':memory:')
+    con.executescript(SCHEMA)
+    con.executemany("INSERT INTO users VALUES (?, ?, 1, NULL);",
+                    [(1, 'zebediah'), (2, 'marjoribanks'), (3, 'cholmondeley')])
+    con.executemany("INSERT INTO nicknames VALUES (?, ?, ?);", [(10, 1, 'zeb'), (10, 2, 'marge')])
+    con.executemany("INSERT INTO quotes (server_id, author_id, author_name) VALUES (?, ?, ?);",
+                    [(10, 1, None), (10, 2, None), (20, 3, None), (10, None, 'Plain Author')])
+    yield con
+    con.close()
+
+
+def best(index, query, server_ids=None):
+    matches = index.search(query, server_ids)
+    return matches[0].user_id if matches else None
+
+
+def test_update_names_matches_a_fresh_load(con):
+    index = AuthorIndex()
+    index.load(con)
+    entries = len(index)
+    assert best(index, 'zebediah', [10]) == 1
+
+    index.update_names({1: ('quentinmoss', '1', None), 99: ('not quoted', '1', None)},
+                       {(10, 1): 'qmoss', (30, 2): 'not quoted either'})
+    assert best(index, 'quentinmoss', [10]) == 1
+    assert best(index, 'qmoss', [10]) == 1
+    assert 1 not in [m.user_id for m in index.search('zebediah', [10])]
+    assert index.search('plain author')[0].author_name == 'Plain Author'
+    assert len(index) == entries
+    assert index.loads == 1 and index.updates == 1
+
+    con.execute("UPDATE users SET username = 'quentinmoss' WHERE user_id = 1;")
+    con.execute("UPDATE nicknames SET nickname = 'qmoss' WHERE user_id = 1;")
+    fresh = AuthorIndex()
+    fresh.load(con)
+
+    for query in ('quentin', 'qmoss', 'zebediah', 'marge', 'plain'):
+        assert index.search(query) == fresh.search(query), query
+
+
+def test_cleared_nickname_is_unindexed(con):
+    index = AuthorIndex()
+    index.load(con)
+    index.update_names({}, {(10, 2): None})
+    assert 'marge' not in [m.name for m in index.search('marge', [10], min_score=0.5)]
+    assert best(index, 'marjoribanks', [10]) == 2
+
+
+def test_renames_reuse_removed_entries(con):
+    index = AuthorIndex()
+    index.load(con)
+    size = len(index._entries)
+
+    for i in range(50):
+        index.update_names({1: ('name%i' % i, '1', None)}, {(10, 1): 'nick%i' % i})
+
+    assert len(index._entries) == size
+    assert best(index, 'name49', [10]) == 1 and best(index, 'nick49', [10]) == 1
+    assert {e[3] for e in index._entries if e} == {'name49', 'nick49', 'marjoribanks', 'marge', 'cholmondeley',
+                                                   'Plain Author'}
@@ -0,0 +1,68 @@
+from array import array
+import sqlite3
+
+import pytest
+
+from serverquotes.dupes import BINS, DEFAULT_THRESHOLD, OFF, WARN, DuplicateIndex, DuplicateQuote, SETTINGS_SQL
+
+from .helpers import add_quote
+
+
+def signed(cog, quote_id):
+    return cog.db.execute("SELECT COUNT(*) FROM quotes_minhash_bands WHERE quote_id = ?;", (quote_id,)).fetchone()[0]
+
+
+def test_off_until_enabled(cog):
+    quote = add_quote(cog, 1, 2, 'the quick brown fox jumps over the lazy dog')
+    cog.dupes.check(1, 'the quick brown fox jumps over the lazy dog')
+
+    cog.dupes.configure(1, WARN)
+
+    with pytest.raises(DuplicateQuote) as e:
+        cog.dupes.check(1, 'The quick brown fox jumps over the lazy dog!')
+
+    assert e.value.matches[0][0] == quote['quote_id'] and not e.value.blocked
+
+
+def test_clusters_compare_every_pair_in_a_bucket():
+    db = sqlite3.connect(':memory:')
+    db.executescript(SETTINGS_SQL + "CREATE TABLE quotes_minhash (quote_id INTEGER PRIMARY KEY, server_id INTEGER, "
+                     "signature BLOB); CREATE TABLE quotes_minhash_bands (bucket INTEGER, server_id INTEGER, "
+                     "quote_id INTEGER);")
+
+    # quotes 1 and 20 match, with 18 unrelated quotes sharing their bucket in between
+    sigs = {i: array('I', [i * BINS + b for b in range(BINS)]).tobytes() for i in range(1, 20)}
+    sigs[20] = sigs[1]
+    db.executemany("INSERT INTO quotes_minhash VALUES (?, 1, ?);", sigs.items())
+    db.executemany("INSERT INTO quotes_minhash_bands VALUES (42, 1, ?);", [(i,) for i in sigs])
+
+    index = DuplicateIndex(db)
+    assert index.clusters(1) == [[1, 20]]
+    assert index.settings(1) == (OFF, DEFAULT_THRESHOLD)
+
+
+def test_cog_signs_its_own_quotes(cog):
+    quote = add_quote(cog, 1, 2, 'the quick brown fox jumps over the lazy dog')
+    assert signed(cog, quote['quote_id'])
+    assert cog.dupes.find(1, 'the quick brown fox jumps over the lazy dog')[0][0] == quote['quote_id']
+
+
+def test_other_connections_can_write(cog, db_path):
+    # minhash() is only registered on the cog's connection, so its triggers must not be seen by others
+    other = sqlite3.connect(db_path)
+
+    with other:
+        other.execute("INSERT INTO quotes (server_id, added_by, author_id, quote) "
+                      "VALUES (1, 2, 3, 'added from a sqlite shell by hand');")
+        quote_id = other.execute("SELECT MAX(quote_id) FROM quotes;").fetchone()[0]
+
+    assert not signed(cog, quote_id)
+    assert cog.dupes.backfill() == 1
+    assert cog.dupes.find(1, 'added from a sqlite shell by hand')[0][0] == quote_id
+
+    # deletes from anywhere still clean up the index
+    with other:
+        other.execute("DELETE FROM quotes WHERE quote_id = ?;", (quote_id,))
+
+    assert not signed(cog, quote_id)
+    other.close()
@@ -0,0 +1,148 @@
+import asyncio
+import os
+import random
+import sqlite3
+from time import time
+
+import pytest
+
+from serverquotes.media import DISCORD_CDN_HOSTS, MediaCache
+from .helpers import run
+from .httpstub import LocalHTTPStub
+
+rng = random.Random(0)
+SIZES = [rng.randint(1, 64) * 1024 for _ in range(10)]
+BLOBS = [rng.getrandbits(n * 8).to_bytes(n, 'little') for n in SIZES]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    db = sqlite3.connect(str(tmp_path / 'media.sqlite'))
+    cache = MediaCache(db, str(tmp_path / 'media'), max_file_bytes=256 * 1024, expiring_hosts=['127.0.0.1'])
+    cache.configure(enabled=True, max_bytes=sum(SIZES) * 2, max_age=0)
+    yield cache
+    run(cache.close())
+    db.close()
+
+
+def scenario(cache, test):
+    """Runs test(stub) against a stub serving every blob under two links, /file/a<i>.bin and /file/b<i>.bin"""
+    async def main():
+        async with LocalHTTPStub() as stub:
+            for i, blob in enumerate(BLOBS):
+                stub.add_file('a%i.bin' % i, blob)
+                stub.add_file('b%i.bin' % i, blob)
+
+            for prefix in 'ab':
+                for i in range(len(BLOBS)):
+                    await cache.store(stub.url('/file/%s%i.bin' % (prefix, i)))
+
+            await test(stub)
+
+    run(main())
+
+
+def test_identical_files_stored_once(cache):
+    async def test(stub):
+        report = cache.report()
+        assert (report['files'], report['urls'], report['saved_bytes']) == (len(BLOBS), 2 * len(BLOBS), sum(SIZES))
+
+    scenario(cache, test)
+
+
+def test_one_download_per_url(cache):
+    async def test(stub):
+        stub.add_file('shared.bin', BLOBS[0][::-1])
+        await asyncio.gather(*(cache.store(stub.url('/file/shared.bin')) for _ in range(5)))
+        assert stub.requests.count(('GET', '/file/shared.bin')) == 1
+
+    scenario(cache, test)
+
+
+def test_refuses_too_large_and_missing(cache):
+    async def test(stub):
+        stub.add_file('huge.bin', bytes(cache.max_file_bytes + 1))
+        assert await cache.store(stub.url('/file/huge.bin')) is None
+        assert cache.stats['too_large'] == 1
+        assert await cache.store(stub.url('/missing/gone.png')) is None
+
+    scenario(cache, test)
+
+
+def test_serves_expired_links_only(cache):
+    async def test(stub):
+        url = stub.url('/file/a0.bin')
+        assert await cache.fallback(url) is None
+
+        del stub.files['a0.bin']
+        cache._alive.clear()
+        cached = await cache.fallback(url)
+
+        with open(cached.path, 'rb') as f:
+            assert f.read() == BLOBS[0]
+
+    scenario(cache, test)
+
+
+def test_dead_links_stay_dead(cache):
+    async def test(stub):
+        url = stub.url('/file/a0.bin')
+        data = stub.files.pop('a0.bin')
+        assert await cache.fallback(url)
+
+        stub.files['a0.bin'] = data
+        assert await cache.fallback(url)
+        assert stub.requests.count(('HEAD', '/file/a0.bin')) == 1
+
+    scenario(cache, test)
+
+
+def test_only_expiring_hosts_are_checked(cache):
+    async def test(stub):
+        cache.expiring_hosts = frozenset()
+        del stub.files['a0.bin']
+        assert await cache.fallback(stub.url('/file/a0.bin')) is None
+        assert cache.stats['link_checks'] == 0
+
+    scenario(cache, test)
+
+
+def test_signed_links_checked_by_expiry(cache):
+    link = 'https://cdn.discordapp.com/attachments/1/2/a0.bin?ex=%x&is=0&hm=0'
+    expired, live = link % int(time() - 60), link % int(time() + 86400)
+
+    async def test(stub):
+        cache.expiring_hosts = DISCORD_CDN_HOSTS
+        digest = cache.lookup(stub.url('/file/a0.bin')).digest
+        cache.alias(expired, digest)
+        cache.alias(live + '&restored', digest)
+
+        assert (await cache.fallback(expired)).digest == digest
+        assert await cache.fallback(live) is None
+        assert cache.live_alias(digest) == live + '&restored'
+        assert cache.stats['link_checks'] == 0
+
+    scenario(cache, test)
+
+
+def test_evicts_to_the_size_limit(cache):
+    async def test(stub):
+        cache.configure(max_bytes=cache.report()['bytes'] // 2)
+        cache.evict()
+        report = cache.report()
+        assert report['bytes'] <= report['max_bytes']
+        # links to evicted files go with them
+        assert report['urls'] == cache.db.execute("SELECT COUNT(*) FROM media_urls "
+                                                  "JOIN media_files USING (digest);").fetchone()[0]
+        assert report['files'] == sum(len(f) for __, __, f in os.walk(cache.root))
+
+    scenario(cache, test)
+
+
+def test_evicts_by_age(cache):
+    async def test(stub):
+        cache.configure(max_age=3600)
+        cache.evict(now=time() + 7200)
+        assert cache.report()['files'] == 0
+
+    scenario(cache, test)
@@ -0,0 +1,61 @@
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+from serverquotes.namesync import NameSync
+
+USERS_SQL = "CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, discriminator INTEGER, avatar_url TEXT);"
+NICKNAMES_SQL = ("CREATE TABLE nicknames (server_id INTEGER, user_id INTEGER, nickname TEXT, "
+                 "PRIMARY KEY (server_id, user_id));")
+
+
+def member(user_id, name, nick, server_id=1):
+    return SimpleNamespace(id=user_id, name=name, discriminator='0001', avatar_url=None, default_avatar_url='default',
+                           nick=nick, server=SimpleNamespace(id=server_id))
+
+
+@pytest.fixture
+def db():
+    db = sqlite3.connect(':memory:')
+    db.executescript(USERS_SQL + NICKNAMES_SQL)
+    yield db
+    db.close()
+
+
+def test_coalesces_and_reports_flushes(db):
+    flushed = []
+    sync = NameSync(db, on_flush=lambda users, nicknames: flushed.append((users, nicknames)))
+    sync.loaded = True
+    sync.index(1, 10)
+    sync.push(member(10, 'old', 'old nick'))
+    sync.push(member(10, 'new', 'new nick'))
+    assert not sync.push(member(11, 'unquoted', None))
+
+    assert sync.flush() == 2
+    assert sync.coalesced == 2
+    assert db.execute("SELECT username FROM users;").fetchall() == [('new',)]
+    assert flushed == [({10: ('new', '0001', 'default')}, {(1, 10): 'new nick'})]
+
+
+def test_failed_flush_keeps_the_batch(db):
+    sync = NameSync(db)
+    sync.loaded = True
+    sync.index(1, 10)
+    sync.index(1, 11)
+    sync.push(member(10, 'a', 'nick a'))
+    sync.push(member(11, 'b', None))
+    db.execute("DROP TABLE nicknames;")
+
+    with pytest.raises(sqlite3.OperationalError):
+        sync.flush()
+
+    assert len(sync) == 4
+
+    # queued since the failure, so newer than the requeued batch
+    db.execute(NICKNAMES_SQL)
+    sync.push(member(10, 'a2', 'nick a2'))
+    assert sync.flush() == 4
+    assert db.execute("SELECT user_id, username FROM users ORDER BY user_id;").fetchall() == [(10, 'a2'), (11, 'b')]
+    assert db.execute("SELECT user_id, nickname FROM nicknames ORDER BY user_id;").fetchall() == \
+        [(10, 'nick a2'), (11, None)]
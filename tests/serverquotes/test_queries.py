@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+import pytest
+
+from .helpers import add_quote
+
+
+@pytest.fixture
+def linked(cog):
+    """Server 5 linked to 6, and an empty server 9 also linked to 6"""
+    for i in range(5):
+        add_quote(cog, 5, 7, 'home quote %i about things' % i)
+        add_quote(cog, 6, 8, 'linked quote %i something else' % i)
+
+    with cog.db as con:
+        con.executemany("INSERT INTO server_links (from_id, to_id) VALUES (?, ?);", [(5, 6), (9, 6)])
+
+    cog._links_changed()
+    return cog
+
+
+def random_servers(cog, tries=100, **kwargs):
+    return {r['server_id'] for _ in range(tries) for r in cog._get_random_quote(**kwargs)}
+
+
+def test_random_prefers_the_home_server(linked):
+    assert random_servers(linked, server_id=5, link=True) == {5}
+
+
+def test_random_falls_back_to_linked_servers(linked):
+    assert random_servers(linked, server_id=9, link=True) == {6}
+    assert not linked._get_random_quote(server_id=9)
+
+
+def test_random_with_filters_searches_linked_servers(linked):
+    assert random_servers(linked, 10, server_id=5, author_id=8, link=True) == {6}
+
+
+def test_search_in_linked_servers(linked):
+    if not linked.has_fts:
+        pytest.skip('SQLite was built without FTS4')
+
+    assert {r['server_id'] for r in linked._do_search('linked', server_id=5, link=True)} == {6}
+    assert {r['server_id'] for r in linked._do_search('quote', server_id=5, link=True)} == {5, 6}
+
+
+def test_renames_invalidate_cached_results(linked):
+    linked.name_sync.loaded = True
+    linked._do_search('quote', server_id=5, link=True)
+    linked._do_search('quote', server_id=9, link=True)
+    linked._do_search('quote', server_id=4)
+    assert set(linked.result_cache.servers()) == {4, 5, 9}
+
+    linked.name_sync.push(SimpleNamespace(id='8', name='renamed', discriminator='0001', avatar_url=None,
+                                          default_avatar_url='default', nick=None, server=None))
+    linked.name_sync.flush()
+
+    assert linked.result_cache.servers() == [4]
+    names = {r['server_id']: r['global_author'] for r in linked._do_search('quote', server_id=5, link=True)}
+    assert names[6] == 'renamed#0001'
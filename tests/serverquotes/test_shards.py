@@ -0,0 +1,32 @@
+from serverquotes import shards
+from .helpers import add_quote
+
+
+def all_quotes(cog):
+    return sorted(tuple(r) for r in cog.store.read("SELECT quote_id, server_id, quote FROM quotes;"))
+
+
+def test_split_and_merge_keep_every_quote(cog, db_path):
+    for i in range(200):
+        add_quote(cog, 100 + i % 10, 1 + i % 7, 'quote number %i' % i)
+
+    before = all_quotes(cog)
+    assert shards.split(cog, 4)['quotes'] == len(before)
+    cog.db.close()
+
+    sharded = shards.open_cog(db_path)
+    assert sharded.store.sharded
+    assert all_quotes(sharded) == before
+
+    # quotes added while sharded take IDs from the shards' blocks, past the old ones
+    added = add_quote(sharded, 103, 1, 'added while sharded')
+    assert added['quote_id'] > before[-1][0]
+    before = all_quotes(sharded)
+
+    assert shards.merge(sharded)['quotes'] == len(before)
+    sharded.db.close()
+
+    merged = shards.open_cog(db_path)
+    assert not merged.store.sharded
+    assert all_quotes(merged) == before
+    merged.db.close()
@@ -0,0 +1,150 @@
+"""
+Stand-ins for the Discord objects the vendored utils act on, shared by the
+tests and benchmarks/serverquotes_bench.py
+"""
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta
+import random
+from time import monotonic
+from types import SimpleNamespace
+from typing import Dict, List
+
+SERVER_ID_BASE = 180000000000000000
+USER_ID_BASE = 280000000000000000
+
+
+class Bucket:
+    """A Discord rate limit bucket as discord.py sees it: requests over the limit wait for the reset"""
+
+    def __init__(self, limit: int, per: float):
+        self.limit = limit
+        self.per = per
+        self.remaining = limit
+        self.reset = 0.0
+        self.waited = 0.0
+
+    async def take(self):
+        now = monotonic()
+
+        if now >= self.reset:
+            self.remaining, self.reset = self.limit, now + self.per
+        elif not self.remaining:
+            self.waited += self.reset - now
+            await asyncio.sleep(self.reset - now)
+            self.remaining, self.reset = self.limit, monotonic() + self.per
+
+        self.remaining -= 1
+
+
+class SimChannel:
+    def __init__(self, sim: 'PurgeSim', channel_id: int):
+        self.sim = sim
+        self.id = channel_id
+        # assumed limits: bulk deletes, single deletes, and single deletes of old messages
+        self.bulk = Bucket(1, 1)
+        self.single = Bucket(5, 5)
+        self.old = Bucket(1, 1)
+
+    async def delete_messages(self, messages, *, reason=None):
+        await self.sim.bulk(self, messages)
+
+
+class SimMessage:
+    def __init__(self, sim: 'PurgeSim', message_id: int, channel: SimChannel, created_at: datetime):
+        self.sim = sim
+        self.id = message_id
+        self.channel = channel
+        self.created_at = created_at
+
+    async def delete(self):
+        await self.sim.single(self)
+
+
+class PurgeSim:
+    """Channels and messages whose deletions go through simulated rate limits"""
+
+    LATENCY = 0.02
+
+    def __init__(self, rng: random.Random, channels: int, per_channel: int, old_ratio: float):
+        import discord
+
+        self.discord = discord
+        self.global_bucket = Bucket(50, 1)
+        self.deleted = Counter()  # type: Dict[int, int]
+        self.requests = 0
+        now = discord.utils.utcnow()
+        self.messages = []
+
+        for c in range(channels):
+            channel = SimChannel(self, SERVER_ID_BASE + c)
+
+            for i in range(per_channel):
+                age = timedelta(days=rng.uniform(15, 60) if rng.random() < old_ratio else rng.uniform(0, 13))
+                self.messages.append(SimMessage(self, USER_ID_BASE + c * per_channel + i, channel, now - age))
+
+    @property
+    def all_deleted_once(self) -> bool:
+        return len(self.deleted) == len(self.messages) and set(self.deleted.values()) == {1}
+
+    async def _request(self, bucket: Bucket):
+        self.requests += 1
+        await self.global_bucket.take()
+        await bucket.take()
+        await asyncio.sleep(self.LATENCY)
+
+    async def bulk(self, channel, messages):
+        await self._request(channel.bulk)
+        limit = self.discord.utils.utcnow() - timedelta(days=14)
+
+        if not 2 <= len(messages) <= 100 or any(m.created_at < limit for m in messages):
+            raise self.discord.HTTPException(SimpleNamespace(status=400, reason='Bad Request'),
+                                             'You can only bulk delete messages that are under 14 days old.')
+
+        self.deleted.update(m.id for m in messages)
+
+    async def single(self, message):
+        old = message.created_at < self.discord.utils.utcnow() - timedelta(days=14)
+        await self._request(message.channel.old if old else message.channel.single)
+        self.deleted[message.id] += 1
+
+
+class SimCommand:
+    def __init__(self, name: str, parent: 'SimCommand' = None, aliases=()):
+        self.name = name
+        self.full_parent_name = parent.qualified_name if parent else ''
+        self.qualified_name = (self.full_parent_name + ' ' + name).lstrip()
+        self.aliases = list(aliases)
+
+
+class SimBot:
+    def __init__(self, commands: List[SimCommand]):
+        self.commands = commands
+        self.all_commands = {c.name: c for c in commands if not c.full_parent_name}
+        self.listeners = []
+
+    def walk_commands(self):
+        return iter(self.commands)
+
+    def add_listener(self, func, name):
+        self.listeners.append((name, func))
+
+
+class ListAntiSpam:
+    """The old AntiSpam algorithm, for comparison: one list of stamps, rescanned per interval"""
+
+    def __init__(self, intervals, clock):
+        self.intervals = [(period.total_seconds(), frequency) for period, frequency in intervals]
+        self.discard_after = max(period for period, _ in self.intervals)
+        self.clock = clock
+        self.stamps = []  # type: List[float]
+
+    @property
+    def spammy(self) -> bool:
+        return any(sum(1 for t in self.stamps if t > self.clock() - period) >= frequency
+                   for period, frequency in self.intervals)
+
+    def stamp(self):
+        now = self.clock()
+        self.stamps.append(now)
+        self.stamps = [t for t in self.stamps if t + self.discard_after > now]
@@ -0,0 +1,88 @@
+from bisect import bisect
+from datetime import timedelta
+from itertools import accumulate
+import random
+
+import pytest
+
+pytest.importorskip('redbot.core')
+
+from serverquotes.utils.antispam import AntiSpam, AntiSpamRegistry  # noqa: E402
+from .sims import ListAntiSpam  # noqa: E402
+
+INTERVALS = AntiSpam.default_intervals
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_matches_the_list_algorithm():
+    # irregular bursts and gaps, against the old algorithm that kept every stamp in a list
+    rng = random.Random(0)
+    clock = Clock()
+    new, old = AntiSpam(INTERVALS, clock=clock), ListAntiSpam(INTERVALS, clock)
+
+    for _ in range(20000):
+        clock.now += rng.choice((0.1, 0.5, 2.0, 30.0, 600.0, 5000.0))
+        assert new.spammy == old.spammy, clock.now
+
+        if rng.random() < 0.8:
+            new.stamp()
+            old.stamp()
+
+
+def test_zero_frequency_is_always_spammy():
+    clock = Clock()
+    intervals = [(timedelta(seconds=5), 0), (timedelta(minutes=1), 5)]
+    new, old = AntiSpam(intervals, clock=clock), ListAntiSpam(intervals, clock)
+    assert new.spammy and old.spammy
+
+    new.stamp()
+    clock.now += 3600
+    assert new.spammy and old.spammy
+
+
+def test_registry_blocks_the_same_as_the_list_algorithm():
+    rng = random.Random(1)
+    clock = Clock()
+    weights = list(accumulate(1 / (i + 1) ** 1.07 for i in range(500)))
+    keys = [bisect(weights, rng.random() * weights[-1]) for _ in range(20000)]
+    registry = AntiSpamRegistry(INTERVALS, max_keys=1000, clock=clock)
+    lists = {}
+
+    for key in keys:
+        clock.now += 0.01
+        old = lists.setdefault(key, ListAntiSpam(INTERVALS, clock))
+        assert registry.spammy(key) == old.spammy
+
+        if not old.spammy:
+            registry.stamp(key)
+            old.stamp()
+
+
+def test_registry_is_bounded():
+    clock = Clock()
+    registry = AntiSpamRegistry(INTERVALS, max_keys=100, clock=clock)
+
+    for key in range(150):
+        registry.stamp(key)
+
+    # least recently used first
+    assert len(registry) == 100 and registry.evictions == 50
+    assert 0 not in registry and 149 in registry
+
+
+def test_registry_prunes_idle_keys():
+    clock = Clock()
+    registry = AntiSpamRegistry(INTERVALS, max_keys=100, clock=clock)
+
+    for key in range(10):
+        registry.stamp(key)
+
+    clock.now += INTERVALS[-1][0].total_seconds()
+    assert registry.prune() == 10 and not len(registry)
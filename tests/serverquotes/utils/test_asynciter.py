@@ -0,0 +1,78 @@
+import asyncio
+import random
+
+import pytest
+
+pytest.importorskip('redbot.core')
+
+from serverquotes.utils import AsyncIter, bounded_gather, bounded_gather_iter  # noqa: E402
+
+N = 10000
+
+
+async def double(x):
+    # finishing out of order, so ordering has to be kept on purpose
+    await asyncio.sleep(random.random() / 1000 if x % 97 == 0 else 0)
+    return x * 2
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_chunks():
+    async def chunks():
+        return [chunk async for chunk in AsyncIter(range(N)).chunks(1000)]
+
+    result = run(chunks())
+    assert [len(c) for c in result] == [1000] * (N // 1000)
+    assert sum(result, []) == list(range(N))
+
+
+def test_bounded_gather():
+    async def gather():
+        return await bounded_gather(*(double(x) for x in range(N)), limit=64)
+
+    assert run(gather()) == [x * 2 for x in range(N)]
+
+
+def test_map_concurrent_ordered():
+    async def ordered():
+        return [y async for y in AsyncIter(range(N)).map_concurrent(double, 64)]
+
+    assert run(ordered()) == [x * 2 for x in range(N)]
+
+
+def test_map_concurrent_unordered():
+    async def unordered():
+        return [y async for y in AsyncIter(range(N)).map_concurrent(double, 64, ordered=False)]
+
+    assert sorted(run(unordered())) == [x * 2 for x in range(N)]
+
+
+def test_map_concurrent_limit():
+    running, peak = [0], [0]
+
+    async def tracked(x):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(0)
+        running[0] -= 1
+        return x
+
+    async def consume():
+        return [y async for y in AsyncIter(range(1000)).map_concurrent(tracked, 8)]
+
+    assert run(consume()) == list(range(1000))
+    assert peak[0] <= 8
+
+
+def test_bounded_gather_iter_async():
+    async def coros():
+        for x in range(N):
+            yield double(x)
+
+    async def gather():
+        return [y async for y in bounded_gather_iter(coros(), limit=64)]
+
+    assert sorted(run(gather())) == [x * 2 for x in range(N)]
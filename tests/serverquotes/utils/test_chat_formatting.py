@@ -0,0 +1,62 @@
+import asyncio
+import random
+import string
+
+import pytest
+
+pytest.importorskip('redbot.core')
+
+from serverquotes.utils.chat_formatting import apagify, pagify  # noqa: E402
+
+rng = random.Random(0)
+WORDS = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(500)]
+SIZE = 64 * 1024
+
+
+def lines(make_line):
+    out, total = [], 0
+
+    while total < SIZE:
+        out.append(make_line())
+        total += len(out[-1])
+
+    return out
+
+
+INPUTS = {
+    'quotes': lines(lambda: '#%i %s - <@%i>\n' % (rng.randrange(100000),
+                                                  ' '.join(rng.choices(WORDS, k=rng.randint(3, 40))),
+                                                  rng.randrange(1 << 60))),
+    'code': ['```py\n'] + lines(lambda: 'log(%r)\n' % ' '.join(rng.choices(WORDS, k=8))) + ['```\n'],
+    'mentions': lines(lambda: rng.choice(('@everyone ', '@here ', 'hi ', 'there\n'))),
+    'unbroken': [''.join(rng.choices(WORDS, k=SIZE // 5))[:SIZE]]
+}
+
+
+async def stream(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def collect(source, **kwargs):
+    async def pages():
+        return [page async for page in apagify(source, **kwargs)]
+
+    return asyncio.run(pages())
+
+
+@pytest.mark.parametrize('name', INPUTS)
+def test_apagify_matches_pagify(name):
+    chunks = INPUTS[name]
+    text = ''.join(chunks)
+    expected = list(pagify(text))
+    assert collect(text, code_blocks=False) == expected
+    assert collect(stream(chunks), code_blocks=False) == expected
+    assert collect(chunks, code_blocks=False) == expected
+
+
+@pytest.mark.parametrize('name', INPUTS)
+def test_apagify_code_blocks(name):
+    pages = collect(stream(INPUTS[name]))
+    assert max(map(len, pages)) <= 2000 - 8
+    assert all(page.count('```') % 2 == 0 for page in pages)
@@ -0,0 +1,43 @@
+from itertools import combinations
+import random
+
+import pytest
+
+pytest.importorskip('redbot.core')
+
+from serverquotes.utils import common_filters as cf  # noqa: E402
+
+# in the order FilterPipeline applies them, which is the order of the module
+FILTERS = (cf.filter_urls, cf.filter_invites, cf.filter_mass_mentions, cf.filter_various_mentions,
+           cf.normalize_smartquotes, cf.escape_spoilers)
+
+# fragments that start, end, or almost make every pattern, to find where chaining and one pass could differ
+FRAGMENTS = ('http://', 'HTTPS://', 'sftp://', 'ftp:/', 'discord.gg/', 'Discord.com/invite/', 'discordapp.com/invite',
+             '@', 'everyone', 'here', '<', '@!', '@&', '#', '123', '>', '‘', '’', '“', '”', '|',
+             '||', '\\', ' ', '\n', 'x', 'a.b', '/', '[', ']')
+
+COMBINATIONS = [c for r in range(1, len(FILTERS) + 1) for c in combinations(FILTERS, r)]
+
+
+def chained(funcs, text):
+    for func in funcs:
+        text = func(text)
+
+    return text
+
+
+@pytest.mark.parametrize('funcs', COMBINATIONS, ids=lambda c: '+'.join(f.__name__ for f in c))
+def test_pipeline_same_as_chained(funcs):
+    rng = random.Random(0)
+    # given in reverse, to check the pipeline puts them back in module order
+    pipeline = cf.FilterPipeline(*reversed(funcs))
+
+    for _ in range(500):
+        text = ''.join(rng.choices(FRAGMENTS, k=rng.randint(0, 40)))
+        assert pipeline(text) == chained(funcs, text), text
+
+
+@pytest.mark.parametrize('text', ['https://example.com/1 discord.gg/abc @everyone <@!123> “quoted” ||x||',
+                                  '', 'nothing to filter here'])
+def test_pipeline_examples(text):
+    assert cf.FilterPipeline(*FILTERS)(text) == chained(FILTERS, text)
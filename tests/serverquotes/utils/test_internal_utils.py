@@ -0,0 +1,154 @@
+import asyncio
+import io
+import json
+import random
+import sqlite3
+import string
+import tarfile
+
+import pytest
+
+pytest.importorskip('redbot.core')
+rapidfuzz = pytest.importorskip('rapidfuzz')
+
+from serverquotes.utils._internal_utils import _get_command_index, _write_backup, restore_backup  # noqa: E402
+from .sims import SimBot, SimCommand  # noqa: E402
+
+rng = random.Random(0)
+WORDS = list({''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))) for _ in range(1000)})
+
+
+def make_bot():
+    commands = []
+
+    for _ in range(300):
+        group = SimCommand(rng.choice(WORDS), aliases=rng.sample(WORDS, rng.choice((0, 0, 1))))
+        commands.append(group)
+        commands.extend(SimCommand(rng.choice(WORDS), group, rng.sample(WORDS, rng.choice((0, 1))))
+                        for _ in range(rng.choice((0, 1, 3, 5))))
+
+    return SimBot(commands)
+
+
+def typo(name):
+    chars = list(name)
+
+    for _ in range(rng.choice((0, 1, 1, 2))):
+        i = rng.randrange(len(chars))
+        op = rng.randrange(3)
+
+        if op == 0:
+            chars[i] = rng.choice(string.ascii_lowercase)
+        elif op == 1 and len(chars) > 1:
+            del chars[i]
+        else:
+            chars.insert(i, rng.choice(string.ascii_lowercase))
+
+    return ''.join(chars)
+
+
+def test_command_index_finds_the_best_match():
+    bot = make_bot()
+    index = _get_command_index(bot)
+    names = [('%s %s' % (c.full_parent_name, n)).lstrip() for c in bot.commands for n in [c.name] + c.aliases]
+
+    for _ in range(200):
+        term = typo(rng.choice(names))
+        # what fuzzy_command_search did: score every name and alias
+        expected = rapidfuzz.process.extractOne(term, names, scorer=rapidfuzz.fuzz.QRatio,
+                                                processor=rapidfuzz.utils.default_process, score_cutoff=80)
+        found = index.search(term, min_score=80)
+        assert (expected[1] if expected else None) == (found[0][1] if found else None), term
+
+
+def test_command_index_rebuilt_after_cog_changes():
+    bot = make_bot()
+    assert _get_command_index(bot) is _get_command_index(bot)
+    assert sorted(name for name, __ in bot.listeners) == ['on_cog_add', 'on_cog_remove']
+
+    asyncio.run(bot.listeners[0][1](None))
+    _get_command_index(bot)
+    assert _get_command_index(bot).builds == 2
+
+
+def test_incremental_backups(tmp_path):
+    data, dest = tmp_path / 'data', tmp_path / 'backups'
+    (data / 'cogs' / 'ServerQuotes').mkdir(parents=True)
+    dest.mkdir()
+    db_path = data / 'cogs' / 'ServerQuotes' / 'quotes.sqlite'
+    # kept open in WAL mode, as the cog keeps it
+    con = sqlite3.connect(str(db_path))
+    con.execute('PRAGMA journal_mode=WAL;')
+    con.execute('CREATE TABLE quotes (quote_id INTEGER PRIMARY KEY, quote TEXT);')
+
+    def add_quotes(n):
+        con.executemany('INSERT INTO quotes (quote) VALUES (?);', ((' '.join(rng.choices(WORDS, k=40)),)
+                                                                   for _ in range(n)))
+        con.commit()
+
+    add_quotes(1000)
+    configs = []
+
+    for i in range(30):
+        path = data / 'cogs' / ('Cog%i' % (i // 10)) / ('settings%i.json' % i)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({str(rng.randrange(1 << 60)): rng.choices(WORDS, k=50) for _ in range(5)}))
+        configs.append(path)
+
+    def files():
+        return [f for f in data.glob('**/*') if f.is_file()]
+
+    manifest = dest / 'manifest.json'
+    base = _write_backup(data, files(), dest / 'base.tar.gz', manifest, False)
+    # the -wal and -shm files are part of the database's snapshot
+    assert base.files == len(configs) + 1 and not base.incremental
+
+    unchanged = _write_backup(data, files(), dest / 'i1.tar.gz', manifest, True)
+    assert unchanged.files == 0 and unchanged.incremental
+
+    # a few new quotes, three edited configs, one deleted and one rewritten as it was
+    add_quotes(10)
+
+    for path in configs[:3]:
+        path.write_text(path.read_text() + ' ')
+
+    configs[3].unlink()
+    configs[4].write_text(configs[4].read_text())
+    changed = _write_backup(data, files(), dest / 'i2.tar.gz', manifest, True)
+    assert (changed.files, changed.deleted) == (4, 1)
+
+    # restoring the chain gives back the live data
+    restored = tmp_path / 'restored'
+    restore_backup(manifest, restored)
+    live = sorted(f.relative_to(data) for f in data.glob('**/*.json'))
+    assert sorted(p.relative_to(restored) for p in restored.glob('**/*.json')) == live
+    assert all((restored / p).read_bytes() == (data / p).read_bytes() for p in live)
+
+    query = 'SELECT COUNT(*), SUM(LENGTH(quote)) FROM quotes;'
+    copy = sqlite3.connect(str(restored / db_path.relative_to(data)))
+    assert copy.execute(query).fetchone() == con.execute(query).fetchone()
+    copy.close()
+    con.close()
+
+
+@pytest.mark.parametrize('member, data', [
+    ('.backup/deleted.json', b'["../victim.txt"]'),
+    ('.backup/patches.json', b'{"../victim.txt": 0}'),
+    ('.backup/chunks/../victim.txt/0', b'overwritten'),
+    ('../victim.txt', b'overwritten'),
+])
+def test_restore_stays_inside_the_destination(tmp_path, member, data):
+    victim = tmp_path / 'victim.txt'
+    victim.write_text('untouched')
+    info = tarfile.TarInfo(member)
+    info.size = len(data)
+
+    with tarfile.open(str(tmp_path / 'evil.tar.gz'), 'w:gz') as tar:
+        tar.addfile(info, io.BytesIO(data))
+
+    (tmp_path / 'manifest.json').write_text(json.dumps({'archives': ['evil.tar.gz']}))
+
+    with pytest.raises((ValueError, tarfile.FilterError)):
+        restore_backup(tmp_path / 'manifest.json', tmp_path / 'restored')
+
+    assert victim.read_text() == 'untouched'
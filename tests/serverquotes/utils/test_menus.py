@@ -0,0 +1,74 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('redbot.core')
+
+from serverquotes.utils.menus import DEFAULT_CONTROLS, LazyPages, menu, next_page  # noqa: E402
+
+N_PAGES, N_VIEWS = 50, 5
+FORWARD = next(k for k, v in DEFAULT_CONTROLS.items() if v is next_page)
+
+
+def render(num):
+    return 'page %i of %i' % (num + 1, N_PAGES)
+
+
+class Message:
+    id = 0
+    channel = None
+    _state = SimpleNamespace(self_id=None)
+
+    def __init__(self, shown, content):
+        self.shown = shown
+        shown.append(content)
+
+    async def edit(self, *, content=None, embed=None):
+        self.shown.append(content)
+
+    async def add_reaction(self, emoji):
+        pass
+
+
+class Bot:
+    """Pages forward N_VIEWS times, then lets the menu time out"""
+
+    user = None
+
+    def __init__(self):
+        self.reactions = N_VIEWS
+
+    async def use_buttons(self):
+        return False
+
+    async def wait_for(self, event, *, check=None, timeout=None):
+        if event == 'reaction_add' and self.reactions:
+            self.reactions -= 1
+            return SimpleNamespace(emoji=FORWARD), None
+
+        await asyncio.sleep(3600)
+
+
+def run_menu(pages):
+    shown = []
+    ctx = SimpleNamespace(bot=Bot(), author=None, me=None)
+
+    async def send(content=None, *, embed=None):
+        return Message(shown, content)
+
+    ctx.send = send
+    asyncio.run(menu(ctx, pages, timeout=0.001))
+    return shown
+
+
+@pytest.mark.parametrize('make_pages', [lambda: [render(i) for i in range(N_PAGES)],
+                                        lambda: LazyPages(render, length=N_PAGES)], ids=['list', 'lazy'])
+def test_pages_shown_in_order(make_pages):
+    assert run_menu(make_pages()) == [render(i) for i in range(N_VIEWS + 1)]
+
+
+def test_lazy_pages_built_when_viewed():
+    pages = LazyPages(render, length=N_PAGES)
+    run_menu(pages)
+    assert pages.built == N_VIEWS + 1
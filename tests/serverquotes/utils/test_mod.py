@@ -0,0 +1,50 @@
+import asyncio
+import random
+
+import pytest
+
+pytest.importorskip('redbot.core')
+discord = pytest.importorskip('discord')
+
+from serverquotes.utils.mod import adaptive_purge  # noqa: E402
+from .sims import PurgeSim, SimChannel, SimMessage  # noqa: E402
+
+
+def test_deletes_every_message_once():
+    # a few too old to bulk delete, which go one at a time
+    sim = PurgeSim(random.Random(0), channels=3, per_channel=100, old_ratio=0.02)
+    progress = []
+    report = asyncio.run(adaptive_purge(sim.messages, on_progress=lambda r: progress.append(r.deleted),
+                                        progress_interval=0.5))
+    assert sim.all_deleted_once
+    assert (report.deleted, report.failed) == (len(sim.messages), 0)
+    assert report.requests == sim.requests
+    assert progress and progress[-1] == len(sim.messages)
+
+
+def test_one_at_a_time():
+    sim = PurgeSim(random.Random(1), channels=2, per_channel=5, old_ratio=0)
+    report = asyncio.run(adaptive_purge(sim.messages, bulk=False))
+    assert sim.all_deleted_once
+    assert report.requests == len(sim.messages)
+
+
+def test_retries_after_rate_limit():
+    class LimitedChannel(SimChannel):
+        limited = False
+
+        async def delete_messages(self, messages, *, reason=None):
+            if not self.limited:
+                self.limited = True
+                raise discord.RateLimited(0.05)
+
+            await super().delete_messages(messages, reason=reason)
+
+    sim = PurgeSim(random.Random(2), channels=0, per_channel=0, old_ratio=0)
+    channel = LimitedChannel(sim, 1)
+    now = discord.utils.utcnow()
+    sim.messages = [SimMessage(sim, i, channel, now) for i in range(10)]
+    report = asyncio.run(adaptive_purge(sim.messages))
+    assert channel.limited
+    assert sim.all_deleted_once
+    assert (report.deleted, report.failed) == (10, 0)
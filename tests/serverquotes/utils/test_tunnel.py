@@ -0,0 +1,82 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('redbot.core')
+pytest.importorskip('aiohttp')
+
+from serverquotes.utils.tunnel import Tunnel, _get_budget  # noqa: E402
+from ..httpstub import LocalHTTPStub  # noqa: E402
+
+rng = random.Random(0)
+SIZES = [rng.randint(1, 512) * 1024 for _ in range(4)]
+LIMIT = sum(SIZES) + 1024
+DESTINATION = SimpleNamespace(guild=SimpleNamespace(filesize_limit=LIMIT))
+
+
+def attachments(stub, names):
+    return [SimpleNamespace(filename=name, url=stub.url('/file/' + name), proxy_url=stub.url('/file/' + name),
+                            size=len(stub.files[name][0]), height=None, description=None, is_spoiler=lambda: False)
+            for name in names]
+
+
+def scenario(test):
+    async def main():
+        async with LocalHTTPStub() as stub:
+            for i, size in enumerate(SIZES):
+                stub.add_file('a%i.bin' % i, rng.getrandbits(size * 8).to_bytes(size, 'little'))
+
+            await test(stub, attachments(stub, ['a%i.bin' % i for i in range(len(SIZES))]))
+
+    asyncio.run(main())
+
+
+def test_streamed_files_downloads_everything():
+    async def test(stub, atts):
+        async with Tunnel.streamed_files(SimpleNamespace(attachments=atts), DESTINATION) as files:
+            assert [f.filename for f in files] == [a.filename for a in atts]
+
+            for f, a in zip(files, atts):
+                f.fp.seek(0)
+                assert f.fp.read() == stub.files[a.filename][0]
+
+    scenario(test)
+
+
+def test_over_the_limit_refused_before_downloading():
+    async def test(stub, atts):
+        stub.add_file('huge.bin', bytes(1024))
+        huge = attachments(stub, ['huge.bin'])[0]
+        huge.size = LIMIT + 1
+        requests = len(stub.requests)
+
+        async with Tunnel.streamed_files(SimpleNamespace(attachments=atts[:1] + [huge]), DESTINATION) as files:
+            assert files == []
+
+        assert len(stub.requests) == requests
+
+    scenario(test)
+
+
+def test_cancelled_downloads_release_the_budget():
+    async def test(stub, atts):
+        for a in atts:
+            a.url = a.proxy_url = a.url.replace('/file/', '/slowfile/')
+
+        async def stream():
+            async with Tunnel.streamed_files(SimpleNamespace(attachments=atts), DESTINATION):
+                pass
+
+        task = asyncio.ensure_future(stream())
+        await asyncio.sleep(0.1)
+        assert _get_budget().used
+        task.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        assert _get_budget().used == 0
+
+    scenario(test)